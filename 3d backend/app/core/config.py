@@ -12,5 +12,67 @@ class Settings:
     MESHY_API_KEY: str = os.getenv("MESHY_API_KEY", "")
     TRIPO_API_KEY: str = os.getenv("TRIPO_API_KEY", "")  # <--- Ensure this is here for Tripo
 
+    # Upstream base URLs (point at mock_upstream.py for offline testing)
+    BRIA_BASE_URL: str = os.getenv("BRIA_BASE_URL", "https://engine.prod.bria-api.com").rstrip("/")
+    TRIPO_BASE_URL: str = os.getenv("TRIPO_BASE_URL", "https://api.tripo3d.ai").rstrip("/")
+
+    # Host-wide upstream limiter (shared with the sprite backend's workers).
+    # genforge_common.rate_limiter reads UPSTREAM_LIMITER_DB, UPSTREAM_LEASE_TTL,
+    # UPSTREAM_ACQUIRE_TIMEOUT, UPSTREAM_HISTORY_SECONDS and UPSTREAM_LANE_SHARES
+    # from the environment; the caps below only apply if none are stored yet.
+    BRIA_RATE_LIMIT_RPM: float = float(os.getenv("BRIA_RATE_LIMIT_RPM", "60"))
+    BRIA_MAX_IN_FLIGHT: int = int(os.getenv("BRIA_MAX_IN_FLIGHT", "6"))
+    TRIPO_RATE_LIMIT_RPM: float = float(os.getenv("TRIPO_RATE_LIMIT_RPM", "30"))
+    TRIPO_MAX_IN_FLIGHT: int = int(os.getenv("TRIPO_MAX_IN_FLIGHT", "2"))
+    # Upstream request timeouts (seconds)
+    BRIA_CONNECT_TIMEOUT: float = float(os.getenv("BRIA_CONNECT_TIMEOUT", "10"))
+    BRIA_READ_TIMEOUT: float = float(os.getenv("BRIA_READ_TIMEOUT", "120"))
+    TRIPO_CONNECT_TIMEOUT: float = float(os.getenv("TRIPO_CONNECT_TIMEOUT", "10"))
+    TRIPO_READ_TIMEOUT: float = float(os.getenv("TRIPO_READ_TIMEOUT", "60"))
+
+    # Completion webhooks (callback_url on generation requests)
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+    WEBHOOK_TIMEOUT: float = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+    WEBHOOK_MAX_ATTEMPTS: int = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "6"))
+    WEBHOOK_MAX_PENDING: int = int(os.getenv("WEBHOOK_MAX_PENDING", "1000"))
+    WEBHOOK_WORKERS: int = int(os.getenv("WEBHOOK_WORKERS", "2"))
+    WEBHOOK_RETRY_BASE: float = float(os.getenv("WEBHOOK_RETRY_BASE", "2"))
+    WEBHOOK_ALLOWED_HOSTS: str = os.getenv("WEBHOOK_ALLOWED_HOSTS", "")
+    # CIDRs of non-public addresses callbacks may reach (e.g. an internal receiver)
+    WEBHOOK_ALLOWED_NETWORKS: str = os.getenv("WEBHOOK_ALLOWED_NETWORKS", "")
+    # Public URL of this server for absolute model URLs in webhooks
+    PUBLIC_BASE_URL: str = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+
+    # Where views and downloaded models are stored, and retention of it
+    # (view renders go before models). The default paths below live in it.
+    ASSETS_DIR: str = os.getenv("ASSETS_DIR", "assets_storage")
+    MODELS_DIR: str = os.path.join(ASSETS_DIR, "models")
+    RETENTION: bool = os.getenv("RETENTION", "true").lower() not in ("0", "false", "no")
+    ASSETS_QUOTA_MB: float = float(os.getenv("ASSETS_QUOTA_MB", "1024"))
+    ASSET_TTL_HOURS: str = os.getenv("ASSET_TTL_HOURS", "views=168,models=720")
+    RETENTION_GRACE: float = float(os.getenv("RETENTION_GRACE", "3600"))
+    RETENTION_SWEEP_INTERVAL: float = float(os.getenv("RETENTION_SWEEP_INTERVAL", "600"))
+    ASSET_RETENTION_DB: str = os.getenv(
+        "ASSET_RETENTION_DB", os.path.join(ASSETS_DIR, ".retention.sqlite")
+    )
+
+    # Job status, shared by the workers on this host (and, through the
+    # artifact store's records, with other nodes)
+    JOB_STORE_DB: str = os.getenv("JOB_STORE_DB", os.path.join(ASSETS_DIR, ".jobs.sqlite"))
+    # Unfinished jobs not updated for this long lost their worker and are
+    # marked failed (the Tripo stage alone can run for several minutes)
+    JOB_STALE_SECONDS: float = float(os.getenv("JOB_STALE_SECONDS", "3600"))
+
+    # Shared content-addressed store for downloaded models and job records (multi-node deployments)
+    ARTIFACT_STORE: str = os.getenv("ARTIFACT_STORE", "").lower()  # "", local or s3
+    ARTIFACT_DIR: str = os.getenv("ARTIFACT_DIR", os.path.join(ASSETS_DIR, "artifacts"))
+    ARTIFACT_S3_ENDPOINT: str = os.getenv("ARTIFACT_S3_ENDPOINT", "https://s3.amazonaws.com").rstrip("/")
+    ARTIFACT_S3_BUCKET: str = os.getenv("ARTIFACT_S3_BUCKET", "")
+    ARTIFACT_S3_REGION: str = os.getenv("ARTIFACT_S3_REGION", "us-east-1")
+    ARTIFACT_S3_ACCESS_KEY: str = os.getenv("ARTIFACT_S3_ACCESS_KEY", "")
+    ARTIFACT_S3_SECRET_KEY: str = os.getenv("ARTIFACT_S3_SECRET_KEY", "")
+    ARTIFACT_S3_PREFIX: str = os.getenv("ARTIFACT_S3_PREFIX", "").strip("/")
+    ARTIFACT_PUBLIC_URL: str = os.getenv("ARTIFACT_PUBLIC_URL", "").rstrip("/")
+
 # Instantiate the settings once
 settings = Settings()
\ No newline at end of file
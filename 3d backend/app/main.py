@@ -1,7 +1,20 @@
+import os
+import logging
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.routers import fibo, generation,assets
+from app.services.rate_limiter import bria_limiter, tripo_limiter
+from app.services.webhooks import webhook_dispatcher
+from app.services.retention import asset_retention
+from app.services.artifact_store import artifact_store
+
+# The shared services (genforge_common) report through logging
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s"
+)
 
 # Initialize the app 
 app = FastAPI(title="Fibo 3D Pipeline")
@@ -19,7 +32,35 @@ app.include_router(fibo.router, prefix="/fibo", tags=["FIBO"])
 app.include_router(generation.router, prefix="/3d", tags=["3D Generation"])
 app.include_router(assets.router, prefix="/assets", tags=["Assets"])
 
+@app.on_event("startup")
+def start_asset_retention():
+    """Disk quota and TTLs for assets_storage/ (one sweeper per worker, one sweep at a time)."""
+    if settings.RETENTION:
+        asset_retention.start()
+
 # A simple test route to check if it works
 @app.get("/")
 def read_root():
     return {"message": f"welcome to {settings.PROJECT_NAME} "}
+
+
+@app.get("/upstream")
+def upstream_stats():
+    """Host-wide upstream limits shared with the sprite backend, plus queue wait times and webhook delivery."""
+    return {
+        "bria": bria_limiter.get_stats(),
+        "tripo": tripo_limiter.get_stats(),
+        "webhooks": webhook_dispatcher.get_stats()
+    }
+
+
+@app.get("/retention")
+def retention_stats():
+    """Storage quota, TTLs per asset class and what the last sweep in this worker removed."""
+    return asset_retention.get_stats()
+
+
+@app.get("/artifacts")
+def artifact_store_stats():
+    """Shared artifact store backend and how many models this worker uploaded or found already stored."""
+    return artifact_store.get_stats()
@@ -1,15 +1,18 @@
 from fastapi import APIRouter
 from fastapi.responses import FileResponse
+from app.core.config import settings
+from app.services.retention import asset_retention
 import os
 
 router = APIRouter()
 
-ASSETS_DIR = "assets_storage"
+ASSETS_DIR = settings.ASSETS_DIR
 
 @router.get("/{filename}")
 async def get_asset(filename: str):
     """Serve stored assets (GLB files, images, etc.)"""
     filepath = os.path.join(ASSETS_DIR, filename)
     if os.path.exists(filepath):
+        asset_retention.touch(filename)
         return FileResponse(filepath)
     return {"error": "Asset not found"}
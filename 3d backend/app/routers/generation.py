@@ -1,24 +1,31 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
 from pydantic import BaseModel
+from app.core.config import settings
 from app.services.image_service import image_service
 from app.services.tripo_service import tripo_service
+from app.services.webhooks import webhook_dispatcher
+from app.services.retention import asset_retention
+from app.services.artifact_store import artifact_store, CHUNK_SIZE
+from app.services.job_store import job_store
 import uuid
 import os
+import time
 import requests
 from typing import Optional
 
 router = APIRouter()
 
-# In-memory storage for job results (use Redis/DB in production)
-job_results = {}
-
-# Directory to store downloaded models
-MODELS_DIR = "assets_storage/models"
+# Directory to store downloaded models (swept by asset retention)
+MODELS_DIR = settings.MODELS_DIR
 os.makedirs(MODELS_DIR, exist_ok=True)
 
+# Retention never removes the model of a job that is still running
+asset_retention.register_active(lambda: {f"models/{jid}.glb" for jid in job_store.active_ids()})
+
 class GenerationRequest(BaseModel):
     prompt: str 
+    callback_url: Optional[str] = None  # signed webhook when the job finishes
 
 class JobStatus(BaseModel):
     job_id: str
@@ -27,44 +34,87 @@ class JobStatus(BaseModel):
     model_url: Optional[str] = None
     error: Optional[str] = None
 
+def send_job_webhook(jid: str, callback_url: str, base_url: str):
+    """POST a finished job's status, artifact URLs and timings to its callback."""
+    result = job_store.get(jid)
+    artifacts = {}
+    for name in ("image_url", "model_url"):
+        url = result.get(name)
+        if url:
+            artifacts[name] = base_url + url if url.startswith("/") else url
+    event = "job.completed" if result["status"] == "completed" else "job.failed"
+    webhook_dispatcher.send(callback_url, event, {"job_id": jid, **result, "artifacts": artifacts})
+
+
+def publish_model(jid: str, local_path: str):
+    """Share a downloaded model with other nodes through the artifact store."""
+    if not artifact_store.enabled:
+        return
+    try:
+        artifact_store.publish(f"models/{jid}", [("model.glb", local_path, os.stat(local_path))])
+    except Exception as e:
+        # This node still serves the model from its own disk
+        print(f"   ⚠️ Publishing model failed: {e}")
+
+
+def iter_blob(key: str):
+    body = artifact_store.open_blob(key)
+    try:
+        while True:
+            chunk = body.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        body.close()
+
+
 @router.post("/generate-full-pipeline")
-async def generate_pipeline(request: GenerationRequest, background_tasks: BackgroundTasks):
+async def generate_pipeline(request: GenerationRequest, background_tasks: BackgroundTasks, http_request: Request):
+    if request.callback_url:
+        try:
+            webhook_dispatcher.validate_url(request.callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    base_url = settings.PUBLIC_BASE_URL or str(http_request.base_url).rstrip("/")
+
     job_id = str(uuid.uuid4())
     
     # Initialize job status
-    job_results[job_id] = {
-        "status": "pending",
-        "image_url": None,
-        "model_url": None,
-        "error": None
-    }
+    job_store.create(job_id)
     
     def run_hybrid_pipeline(jid, user_prompt):
         print(f"\n🚀 STARTING FIBO -> TRIPO PIPELINE (Job {jid})")
+        timings = {}
+        # Written together with the timings, so a finished job's record is complete
+        outcome = {"status": "failed"}
+        started = time.monotonic()
         
         try:
             # 1. FIBO (Phase 1)
-            job_results[jid]["status"] = "generating_image"
+            job_store.update(jid, status="generating_image")
+            stage_start = time.monotonic()
             image_url = image_service.generate_single_image(user_prompt)
+            timings["image"] = round(time.monotonic() - stage_start, 3)
             
             if not image_url:
-                job_results[jid]["status"] = "failed"
-                job_results[jid]["error"] = "Failed to generate image"
+                outcome["error"] = "Failed to generate image"
                 print("❌ Pipeline Stopped at Phase 1 (Fibo)")
                 return
             
-            job_results[jid]["image_url"] = image_url
-
             # 2. TRIPO (Phase 2)
             print(f"--- PHASE 2: TRIPO 3D CONVERSION ---")
-            job_results[jid]["status"] = "generating_3d"
+            job_store.update(jid, status="generating_3d", image_url=image_url)
+            stage_start = time.monotonic()
             glb_url = tripo_service.generate_3d_model(image_url)
+            timings["tripo"] = round(time.monotonic() - stage_start, 3)
 
             if glb_url:
                 # Download the GLB file to serve locally (avoids CORS issues)
                 print(f"   📥 Downloading GLB file...")
                 local_filename = f"{jid}.glb"
                 local_path = os.path.join(MODELS_DIR, local_filename)
+                stage_start = time.monotonic()
                 
                 try:
                     resp = requests.get(glb_url, timeout=120)
@@ -72,29 +122,33 @@ async def generate_pipeline(request: GenerationRequest, background_tasks: Backgr
                         with open(local_path, 'wb') as f:
                             f.write(resp.content)
                         # Use local URL instead of remote
-                        local_model_url = f"/3d/models/{local_filename}"
-                        job_results[jid]["model_url"] = local_model_url
+                        model_url = f"/3d/models/{local_filename}"
                         print(f"   💾 Saved to: {local_path}")
+                        publish_model(jid, local_path)
                     else:
                         # Fallback to remote URL
-                        job_results[jid]["model_url"] = glb_url
+                        model_url = glb_url
                         print(f"   ⚠️ Could not download, using remote URL")
                 except Exception as download_err:
                     print(f"   ⚠️ Download failed: {download_err}, using remote URL")
-                    job_results[jid]["model_url"] = glb_url
+                    model_url = glb_url
+                timings["download"] = round(time.monotonic() - stage_start, 3)
                 
-                job_results[jid]["status"] = "completed"
+                outcome = {"status": "completed", "model_url": model_url}
                 print(f"\n✨ SUCCESS!")
                 print(f"   🖼️ Input Image: {image_url}")
-                print(f"   📦 Final 3D Model: {job_results[jid]['model_url']}")
+                print(f"   📦 Final 3D Model: {model_url}")
             else:
-                job_results[jid]["status"] = "failed"
-                job_results[jid]["error"] = "Failed to generate 3D model"
+                outcome["error"] = "Failed to generate 3D model"
                 print("❌ Pipeline Stopped at Phase 2 (Tripo)")
         except Exception as e:
-            job_results[jid]["status"] = "failed"
-            job_results[jid]["error"] = str(e)
+            outcome = {"status": "failed", "error": str(e)}
             print(f"❌ Pipeline Error: {e}")
+        finally:
+            timings["total"] = round(time.monotonic() - started, 3)
+            job_store.update(jid, timings=timings, **outcome)
+            if request.callback_url:
+                send_job_webhook(jid, request.callback_url, base_url)
 
     background_tasks.add_task(run_hybrid_pipeline, job_id, request.prompt)
     
@@ -106,10 +160,9 @@ async def generate_pipeline(request: GenerationRequest, background_tasks: Backgr
 @router.get("/status/{job_id}")
 async def get_job_status(job_id: str):
     """Get the status of a generation job"""
-    if job_id not in job_results:
+    result = job_store.get(job_id)
+    if result is None:
         raise HTTPException(status_code=404, detail="Job not found")
-    
-    result = job_results[job_id]
     return {
         "job_id": job_id,
         **result
@@ -152,14 +205,27 @@ async def generate_sync(request: GenerationRequest):
 async def get_model(filename: str):
     """Serve downloaded GLB model files"""
     filepath = os.path.join(MODELS_DIR, filename)
+    headers = {
+        "Access-Control-Allow-Origin": "*",
+        "Content-Disposition": f"inline; filename={filename}"
+    }
     if not os.path.exists(filepath):
-        raise HTTPException(status_code=404, detail="Model not found")
+        # Downloaded on another node (or evicted here): serve the shared copy
+        entry = None
+        if artifact_store.enabled and filename.endswith(".glb"):
+            entry = artifact_store.resolve(f"models/{filename[:-len('.glb')]}", "model.glb")
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Model not found")
+        url = artifact_store.public_url(entry["key"])
+        if url:
+            return RedirectResponse(url, status_code=302)
+        local_path = artifact_store.local_path(entry["key"])
+        if local_path:
+            return FileResponse(local_path, media_type="model/gltf-binary", headers=headers)
+        return StreamingResponse(
+            iter_blob(entry["key"]), media_type="model/gltf-binary",
+            headers={**headers, "Content-Length": str(entry["size"])}
+        )
+    asset_retention.touch(f"models/{filename}")
     
-    return FileResponse(
-        filepath,
-        media_type="model/gltf-binary",
-        headers={
-            "Access-Control-Allow-Origin": "*",
-            "Content-Disposition": f"inline; filename={filename}"
-        }
-    )
+    return FileResponse(filepath, media_type="model/gltf-binary", headers=headers)
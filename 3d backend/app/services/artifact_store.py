@@ -0,0 +1,19 @@
+"""
+Artifact Store - The 3D backend's instance of genforge_common.artifact_store.
+
+Downloaded models are published under jobs/models/<job_id>.json, so a node
+that does not have assets_storage/models/<job>.glb serves it from the
+store; job_store keeps each job's status in a 3d-jobs/<job_id> record.
+Backends and settings are described in the shared module.
+"""
+from app.core.config import settings
+from genforge_common.artifact_store import ArtifactStore, CHUNK_SIZE, make_backend
+
+artifact_store = ArtifactStore(
+    make_backend(
+        settings.ARTIFACT_STORE, settings.ARTIFACT_DIR, settings.ARTIFACT_S3_ENDPOINT,
+        settings.ARTIFACT_S3_BUCKET, settings.ARTIFACT_S3_REGION, settings.ARTIFACT_S3_ACCESS_KEY,
+        settings.ARTIFACT_S3_SECRET_KEY, settings.ARTIFACT_S3_PREFIX
+    ),
+    settings.ARTIFACT_PUBLIC_URL
+)
@@ -2,9 +2,10 @@ import json
 import requests
 import os
 from app.core.config import settings
+from app.services.rate_limiter import NO_RESPONSE, bria_limiter
 
 class ImageService:
-    BASE_URL = "https://engine.prod.bria-api.com/v2/image/generate"
+    BASE_URL = f"{settings.BRIA_BASE_URL}/v2/image/generate"
 
     def _build_prompt(self, subject: str):
         """
@@ -66,7 +67,16 @@ class ImageService:
         }
 
         try:
-            response = requests.post(self.BASE_URL, headers=headers, json=payload)
+            with bria_limiter.slot() as slot:
+                try:
+                    response = requests.post(
+                        self.BASE_URL, headers=headers, json=payload,
+                        timeout=(settings.BRIA_CONNECT_TIMEOUT, settings.BRIA_READ_TIMEOUT)
+                    )
+                except requests.RequestException:
+                    slot.status_code = NO_RESPONSE
+                    raise
+                slot.status_code = response.status_code
             
             if response.status_code != 200:
                 print(f"❌ Fibo Error: {response.text}")
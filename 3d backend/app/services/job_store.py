@@ -0,0 +1,169 @@
+"""
+Job Store - Status of /3d/generate-full-pipeline jobs, shared by all workers.
+
+A job runs in the worker that accepted it, but its status may be polled
+through any worker. Jobs live in a small SQLite table, so the Gunicorn
+workers on one host see each other's jobs. With an artifact store
+configured, every change is also written to a 3d-jobs/<job_id> record,
+and a job this host has never seen is looked up there; finished jobs
+read from the store are kept locally.
+
+A job whose worker died stays unfinished until its updated_at is older than
+JOB_STALE_SECONDS; it is then marked failed, so polls end and retention may
+evict its model.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+from app.core.config import settings
+from app.services.artifact_store import artifact_store
+
+log = logging.getLogger(__name__)
+
+FINISHED = ("completed", "failed")
+FIELDS = ("status", "image_url", "model_url", "error", "timings")
+STALE_ERROR = "The worker running this job stopped before it finished"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    image_url TEXT,
+    model_url TEXT,
+    error TEXT,
+    timings TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+"""
+
+
+class JobStore:
+    def __init__(self, db_path: str, records, stale_seconds: float = 3600):
+        self.db_path = db_path
+        self.records = records
+        self.stale_seconds = stale_seconds
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _row(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT status, image_url, model_url, error, timings FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["timings"] = json.loads(job["timings"])
+        return job
+
+    def _publish(self, job_id: str, job: Dict[str, Any]):
+        if not self.records.enabled:
+            return
+        try:
+            self.records.put_record(f"3d-jobs/{job_id}", job)
+        except Exception as e:
+            # Workers on this host still answer from the local table
+            log.warning("Could not publish the status of job %s: %s", job_id, e)
+
+    def create(self, job_id: str) -> Dict[str, Any]:
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, status, created_at, updated_at) VALUES (?, 'pending', ?, ?)",
+            (job_id, now, now)
+        )
+        job = self._row(job_id)
+        self._publish(job_id, job)
+        return job
+
+    def update(self, job_id: str, **fields) -> Dict[str, Any]:
+        """Set some of status, image_url, model_url, error and timings (a dict)."""
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown job fields: {', '.join(sorted(unknown))}")
+        if "timings" in fields:
+            fields["timings"] = json.dumps(fields["timings"])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._connect().execute(
+            f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ?",
+            (*fields.values(), time.time(), job_id)
+        )
+        job = self._row(job_id)
+        self._publish(job_id, job)
+        return job
+
+    def expire_stale(self, job_id: Optional[str] = None) -> List[str]:
+        """
+        Mark unfinished jobs (or just job_id) failed once they have not been
+        updated for stale_seconds. Returns the ids that were expired.
+        """
+        conn = self._connect()
+        stale = "status NOT IN (?, ?) AND updated_at < ?"
+        params = (*FINISHED, time.time() - self.stale_seconds)
+        if job_id is None:
+            rows = conn.execute(f"SELECT id FROM jobs WHERE {stale}", params).fetchall()
+        else:
+            rows = conn.execute(f"SELECT id FROM jobs WHERE id = ? AND {stale}", (job_id, *params)).fetchall()
+        expired = []
+        for row in rows:
+            # Still stale: the worker may have written since the SELECT
+            cursor = conn.execute(
+                f"UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ? AND {stale}",
+                (STALE_ERROR, time.time(), row["id"], *params)
+            )
+            if cursor.rowcount:
+                expired.append(row["id"])
+                self._publish(row["id"], self._row(row["id"]))
+        if expired:
+            log.warning("Expired %d job(s) whose worker stopped: %s", len(expired), ", ".join(expired))
+        return expired
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job's status, timings and URLs (None if no node knows it)."""
+        self.expire_stale(job_id)
+        job = self._row(job_id)
+        if job is not None or not self.records.enabled:
+            return job
+        try:
+            job = self.records.get_record(f"3d-jobs/{job_id}")
+        except Exception as e:
+            log.warning("Could not look up job %s in the artifact store: %s", job_id, e)
+            return None
+        if job is not None and job["status"] in FINISHED:
+            # Finished jobs no longer change, so later polls stay local
+            now = time.time()
+            self._connect().execute(
+                """
+                INSERT OR IGNORE INTO jobs (id, status, image_url, model_url, error, timings, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (job_id, job["status"], job.get("image_url"), job.get("model_url"), job.get("error"),
+                 json.dumps(job.get("timings") or {}), now, now)
+            )
+        return job
+
+    def active_ids(self) -> Set[str]:
+        """Jobs on this host that have not finished yet (stale ones expire first)."""
+        self.expire_stale()
+        rows = self._connect().execute(
+            "SELECT id FROM jobs WHERE status NOT IN (?, ?)", FINISHED
+        ).fetchall()
+        return {row["id"] for row in rows}
+
+
+job_store = JobStore(settings.JOB_STORE_DB, artifact_store, settings.JOB_STALE_SECONDS)
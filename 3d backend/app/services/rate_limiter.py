@@ -0,0 +1,11 @@
+"""
+Host-wide BRIA and Tripo limiters of the 3D backend.
+
+The limiter itself lives in genforge_common.rate_limiter, shared with the
+sprite backend; both register the same "bria" upstream.
+"""
+from app.core.config import settings
+from genforge_common.rate_limiter import NO_RESPONSE, RateLimitTimeout, UpstreamLimiter
+
+bria_limiter = UpstreamLimiter("bria", settings.BRIA_RATE_LIMIT_RPM, settings.BRIA_MAX_IN_FLIGHT)
+tripo_limiter = UpstreamLimiter("tripo", settings.TRIPO_RATE_LIMIT_RPM, settings.TRIPO_MAX_IN_FLIGHT)
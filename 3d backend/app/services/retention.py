@@ -0,0 +1,218 @@
+"""
+Asset Retention - Disk quota and per-class TTLs for assets_storage/.
+
+Stored assets fall into two classes:
+
+    views   assets_storage/<id>/views/*.png   rendered views (~1.2 MB each)
+    models  assets_storage/models/<job>.glb   downloaded Tripo models
+
+A background sweeper first removes entries whose class TTL has passed
+since they were last served (or written). Then, while the directory is
+larger than ASSETS_QUOTA_MB, it evicts views before models, least recently
+used first. Models of jobs that are still running, and anything written
+within RETENTION_GRACE seconds, are never removed.
+
+Last-served times are recorded in memory by the serving routes and merged
+into a small SQLite table, so both Gunicorn workers share one LRU order.
+Only one worker sweeps at a time (see genforge_common.retention).
+"""
+import os
+import time
+import shutil
+import sqlite3
+import logging
+import threading
+from typing import Callable, Dict, Any, List, Optional, Set
+
+from app.core.config import settings
+from genforge_common.retention import AccessLog, Sweeper, parse_ttls, run_exclusive
+
+log = logging.getLogger(__name__)
+
+# Evicted in this order under quota pressure
+ASSET_CLASSES = ("views", "models")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS asset_access (
+    key TEXT PRIMARY KEY,
+    accessed_at REAL NOT NULL
+);
+"""
+
+
+class _Entry:
+    def __init__(self, key: str, cls: str, path: str, size: int, modified: float):
+        self.key = key
+        self.cls = cls
+        self.path = path
+        self.size = size
+        self.modified = modified
+        self.last_used = modified
+
+
+class AssetRetention:
+    def __init__(self, root: str, quota_bytes: int, ttls: Dict[str, float],
+                 grace: float, interval: float, db_path: str):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.ttls = ttls
+        self.grace = grace
+        self.interval = interval
+        self.db_path = db_path
+        self._access = AccessLog(self._save_access)
+        self._local = threading.local()
+        self._active: Optional[Callable[[], Set[str]]] = None
+        self._sweeper = Sweeper("asset-retention", self.flush_access, self._sweep_exclusive, interval)
+        self._last_sweep: Dict[str, Any] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def register_active(self, active: Callable[[], Set[str]]):
+        """active() returns keys (e.g. "models/<job>.glb") that jobs are still writing."""
+        self._active = active
+
+    def touch(self, key: str):
+        """Record that an asset was served; key is its path under the root."""
+        self._access.touch(key.split("/views/", 1)[0])
+
+    def flush_access(self):
+        self._access.flush()
+
+    def _save_access(self, access: Dict[str, float]):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                """
+                INSERT INTO asset_access (key, accessed_at) VALUES (?, ?)
+                ON CONFLICT (key) DO UPDATE SET accessed_at = MAX(accessed_at, excluded.accessed_at)
+                """,
+                list(access.items())
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _entries(self) -> List[_Entry]:
+        """Every view directory and model file under the root."""
+        entries = []
+        models_dir = os.path.join(self.root, "models")
+        if os.path.isdir(models_dir):
+            for name in os.listdir(models_dir):
+                path = os.path.join(models_dir, name)
+                if os.path.isfile(path):
+                    st = os.stat(path)
+                    entries.append(_Entry(f"models/{name}", "models", path, st.st_size, st.st_mtime))
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                views = os.path.join(self.root, name, "views")
+                if name == "models" or not os.path.isdir(views):
+                    continue
+                size, modified = 0, 0.0
+                for filename in os.listdir(views):
+                    try:
+                        st = os.stat(os.path.join(views, filename))
+                    except OSError:
+                        continue
+                    size += st.st_size
+                    modified = max(modified, st.st_mtime)
+                entries.append(_Entry(name, "views", views, size, modified))
+        return entries
+
+    def _remove(self, entry: _Entry):
+        if entry.cls == "views":
+            shutil.rmtree(entry.path, ignore_errors=True)
+            try:
+                os.rmdir(os.path.dirname(entry.path))
+            except OSError:
+                pass
+        else:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        self._connect().execute("DELETE FROM asset_access WHERE key = ?", (entry.key,))
+
+    def sweep(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Apply TTLs, then the quota. Returns what was removed."""
+        now = now or time.time()
+        self.flush_access()
+        access = dict(self._connect().execute("SELECT key, accessed_at FROM asset_access").fetchall())
+        active = self._active() if self._active else set()
+
+        entries = self._entries()
+        total = sum(entry.size for entry in entries)
+        candidates = []
+        for entry in entries:
+            entry.last_used = max(entry.modified, access.get(entry.key, 0))
+            if entry.key not in active and now - entry.modified >= self.grace:
+                candidates.append(entry)
+
+        freed = {cls: 0 for cls in ASSET_CLASSES}
+        removed = set()
+        for entry in candidates:
+            ttl = self.ttls.get(entry.cls)
+            if ttl and now - entry.last_used > ttl:
+                self._remove(entry)
+                removed.add(entry.key)
+                freed[entry.cls] += entry.size
+
+        used = total - sum(freed.values())
+        if self.quota_bytes and used > self.quota_bytes:
+            for cls in ASSET_CLASSES:
+                for entry in sorted(candidates, key=lambda e: e.last_used):
+                    if used <= self.quota_bytes:
+                        break
+                    if entry.cls != cls or entry.key in removed:
+                        continue
+                    self._remove(entry)
+                    removed.add(entry.key)
+                    freed[cls] += entry.size
+                    used -= entry.size
+
+        self._last_sweep = {
+            "finished_at": now,
+            "bytes_before": total,
+            "bytes_after": used,
+            "freed_bytes": freed,
+            "removed": len(removed),
+            "skipped": len(entries) - len(candidates)
+        }
+        if removed:
+            log.info("Removed %d entries (%.1f MB), storage now %.1f MB",
+                     len(removed), sum(freed.values()) / 2**20, used / 2**20)
+        return self._last_sweep
+
+    def _sweep_exclusive(self):
+        """Sweep unless another worker on this host is already sweeping."""
+        return run_exclusive(self.db_path + ".lock", self.sweep)
+
+    def start(self):
+        """Start the sweeper thread (once per process)."""
+        self._sweeper.start()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "quota_bytes": self.quota_bytes,
+            "ttl_hours": {cls: ttl / 3600 for cls, ttl in self.ttls.items()},
+            "last_sweep": self._last_sweep or None
+        }
+
+
+asset_retention = AssetRetention(
+    settings.ASSETS_DIR,
+    int(settings.ASSETS_QUOTA_MB * 1024 * 1024),
+    parse_ttls(settings.ASSET_TTL_HOURS, ASSET_CLASSES),
+    settings.RETENTION_GRACE,
+    settings.RETENTION_SWEEP_INTERVAL,
+    settings.ASSET_RETENTION_DB
+)
@@ -2,12 +2,14 @@ import requests
 import time
 import json
 from app.core.config import settings
+from app.services.rate_limiter import NO_RESPONSE, tripo_limiter, RateLimitTimeout
 
 class TripoService:
     # 🔴 DISABLE MOCK MODE (Set to True only if you run out of credits)
     MOCK_MODE = False
     
-    BASE_URL = "https://api.tripo3d.ai/v2/openapi/task"
+    BASE_URL = f"{settings.TRIPO_BASE_URL}/v2/openapi/task"
+    TIMEOUT = (settings.TRIPO_CONNECT_TIMEOUT, settings.TRIPO_READ_TIMEOUT)
 
     def generate_3d_model(self, image_url: str):
         # --- MOCK PATH (Safety Net) ---
@@ -18,6 +20,17 @@ class TripoService:
             return "https://model-viewer.googleusercontent.com/models/astronaut.glb"
         # -----------------------------
 
+        # Hold a host-wide Tripo slot for the whole task (submit + polling):
+        # TRIPO_MAX_IN_FLIGHT caps running Tripo tasks, and the lease is
+        # renewed on every poll so it cannot expire while the task runs
+        try:
+            with tripo_limiter.slot() as slot:
+                return self._run_task(image_url, slot)
+        except RateLimitTimeout as e:
+            print(f"❌ Tripo busy: {e}")
+            return None
+
+    def _run_task(self, image_url: str, slot):
         headers = {
             "Authorization": f"Bearer {settings.TRIPO_API_KEY}",
             "Content-Type": "application/json"
@@ -40,7 +53,8 @@ class TripoService:
         print(f"☁️ [Tripo] Sending image to 3D pipeline (Color Enabled)...")
         
         try:
-            resp = requests.post(self.BASE_URL, headers=headers, json=payload)
+            resp = requests.post(self.BASE_URL, headers=headers, json=payload, timeout=self.TIMEOUT)
+            slot.status_code = resp.status_code
             if resp.status_code != 200:
                 print(f"❌ Tripo Error ({resp.status_code}): {resp.text}")
                 return None
@@ -55,6 +69,8 @@ class TripoService:
             print(f"   ⏳ Task ID: {task_id}")
 
         except Exception as e:
+            if isinstance(e, requests.RequestException):
+                slot.status_code = NO_RESPONSE
             print(f"❌ Connection Failed: {e}")
             return None
 
@@ -63,10 +79,11 @@ class TripoService:
         
         for _ in range(max_retries):
             time.sleep(5) 
+            slot.renew()
             
             check_url = f"{self.BASE_URL}/{task_id}"
             try:
-                status_resp = requests.get(check_url, headers=headers)
+                status_resp = requests.get(check_url, headers=headers, timeout=self.TIMEOUT)
                 status_data = status_resp.json()
                 
                 # Safe Access using .get()
@@ -0,0 +1,19 @@
+"""
+Webhooks - The 3D backend's dispatcher for job completion callbacks.
+
+Delivery, retries and the signature format are described in
+genforge_common.webhooks.
+"""
+from app.core.config import settings
+from genforge_common.webhooks import WebhookDispatcher, parse_hosts, parse_networks
+
+webhook_dispatcher = WebhookDispatcher(
+    settings.WEBHOOK_SECRET,
+    settings.WEBHOOK_MAX_PENDING,
+    settings.WEBHOOK_MAX_ATTEMPTS,
+    settings.WEBHOOK_TIMEOUT,
+    settings.WEBHOOK_WORKERS,
+    parse_hosts(settings.WEBHOOK_ALLOWED_HOSTS),
+    settings.WEBHOOK_RETRY_BASE,
+    parse_networks(settings.WEBHOOK_ALLOWED_NETWORKS)
+)
@@ -1,8 +1,18 @@
-from flask import Flask, send_from_directory
+from flask import Flask, Response
 from flask_cors import CORS
 from flask_restx import Api
 from routes.sprite import sprite_ns
+from services.job_queue import start_workers
+from services.output_files import send_output, send_job_zip, OUTPUTS_DIR
+from services import metrics, retention
+from services.sprite_service import start_warmup
 import os
+import logging
+
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s"
+)
 
 app = Flask(__name__)
 CORS(app)
@@ -20,10 +30,29 @@ api = Api(
 # Register namespaces
 api.add_namespace(sprite_ns, path='/sprite')
 
-# Serve output files
+# Background workers for queued sprite jobs (one pool per worker process)
+start_workers()
+# Output retention: disk quota and per-artifact TTLs
+retention.start_sweeper()
+# Per-process metrics snapshots, added up by /metrics
+metrics.start_flusher()
+
+# Serve output files (immutable once a job has finished, see services/output_files.py)
 @app.route("/outputs/<path:filename>")
 def serve_output(filename):
-    return send_from_directory("outputs", filename)
+    retention.touch(filename)
+    return send_output(filename)
+
+# Whole job as a zip built on the fly (?include=combined,sheets,gifs,frames,metadata,raw)
+@app.route("/outputs/<job_id>.zip")
+def serve_job_zip(job_id):
+    retention.touch(job_id)
+    return send_job_zip(job_id)
+
+# Prometheus scrape endpoint: stage timings, job counts and in-flight gauges
+@app.route("/metrics")
+def serve_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route("/health")
 def health():
@@ -50,7 +79,7 @@ def redoc():
     '''
 
 if __name__ == "__main__":
-    os.makedirs("outputs", exist_ok=True)
+    os.makedirs(OUTPUTS_DIR, exist_ok=True)
     os.makedirs("temp", exist_ok=True)
     print("\n" + "="*50)
     print("Sprite Generator API")
@@ -59,4 +88,5 @@ if __name__ == "__main__":
     print("ReDoc:      http://localhost:5000/redoc")
     print("API Base:   http://localhost:5000/api")
     print("="*50 + "\n")
+    start_warmup()
     app.run(debug=True, port=5000)
@@ -0,0 +1,125 @@
+"""
+Benchmark /outputs serving: the old send_from_directory route vs
+services.output_files.send_output.
+
+Builds a finished job directory (sheets, GIFs, frames, metadata.json) in a
+temporary folder and measures requests per second through Flask's test
+client for full downloads, revalidations (If-None-Match) and Range
+requests. It also counts how many requests a browser makes when a viewer
+page with all of the job's files is loaded again.
+
+Usage:
+    python bench_outputs.py [--seconds 2] [--frames 32]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+from flask import Flask, send_from_directory
+
+from services import output_files
+
+
+def make_job(root: str, frames: int) -> list:
+    """Write a fake finished job and return its file names relative to root."""
+    job_dir = os.path.join(root, "11111111-2222-3333-4444-555555555555")
+    os.makedirs(os.path.join(job_dir, "idle"), exist_ok=True)
+    names = []
+    for i in range(frames):
+        name = f"idle/frame_{i:02d}.png"
+        with open(os.path.join(job_dir, name), "wb") as f:
+            f.write(os.urandom(8 * 1024))
+        names.append(name)
+    for name, size in (("idle_sheet.png", 200 * 1024), ("idle.gif", 300 * 1024), ("combined_sheet.png", 600 * 1024)):
+        with open(os.path.join(job_dir, name), "wb") as f:
+            f.write(os.urandom(size))
+        names.append(name)
+    with open(os.path.join(job_dir, "metadata.json"), "w") as f:
+        f.write("{}")
+    names.append("metadata.json")
+    return [f"{os.path.basename(job_dir)}/{name}" for name in names]
+
+
+def make_app(root: str) -> Flask:
+    app = Flask(__name__)
+
+    @app.route("/legacy/<path:filename>")
+    def legacy(filename):
+        return send_from_directory(root, filename)
+
+    @app.route("/outputs/<path:filename>")
+    def current(filename):
+        return output_files.send_output(filename)
+
+    return app
+
+
+def rate(client, urls, headers_for, seconds: float) -> float:
+    """Requests per second cycling through urls for the given duration."""
+    count = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for url in urls:
+            resp = client.get(url, headers=headers_for(url))
+            resp.get_data()
+            resp.close()
+            count += 1
+    return count / (time.perf_counter() - start)
+
+
+def reload_requests(client, urls, prefix: str) -> int:
+    """Requests a browser still sends when reloading a page with cached files."""
+    sent = 0
+    for url in urls:
+        resp = client.get(prefix + url)
+        cache_control = resp.headers.get("Cache-Control", "")
+        resp.close()
+        if "immutable" not in cache_control:
+            sent += 1
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--seconds", type=float, default=2.0, help="duration of each measurement")
+    parser.add_argument("--frames", type=int, default=32, help="frame files in the fake job")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench_outputs_")
+    try:
+        names = make_job(root, args.frames)
+        output_files.OUTPUTS_DIR = root
+        client = make_app(root).test_client()
+
+        etags = {}
+        for prefix in ("/legacy/", "/outputs/"):
+            for name in names:
+                resp = client.get(prefix + name)
+                etags[prefix + name] = resp.headers["ETag"]
+                resp.close()
+
+        scenarios = [
+            ("full GET", lambda url: {}),
+            ("If-None-Match (304)", lambda url: {"If-None-Match": etags[url]}),
+            ("Range bytes=0-1023", lambda url: {"Range": "bytes=0-1023"}),
+        ]
+        print(f"{len(names)} files, {args.seconds:.0f}s per measurement\n")
+        print(f"{'scenario':<22}{'legacy req/s':>14}{'outputs req/s':>15}{'change':>9}")
+        for label, headers_for in scenarios:
+            legacy = rate(client, ["/legacy/" + n for n in names], headers_for, args.seconds)
+            current = rate(client, ["/outputs/" + n for n in names], headers_for, args.seconds)
+            print(f"{label:<22}{legacy:>14.0f}{current:>15.0f}{(current / legacy - 1) * 100:>+8.0f}%")
+
+        print(f"\nRequests on page reload with a warm browser cache:")
+        print(f"  legacy:  {reload_requests(client, names, '/legacy/')} of {len(names)}")
+        print(f"  outputs: {reload_requests(client, names, '/outputs/')} of {len(names)}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,367 @@
+"""
+Benchmark the sprite pipeline in mock mode on a corpus of real raw sheets.
+
+The fixture corpus is the raw sheets of past jobs (outputs/*/*_raw.png, or
+--corpus); each sheet's frame count comes from its job's metadata.json.
+Two sections run, each in a fresh interpreter so that peak RSS is its own:
+
+    stages  every stage on each fixture sheet: slicing, the background
+            removal variants (chroma key, simple, edge-based, and
+            remove_background as configured - rembg when installed),
+            resize to each preset canvas, frame encoding, sprite sheet,
+            GIF, combined sheet and metadata
+    jobs    process_sprite_job for every preset in mock mode, with fixture
+            sheets standing in for BRIA's responses
+
+Every measurement is the median of --repeat runs and is reported with its
+throughput and output bytes. Results are compared with a stored baseline
+(bench_pipeline_baseline.json, written by --save-baseline on the machine
+that runs the comparison). The exit status is 1 when a stage, a job or a
+section's peak RSS is more than --threshold over the baseline, and with
+--require-baseline (or BENCH_REQUIRE_BASELINE=1, for CI) also when there
+is no baseline to compare with.
+
+Usage:
+    python bench_pipeline.py [--repeat 3] [--sheets 4] [--presets anime_action,chibi]
+                             [--threshold 0.25] [--save-baseline] [--require-baseline]
+                             [--corpus 'outputs/*/*_raw.png']
+"""
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS = os.path.join(ROOT, "outputs", "*", "*_raw.png")
+BASELINE_PATH = os.path.join(ROOT, "bench_pipeline_baseline.json")
+SECTIONS = ("stages", "jobs")
+# Measurements faster than this are reported but never fail the run (timer noise)
+MIN_COMPARED_SECONDS = 0.005
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def load_corpus(pattern: str, count: int) -> list:
+    """(path, frame count) of up to count raw sheets, spread over the corpus."""
+    paths = sorted(glob.glob(pattern))
+    if count and len(paths) > count:
+        step = len(paths) / count
+        paths = [paths[int(i * step)] for i in range(count)]
+    corpus = []
+    for path in paths:
+        animation = os.path.basename(path)[:-len("_raw.png")]
+        frame_count = 6
+        try:
+            with open(os.path.join(os.path.dirname(path), "metadata.json")) as f:
+                frame_count = json.load(f)["animations"][animation]["frame_count"]
+        except (OSError, KeyError, ValueError):
+            pass
+        corpus.append((path, frame_count))
+    return corpus
+
+
+def dir_bytes(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(parent, name))
+        for parent, _, names in os.walk(path) for name in names
+    )
+
+
+class Recorder:
+    """Median seconds per measurement over repeats, with units and output bytes."""
+
+    def __init__(self):
+        self.samples = {}
+        self.info = {}
+
+    def add(self, name: str, seconds: float, units: int = None, unit: str = None, output_bytes: int = None):
+        self.samples.setdefault(name, []).append(seconds)
+        self.info[name] = {"units": units, "unit": unit, "bytes": output_bytes}
+
+    def results(self) -> dict:
+        results = {}
+        for name, samples in self.samples.items():
+            seconds = statistics.median(samples)
+            info = self.info[name]
+            results[name] = {"seconds": seconds, "bytes": info["bytes"]}
+            if info["units"]:
+                per_minute = info["unit"] == "jobs"
+                rate = info["units"] / seconds * (60 if per_minute else 1) if seconds else None
+                results[name]["throughput"] = rate
+                results[name]["throughput_unit"] = f"{info['unit']}/{'min' if per_minute else 's'}"
+        return results
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def run_stages(corpus: list, presets: list, repeat: int, work_dir: str) -> dict:
+    from PIL import Image
+    from services import sprite_service as sprites
+    from services.preset_loader import load_preset
+
+    variants = {
+        "chroma_key": sprites.remove_chroma_key,
+        "simple": sprites.remove_background_simple,
+        "edge_based": sprites.remove_background_edge_based,
+        "configured": sprites.remove_background,
+    }
+    canvases = sorted({tuple(load_preset(name).get("canvas", [128, 128])) for name in presets})
+    sprites.OUTPUTS_DIR = work_dir
+    recorder = Recorder()
+
+    for run in range(repeat):
+        job_id = f"stages-{run}"
+        job_dir = os.path.join(work_dir, job_id)
+        totals = {}
+        frame_dict, outputs = {}, {}
+
+        def add(name, seconds, units=None, unit=None, output_bytes=None):
+            entry = totals.setdefault(name, [0.0, 0, unit, None])
+            entry[0] += seconds
+            entry[1] += units or 0
+            if output_bytes is not None:
+                entry[3] = (entry[3] or 0) + output_bytes
+
+        for index, (path, frame_count) in enumerate(corpus):
+            animation = f"sheet{index:02d}"
+
+            def cut():
+                sheet = Image.open(path).convert("RGBA")
+                cols, rows = sprites.detect_grid_layout(sheet.width, sheet.height, frame_count)
+                w, h = sheet.width // cols, sheet.height // rows
+                return [sheet.crop((c * w, r * h, c * w + w, r * h + h)) for r in range(rows) for c in range(cols)]
+
+            crops, seconds = timed(cut)
+            add("stage/slice", seconds, len(crops), "frames")
+
+            cleaned = None
+            for variant, remove in variants.items():
+                frames, seconds = timed(lambda: [remove(frame.copy()) for frame in crops])
+                add(f"stage/background_removal[{variant}]", seconds, len(crops), "frames")
+                if variant == "configured":
+                    cleaned = frames
+
+            for w, h in canvases:
+                resized, seconds = timed(lambda: [sprites.fit_to_size_with_padding(f, w, h) for f in cleaned])
+                add(f"stage/resize[{w}x{h}]", seconds, len(cleaned), "frames")
+
+            frame_dir = os.path.join(job_dir, animation)
+            os.makedirs(frame_dir, exist_ok=True)
+            frame_paths = [os.path.join(frame_dir, f"frame_{i:02d}.png") for i in range(len(resized))]
+            _, seconds = timed(lambda: [frame.save(p) for frame, p in zip(resized, frame_paths)])
+            add("stage/encode_frames", seconds, len(frame_paths), "frames",
+                sum(os.path.getsize(p) for p in frame_paths))
+
+            sheet_path = os.path.join(job_dir, f"{animation}_sheet.png")
+            _, seconds = timed(sprites.make_sprite_sheet, frame_paths, sheet_path)
+            add("stage/sprite_sheet", seconds, len(frame_paths), "frames", os.path.getsize(sheet_path))
+
+            gif_path = os.path.join(job_dir, f"{animation}.gif")
+            _, seconds = timed(sprites.make_gif, frame_paths, gif_path)
+            add("stage/gif", seconds, len(frame_paths), "frames", os.path.getsize(gif_path))
+
+            frame_dict[animation] = frame_paths
+            outputs[animation] = {
+                "frames": frame_paths, "sprite_sheet": sheet_path,
+                "gif": gif_path, "frame_count": len(frame_paths)
+            }
+
+        combined, seconds = timed(sprites.create_combined_sheet, job_id, frame_dict)
+        add("stage/combined_sheet", seconds, sum(len(f) for f in frame_dict.values()), "frames",
+            os.path.getsize(combined))
+        metadata, seconds = timed(sprites.create_metadata, job_id, outputs, load_preset(presets[0]), "benchmark")
+        add("stage/metadata", seconds, None, None, os.path.getsize(metadata))
+
+        for name, (seconds, units, unit, output_bytes) in totals.items():
+            recorder.add(name, seconds, units, unit, output_bytes)
+        shutil.rmtree(job_dir, ignore_errors=True)
+    return recorder.results()
+
+
+def run_jobs(corpus: list, presets: list, repeat: int, work_dir: str) -> dict:
+    from services import metrics, sprite_service as sprites
+
+    def fixture_sheet(prompt, animation, frame_count, preset, out_path):
+        # Stand-in for BRIA: the same corpus sheet for the same animation every run
+        path, _ = corpus[sum(map(ord, animation)) % len(corpus)]
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        shutil.copyfile(path, out_path)
+        return out_path
+
+    sprites.USE_MOCK = True
+    sprites.generate_mock_spritesheet = fixture_sheet
+    sprites.OUTPUTS_DIR = work_dir
+    recorder = Recorder()
+    breakdown = {}
+    for name in presets:
+        for run in range(repeat):
+            job_id = f"job-{name}-{run}"
+            with metrics.track_job("generate") as timings:
+                result, seconds = timed(sprites.process_sprite_job, {"prompt": "benchmark knight", "preset": name}, job_id)
+            frames = sum(anim["frame_count"] for anim in result["animations"].values())
+            recorder.add(f"job/{name}", seconds, 1, "jobs", dir_bytes(os.path.join(work_dir, job_id)))
+            recorder.add(f"job/{name}/per_frame", seconds / frames, None)
+            breakdown[name] = timings.as_dict()
+            shutil.rmtree(os.path.join(work_dir, job_id), ignore_errors=True)
+    results = recorder.results()
+    for name, stages in breakdown.items():
+        results[f"job/{name}"]["stages"] = stages
+    return results
+
+
+def run_section(section: str, args) -> dict:
+    """Run one section in this process (called in a child interpreter)."""
+    from services import output_files
+
+    corpus = load_corpus(args.corpus, args.sheets)
+    if not corpus:
+        raise SystemExit(f"No raw sheets match {args.corpus}")
+    from services.preset_loader import get_all_presets
+    presets = args.presets.split(",") if args.presets else sorted(get_all_presets())
+
+    work_dir = tempfile.mkdtemp(prefix=f"bench_pipeline_{section}_")
+    output_files.OUTPUTS_DIR = work_dir
+    try:
+        runner = run_stages if section == "stages" else run_jobs
+        results = runner(corpus, presets, args.repeat, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {"results": results, "peak_rss_mb": peak_rss_mb(), "sheets": len(corpus), "presets": presets}
+
+
+def spawn_section(section: str, args) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), "--section", section,
+               "--repeat", str(args.repeat), "--sheets", str(args.sheets), "--corpus", args.corpus]
+    if args.presets:
+        command += ["--presets", args.presets]
+    # Mock mode, no warm-up and no artifact store uploads, whatever .env says
+    env = {**os.environ, "BRIA_API_KEY": "", "WARMUP": "false", "ARTIFACT_STORE": ""}
+    proc = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{section} section failed:\n{proc.stderr[-3000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Print the results next to the baseline; returns the regressions."""
+    failures = []
+    base_results = baseline.get("results", {})
+    print(f"{'measurement':<44}{'seconds':>10}{'throughput':>18}{'output':>10}{'baseline':>10}{'change':>9}")
+    for name, result in current["results"].items():
+        throughput = ""
+        if result.get("throughput"):
+            throughput = f"{result['throughput']:.1f} {result['throughput_unit']}"
+        output = f"{result['bytes'] / 1024:.0f} KB" if result.get("bytes") else ""
+        base = base_results.get(name)
+        line = f"{name:<44}{result['seconds']:>10.4f}{throughput:>18}{output:>10}"
+        if base:
+            change = result["seconds"] / base["seconds"] - 1 if base["seconds"] else 0.0
+            flag = ""
+            if change > threshold and base["seconds"] >= MIN_COMPARED_SECONDS:
+                flag = "  SLOWER"
+                failures.append(f"{name}: {result['seconds']:.4f}s vs {base['seconds']:.4f}s ({change:+.0%})")
+            line += f"{base['seconds']:>10.4f}{change:>+8.0%}{flag}"
+        print(line)
+        if result.get("stages"):
+            print(" " * 4 + ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in result["stages"].items()))
+
+    for section, rss in current["peak_rss_mb"].items():
+        base = baseline.get("peak_rss_mb", {}).get(section)
+        line = f"peak RSS ({section}): {rss:.0f} MB" if rss is not None else f"peak RSS ({section}): n/a"
+        if base and rss is not None:
+            change = rss / base - 1
+            line += f" (baseline {base:.0f} MB, {change:+.0%})"
+            if change > threshold:
+                failures.append(f"peak RSS of {section}: {rss:.0f} MB vs {base:.0f} MB ({change:+.0%})")
+        print(line)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement (median is used)")
+    parser.add_argument("--sheets", type=int, default=4, help="fixture sheets to use (0 = all)")
+    parser.add_argument("--presets", default="", help="comma-separated presets (default: all)")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="glob of raw sheets")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("BENCH_THRESHOLD", "0.25")),
+                        help="allowed slowdown over the baseline (env BENCH_THRESHOLD)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--require-baseline", action="store_true",
+                        default=os.getenv("BENCH_REQUIRE_BASELINE", "").lower() in ("1", "true", "yes"),
+                        help="fail when there is no baseline (env BENCH_REQUIRE_BASELINE)")
+    parser.add_argument("--only", choices=SECTIONS, help="run one section")
+    parser.add_argument("--section", choices=SECTIONS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.section:
+        print(json.dumps(run_section(args.section, args)))
+        return 0
+    if args.require_baseline and not args.save_baseline and not os.path.exists(args.baseline):
+        print(f"FAIL: no baseline at {args.baseline}; run with --save-baseline on this machine first")
+        return 1
+
+    current = {
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "machine": f"{platform.machine()} {os.cpu_count()} cpus",
+        "results": {},
+        "peak_rss_mb": {}
+    }
+    for section in ([args.only] if args.only else SECTIONS):
+        print(f"Running {section} section ...", flush=True)
+        output = spawn_section(section, args)
+        current["results"].update(output["results"])
+        current["peak_rss_mb"][section] = output["peak_rss_mb"]
+        current["sheets"], current["presets"] = output["sheets"], output["presets"]
+    print(f"\n{current['sheets']} fixture sheets, {args.repeat} runs per measurement, "
+          f"presets: {', '.join(current['presets'])}\n")
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failures = compare(current, baseline, args.threshold)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+    if not baseline:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to store one")
+        return 0
+    if failures:
+        print(f"\nFAIL: more than {args.threshold:.0%} over the baseline "
+              f"({baseline.get('machine')}, Python {baseline.get('python')}):")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("\nOK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
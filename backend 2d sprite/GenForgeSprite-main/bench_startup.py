@@ -0,0 +1,89 @@
+"""
+Import-time budget for the sprite API.
+
+Imports app.py in fresh interpreters, as a Gunicorn worker does when it
+boots, and reports the median import time and the slowest modules
+(python -X importtime). Exits with status 1 when the median is over the
+budget, or when a module that must only be loaded lazily (rembg,
+onnxruntime) was imported at startup. Run it in CI or before deploying.
+
+Usage:
+    python bench_startup.py [--runs 5] [--budget-ms 1500] [--top 10]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# Heavy optional dependencies that must not be imported by "import app"
+LAZY_MODULES = ("rembg", "onnxruntime", "numba", "scipy")
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+
+def run_once() -> tuple:
+    """(import seconds, lazy modules that were loaded, {module: self microseconds})."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={**os.environ, "WARMUP": "false"},
+        capture_output=True, text=True, timeout=120
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import app failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(self_us)
+    return result["seconds"], result["loaded"], modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to measure")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "1500")),
+                        help="maximum median import time of app.py (env STARTUP_BUDGET_MS)")
+    parser.add_argument("--top", type=int, default=10, help="slowest modules to list")
+    args = parser.parse_args()
+
+    times, loaded, slowest = [], set(), {}
+    for _ in range(args.runs):
+        seconds, lazy_loaded, modules = run_once()
+        times.append(seconds * 1000)
+        loaded.update(lazy_loaded)
+        for name, self_us in modules.items():
+            slowest.setdefault(name, []).append(self_us)
+
+    median = statistics.median(times)
+    print(f"import app: median {median:.0f} ms, min {min(times):.0f} ms, max {max(times):.0f} ms "
+          f"over {args.runs} runs (budget {args.budget_ms:.0f} ms)\n")
+    print(f"Slowest modules (median self time):")
+    ranked = sorted(slowest.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for name, samples in ranked[:args.top]:
+        print(f"  {statistics.median(samples) / 1000:>7.1f} ms  {name}")
+
+    failed = False
+    if loaded:
+        print(f"\nFAIL: imported at startup, should be lazy: {', '.join(sorted(loaded))}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"\nFAIL: median import time {median:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if not failed:
+        print("\nOK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
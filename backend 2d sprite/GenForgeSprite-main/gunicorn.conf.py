@@ -0,0 +1,39 @@
+"""
+Gunicorn configuration - threaded (gthread) workers.
+
+Sprite jobs spend nearly all of their time waiting on BRIA, and each SSE
+event stream (/api/sprite/events/<id>) holds a connection open for as long as
+its job runs. With sync workers every open stream or slow request pins a
+whole process. gthread workers serve requests on a pool of threads, so
+one process keeps many streams, polls and downloads going while its job
+queue threads run the jobs themselves (JOB_WORKERS per process).
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Settings (environment):
+    PORT               listen port (default 5000)
+    WEB_CONCURRENCY    worker processes (default 2)
+    GUNICORN_THREADS   request threads per process (default 16)
+    GUNICORN_TIMEOUT   worker heartbeat timeout in seconds (default 120)
+    WARMUP             load rembg etc. in the background once a worker is
+                       up (default true; see sprite_service.start_warmup)
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# The job queue workers and the retention sweeper are threads started when
+# app.py is imported; they must be started in each worker, not in the master
+preload_app = False
+
+
+def post_worker_init(worker):
+    # The worker serves requests right away; heavy imports finish behind it
+    from services.sprite_service import start_warmup
+    start_warmup()
@@ -0,0 +1,688 @@
+"""
+Load test - Concurrent users against the sprite API and the 3D API.
+
+Each simulated user loops until the test ends: it picks an operation from
+the request mix, sends it, and waits an exponentially distributed think
+time. Operations:
+
+    generate      POST /api/sprite/generate (a few animations of a preset)
+    refine        POST /api/sprite/refine of a finished sprite job
+    status        GET  /api/sprite/status/<job> (prefers unfinished jobs)
+    download      GET  an /outputs URL of a finished sprite job
+    3d_generate   POST /3d/generate-full-pipeline
+    3d_status     GET  /3d/status/<job>
+    3d_download   GET  /3d/models/<job>.glb of a finished 3D job
+
+Operations that need a job (refine, status, downloads) are skipped until
+one exists. Upstream calls are never real: run both services against
+mock_upstream.py, or let --launch start the mock and both services with
+their state in a temporary directory.
+
+The report lists p50/p95/p99 latency, throughput and errors per operation,
+end-to-end job times, and worker saturation:
+
+    probe       latency of a cheap endpoint (/health, 3D /) sampled once a
+                second; it grows when every request thread is busy. The 3D
+                / route runs in the same threadpool as the pipeline's
+                background tasks, so it also shows that pool filling up.
+    busy        request concurrency by Little's law (throughput x mean
+                latency), against workers x threads when known
+    job queue   queued and running sprite jobs from /metrics, against
+                WEB_CONCURRENCY x JOB_WORKERS when known (a bulk job that
+                yielded to a refinement still counts as running)
+    upstream    in-flight and waiting BRIA / Tripo calls of the host-wide
+                limiter (3D /upstream, or /api/sprite/upstream)
+
+Usage:
+    python mock_upstream.py --port 8090 &
+    BRIA_API_KEY=mock BRIA_BASE_URL=http://localhost:8090 gunicorn -c gunicorn.conf.py app:app &
+    python loadtest.py --sprite-url http://localhost:5000 --mix generate=1,status=10,download=5
+
+    # Start the mock and both services, 2 sprite workers with 1 thread each
+    python loadtest.py --launch --users 30 --duration 120 --sprite-workers 2 --sprite-threads 1
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import shlex
+import random
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+THREED_DIR = os.path.join(ROOT, "..", "..", "3d backend")
+
+SPRITE_OPS = ("generate", "refine", "status", "download")
+THREED_OPS = ("3d_generate", "3d_status", "3d_download")
+DEFAULT_MIX = "generate=1,refine=0.5,status=10,download=4,3d_generate=0.5,3d_status=5,3d_download=1"
+
+PROMPTS = (
+    "ninja warrior with katana", "space marine in heavy armor", "forest elf archer",
+    "robot knight with laser sword", "pirate captain with a hook", "fire mage in red robes",
+    "cyberpunk hacker with goggles", "viking berserker with two axes"
+)
+REFINEMENTS = (
+    "make the poses more dynamic", "face more to the right", "brighter colors",
+    "thicker outlines", "more exaggerated motion"
+)
+FINISHED = ("completed", "failed")
+# Jobs tracked per service (the oldest finished ones are dropped)
+MAX_TRACKED_JOBS = 500
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parse "generate=1,status=10" into operation weights."""
+    mix = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        op, _, weight = item.partition("=")
+        op = op.strip()
+        if op not in SPRITE_OPS + THREED_OPS:
+            raise ValueError(f"Unknown operation '{op}' (choose from {', '.join(SPRITE_OPS + THREED_OPS)})")
+        mix[op] = float(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("The request mix has no operation with a positive weight")
+    return {op: weight for op, weight in mix.items() if weight > 0}
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile (None for no values)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(-(-pct * len(ordered) // 100)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class Recorder:
+    """Request, job and probe samples from all user threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[str, List[Tuple[float, float, int, bool, int]]] = {}
+        self.skipped: Dict[str, int] = {}
+        self.jobs: Dict[str, List[Tuple[str, float]]] = {}
+        self.probes: Dict[str, List[Tuple[float, Optional[float]]]] = {}
+        self.gauges: Dict[str, List[Tuple[float, float]]] = {}
+
+    def request(self, op: str, started: float, seconds: float, status: int, ok: bool, size: int = 0):
+        with self._lock:
+            self.requests.setdefault(op, []).append((started, seconds, status, ok, size))
+
+    def skip(self, op: str):
+        with self._lock:
+            self.skipped[op] = self.skipped.get(op, 0) + 1
+
+    def job(self, service: str, status: str, seconds: float):
+        with self._lock:
+            self.jobs.setdefault(service, []).append((status, seconds))
+
+    def probe(self, name: str, seconds: Optional[float]):
+        with self._lock:
+            self.probes.setdefault(name, []).append((time.time(), seconds))
+
+    def gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges.setdefault(name, []).append((time.time(), value))
+
+
+class JobPool:
+    """Jobs submitted during the test, shared by all users of one service."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.finished: Dict[str, Dict[str, Any]] = {}
+        self.downloads: List[str] = []
+
+    def add(self, job_id: str, **info):
+        with self._lock:
+            self.pending[job_id] = {"submitted": time.time(), **info}
+
+    def pick_status(self) -> Optional[str]:
+        """An unfinished job, or a finished one when none is running."""
+        with self._lock:
+            pool = self.pending or self.finished
+            return random.choice(list(pool)) if pool else None
+
+    def pick_finished(self) -> Optional[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            done = [(job_id, info) for job_id, info in self.finished.items() if info.get("ok")]
+            return random.choice(done) if done else None
+
+    def pick_download(self) -> Optional[str]:
+        with self._lock:
+            return random.choice(self.downloads) if self.downloads else None
+
+    def finish(self, job_id: str, ok: bool, urls: List[str], **info) -> Optional[Dict[str, Any]]:
+        """Move a job to finished; returns its info the first time only."""
+        with self._lock:
+            job = self.pending.pop(job_id, None)
+            if job is None:
+                return None
+            self.finished[job_id] = {**job, **info, "ok": ok}
+            self.downloads.extend(urls)
+            while len(self.finished) > MAX_TRACKED_JOBS:
+                del self.finished[next(iter(self.finished))]
+            del self.downloads[:-MAX_TRACKED_JOBS * 8]
+            return job
+
+
+class LoadTest:
+    def __init__(self, args, mix: Dict[str, float]):
+        self.args = args
+        self.mix = mix
+        self.sprite_url = args.sprite_url.rstrip("/")
+        self.threed_url = args.threed_url.rstrip("/")
+        self.recorder = Recorder()
+        self.sprite_jobs = JobPool()
+        self.threed_jobs = JobPool()
+        self.stop = threading.Event()
+        self.animations = ["idle"]
+        self._ops = list(mix)
+        self._weights = [mix[op] for op in self._ops]
+
+    # --- requests ---------------------------------------------------------------
+
+    def _send(self, session: requests.Session, op: str, method: str, url: str,
+              ok_statuses=(200,), **kwargs) -> Optional[requests.Response]:
+        """Send one request and record it; the response is None after an exception."""
+        started = time.time()
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=self.args.timeout, **kwargs)
+            size = len(response.content)
+        except requests.RequestException:
+            self.recorder.request(op, started, time.perf_counter() - start, 0, False)
+            return None
+        seconds = time.perf_counter() - start
+        self.recorder.request(op, started, seconds, response.status_code,
+                              response.status_code in ok_statuses, size)
+        return response
+
+    def _prompt(self) -> str:
+        prompt = random.choice(PROMPTS)
+        if self.args.prompts:
+            return f"{prompt} #{random.randrange(self.args.prompts)}"
+        # Unique prompts so the generation cache does not hide the upstream
+        return f"{prompt} {uuid.uuid4().hex[:8]}"
+
+    def op_generate(self, session: requests.Session) -> bool:
+        animations = random.sample(self.animations, min(self.args.animations, len(self.animations)))
+        body = {"prompt": self._prompt(), "preset": self.args.preset, "animations": animations}
+        response = self._send(session, "generate", "POST", f"{self.sprite_url}/api/sprite/generate",
+                              ok_statuses=(202,), json=body)
+        if response is not None and response.status_code == 202:
+            self.sprite_jobs.add(response.json()["job_id"], prompt=body["prompt"], animations=animations)
+        return True
+
+    def op_refine(self, session: requests.Session) -> bool:
+        picked = self.sprite_jobs.pick_finished()
+        if picked is None or not picked[1].get("animations"):
+            return False
+        job_id, info = picked
+        body = {
+            "job_id": job_id, "animation": random.choice(info["animations"]),
+            "prompt": info["prompt"], "preset": self.args.preset,
+            "refinement": random.choice(REFINEMENTS)
+        }
+        response = self._send(session, "refine", "POST", f"{self.sprite_url}/api/sprite/refine",
+                              ok_statuses=(200, 202), json=body)
+        if response is not None and response.status_code == 202:
+            # Still running after REFINE_WAIT_SECONDS: poll it like a generate job
+            self.sprite_jobs.add(response.json()["job_id"], prompt=info["prompt"], animations=[])
+        return True
+
+    def op_status(self, session: requests.Session) -> bool:
+        job_id = self.sprite_jobs.pick_status()
+        if job_id is None:
+            return False
+        response = self._send(session, "status", "GET", f"{self.sprite_url}/api/sprite/status/{job_id}")
+        if response is None or response.status_code != 200:
+            return True
+        status = response.json()
+        if status.get("status") in FINISHED:
+            result = status.get("result") or {}
+            urls = [url for url in (result.get("download_urls") or {}).values()
+                    if url.startswith("/outputs/") and not url.endswith(".zip")]
+            ok = status["status"] == "completed"
+            job = self.sprite_jobs.finish(job_id, ok, urls)
+            if job is not None:
+                # Queued -> finished as recorded by the job store (no polling delay)
+                seconds = (status.get("finished_at") or time.time()) - (status.get("created_at") or job["submitted"])
+                self.recorder.job("sprite", status["status"], seconds)
+        return True
+
+    def op_download(self, session: requests.Session) -> bool:
+        url = self.sprite_jobs.pick_download()
+        if url is None:
+            return False
+        self._send(session, "download", "GET", f"{self.sprite_url}{url}")
+        return True
+
+    def op_3d_generate(self, session: requests.Session) -> bool:
+        response = self._send(session, "3d_generate", "POST", f"{self.threed_url}/3d/generate-full-pipeline",
+                              json={"prompt": self._prompt()})
+        if response is not None and response.status_code == 200:
+            self.threed_jobs.add(response.json()["job_id"])
+        return True
+
+    def op_3d_status(self, session: requests.Session) -> bool:
+        job_id = self.threed_jobs.pick_status()
+        if job_id is None:
+            return False
+        response = self._send(session, "3d_status", "GET", f"{self.threed_url}/3d/status/{job_id}")
+        if response is None or response.status_code != 200:
+            return True
+        status = response.json()
+        if status.get("status") in FINISHED:
+            model_url = status.get("model_url") or ""
+            urls = [model_url] if model_url.startswith("/3d/models/") else []
+            job = self.threed_jobs.finish(job_id, status["status"] == "completed", urls)
+            if job is not None:
+                # Submit -> first poll that saw it finished
+                self.recorder.job("3d", status["status"], time.time() - job["submitted"])
+        return True
+
+    def op_3d_download(self, session: requests.Session) -> bool:
+        url = self.threed_jobs.pick_download()
+        if url is None:
+            return False
+        self._send(session, "3d_download", "GET", f"{self.threed_url}{url}")
+        return True
+
+    # --- users and probes -------------------------------------------------------
+
+    def _think(self):
+        if self.args.think > 0:
+            self.stop.wait(random.expovariate(1 / self.args.think))
+
+    def user(self, delay: float):
+        if self.stop.wait(delay):
+            return
+        session = requests.Session()
+        while not self.stop.is_set():
+            op = random.choices(self._ops, self._weights)[0]
+            try:
+                if not getattr(self, f"op_{op}")(session):
+                    self.recorder.skip(op)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                pass  # unexpected response body; the request itself was recorded
+            self._think()
+
+    def _sample_sprite_metrics(self, session: requests.Session):
+        response = session.get(f"{self.sprite_url}/metrics", timeout=10)
+        queued = running = 0.0
+        for line in response.text.splitlines():
+            match = re.match(r'sprite_queue_jobs\{status="(\w+)"\} (\S+)', line)
+            if match and match.group(1) == "queued":
+                queued = float(match.group(2))
+            elif match and match.group(1) == "running":
+                running = float(match.group(2))
+        self.recorder.gauge("sprite_jobs_queued", queued)
+        self.recorder.gauge("sprite_jobs_running", running)
+
+    def _sample_upstream(self, session: requests.Session):
+        if "3d" in self.services():
+            stats = session.get(f"{self.threed_url}/upstream", timeout=10).json()
+            limiters = {"bria": stats["bria"], "tripo": stats["tripo"]}
+        else:
+            limiters = {"bria": session.get(f"{self.sprite_url}/api/sprite/upstream", timeout=10).json()["bria"]}
+        for name, limiter in limiters.items():
+            self.recorder.gauge(f"{name}_in_flight", limiter.get("in_flight", 0))
+            self.recorder.gauge(f"{name}_waiting", limiter.get("waiting", 0))
+
+    def prober(self):
+        """Sample probe latency and queue / upstream gauges once per --probe-interval."""
+        session = requests.Session()
+        probes, samplers = [], [self._sample_upstream]
+        if "sprite" in self.services():
+            probes.append(("sprite", f"{self.sprite_url}/health"))
+            samplers.append(self._sample_sprite_metrics)
+        if "3d" in self.services():
+            probes.append(("3d", f"{self.threed_url}/"))
+        while not self.stop.wait(self.args.probe_interval):
+            for name, url in probes:
+                start = time.perf_counter()
+                try:
+                    ok = session.get(url, timeout=self.args.timeout).status_code == 200
+                except requests.RequestException:
+                    ok = False
+                self.recorder.probe(name, time.perf_counter() - start if ok else None)
+            for sample in samplers:
+                try:
+                    sample(session)
+                except (requests.RequestException, ValueError, KeyError):
+                    pass
+
+    def services(self) -> List[str]:
+        services = []
+        if any(op in SPRITE_OPS for op in self.mix):
+            services.append("sprite")
+        if any(op in THREED_OPS for op in self.mix):
+            services.append("3d")
+        return services
+
+    def load_animations(self):
+        """Animations of --preset, sampled by generate requests."""
+        try:
+            response = requests.get(f"{self.sprite_url}/api/sprite/presets/{self.args.preset}", timeout=10)
+            self.animations = list(response.json()["animations"]) or self.animations
+        except (requests.RequestException, ValueError, KeyError, TypeError):
+            print(f"Could not load preset '{self.args.preset}', generating {self.animations} only")
+
+    def run(self) -> float:
+        """Run the users for --duration seconds; returns the measured seconds."""
+        if "sprite" in self.services():
+            self.load_animations()
+        users = [
+            threading.Thread(target=self.user, args=(self.args.ramp * i / self.args.users,), daemon=True)
+            for i in range(self.args.users)
+        ]
+        threads = users + [threading.Thread(target=self.prober, daemon=True)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        try:
+            self.stop.wait(self.args.duration)
+        except KeyboardInterrupt:
+            print("Interrupted, reporting what was measured so far")
+        self.stop.set()
+        elapsed = time.time() - start
+        for thread in threads:
+            thread.join(self.args.timeout + 5)
+        return elapsed
+
+
+# --- report ---------------------------------------------------------------------
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def summarize(test: LoadTest, elapsed: float, capacity: Dict[str, Optional[int]]) -> Dict[str, Any]:
+    recorder = test.recorder
+    report: Dict[str, Any] = {
+        "duration_seconds": round(elapsed, 1), "users": test.args.users, "mix": test.mix,
+        "operations": {}, "services": {}, "jobs": {}, "saturation": {}
+    }
+    for op in SPRITE_OPS + THREED_OPS:
+        samples = recorder.requests.get(op, [])
+        if not samples and op not in recorder.skipped:
+            continue
+        latencies = [seconds for _, seconds, _, _, _ in samples]
+        errors: Dict[str, int] = {}
+        for _, _, status, ok, _ in samples:
+            if not ok:
+                key = str(status) if status else "exception"
+                errors[key] = errors.get(key, 0) + 1
+        report["operations"][op] = {
+            "requests": len(samples),
+            "skipped": recorder.skipped.get(op, 0),
+            "rps": round(len(samples) / elapsed, 2),
+            "errors": sum(errors.values()),
+            "error_rate": round(sum(errors.values()) / len(samples), 4) if samples else 0.0,
+            "errors_by_status": errors,
+            "p50_ms": _ms(percentile(latencies, 50)),
+            "p95_ms": _ms(percentile(latencies, 95)),
+            "p99_ms": _ms(percentile(latencies, 99)),
+            "max_ms": _ms(max(latencies, default=None)),
+            "mb": round(sum(size for *_, size in samples) / 2**20, 2)
+        }
+
+    for service, ops in (("sprite", SPRITE_OPS), ("3d", THREED_OPS)):
+        samples = [sample for op in ops for sample in recorder.requests.get(op, [])]
+        if not samples:
+            continue
+        latencies = [seconds for _, seconds, _, _, _ in samples]
+        # Little's law: requests being served at once, on average
+        busy = len(samples) / elapsed * (sum(latencies) / len(latencies))
+        probes = [seconds for _, seconds in recorder.probes.get(service, [])]
+        answered = [seconds for seconds in probes if seconds is not None]
+        report["services"][service] = {
+            "requests": len(samples),
+            "rps": round(len(samples) / elapsed, 2),
+            "error_rate": round(sum(1 for sample in samples if not sample[3]) / len(samples), 4),
+            "p50_ms": _ms(percentile(latencies, 50)),
+            "p95_ms": _ms(percentile(latencies, 95)),
+            "p99_ms": _ms(percentile(latencies, 99)),
+            "busy_requests": round(busy, 2),
+            "request_capacity": capacity.get(f"{service}_requests"),
+            "probe_p50_ms": _ms(percentile(answered, 50)),
+            "probe_p99_ms": _ms(percentile(answered, 99)),
+            "probe_failures": len(probes) - len(answered)
+        }
+
+    for service, jobs in recorder.jobs.items():
+        seconds = [s for status, s in jobs if status == "completed"]
+        pool = test.sprite_jobs if service == "sprite" else test.threed_jobs
+        report["jobs"][service] = {
+            "completed": len(seconds),
+            "failed": sum(1 for status, _ in jobs if status == "failed"),
+            "unfinished": len(pool.pending),
+            "per_minute": round(len(seconds) / elapsed * 60, 2),
+            "p50_s": None if not seconds else round(percentile(seconds, 50), 2),
+            "p95_s": None if not seconds else round(percentile(seconds, 95), 2),
+            "max_s": None if not seconds else round(max(seconds), 2)
+        }
+
+    for name, samples in sorted(recorder.gauges.items()):
+        values = [value for _, value in samples]
+        report["saturation"][name] = {"mean": round(sum(values) / len(values), 2), "max": max(values)}
+    if "sprite_jobs_running" in report["saturation"] and capacity.get("sprite_jobs"):
+        report["saturation"]["sprite_jobs_running"]["capacity"] = capacity["sprite_jobs"]
+    return report
+
+
+def _cell(value) -> str:
+    return "-" if value is None else str(value)
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n{report['users']} users for {report['duration_seconds']}s, mix "
+          + ",".join(f"{op}={weight:g}" for op, weight in report["mix"].items()))
+
+    print(f"\n{'operation':<13}{'requests':>9}{'skipped':>9}{'rps':>8}{'errors':>8}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'MB':>8}")
+    for op, row in report["operations"].items():
+        print(f"{op:<13}{row['requests']:>9}{row['skipped']:>9}{row['rps']:>8}"
+              f"{row['error_rate'] * 100:>7.1f}%{_cell(row['p50_ms']):>9}{_cell(row['p95_ms']):>9}"
+              f"{_cell(row['p99_ms']):>9}{_cell(row['max_ms']):>9}{row['mb']:>8}")
+        if row["errors_by_status"]:
+            print(f"{'':<13}errors: " + ", ".join(f"{n}x {status}" for status, n in row["errors_by_status"].items()))
+
+    print("\nServices:")
+    for service, row in report["services"].items():
+        capacity = f" of {row['request_capacity']}" if row["request_capacity"] else ""
+        print(f"  {service:<7}{row['rps']} req/s, {row['error_rate'] * 100:.1f}% errors, "
+              f"p50/p95/p99 {row['p50_ms']}/{row['p95_ms']}/{row['p99_ms']} ms, "
+              f"busy {row['busy_requests']}{capacity} request slots, "
+              f"probe p50/p99 {row['probe_p50_ms']}/{row['probe_p99_ms']} ms"
+              + (f", {row['probe_failures']} probes failed" if row["probe_failures"] else ""))
+
+    if report["jobs"]:
+        print("\nJobs (sprite: queued -> finished in the job store; 3d: submit -> first finished poll):")
+        for service, row in report["jobs"].items():
+            print(f"  {service:<7}{row['completed']} completed, {row['failed']} failed, "
+                  f"{row['unfinished']} unfinished, {row['per_minute']}/min, "
+                  f"p50 {_cell(row['p50_s'])}s, p95 {_cell(row['p95_s'])}s, max {_cell(row['max_s'])}s")
+
+    if report["saturation"]:
+        print("\nSaturation (sampled):")
+        for name, row in report["saturation"].items():
+            capacity = f" of {row['capacity']}" if row.get("capacity") else ""
+            print(f"  {name:<22}mean {row['mean']}, max {row['max']:g}{capacity}")
+
+
+# --- --launch -------------------------------------------------------------------
+
+def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url}: process exited with status {proc.returncode}")
+        try:
+            if requests.get(url, timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+def launch(args, services: List[str], workdir: str) -> List[subprocess.Popen]:
+    """Start the mock upstream and the services under test, with state in workdir."""
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    procs = []
+
+    def start(name: str, cmd: List[str], env: Dict[str, str], cwd: str) -> subprocess.Popen:
+        log = open(os.path.join(workdir, f"{name}.log"), "w")
+        proc = subprocess.Popen(cmd, cwd=cwd, env={**os.environ, **env, **extra_env},
+                                stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+        procs.append(proc)
+        return proc
+
+    mock = start("mock_upstream", [sys.executable, os.path.join(ROOT, "mock_upstream.py"),
+                                   "--port", str(args.mock_port)] + shlex.split(args.mock_args), {}, ROOT)
+    _wait_ready(f"{mock_url}/mock/stats", mock)
+
+    upstream = {
+        "BRIA_API_KEY": "mock", "BRIA_BASE_URL": mock_url,
+        "TRIPO_API_KEY": "mock", "TRIPO_BASE_URL": mock_url,
+        # A limiter of its own, so a real deployment on this host is not throttled
+        "UPSTREAM_LIMITER_DB": os.path.join(workdir, "upstream.sqlite"),
+        "ARTIFACT_STORE": ""
+    }
+    if "sprite" in services:
+        state = os.path.join(workdir, "sprite")
+        sprite = start("sprite", ["gunicorn", "-c", "gunicorn.conf.py", "app:app"], {
+            **upstream,
+            "PORT": str(args.sprite_port),
+            "WEB_CONCURRENCY": str(args.sprite_workers),
+            "GUNICORN_THREADS": str(args.sprite_threads),
+            "JOB_WORKERS": str(args.job_workers),
+            "OUTPUTS_DIR": os.path.join(state, "outputs"),
+            "JOB_STORE_DB": os.path.join(state, "jobs.sqlite"),
+            "GENERATION_CACHE_DIR": os.path.join(state, "cache", "generations"),
+            "SINGLE_FLIGHT_DIR": os.path.join(state, "cache", "locks"),
+            "RETENTION_LOCK": os.path.join(state, "cache", "locks", "retention.lock")
+        }, ROOT)
+        _wait_ready(f"{args.sprite_url}/health", sprite)
+    if "3d" in services:
+        state = os.path.join(workdir, "3d")
+        os.makedirs(state)
+        threed = start("3d", [
+            "gunicorn", "app.main:app", "-k", "uvicorn.workers.UvicornWorker",
+            "--bind", f"127.0.0.1:{args.threed_port}", "--workers", str(args.threed_workers),
+            "--timeout", "300", "--pythonpath", os.path.abspath(THREED_DIR)
+        ], upstream, state)
+        _wait_ready(f"{args.threed_url}/", threed)
+    return procs
+
+
+def stop_all(procs: List[subprocess.Popen]):
+    for proc in reversed(procs):
+        if proc.poll() is None:
+            os.killpg(proc.pid, signal.SIGTERM)
+    for proc in procs:
+        try:
+            proc.wait(30)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sprite-url", default=None, help="sprite API (default http://127.0.0.1:5000)")
+    parser.add_argument("--3d-url", dest="threed_url", default=None, help="3D API (default http://127.0.0.1:8000)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation weights, e.g. generate=1,status=10")
+    parser.add_argument("--users", type=int, default=20, help="concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to run (ramp-up included)")
+    parser.add_argument("--ramp", type=float, default=10, help="seconds over which users start")
+    parser.add_argument("--think", type=float, default=1.0, help="mean think time between a user's requests")
+    parser.add_argument("--timeout", type=float, default=60, help="per-request timeout in seconds")
+    parser.add_argument("--preset", default="anime_action", help="preset of generate requests")
+    parser.add_argument("--animations", type=int, default=2, help="animations per generate request")
+    parser.add_argument("--prompts", type=int, default=0,
+                        help="distinct prompts to draw from (0 = unique, so the generation cache never hits)")
+    parser.add_argument("--probe-interval", type=float, default=1.0, help="seconds between saturation samples")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for the request mix")
+    parser.add_argument("--json", default=None, help="also write the report to this file")
+    parser.add_argument("--launch", action="store_true",
+                        help="start mock_upstream.py and the services under test in a temporary directory")
+    parser.add_argument("--mock-port", type=int, default=8090)
+    parser.add_argument("--mock-args", default="", help="extra mock_upstream.py options, e.g. \"--error-rate 0.05\"")
+    parser.add_argument("--sprite-port", type=int, default=5077)
+    parser.add_argument("--sprite-workers", type=int, default=2, help="WEB_CONCURRENCY of the sprite service")
+    parser.add_argument("--sprite-threads", type=int, default=16,
+                        help="GUNICORN_THREADS of the sprite service (1 behaves like sync workers)")
+    parser.add_argument("--job-workers", type=int, default=2, help="JOB_WORKERS per sprite worker")
+    parser.add_argument("--3d-port", dest="threed_port", type=int, default=8077)
+    parser.add_argument("--3d-workers", dest="threed_workers", type=int, default=2,
+                        help="Uvicorn workers of the 3D service")
+    parser.add_argument("--env", action="append", default=[],
+                        help="KEY=VALUE for the launched services (repeatable), e.g. TRIPO_RATE_LIMIT_RPM=600")
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.seed is not None:
+        random.seed(args.seed)
+    default_sprite = f"http://127.0.0.1:{args.sprite_port if args.launch else 5000}"
+    default_threed = f"http://127.0.0.1:{args.threed_port if args.launch else 8000}"
+    args.sprite_url = args.sprite_url or default_sprite
+    args.threed_url = args.threed_url or default_threed
+
+    test = LoadTest(args, mix)
+    services = test.services()
+    capacity: Dict[str, Optional[int]] = {}
+    procs: List[subprocess.Popen] = []
+    workdir = None
+    if args.launch:
+        workdir = tempfile.mkdtemp(prefix="genforge-loadtest-")
+        capacity = {
+            "sprite_requests": args.sprite_workers * args.sprite_threads,
+            "sprite_jobs": args.sprite_workers * args.job_workers,
+            # Sync routes and background tasks share AnyIO's 40-thread pool per worker
+            "3d_requests": args.threed_workers * 40
+        }
+        print(f"Launching {', '.join(['mock upstream'] + services)} (logs and state in {workdir})")
+        try:
+            procs = launch(args, services, workdir)
+        except Exception as e:
+            stop_all(procs)
+            print(f"Launch failed: {e}")
+            return 1
+
+    try:
+        print(f"Running {args.users} users for {args.duration:.0f}s against {', '.join(services)}")
+        elapsed = test.run()
+    finally:
+        stop_all(procs)
+
+    report = summarize(test, elapsed, capacity)
+    print_report(report)
+    if workdir:
+        print(f"\nService logs: {workdir}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
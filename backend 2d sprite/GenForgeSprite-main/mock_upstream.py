@@ -0,0 +1,413 @@
+"""
+Mock Upstream Server - Local stand-in for the BRIA and Tripo HTTP APIs.
+
+Unlike USE_MOCK / TripoService.MOCK_MODE, the backends talk to this server
+over real HTTP, so timeouts, retries, polling and connection pooling are all
+exercised. Use it to benchmark and load-test both backends without
+credentials.
+
+Run:
+    python mock_upstream.py --port 8090 --bria-latency lognormal:1.5,0.4 --error-rate 0.05
+
+Then point the backends at it:
+    BRIA_API_KEY=mock BRIA_BASE_URL=http://localhost:8090 python app.py
+    BRIA_API_KEY=mock TRIPO_API_KEY=mock BRIA_BASE_URL=http://localhost:8090 \
+        TRIPO_BASE_URL=http://localhost:8090 uvicorn app.main:app
+
+Endpoints:
+    POST /v2/image/generate          BRIA generate (sync and async)
+    GET  /v2/status/<request_id>     BRIA async status
+    POST /v2/openapi/task            Tripo task submit
+    GET  /v2/openapi/task/<task_id>  Tripo task status
+    GET  /files/<name>               Generated sheets (PNG) and models (GLB)
+    PUT|GET|HEAD /s3/<bucket>/<key>  In-memory S3 stand-in for the artifact store
+    GET  /mock/stats                 Request counters
+
+The S3 stand-in checks that requests carry a SigV4 Authorization header and
+that uploads match their x-amz-content-sha256 (the signature itself is not
+verified):
+    ARTIFACT_STORE=s3 ARTIFACT_S3_ENDPOINT=http://localhost:8090/s3 ARTIFACT_S3_BUCKET=mock
+"""
+import io
+import re
+import sys
+import json
+import hashlib
+import math
+import time
+import uuid
+import random
+import struct
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Any, Tuple
+
+from PIL import Image, ImageDraw
+
+# Same grid table as fibo_client.get_grid_layout()
+GRID_LAYOUTS = {2: (2, 1), 3: (3, 1), 4: (2, 2), 5: (3, 2), 6: (3, 2), 8: (4, 2)}
+
+ASPECT_SIZES = {
+    "1:1": (1024, 1024), "2:3": (832, 1248), "3:2": (1248, 832),
+    "3:4": (896, 1152), "4:3": (1152, 896), "4:5": (896, 1120),
+    "5:4": (1120, 896), "9:16": (768, 1344), "16:9": (1344, 768)
+}
+
+# Tripo progress curves: fraction of elapsed time -> fraction complete
+PROGRESS_CURVES = {
+    "linear": lambda t: t,
+    "ease-in": lambda t: t * t,
+    "ease-out": lambda t: 1 - (1 - t) ** 2,
+    "stall": lambda t: min(t * 2, 0.9) if t < 0.95 else t
+}
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Parse a latency distribution spec into a sampler (seconds).
+
+    fixed:S | uniform:A,B | normal:MEAN,STD | lognormal:MU,SIGMA | exp:MEAN
+    A bare number is treated as fixed.
+    """
+    kind, _, args = spec.partition(":")
+    if not args:
+        value = float(kind)
+        return lambda: value
+    params = [float(a) for a in args.split(",")]
+    if kind == "fixed":
+        return lambda: params[0]
+    if kind == "uniform":
+        return lambda: random.uniform(params[0], params[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(params[0], params[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(params[0]), params[1])
+    if kind == "exp":
+        return lambda: random.expovariate(1.0 / params[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def render_sheet(frame_count: int, aspect_ratio: str, seed: int) -> bytes:
+    """Draw a magenta-background sprite sheet with one figure per cell."""
+    width, height = ASPECT_SIZES.get(aspect_ratio, (1024, 1024))
+    cols, rows = GRID_LAYOUTS.get(frame_count, (1, 1)) if frame_count else (1, 1)
+    rng = random.Random(seed)
+    color = (rng.randint(40, 200), rng.randint(40, 200), rng.randint(40, 200), 255)
+
+    img = Image.new("RGBA", (width, height), (255, 0, 255, 255))
+    draw = ImageDraw.Draw(img)
+    cell_w, cell_h = width // cols, height // rows
+    for i in range(cols * rows):
+        cx = (i % cols) * cell_w + cell_w // 2
+        cy = (i // cols) * cell_h + cell_h // 2
+        unit = min(cell_w, cell_h) // 8
+        swing = (i - cols * rows // 2) * unit // 3
+        draw.ellipse([cx - unit, cy - 3 * unit, cx + unit, cy - unit], fill=color)
+        draw.rectangle([cx - unit, cy - unit, cx + unit, cy + unit * 2], fill=color)
+        draw.line([cx, cy, cx - 2 * unit + swing, cy + unit], fill=color, width=max(2, unit // 3))
+        draw.line([cx, cy, cx + 2 * unit - swing, cy + unit], fill=color, width=max(2, unit // 3))
+        draw.line([cx, cy + 2 * unit, cx - unit + swing, cy + 4 * unit], fill=color, width=max(2, unit // 2))
+        draw.line([cx, cy + 2 * unit, cx + unit - swing, cy + 4 * unit], fill=color, width=max(2, unit // 2))
+
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def build_glb() -> bytes:
+    """Smallest useful binary glTF: one triangle."""
+    positions = struct.pack("<9f", 0, 0, 0, 1, 0, 0, 0, 1, 0)
+    gltf = {
+        "asset": {"version": "2.0", "generator": "genforge-mock-upstream"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0}],
+        "meshes": [{"primitives": [{"attributes": {"POSITION": 0}}]}],
+        "buffers": [{"byteLength": len(positions)}],
+        "bufferViews": [{"buffer": 0, "byteOffset": 0, "byteLength": len(positions)}],
+        "accessors": [{
+            "bufferView": 0, "componentType": 5126, "count": 3, "type": "VEC3",
+            "min": [0, 0, 0], "max": [1, 1, 0]
+        }]
+    }
+    json_chunk = json.dumps(gltf, separators=(",", ":")).encode()
+    json_chunk += b" " * (-len(json_chunk) % 4)
+    bin_chunk = positions + b"\x00" * (-len(positions) % 4)
+    total = 12 + 8 + len(json_chunk) + 8 + len(bin_chunk)
+    return (
+        struct.pack("<III", 0x46546C67, 2, total)
+        + struct.pack("<II", len(json_chunk), 0x4E4F534A) + json_chunk
+        + struct.pack("<II", len(bin_chunk), 0x004E4942) + bin_chunk
+    )
+
+
+class MockState:
+    def __init__(self, args):
+        self.args = args
+        self.bria_latency = parse_latency(args.bria_latency)
+        self.tripo_latency = parse_latency(args.tripo_latency)
+        self.download_latency = parse_latency(args.download_latency)
+        self.progress_curve = PROGRESS_CURVES[args.progress_curve]
+        self.glb = build_glb()
+        self.requests: Dict[str, Dict[str, Any]] = {}
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        self.files: Dict[str, Tuple[bytes, str]] = {}
+        self.objects: Dict[str, bytes] = {}
+        self.counters: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def count(self, name: str):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def injected_error(self) -> int:
+        """Return an HTTP status to fail with, or 0."""
+        roll = random.random()
+        if roll < self.args.throttle_rate:
+            return 429
+        if roll < self.args.throttle_rate + self.args.error_rate:
+            return 500
+        return 0
+
+
+def _frame_count_from(payload: Dict[str, Any]) -> int:
+    text = payload.get("prompt") or payload.get("structured_prompt") or ""
+    match = re.search(r"(\d+) frame", text)
+    return int(match.group(1)) if match else 0
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    state: MockState = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        if self.state.args.verbose:
+            super().log_message(fmt, *args)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.headers.get('Host', 'localhost')}"
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, obj: Dict[str, Any]):
+        self._send(status, json.dumps(obj).encode(), "application/json")
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        if self.path == "/v2/image/generate":
+            return self._bria_generate()
+        if self.path == "/v2/openapi/task":
+            return self._tripo_submit()
+        self._json(404, {"error": "not found"})
+
+    def do_PUT(self):
+        if self.path.startswith("/s3/"):
+            return self._s3_put()
+        self._json(404, {"error": "not found"})
+
+    def do_HEAD(self):
+        if self.path.startswith("/s3/"):
+            return self._s3_get(head=True)
+        self._send(404, b"", "application/json")
+
+    def do_GET(self):
+        if self.path.startswith("/s3/"):
+            return self._s3_get()
+        if self.path.startswith("/v2/status/"):
+            return self._bria_status(self.path.rsplit("/", 1)[1])
+        if self.path.startswith("/v2/openapi/task/"):
+            return self._tripo_status(self.path.rsplit("/", 1)[1])
+        if self.path.startswith("/files/"):
+            return self._file(self.path[len("/files/"):])
+        if self.path == "/mock/stats":
+            with self.state.lock:
+                return self._json(200, dict(self.state.counters))
+        self._json(404, {"error": "not found"})
+
+    # ---- BRIA ----
+
+    def _bria_generate(self):
+        state = self.state
+        state.count("bria_generate")
+        payload = self._read_json()
+
+        status = state.injected_error()
+        if status:
+            state.count(f"bria_error_{status}")
+            return self._json(status, {"error": "injected failure"})
+
+        request_id = uuid.uuid4().hex
+        latency = state.bria_latency()
+        image = render_sheet(
+            _frame_count_from(payload), payload.get("aspect_ratio", "1:1"), payload.get("seed", 0)
+        )
+        with state.lock:
+            state.files[f"{request_id}.png"] = (image, "image/png")
+            state.requests[request_id] = {"ready_at": time.monotonic() + latency}
+        result = {"image_url": f"{self.base_url}/files/{request_id}.png", "seed": payload.get("seed")}
+
+        if payload.get("sync", True):
+            time.sleep(latency)
+            return self._json(200, {"result": result, "request_id": request_id})
+
+        state.requests[request_id]["result"] = result
+        self._json(202, {
+            "request_id": request_id,
+            "status_url": f"{self.base_url}/v2/status/{request_id}"
+        })
+
+    def _bria_status(self, request_id: str):
+        state = self.state
+        state.count("bria_status")
+        req = state.requests.get(request_id)
+        if not req:
+            return self._json(404, {"error": "unknown request"})
+        if time.monotonic() < req["ready_at"]:
+            return self._json(200, {"status": "IN_PROGRESS", "request_id": request_id})
+        self._json(200, {"status": "COMPLETED", "request_id": request_id, "result": req["result"]})
+
+    # ---- Tripo ----
+
+    def _tripo_submit(self):
+        state = self.state
+        state.count("tripo_submit")
+        self._read_json()
+
+        status = state.injected_error()
+        if status:
+            state.count(f"tripo_error_{status}")
+            return self._json(status, {"code": status, "message": "injected failure"})
+
+        task_id = uuid.uuid4().hex
+        with state.lock:
+            state.tasks[task_id] = {
+                "started_at": time.monotonic(),
+                "duration": max(state.tripo_latency(), 0.001),
+                "fails": random.random() < state.args.tripo_fail_rate
+            }
+            state.files[f"{task_id}.glb"] = (state.glb, "model/gltf-binary")
+        self._json(200, {"code": 0, "data": {"task_id": task_id}})
+
+    def _tripo_status(self, task_id: str):
+        state = self.state
+        state.count("tripo_status")
+        task = state.tasks.get(task_id)
+        if not task:
+            return self._json(404, {"code": 404, "message": "unknown task"})
+
+        elapsed = (time.monotonic() - task["started_at"]) / task["duration"]
+        data = {"task_id": task_id}
+        if elapsed >= 1.0:
+            if task["fails"]:
+                data.update({"status": "failed", "task_error": "injected failure"})
+            else:
+                data.update({
+                    "status": "success", "progress": 100,
+                    "output": {"model": f"{self.base_url}/files/{task_id}.glb"}
+                })
+        else:
+            progress = int(max(0.0, min(1.0, state.progress_curve(elapsed))) * 100)
+            data.update({"status": "running" if progress else "queued", "progress": progress})
+        self._json(200, {"code": 0, "data": data})
+
+    # ---- Files ----
+
+    def _file(self, name: str):
+        state = self.state
+        state.count("download")
+        entry = state.files.get(name)
+        if not entry:
+            return self._json(404, {"error": "file not found"})
+        time.sleep(state.download_latency())
+        self._send(200, entry[0], entry[1])
+
+    # ---- S3 ----
+
+    def _s3_authorized(self) -> bool:
+        if self.headers.get("Authorization", "").startswith("AWS4-HMAC-SHA256 "):
+            return True
+        self._send(403, b"<Error><Code>AccessDenied</Code></Error>", "application/xml")
+        return False
+
+    def _s3_put(self):
+        state = self.state
+        state.count("s3_put")
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if not self._s3_authorized():
+            return
+        if hashlib.sha256(body).hexdigest() != self.headers.get("x-amz-content-sha256"):
+            return self._send(400, b"<Error><Code>XAmzContentSHA256Mismatch</Code></Error>", "application/xml")
+        with state.lock:
+            state.objects[self.path] = body
+        self._send(200, b"", "application/xml")
+
+    def _s3_get(self, head: bool = False):
+        state = self.state
+        state.count("s3_head" if head else "s3_get")
+        if not self._s3_authorized():
+            return
+        body = state.objects.get(self.path)
+        if body is None:
+            return self._send(404, b"" if head else b"<Error><Code>NoSuchKey</Code></Error>", "application/xml")
+        if head:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            return
+        self._send(200, body, "application/octet-stream")
+
+
+def build_server(args) -> ThreadingHTTPServer:
+    handler = type("BoundMockHandler", (MockHandler,), {"state": MockState(args)})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mock BRIA / Tripo upstream server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--bria-latency", default="lognormal:2,0.3",
+                        help="BRIA generation latency distribution (seconds)")
+    parser.add_argument("--tripo-latency", default="uniform:10,20",
+                        help="Tripo task duration distribution (seconds)")
+    parser.add_argument("--download-latency", default="fixed:0.05",
+                        help="File download latency distribution (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of submits failing with HTTP 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="Fraction of submits failing with HTTP 429")
+    parser.add_argument("--tripo-fail-rate", type=float, default=0.0,
+                        help="Fraction of Tripo tasks ending in status 'failed'")
+    parser.add_argument("--progress-curve", default="linear", choices=sorted(PROGRESS_CURVES))
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs")
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    server = build_server(args)
+    print(f"Mock upstream listening on http://{args.host}:{args.port}")
+    print(f"  BRIA latency:  {args.bria_latency}")
+    print(f"  Tripo latency: {args.tripo_latency} ({args.progress_curve})")
+    print(f"  Errors: 500={args.error_rate} 429={args.throttle_rate} tripo_fail={args.tripo_fail_rate}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
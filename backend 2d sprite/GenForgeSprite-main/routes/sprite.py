@@ -1,5 +1,28 @@
+import os
+import hmac
+import json
+from flask import Response, request, send_file, stream_with_context
 from flask_restx import Namespace, Resource, fields
-from services.sprite_service import process_sprite_job, get_available_presets, refine_sprite_animation
+from services.sprite_service import (
+    IdempotencyConflict,
+    submit_sprite_job,
+    submit_refine_job,
+    get_job_status,
+    get_job_profile,
+    stream_job_events,
+    submit_sprite_batch,
+    get_batch_status,
+    stream_batch_events,
+    get_available_presets,
+    get_available_presets_json,
+    get_generation_cache_stats,
+    get_upstream_stats,
+    get_queue_stats,
+    get_retention_stats,
+    get_artifact_store_stats,
+    estimate_sprite_job,
+    get_estimator_stats,
+)
 
 # Create namespace with description
 sprite_ns = Namespace(
@@ -25,6 +48,26 @@ generate_request = sprite_ns.model('GenerateRequest', {
         required=False,
         description='List of animations to generate (defaults to all)',
         example=['idle', 'run', 'attack']
+    ),
+    'bypass_cache': fields.Boolean(
+        required=False,
+        description='Ignore cached upstream generations and call BRIA again',
+        default=False
+    ),
+    'callback_url': fields.String(
+        required=False,
+        description='URL that receives a signed webhook when the job completes or fails',
+        example='https://example.com/hooks/genforge'
+    ),
+    'profile': fields.Boolean(
+        required=False,
+        description='Admin only (X-Admin-Token): capture a cProfile of this job',
+        default=False
+    ),
+    'profile_memory': fields.Boolean(
+        required=False,
+        description='Admin only: also record peak memory with tracemalloc (implies profile)',
+        default=False
     )
 })
 
@@ -46,6 +89,32 @@ generate_response = sprite_ns.model('GenerateResponse', {
     'download_urls': fields.Raw(description='Download URLs for all outputs')
 })
 
+job_accepted = sprite_ns.model('JobAccepted', {
+    'job_id': fields.String(description='Unique job identifier'),
+    'status': fields.String(description='Job status (queued)'),
+    'queue_position': fields.Integer(description='Position in the job queue'),
+    'status_url': fields.String(description='URL to poll for progress and results'),
+    'events_url': fields.String(description='Server-sent events stream of job progress'),
+    'estimate': fields.Raw(description='Predicted run time, BRIA calls and queue wait')
+})
+
+job_status = sprite_ns.model('JobStatus', {
+    'job_id': fields.String(description='Unique job identifier'),
+    'kind': fields.String(description='Job type'),
+    'status': fields.String(description='queued, running, completed or failed'),
+    'queue_position': fields.Integer(description='Position in the queue while queued'),
+    'progress': fields.Raw(description='Per-animation stage, stage timings and URLs'),
+    'timings': fields.Raw(description='Stage timings in seconds'),
+    'created_at': fields.Float(description='Unix time the job was queued'),
+    'started_at': fields.Float(description='Unix time a worker picked the job up'),
+    'finished_at': fields.Float(description='Unix time the job finished'),
+    'result': fields.Raw(description='Job result once completed (generate or refine response)'),
+    'error': fields.String(description='Error message if the job failed'),
+    'estimate': fields.Raw(
+        description='Predicted run time and BRIA calls; queue wait while queued, remaining time while running'
+    )
+})
+
 preset_model = sprite_ns.model('Preset', {
     'name': fields.String(description='Preset identifier'),
     'display_name': fields.String(description='Human-readable name'),
@@ -56,10 +125,159 @@ preset_model = sprite_ns.model('Preset', {
     'animations': fields.Raw(description='Available animations with frame counts')
 })
 
+estimate_request = sprite_ns.model('EstimateRequest', {
+    'kind': fields.String(
+        required=False,
+        description='generate or refine',
+        default='generate',
+        enum=['generate', 'refine']
+    ),
+    'prompt': fields.String(required=True, description='Character description prompt'),
+    'preset': fields.String(required=False, description='Style preset name', default='anime_action'),
+    'animations': fields.List(
+        fields.String,
+        required=False,
+        description='generate: animations to generate (defaults to all)'
+    ),
+    'use_fibo_enhanced': fields.Boolean(required=False, default=False),
+    'bypass_cache': fields.Boolean(required=False, default=False),
+    'animation': fields.String(required=False, description='refine: animation to refine'),
+    'refinement': fields.String(required=False, description='refine: refinement instructions'),
+    'seed': fields.Integer(required=False, description='refine: fixed seed (may be cached)')
+})
+
+estimate_response = sprite_ns.model('Estimate', {
+    'seconds': fields.Float(description='Predicted run time once a worker picks the job up'),
+    'upstream_calls': fields.Integer(description='BRIA generations the job would make'),
+    'cached_animations': fields.Integer(description='Animations served from the generation cache'),
+    'breakdown': fields.Raw(description='Predicted seconds of upstream calls, processing and finishing'),
+    'history': fields.Raw(description='Jobs of the preset and upstream calls the estimate is based on'),
+    'queue_seconds': fields.Float(description='Expected wait before a worker picks the job up'),
+    'jobs_ahead': fields.Integer(description='Queued jobs that would run first'),
+    'ready_in_seconds': fields.Float(description='queue_seconds + seconds')
+})
+
 error_model = sprite_ns.model('Error', {
     'error': fields.String(description='Error message')
 })
 
+# Batch models
+batch_item = sprite_ns.model('BatchItem', {
+    'prompt': fields.String(required=True, description='Character description prompt'),
+    'preset': fields.String(required=False, description='Style preset name', default='anime_action'),
+    'animations': fields.List(
+        fields.String,
+        required=False,
+        description='List of animations to generate (defaults to all)'
+    ),
+    'use_fibo_enhanced': fields.Boolean(required=False, default=False)
+})
+
+batch_request = sprite_ns.model('BatchRequest', {
+    'items': fields.List(fields.Nested(batch_item), required=True, description='Characters to generate'),
+    'bypass_cache': fields.Boolean(
+        required=False,
+        description='Ignore cached upstream generations for every item',
+        default=False
+    ),
+    'callback_url': fields.String(
+        required=False,
+        description='URL that receives a signed webhook as each item\'s job finishes'
+    )
+})
+
+batch_status = sprite_ns.model('BatchStatus', {
+    'batch_id': fields.String(description='Unique batch identifier'),
+    'status': fields.String(description='queued, running, completed, completed_with_errors or failed'),
+    'total': fields.Integer(description='Number of items'),
+    'unique_jobs': fields.Integer(description='Jobs after merging identical items'),
+    'counts': fields.Raw(description='Number of jobs per status'),
+    'items': fields.Raw(description='Per-item job id, status, animation stages and result'),
+    'requested_calls': fields.Integer(description='Upstream calls asked for by all items'),
+    'upstream_calls': fields.Integer(description='Distinct upstream calls after de-duplication'),
+    'status_url': fields.String(description='URL to poll for batch progress'),
+    'events_url': fields.String(description='Server-sent events stream of finished items')
+})
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# Public URL of this server for absolute artifact URLs in webhooks
+# (defaults to the host the request was sent to)
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "")
+# Token for admin-only features (job profiling); unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+idempotency_header = {
+    'Idempotency-Key': {
+        'description': 'Client-chosen unique key; a retry with the same key returns the original job',
+        'in': 'header',
+        'type': 'string'
+    }
+}
+
+
+def idempotency_key():
+    """The request's Idempotency-Key header (None if absent); raises ValueError if invalid."""
+    key = request.headers.get("Idempotency-Key", "").strip()
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise ValueError(f"Idempotency-Key longer than {IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+    return key or None
+
+
+def public_base_url() -> str:
+    return (PUBLIC_BASE_URL or request.host_url).rstrip("/")
+
+
+def is_admin() -> bool:
+    """Whether the request carries the admin token (X-Admin-Token header)."""
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+
+def profiling_options(data: dict):
+    """
+    Normalize the profile / profile_memory flags of a request body in place;
+    raises PermissionError if they are set by a non-admin.
+    """
+    profile_memory = bool(data.pop("profile_memory", False))
+    profile = bool(data.pop("profile", False)) or profile_memory
+    if not profile:
+        return
+    if not is_admin():
+        raise PermissionError("Profiling requires a valid X-Admin-Token")
+    data["profile"] = True
+    if profile_memory:
+        data["profile_memory"] = True
+
+
+def replay_headers(job: dict) -> dict:
+    return {"Idempotent-Replayed": "true"} if job.get("replayed") else {}
+
+
+def event_stream(events) -> Response:
+    """Serve an iterator of event dicts (None = keep-alive) as server-sent events."""
+    def generate():
+        yield "retry: 3000\n\n"
+        for event in events:
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            event = dict(event)
+            event_id = event.pop("id")
+            name = event.pop("event")
+            yield f"id: {event_id}\nevent: {name}\ndata: {json.dumps(event)}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def last_event_id() -> int:
+    """Resume point of an event stream (Last-Event-ID header or ?after=)."""
+    return int(request.headers.get("Last-Event-ID") or request.args.get("after", 0))
+
 
 @sprite_ns.route('/health')
 class Health(Resource):
@@ -72,16 +290,26 @@ class Health(Resource):
 
 @sprite_ns.route('/generate')
 class Generate(Resource):
-    @sprite_ns.doc('generate_sprite')
+    @sprite_ns.doc('generate_sprite', params=idempotency_header)
     @sprite_ns.expect(generate_request)
-    @sprite_ns.response(200, 'Sprite generated successfully', generate_response)
+    @sprite_ns.response(202, 'Sprite job queued', job_accepted)
     @sprite_ns.response(400, 'Invalid request', error_model)
+    @sprite_ns.response(403, 'Profiling requested without the admin token', error_model)
+    @sprite_ns.response(422, 'Idempotency key reused with a different request', error_model)
     @sprite_ns.response(500, 'Server error', error_model)
     def post(self):
         """
-        Generate sprite sheet and animations from a text prompt.
+        Queue sprite sheet and animation generation from a text prompt.
         
-        This endpoint takes a character description and generates:
+        Returns a job id immediately; poll /sprite/status/{job_id} for
+        per-animation progress and the final result. Send an
+        Idempotency-Key header to make retries safe: a repeated request
+        with the same key returns the existing (possibly still running or
+        finished) job instead of paying for the generation again.
+        Set callback_url to get a signed webhook with the artifact URLs
+        and stage timings when the job finishes, instead of polling.
+        
+        The job takes a character description and generates:
         - A canonical reference image
         - Animation frames for each requested animation
         - Sprite sheets (PNG) for each animation
@@ -94,11 +322,241 @@ class Generate(Resource):
         if not data or "prompt" not in data:
             return {"error": "Missing 'prompt' in request body"}, 400
         
+        callback_url = data.pop("callback_url", None)
+        try:
+            profiling_options(data)
+        except PermissionError as e:
+            return {"error": str(e)}, 403
+        try:
+            job = submit_sprite_job(
+                data, idempotency_key=idempotency_key(),
+                callback_url=callback_url, base_url=public_base_url()
+            )
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except IdempotencyConflict as e:
+            return {"error": str(e)}, 422
+        except Exception as e:
+            return {"error": str(e)}, 500
+        
+        return {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "queue_position": job.get("queue_position"),
+            "status_url": f"/api/sprite/status/{job['job_id']}",
+            "events_url": f"/api/sprite/events/{job['job_id']}",
+            "estimate": job.get("estimate")
+        }, 202, replay_headers(job)
+
+
+@sprite_ns.route('/estimate')
+class Estimate(Resource):
+    @sprite_ns.doc('estimate_job')
+    @sprite_ns.expect(estimate_request)
+    @sprite_ns.response(200, 'Predicted duration and upstream calls', estimate_response)
+    @sprite_ns.response(400, 'Invalid request', error_model)
+    def post(self):
+        """
+        Dry run: predict how long a generate or refine request would take.
+        
+        Returns the predicted run time, the BRIA calls it would make
+        (animations already in the generation cache need none) and the
+        expected queue wait if it were submitted now. Nothing is queued.
+        Predictions come from stage timings of recent jobs and the latency
+        of recent upstream calls.
+        """
+        data = dict(sprite_ns.payload or {})
+        kind = data.pop("kind", "generate")
+        if not data.get("prompt"):
+            return {"error": "Missing 'prompt' in request body"}, 400
+        if kind == "refine" and not data.get("animation"):
+            return {"error": "Missing 'animation' for a refine estimate"}, 400
+        try:
+            return estimate_sprite_job(data, kind)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+    @sprite_ns.doc('estimator_stats')
+    @sprite_ns.response(200, 'Estimator model and accuracy')
+    def get(self):
+        """
+        Medians the estimator currently uses (seconds per frame by preset,
+        finishing time, upstream latency), the queue order (fifo or sjf)
+        and the median error of estimates of recent jobs.
+        """
+        return get_estimator_stats()
+
+
+@sprite_ns.route('/status/<string:job_id>')
+@sprite_ns.param('job_id', 'The job identifier returned by /generate')
+class JobStatus(Resource):
+    @sprite_ns.doc('get_job_status')
+    @sprite_ns.response(200, 'Job status', job_status)
+    @sprite_ns.response(404, 'Job not found', error_model)
+    def get(self, job_id):
+        """Get progress, stage timings and results of a sprite job."""
+        status = get_job_status(job_id)
+        if not status:
+            return {"error": f"Job '{job_id}' not found"}, 404
+        return status
+
+
+@sprite_ns.route('/profile/<string:job_id>')
+@sprite_ns.param('job_id', 'The job identifier of a job queued with "profile": true')
+class JobProfile(Resource):
+    @sprite_ns.doc('get_job_profile', params={
+        'format': 'txt (summary, default) or pstats (for pstats / snakeviz)',
+        'X-Admin-Token': {'description': 'Admin token', 'in': 'header', 'type': 'string'}
+    })
+    @sprite_ns.produces(['text/plain', 'application/octet-stream'])
+    @sprite_ns.response(200, 'Profile of the job')
+    @sprite_ns.response(403, 'Missing or invalid admin token', error_model)
+    @sprite_ns.response(404, 'No profile for this job', error_model)
+    def get(self, job_id):
+        """
+        Download the cProfile of a profiled job (admins only).
+        
+        The summary lists the functions with the most cumulative time and,
+        if profile_memory was set, the peak traced memory. The profile is
+        written when the job finishes, whether it completed or failed.
+        """
+        if not is_admin():
+            return {"error": "Profiles require a valid X-Admin-Token"}, 403
+        fmt = request.args.get("format", "txt")
+        path, content_type = get_job_profile(job_id, fmt)
+        if not path:
+            return {"error": f"No {fmt} profile for job '{job_id}'"}, 404
+        return send_file(
+            path, mimetype=content_type, max_age=0,
+            as_attachment=fmt == "pstats", download_name=os.path.basename(path)
+        )
+
+
+@sprite_ns.route('/events/<string:job_id>')
+@sprite_ns.param('job_id', 'The job identifier returned by /generate')
+class JobEvents(Resource):
+    @sprite_ns.doc('stream_job_events', params={
+        'after': 'Only send events after this event id (same as Last-Event-ID)'
+    })
+    @sprite_ns.produces(['text/event-stream'])
+    @sprite_ns.response(200, 'Event stream')
+    @sprite_ns.response(404, 'Job not found', error_model)
+    def get(self, job_id):
+        """
+        Stream a sprite job's progress as server-sent events.
+        
+        Events: queued, running, pending, generating, sheet_received,
+        frames_sliced, animation_done, combined_sheet, metadata, then
+        completed (with the full result) or failed. Each event's data is a
+        JSON object with the animation, stage timings and download URLs of
+        the files written so far. The stream ends after completed/failed;
+        reconnecting clients resume from Last-Event-ID.
+        """
+        if not get_job_status(job_id):
+            return {"error": f"Job '{job_id}' not found"}, 404
+        
+        try:
+            after_id = last_event_id()
+        except ValueError:
+            return {"error": "Invalid event id"}, 400
+        
+        return event_stream(
+            {
+                "id": event["id"],
+                "event": event["event"],
+                "job_id": job_id,
+                "animation": event["animation"],
+                **event["data"]
+            } if event else None
+            for event in stream_job_events(job_id, after_id)
+        )
+
+
+@sprite_ns.route('/batch')
+class Batch(Resource):
+    @sprite_ns.doc('generate_batch')
+    @sprite_ns.expect(batch_request)
+    @sprite_ns.response(202, 'Batch queued', batch_status)
+    @sprite_ns.response(400, 'Invalid request', error_model)
+    @sprite_ns.response(500, 'Server error', error_model)
+    def post(self):
+        """
+        Queue sprite generation for many characters at once.
+        
+        Each item is a {prompt, preset, animations} generate request. Items
+        are queued as jobs that share the worker pool and the host-wide
+        upstream budget; identical items share one job and overlapping
+        animations share one upstream call. Poll /sprite/batch/{batch_id}
+        or follow /sprite/batch/{batch_id}/events for results in
+        completion order.
+        """
+        data = sprite_ns.payload or {}
+        items = data.get("items")
+        
+        if not isinstance(items, list) or not items:
+            return {"error": "Missing 'items' in request body"}, 400
+        if len(items) > BATCH_MAX_ITEMS:
+            return {"error": f"Too many items ({len(items)} > {BATCH_MAX_ITEMS})"}, 400
+        for i, item in enumerate(items):
+            if not isinstance(item, dict) or not item.get("prompt"):
+                return {"error": f"Missing 'prompt' in item {i}"}, 400
+        
         try:
-            result = process_sprite_job(data)
-            return result
+            batch = submit_sprite_batch(
+                items, bypass_cache=data.get("bypass_cache", False),
+                callback_url=data.get("callback_url"), base_url=public_base_url()
+            )
+        except ValueError as e:
+            return {"error": str(e)}, 400
         except Exception as e:
             return {"error": str(e)}, 500
+        
+        return {
+            **batch,
+            "status_url": f"/api/sprite/batch/{batch['batch_id']}",
+            "events_url": f"/api/sprite/batch/{batch['batch_id']}/events"
+        }, 202
+
+
+@sprite_ns.route('/batch/<string:batch_id>')
+@sprite_ns.param('batch_id', 'The batch identifier returned by /batch')
+class BatchStatus(Resource):
+    @sprite_ns.doc('get_batch_status')
+    @sprite_ns.response(200, 'Batch status', batch_status)
+    @sprite_ns.response(404, 'Batch not found', error_model)
+    def get(self, batch_id):
+        """Get per-item progress and results of a batch."""
+        status = get_batch_status(batch_id)
+        if not status:
+            return {"error": f"Batch '{batch_id}' not found"}, 404
+        return status
+
+
+@sprite_ns.route('/batch/<string:batch_id>/events')
+@sprite_ns.param('batch_id', 'The batch identifier returned by /batch')
+class BatchEvents(Resource):
+    @sprite_ns.doc('stream_batch_events', params={
+        'after': 'Only send events after this event id (same as Last-Event-ID)'
+    })
+    @sprite_ns.produces(['text/event-stream'])
+    @sprite_ns.response(200, 'Event stream')
+    @sprite_ns.response(404, 'Batch not found', error_model)
+    def get(self, batch_id):
+        """
+        Stream batch results as server-sent events in completion order.
+        
+        Sends item_completed (with the result) or item_failed for each job,
+        listing the indexes of all items it serves, then batch_completed.
+        """
+        if not get_batch_status(batch_id):
+            return {"error": f"Batch '{batch_id}' not found"}, 404
+        
+        try:
+            after_id = last_event_id()
+        except ValueError:
+            return {"error": "Invalid event id"}, 400
+        
+        return event_stream(stream_batch_events(batch_id, after_id))
 
 
 @sprite_ns.route('/presets')
@@ -117,8 +575,15 @@ class PresetList(Resource):
         - cartoon_platformer: Colorful cartoon style (256x256)
         - realistic_2d: High-fidelity realistic art (512x512)
         - chibi: Cute chibi-style characters (256x256)
+        
+        Responses carry an ETag; send it back as If-None-Match to get a
+        304 until a preset changes.
         """
-        return get_available_presets()
+        body, etag = get_available_presets_json()
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
+        return Response(body, mimetype="application/json", headers=headers)
 
 
 @sprite_ns.route('/presets/<string:preset_name>')
@@ -135,6 +600,82 @@ class PresetDetail(Resource):
         return {"error": f"Preset '{preset_name}' not found"}, 404
 
 
+cache_stats_model = sprite_ns.model('CacheStats', {
+    'enabled': fields.Boolean(description='Whether the generation cache is enabled'),
+    'hits': fields.Integer(description='Cache hits in this worker'),
+    'misses': fields.Integer(description='Cache misses in this worker'),
+    'stores': fields.Integer(description='Entries written by this worker'),
+    'evictions': fields.Integer(description='Entries evicted by this worker'),
+    'hit_rate': fields.Float(description='hits / (hits + misses)'),
+    'entries': fields.Integer(description='Entries on disk'),
+    'bytes': fields.Integer(description='Bytes on disk'),
+    'max_bytes': fields.Integer(description='Size cap before LRU eviction')
+})
+
+
+@sprite_ns.route('/cache')
+class CacheStats(Resource):
+    @sprite_ns.doc('generation_cache_stats')
+    @sprite_ns.response(200, 'Generation cache statistics', cache_stats_model)
+    def get(self):
+        """Hit/miss statistics and disk usage of the upstream generation cache."""
+        return get_generation_cache_stats()
+
+
+@sprite_ns.route('/upstream')
+class UpstreamStats(Resource):
+    @sprite_ns.doc('upstream_limiter_stats')
+    @sprite_ns.response(200, 'Host-wide upstream limiter state')
+    def get(self):
+        """
+        Current host-wide limits for upstream APIs.
+        
+        Shows the adaptive requests-per-minute and concurrency limits shared
+        by all workers, slots in flight, and queue wait times in this worker,
+        in total and per priority lane (refine, generate, bulk).
+        """
+        return get_upstream_stats()
+
+
+@sprite_ns.route('/queue')
+class QueueStats(Resource):
+    @sprite_ns.doc('job_queue_stats')
+    @sprite_ns.response(200, 'Job queue state per priority lane')
+    def get(self):
+        """
+        Queue depth, queue wait times and preemptions per priority lane.
+        
+        Jobs are claimed refine first, then generate, then bulk (batch);
+        a lower-lane job yields to queued higher-lane jobs whenever it
+        finishes a stage.
+        """
+        return get_queue_stats()
+
+
+@sprite_ns.route('/retention')
+class RetentionStats(Resource):
+    @sprite_ns.doc('output_retention_stats')
+    @sprite_ns.response(200, 'Output quota, TTLs and the last sweep')
+    def get(self):
+        """
+        Disk quota and per-artifact TTLs of job outputs, and what the last
+        sweep in this worker removed.
+        """
+        return get_retention_stats()
+
+
+@sprite_ns.route('/artifacts')
+class ArtifactStoreStats(Resource):
+    @sprite_ns.doc('artifact_store_stats')
+    @sprite_ns.response(200, 'Shared artifact store backend and dedupe counters')
+    def get(self):
+        """
+        Backend of the shared artifact store (null when disabled) and how
+        many published files this worker uploaded or found already stored.
+        """
+        return get_artifact_store_stats()
+
+
 # Refine request model
 refine_request = sprite_ns.model('RefineRequest', {
     'job_id': fields.String(
@@ -167,6 +708,25 @@ refine_request = sprite_ns.model('RefineRequest', {
         required=False,
         description='Random seed for consistency (optional)',
         example=42
+    ),
+    'bypass_cache': fields.Boolean(
+        required=False,
+        description='Ignore cached upstream generations and call BRIA again',
+        default=False
+    ),
+    'callback_url': fields.String(
+        required=False,
+        description='URL that receives a signed webhook when the refinement completes or fails'
+    ),
+    'profile': fields.Boolean(
+        required=False,
+        description='Admin only (X-Admin-Token): capture a cProfile of this job',
+        default=False
+    ),
+    'profile_memory': fields.Boolean(
+        required=False,
+        description='Admin only: also record peak memory with tracemalloc (implies profile)',
+        default=False
     )
 })
 
@@ -187,10 +747,13 @@ refine_response = sprite_ns.model('RefineResponse', {
 
 @sprite_ns.route('/refine')
 class Refine(Resource):
-    @sprite_ns.doc('refine_sprite')
+    @sprite_ns.doc('refine_sprite', params=idempotency_header)
     @sprite_ns.expect(refine_request)
     @sprite_ns.response(200, 'Sprite refined successfully', refine_response)
+    @sprite_ns.response(202, 'Refinement still running', job_accepted)
     @sprite_ns.response(400, 'Invalid request', error_model)
+    @sprite_ns.response(403, 'Profiling requested without the admin token', error_model)
+    @sprite_ns.response(422, 'Idempotency key reused with a different request', error_model)
     @sprite_ns.response(500, 'Server error', error_model)
     def post(self):
         """
@@ -205,6 +768,10 @@ class Refine(Resource):
         
         The refinement instructions are added to the original prompt to guide
         the AI in generating an improved version.
+        
+        Refinements run as jobs in the highest-priority lane. If the job takes
+        longer than REFINE_WAIT_SECONDS, 202 is returned with a status URL.
+        With an Idempotency-Key header, a retry returns the same job.
         """
         data = sprite_ns.payload
         
@@ -213,8 +780,32 @@ class Refine(Resource):
         if missing:
             return {"error": f"Missing required fields: {', '.join(missing)}"}, 400
         
+        callback_url = data.pop("callback_url", None)
         try:
-            result = refine_sprite_animation(data)
-            return result
+            profiling_options(data)
+        except PermissionError as e:
+            return {"error": str(e)}, 403
+        try:
+            job = submit_refine_job(
+                data, idempotency_key=idempotency_key(),
+                callback_url=callback_url, base_url=public_base_url()
+            )
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except IdempotencyConflict as e:
+            return {"error": str(e)}, 422
         except Exception as e:
             return {"error": str(e)}, 500
+        
+        if job["status"] == "completed":
+            return job["result"], 200, replay_headers(job)
+        if job["status"] == "failed":
+            return {"error": job["error"]}, 500, replay_headers(job)
+        return {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "queue_position": job.get("queue_position"),
+            "status_url": f"/api/sprite/status/{job['job_id']}",
+            "events_url": f"/api/sprite/events/{job['job_id']}",
+            "estimate": job.get("estimate")
+        }, 202, replay_headers(job)
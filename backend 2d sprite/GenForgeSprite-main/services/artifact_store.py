@@ -0,0 +1,16 @@
+"""
+Artifact Store - The sprite backend's instance of genforge_common.artifact_store.
+
+Finished jobs are published under jobs/<job_id>.json, so any node can
+answer /outputs/<job_id>/<file>; job_queue also keeps each job's status in
+a sprite-jobs/<job_id> record. Backends and settings (ARTIFACT_STORE,
+ARTIFACT_DIR, ARTIFACT_S3_*, ARTIFACT_PUBLIC_URL) are described in the
+shared module.
+"""
+import os
+
+from genforge_common.artifact_store import from_env
+
+store = from_env(
+    default_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache", "artifacts")
+)
@@ -0,0 +1,212 @@
+"""
+Estimator - Predicted run time and upstream calls of sprite jobs.
+
+Estimates are learned from what recent jobs actually spent (the per-stage
+"timings" of their results, see services/metrics.py) and from the
+host-wide log of upstream calls (genforge_common.rate_limiter):
+
+    upstream     one BRIA call per animation whose sheet is not in the
+                 generation cache (none in mock mode). A call takes the
+                 median latency of recent BRIA calls, plus the median wait
+                 for a limiter slot and the median download per call of
+                 recent jobs. A job runs MAX_CONCURRENT_GENERATIONS calls at
+                 a time, so calls cost ceil(calls / concurrency) rounds.
+    processing   slicing, background removal, resizing and encoding: the
+                 median seconds per frame of the animation in recent jobs
+                 with the preset (from each animation's own stage timings),
+                 falling back to the preset's median per frame, then to all
+                 presets', while a key has fewer than ESTIMATE_MIN_SAMPLES
+    finish       combined sheet, metadata and upload: the median per job of
+                 the same kind and preset
+
+Sheets of a job arrive at about the same time, so processing is added to
+the upstream time rather than overlapped with it. Until there is history,
+DEFAULTS stand in. The model is rebuilt from the last ESTIMATE_HISTORY_JOBS
+completed jobs at most every ESTIMATE_REFRESH seconds per process.
+
+Jobs keep the estimate they were queued with; the job queue adds the
+expected queue wait to the status of queued jobs and, with JOB_ORDER=sjf,
+claims the shortest jobs of a lane first.
+"""
+import os
+import math
+import time
+import statistics
+import threading
+from typing import Any, Dict, List, Optional
+
+from services import job_store
+from services.fibo_client import bria_limiter
+
+HISTORY_JOBS = int(os.getenv("ESTIMATE_HISTORY_JOBS", "200"))
+REFRESH_SECONDS = float(os.getenv("ESTIMATE_REFRESH", "60"))
+# Jobs of a preset needed before its own medians replace the all-preset ones
+MIN_SAMPLES = int(os.getenv("ESTIMATE_MIN_SAMPLES", "5"))
+# Only calls this recent count towards upstream latency
+UPSTREAM_WINDOW = float(os.getenv("ESTIMATE_UPSTREAM_WINDOW", "3600"))
+
+# Stages (metrics.STAGES) that scale with frames, and per-job stages
+PROCESSING_STAGES = ("slice", "background_removal", "resize", "encode", "gif")
+FINISH_STAGES = ("combine", "metadata", "upload")
+# Per-animation timings of the same work (the animation's progress events)
+ANIMATION_STAGES = ("slice", "sheet", "gif")
+
+# Seconds used until there is history
+DEFAULTS = {
+    "upstream_seconds": float(os.getenv("ESTIMATE_DEFAULT_UPSTREAM_SECONDS", "20")),
+    "upstream_wait_seconds": 0.0,
+    "download_seconds": 1.0,
+    "frame_seconds": 0.1,
+    "finish_seconds": 0.5
+}
+
+_model: Optional[Dict[str, Any]] = None
+_built_at = 0.0
+_lock = threading.Lock()
+
+
+def _median(values: List[float]) -> Optional[float]:
+    return statistics.median(values) if values else None
+
+
+def _animation_frame_seconds(job: Dict[str, Any]) -> Dict[str, float]:
+    """Processing seconds per frame of each animation of a job (from its progress timings)."""
+    per_frame = {}
+    for anim, entry in (job.get("progress") or {}).items():
+        timings = entry.get("timings") or {}
+        frames = entry.get("frame_count")
+        if frames and "slice" in timings:
+            per_frame[anim] = sum(timings.get(stage, 0.0) for stage in ANIMATION_STAGES) / frames
+    return per_frame
+
+
+def _job_frames(job: Dict[str, Any]) -> int:
+    result = job["result"] or {}
+    if job["kind"] == "refine":
+        return result.get("frame_count") or 0
+    return sum(anim.get("frame_count", 0) for anim in (result.get("animations") or {}).values())
+
+
+def build_model() -> Dict[str, Any]:
+    """Medians of recent completed jobs and of recent upstream calls."""
+    frame_seconds: Dict[str, List[float]] = {}
+    finish_seconds: Dict[str, List[float]] = {}
+    downloads: List[float] = []
+    errors: List[float] = []
+    for job in job_store.recent_completed(HISTORY_JOBS):
+        result = job["result"] or {}
+        timings = result.get("timings") or {}
+        preset = (job["request"] or {}).get("preset", "anime_action")
+        frames = _job_frames(job)
+        if frames and any(stage in timings for stage in PROCESSING_STAGES):
+            per_frame = sum(timings.get(stage, 0.0) for stage in PROCESSING_STAGES) / frames
+            frame_seconds.setdefault(preset, []).append(per_frame)
+            frame_seconds.setdefault("", []).append(per_frame)
+        for anim, per_frame in _animation_frame_seconds(job).items():
+            frame_seconds.setdefault(f"{preset}:{anim}", []).append(per_frame)
+        finish = sum(timings.get(stage, 0.0) for stage in FINISH_STAGES)
+        for key in (f"{job['kind']}:{preset}", f"{job['kind']}:"):
+            finish_seconds.setdefault(key, []).append(finish)
+        if result.get("upstream_calls"):
+            downloads.append(timings.get("download", 0.0) / result["upstream_calls"])
+        estimate = job.get("estimate")
+        # Time spent running preempting jobs is not part of the total
+        actual = timings.get("total")
+        if estimate and actual and actual > 0:
+            errors.append(abs(estimate["seconds"] - actual) / actual)
+
+    upstream = bria_limiter.latency(UPSTREAM_WINDOW)
+    return {
+        "built_at": time.time(),
+        "jobs": len(frame_seconds.get("", [])),
+        # Keys: "<preset>:<animation>", "<preset>" and "" (all presets)
+        "frame_seconds": {preset: (_median(values), len(values)) for preset, values in frame_seconds.items()},
+        "finish_seconds": {key: (_median(values), len(values)) for key, values in finish_seconds.items()},
+        "download_seconds": _median(downloads),
+        "upstream": upstream,
+        # How far stored estimates were off (|estimate - actual| / actual)
+        "median_error": None if not errors else round(_median(errors), 3)
+    }
+
+
+def get_model() -> Dict[str, Any]:
+    """The current model, rebuilt when older than REFRESH_SECONDS."""
+    global _model, _built_at
+    with _lock:
+        if _model is None or time.monotonic() - _built_at > REFRESH_SECONDS:
+            _model = build_model()
+            _built_at = time.monotonic()
+        return _model
+
+
+def _pick(table: Dict[str, Any], *keys: str) -> Optional[float]:
+    """
+    The median of the first key with MIN_SAMPLES samples; keys go from the
+    most specific to the broadest. Without one, the broadest key present.
+    """
+    known = [table[key] for key in keys if key in table]
+    for value, samples in known:
+        if samples >= MIN_SAMPLES:
+            return value
+    return known[-1][0] if known else None
+
+
+def estimate(kind: str, preset: str, animations: Dict[str, int], upstream_calls: int,
+             cached: int = 0, concurrency: int = 1) -> Dict[str, Any]:
+    """
+    Predicted run time of a job (excluding queue wait).
+
+    animations maps each animation to its frame count; upstream_calls is
+    how many of them need a BRIA call and cached how many are in the
+    generation cache; concurrency is how many calls the job makes at once.
+    """
+    model = get_model()
+    upstream = model["upstream"]
+    call = upstream["p50_seconds"] if upstream["p50_seconds"] is not None else DEFAULTS["upstream_seconds"]
+    wait = upstream["wait_p50_seconds"] if upstream["wait_p50_seconds"] is not None else DEFAULTS["upstream_wait_seconds"]
+    download = model["download_seconds"] if model["download_seconds"] is not None else DEFAULTS["download_seconds"]
+    finish = _pick(model["finish_seconds"], f"{kind}:{preset}", f"{kind}:")
+
+    processing = 0.0
+    for anim, frame_count in animations.items():
+        per_frame = _pick(model["frame_seconds"], f"{preset}:{anim}", preset, "")
+        processing += frame_count * (per_frame if per_frame is not None else DEFAULTS["frame_seconds"])
+
+    rounds = math.ceil(upstream_calls / max(1, concurrency))
+    breakdown = {
+        "upstream": rounds * (wait + call + download),
+        "processing": processing,
+        "finish": finish if finish is not None else DEFAULTS["finish_seconds"]
+    }
+    return {
+        "seconds": round(sum(breakdown.values()), 1),
+        "upstream_calls": upstream_calls,
+        "cached_animations": cached,
+        "breakdown": {name: round(seconds, 2) for name, seconds in breakdown.items()},
+        "history": {
+            "jobs": model["frame_seconds"].get(preset, (None, 0))[1],
+            "upstream_calls": upstream["calls"]
+        }
+    }
+
+
+def get_stats() -> Dict[str, Any]:
+    """The model's medians and how accurate recent estimates were."""
+    model = get_model()
+    return {
+        "order": job_store.ORDER,
+        "sjf_aging": job_store.SJF_AGING,
+        "jobs": model["jobs"],
+        "frame_seconds": {
+            preset or "all": {"median": round(value, 4), "jobs": samples}
+            for preset, (value, samples) in model["frame_seconds"].items()
+        },
+        "finish_seconds": {
+            (key + "all" if key.endswith(":") else key): {"median": round(value, 3), "jobs": samples}
+            for key, (value, samples) in model["finish_seconds"].items()
+        },
+        "download_seconds": None if model["download_seconds"] is None else round(model["download_seconds"], 3),
+        "upstream": model["upstream"],
+        "median_error": model["median_error"],
+        "defaults": DEFAULTS
+    }
@@ -2,45 +2,106 @@
 FIBO Client - Handles communication with BRIA's FIBO API for sprite sheet generation.
 Simplified client using simple text prompts (like FIBO platform UI).
 """
+import io
 import os
 import json
+import time
+import threading
+import logging
+from functools import lru_cache
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
+from services import generation_cache, metrics, single_flight
+from genforge_common.rate_limiter import UpstreamLimiter, DEFAULT_LANE, NO_RESPONSE
+
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
 # API Endpoints
-BASE_URL = "https://engine.prod.bria-api.com"
+BASE_URL = os.getenv("BRIA_BASE_URL", "https://engine.prod.bria-api.com").rstrip("/")
 GENERATE_URL = f"{BASE_URL}/v2/image/generate"
+STATUS_URL = f"{BASE_URL}/v2/status"
 
 API_TOKEN = os.getenv("BRIA_API_KEY", "")
 
+# HTTP connection settings (seconds / pool sizes)
+CONNECT_TIMEOUT = float(os.getenv("BRIA_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("BRIA_READ_TIMEOUT", "120"))
+DOWNLOAD_TIMEOUT = float(os.getenv("BRIA_DOWNLOAD_TIMEOUT", "60"))
+POOL_SIZE = int(os.getenv("BRIA_POOL_SIZE", "10"))
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
 
-def generate_image_sync(
+# Async generation: submit, then poll the status URL with backoff. Each
+# generation is waited on by the thread that submitted it; a job's
+# animations are in flight together through process_sprite_job's pool.
+ASYNC_MODE = os.getenv("BRIA_ASYNC", "false").lower() in ("1", "true", "yes")
+GENERATION_TIMEOUT = float(os.getenv("BRIA_GENERATION_TIMEOUT", "300"))
+POLL_INTERVAL = float(os.getenv("BRIA_POLL_INTERVAL", "1"))
+POLL_MAX_INTERVAL = float(os.getenv("BRIA_POLL_MAX_INTERVAL", "8"))
+POLL_BACKOFF = 1.5
+
+# Host-wide upstream limits, shared with the 3D backend's BRIA calls
+UPSTREAM_RETRIES = int(os.getenv("BRIA_RETRIES", "2"))
+bria_limiter = UpstreamLimiter(
+    "bria",
+    max_rpm=float(os.getenv("BRIA_RATE_LIMIT_RPM", "60")),
+    max_concurrency=int(os.getenv("BRIA_MAX_IN_FLIGHT", "6"))
+)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class BriaApiError(Exception):
+    """Non-success response from the BRIA API."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class BriaGenerationError(BriaApiError):
+    """A submitted generation that BRIA reports as failed (status ERROR)."""
+
+
+def get_session() -> requests.Session:
+    """
+    Return the shared HTTP session.
+
+    A single pooled session keeps TLS connections to BRIA and its image CDN
+    alive between calls instead of opening a new connection per request.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def build_generate_payload(
     structured_prompt: dict = None,
     seed: int = 42,
     aspect_ratio: str = "1:1",
     simple_prompt: str = None,
     num_results: int = 4
-) -> str:
+) -> dict:
     """
-    Generate image using FIBO API.
+    Build the request body for /v2/image/generate (without the sync flag).
     
     Can use either:
     - structured_prompt: dict with FIBO structured format
     - simple_prompt: plain text prompt (like FIBO platform UI)
     """
-    if not API_TOKEN:
-        raise ValueError("BRIA_API_KEY not set")
-    
-    headers = {
-        "api_token": API_TOKEN,
-        "Content-Type": "application/json"
-    }
-    
     payload = {
         "aspect_ratio": aspect_ratio,
-        "sync": True,
         "seed": seed,
         "num_results": num_results
     }
@@ -53,36 +114,225 @@ def generate_image_sync(
     else:
         raise ValueError("Either simple_prompt or structured_prompt required")
     
-    print(f"    API Request: aspect_ratio={aspect_ratio}, seed={seed}")
-    if simple_prompt:
-        print(f"    Prompt: {simple_prompt[:100]}...")
+    return payload
+
+
+def _api_headers() -> dict:
+    if not API_TOKEN:
+        raise ValueError("BRIA_API_KEY not set")
+    return {
+        "api_token": API_TOKEN,
+        "Content-Type": "application/json"
+    }
+
+
+def _log_request(payload: dict):
+    log.info("API request: aspect_ratio=%s, seed=%s", payload["aspect_ratio"], payload["seed"])
+    if "prompt" in payload:
+        log.debug("Prompt: %s...", payload["prompt"][:100])
+
+
+def generate_image_sync(
+    structured_prompt: dict = None,
+    seed: int = 42,
+    aspect_ratio: str = "1:1",
+    simple_prompt: str = None,
+    num_results: int = 4
+) -> str:
+    """
+    Generate image using FIBO API, holding the request open until done.
     
-    resp = requests.post(GENERATE_URL, headers=headers, json=payload, timeout=120)
+    Can use either:
+    - structured_prompt: dict with FIBO structured format
+    - simple_prompt: plain text prompt (like FIBO platform UI)
+    """
+    payload = build_generate_payload(
+        structured_prompt, seed, aspect_ratio, simple_prompt, num_results
+    )
+    return generate_limited(payload, use_async=False)
+
+
+def generate_from_payload(payload: dict, use_async: bool = None, timeout: float = None) -> str:
+    """
+    Run one generation and return its image URL.
+    
+    Args:
+        payload: Body from build_generate_payload()
+        use_async: Submit and poll instead of a blocking sync call
+                   (defaults to BRIA_ASYNC)
+        timeout: Overall deadline in seconds for this request
+    """
+    if use_async is None:
+        use_async = ASYNC_MODE
+    
+    if use_async:
+        handle = submit_generation(payload, timeout=timeout)
+        return wait_for_generation(handle)
+    
+    headers = _api_headers()
+    _log_request(payload)
+    
+    resp = get_session().post(
+        GENERATE_URL, headers=headers, json={**payload, "sync": True},
+        timeout=(CONNECT_TIMEOUT, timeout or READ_TIMEOUT)
+    )
     
     if resp.status_code != 200:
-        raise Exception(f"BRIA API Error {resp.status_code}: {resp.text}")
+        raise BriaApiError(resp.status_code, f"BRIA API Error {resp.status_code}: {resp.text}")
     
     result = resp.json()
     return result["result"]["image_url"]
 
 
-def get_animation_pose_sequence(animation: str, frame_count: int) -> str:
+def generate_limited(payload: dict, use_async: bool = None, lane: str = DEFAULT_LANE) -> str:
     """
-    Get pose descriptions for animation cycle based on frame count.
-    Kept short to avoid content moderation issues.
-    """
-    # Base poses for each animation type
-    pose_bases = {
-        "run": ["right leg forward", "pushing off", "mid air", "left leg forward", "pushing off opposite", "mid air loop"],
-        "idle": ["neutral stance", "slight inhale", "chest up", "exhale start", "settling", "back to neutral"],
-        "attack": ["wind up pose", "swing start", "mid swing", "full extend", "follow through", "recovery"],
-        "walk": ["right step", "weight shift", "left swing", "left step", "weight shift", "right swing"],
-        "jump": ["crouch", "launch up", "rising", "peak height", "descending", "landing"],
-        "hurt": ["surprised", "leaning back", "stumble", "recovering", "balancing", "standing again"],
-        "death": ["off balance", "tilting", "falling", "almost down", "on ground", "resting"]
+    generate_from_payload() under the host-wide BRIA limiter.
+    
+    The slot is taken in the given priority lane (refine, generate, bulk).
+    Throttled (429) and server (5xx) responses, connection errors and
+    timeouts shrink the shared limits and are retried up to BRIA_RETRIES
+    times.
+    """
+    attempt = 0
+    while True:
+        wait_start = time.perf_counter()
+        with bria_limiter.slot(lane=lane) as slot:
+            metrics.observe("bria_wait", time.perf_counter() - wait_start)
+            try:
+                with metrics.stage("bria"):
+                    image_url = generate_from_payload(payload, use_async=use_async)
+                slot.status_code = 200
+                return image_url
+            except BriaApiError as e:
+                slot.status_code = e.status_code
+                retryable = e.status_code == 429 or e.status_code >= 500
+                if not retryable or attempt >= UPSTREAM_RETRIES:
+                    raise
+                reason = f"returned {e.status_code}"
+            except (requests.RequestException, TimeoutError) as e:
+                # No answer at all is the clearest sign of an overloaded upstream
+                slot.status_code = NO_RESPONSE
+                if attempt >= UPSTREAM_RETRIES:
+                    raise
+                reason = f"did not answer ({type(e).__name__})"
+        attempt += 1
+        backoff = 2 ** attempt
+        log.warning("BRIA %s, retrying in %ds (%d/%d)", reason, backoff, attempt, UPSTREAM_RETRIES)
+        time.sleep(backoff)
+
+
+def submit_generation(payload: dict, timeout: float = None) -> dict:
+    """
+    Submit an asynchronous generation and return a handle for polling.
+    
+    The handle is a plain dict carrying the request id, status URL,
+    deadline and backoff state used by poll_generation().
+    """
+    headers = _api_headers()
+    _log_request(payload)
+    
+    resp = get_session().post(
+        GENERATE_URL, headers=headers, json={**payload, "sync": False},
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+    )
+    
+    if resp.status_code not in (200, 202):
+        raise BriaApiError(resp.status_code, f"BRIA API Error {resp.status_code}: {resp.text}")
+    
+    result = resp.json()
+    image_url = result.get("result", {}).get("image_url")
+    if not (result.get("request_id") or result.get("status_url") or image_url):
+        raise BriaApiError(resp.status_code, f"BRIA API response without a request_id: {resp.text}")
+    now = time.monotonic()
+    handle = {
+        "request_id": result.get("request_id"),
+        "status_url": result.get("status_url") or f"{STATUS_URL}/{result.get('request_id')}",
+        "deadline": now + (timeout or GENERATION_TIMEOUT),
+        "interval": POLL_INTERVAL,
+        "next_poll": now + POLL_INTERVAL,
+        # Some responses complete immediately even when submitted async
+        "image_url": image_url
     }
     
-    base_poses = pose_bases.get(animation, ["pose 1", "pose 2", "pose 3", "pose 4", "pose 5", "pose 6"])
+    log.info("Submitted BRIA request %s", handle["request_id"])
+    return handle
+
+
+def poll_generation(handle: dict) -> str:
+    """
+    Poll the status URL of a submitted generation once.
+    
+    Returns the image URL when complete, None while still running.
+    Raises if the request failed or its deadline has passed.
+    """
+    if handle["image_url"]:
+        return handle["image_url"]
+    
+    resp = get_session().get(
+        handle["status_url"], headers=_api_headers(),
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+    )
+    if resp.status_code >= 500 or resp.status_code == 429:
+        data = {"status": "IN_PROGRESS"}
+    elif resp.status_code not in (200, 202):
+        raise BriaApiError(resp.status_code, f"BRIA Status Error {resp.status_code}: {resp.text}")
+    else:
+        data = resp.json()
+    
+    status = data.get("status", "IN_PROGRESS")
+    if status == "COMPLETED":
+        handle["image_url"] = data["result"]["image_url"]
+        return handle["image_url"]
+    if status == "ERROR":
+        raise BriaGenerationError(
+            resp.status_code, f"BRIA generation {handle['request_id']} failed: {data.get('error')}"
+        )
+    
+    now = time.monotonic()
+    if now >= handle["deadline"]:
+        raise TimeoutError(f"BRIA generation {handle['request_id']} timed out")
+    
+    # Exponential backoff, never sleeping past the deadline
+    handle["interval"] = min(handle["interval"] * POLL_BACKOFF, POLL_MAX_INTERVAL)
+    handle["next_poll"] = min(now + handle["interval"], handle["deadline"])
+    return None
+
+
+def wait_for_generation(handle: dict) -> str:
+    """
+    Poll a submitted generation with backoff until it completes; returns its image URL.
+    
+    Blocks the calling thread, which sleeps between polls. Concurrent
+    generations come from the callers' threads (a job's animations run in
+    process_sprite_job's pool, up to SPRITE_MAX_CONCURRENCY).
+    """
+    while True:
+        image_url = poll_generation(handle)
+        if image_url:
+            return image_url
+        time.sleep(max(0.0, handle["next_poll"] - time.monotonic()))
+
+
+# Base poses for each animation type
+POSE_BASES = {
+    "run": ["right leg forward", "pushing off", "mid air", "left leg forward", "pushing off opposite", "mid air loop"],
+    "idle": ["neutral stance", "slight inhale", "chest up", "exhale start", "settling", "back to neutral"],
+    "attack": ["wind up pose", "swing start", "mid swing", "full extend", "follow through", "recovery"],
+    "walk": ["right step", "weight shift", "left swing", "left step", "weight shift", "right swing"],
+    "jump": ["crouch", "launch up", "rising", "peak height", "descending", "landing"],
+    "hurt": ["surprised", "leaning back", "stumble", "recovering", "balancing", "standing again"],
+    "death": ["off balance", "tilting", "falling", "almost down", "on ground", "resting"]
+}
+
+
+@lru_cache(maxsize=512)
+def get_animation_pose_sequence(animation: str, frame_count: int) -> str:
+    """
+    Get pose descriptions for animation cycle based on frame count.
+    Kept short to avoid content moderation issues. Each (animation, frame
+    count) pair is built once.
+    """
+    base_poses = POSE_BASES.get(animation, ["pose 1", "pose 2", "pose 3", "pose 4", "pose 5", "pose 6"])
     
     # Adjust poses to match frame count
     if frame_count <= len(base_poses):
@@ -173,16 +423,17 @@ def build_structured_sprite_prompt(
     }
 
 
-def generate_spritesheet_simple(
+def build_spritesheet_payload(
     subject: str,
     animation: str,
     frame_count: int = 6,
     style: str = "anime",
     seed: int = 42,
     use_structured: bool = False
-) -> str:
+) -> dict:
     """
-    Generate sprite sheet with dynamic grid layout based on frame count.
+    Build the generate request for a sprite sheet with a grid layout
+    based on frame count.
     
     Args:
         use_structured: If True, uses FIBO's structured prompt format for better accuracy
@@ -190,14 +441,14 @@ def generate_spritesheet_simple(
     # Get optimal grid layout
     cols, rows, aspect_ratio = get_grid_layout(frame_count)
     
-    print(f"    Grid: {cols}x{rows}, Aspect: {aspect_ratio}, Structured: {use_structured}")
+    log.debug("Grid: %dx%d, aspect: %s, structured: %s", cols, rows, aspect_ratio, use_structured)
     
     if use_structured:
         # Use structured prompt for better accuracy
         structured_prompt = build_structured_sprite_prompt(
             subject, animation, frame_count, style, cols, rows
         )
-        return generate_image_sync(
+        return build_generate_payload(
             structured_prompt=structured_prompt,
             seed=seed,
             aspect_ratio=aspect_ratio,
@@ -231,7 +482,7 @@ def generate_spritesheet_simple(
             f"Side view, clean solid background, no text, game sprite style."
         )
         
-        return generate_image_sync(
+        return build_generate_payload(
             simple_prompt=prompt,
             seed=seed,
             aspect_ratio=aspect_ratio,
@@ -239,29 +490,112 @@ def generate_spritesheet_simple(
         )
 
 
-def download_image(url: str, save_path: str) -> str:
-    """Download image from URL and save locally."""
-    resp = requests.get(url, timeout=60)
-    if resp.status_code != 200:
-        raise Exception(f"Failed to download: {resp.status_code}")
+def generate_spritesheet_simple(
+    subject: str,
+    animation: str,
+    frame_count: int = 6,
+    style: str = "anime",
+    seed: int = 42,
+    use_structured: bool = False
+) -> str:
+    """
+    Generate sprite sheet with dynamic grid layout based on frame count.
     
+    Args:
+        use_structured: If True, uses FIBO's structured prompt format for better accuracy
+    """
+    payload = build_spritesheet_payload(
+        subject, animation, frame_count, style, seed, use_structured
+    )
+    return generate_limited(payload)
+
+
+def fetch_image(url: str, save_path: str = None) -> io.BytesIO:
+    """
+    Stream an image from URL into an in-memory buffer.
+
+    The returned buffer is rewound and can be passed straight to PIL.
+    If save_path is given, a copy is also written to disk.
+    """
+    buf = io.BytesIO()
+    with get_session().get(
+        url, stream=True, timeout=(CONNECT_TIMEOUT, DOWNLOAD_TIMEOUT)
+    ) as resp:
+        if resp.status_code != 200:
+            raise Exception(f"Failed to download: {resp.status_code}")
+        for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            buf.write(chunk)
+    
+    buf.seek(0)
+    if save_path:
+        save_buffer(buf, save_path)
+    return buf
+
+
+def save_buffer(buf: io.BytesIO, save_path: str) -> str:
+    """Write an in-memory image to disk without moving its read position."""
     os.makedirs(os.path.dirname(save_path), exist_ok=True)
     with open(save_path, "wb") as f:
-        f.write(resp.content)
+        f.write(buf.getbuffer())
+    return save_path
+
+
+def generate_sheet(payload: dict, save_path: str = None, bypass_cache: bool = False,
+                   lane: str = DEFAULT_LANE) -> io.BytesIO:
+    """
+    Generate one image and download it into memory.
+    
+    Results are cached by payload; a hit skips both the BRIA call and the
+    download. bypass_cache forces a fresh generation (which is then cached).
+    Identical requests already in flight are joined instead of repeated,
+    except by bypass_cache callers.
+    lane is the upstream priority lane of the call.
+    """
+    key = generation_cache.payload_key(payload)
+    
+    if not bypass_cache:
+        data = generation_cache.get(key)
+        if data is not None:
+            log.info("Cache hit: %s", key[:12])
+            return _to_buffer(data, save_path)
+    
+    def run() -> bytes:
+        image_url = generate_limited(payload, lane=lane)
+        with metrics.stage("download"):
+            data = fetch_image(image_url).getvalue()
+        generation_cache.put(key, data)
+        return data
     
+    # Another worker may have finished the same request while we waited
+    # for its lock; its result is in the shared cache.
+    recheck = None if bypass_cache else (lambda: generation_cache.peek(key))
+    data = single_flight.do(key, run, recheck=recheck, join=not bypass_cache)
+    return _to_buffer(data, save_path)
+
+
+def _to_buffer(data: bytes, save_path: str = None) -> io.BytesIO:
+    buf = io.BytesIO(data)
+    if save_path:
+        save_buffer(buf, save_path)
+    return buf
+
+
+def download_image(url: str, save_path: str) -> str:
+    """Download image from URL and save locally."""
+    fetch_image(url, save_path)
     return save_path
 
 
-def refine_spritesheet(
+def build_refine_payload(
     original_prompt: str,
     animation: str,
     frame_count: int,
     style: str,
     refinement_instructions: str,
     seed: int = None
-) -> str:
+) -> dict:
     """
-    Refine/regenerate a sprite sheet with additional instructions.
+    Build the generate request for a refined sprite sheet.
     Uses the original prompt plus refinement feedback for better results.
     
     Args:
@@ -311,12 +645,30 @@ def refine_spritesheet(
     # Use random seed for variation, or specific seed for consistency
     actual_seed = seed if seed is not None else random.randint(1, 99999)
     
-    print(f"    Refining with seed: {actual_seed}")
-    print(f"    Refinement: {refinement_instructions[:100]}...")
+    log.info("Refining with seed %s: %s...", actual_seed, refinement_instructions[:100])
     
-    return generate_image_sync(
+    return build_generate_payload(
         simple_prompt=prompt,
         seed=actual_seed,
         aspect_ratio=aspect_ratio,
         num_results=1
     )
+
+
+def refine_spritesheet(
+    original_prompt: str,
+    animation: str,
+    frame_count: int,
+    style: str,
+    refinement_instructions: str,
+    seed: int = None
+) -> str:
+    """
+    Refine/regenerate a sprite sheet with additional instructions.
+    Uses the original prompt plus refinement feedback for better results.
+    """
+    payload = build_refine_payload(
+        original_prompt, animation, frame_count, style,
+        refinement_instructions, seed
+    )
+    return generate_limited(payload, lane="refine")
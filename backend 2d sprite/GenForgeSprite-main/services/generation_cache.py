@@ -0,0 +1,177 @@
+"""
+Generation Cache - Content-addressed store of downloaded upstream images.
+
+Images are keyed by a hash of the exact /v2/image/generate payload. With a
+fixed seed the same payload produces the same sheet, so repeat requests can
+be served from disk without calling BRIA at all.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+CACHE_DIR = os.getenv(
+    "GENERATION_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache", "generations")
+)
+CACHE_ENABLED = os.getenv("GENERATION_CACHE", "true").lower() not in ("0", "false", "no")
+MAX_BYTES = int(float(os.getenv("GENERATION_CACHE_MAX_MB", "512")) * 1024 * 1024)
+# Other workers store entries too, so the running size total is corrected
+# by a directory scan at least this often (seconds)
+RESCAN_INTERVAL = 60.0
+
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+# Bytes on disk as of the last scan plus what this process stored since
+_usage = {"bytes": None, "scanned_at": 0.0}
+_lock = threading.Lock()
+
+
+def payload_key(payload: Dict[str, Any]) -> str:
+    """Stable content key for an upstream request body."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, key[:2], f"{key}.png")
+
+
+def _count(stat: str, n: int = 1):
+    with _lock:
+        _stats[stat] += n
+
+
+def _read(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def get(key: str) -> Optional[bytes]:
+    """Return cached image bytes for key, or None on a miss."""
+    if not CACHE_ENABLED:
+        return None
+
+    path = _entry_path(key)
+    data = _read(path)
+    if data is None:
+        _count("misses")
+        return None
+
+    # Touch the entry so eviction sees it as recently used
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    _count("hits")
+    return data
+
+
+def peek(key: str) -> Optional[bytes]:
+    """Cached image bytes for key, without counting a lookup or touching the entry."""
+    if not CACHE_ENABLED:
+        return None
+    return _read(_entry_path(key))
+
+
+def contains(key: str) -> bool:
+    """Whether key is cached, without counting a lookup or touching the entry."""
+    return CACHE_ENABLED and os.path.isfile(_entry_path(key))
+
+
+def put(key: str, data: bytes) -> Optional[str]:
+    """Store image bytes under key and evict old entries over the size cap."""
+    if not CACHE_ENABLED:
+        return None
+
+    path = _entry_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        replaced = os.path.getsize(path)
+    except OSError:
+        replaced = 0
+
+    # Write atomically so concurrent readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    _count("stores")
+
+    if _over_cap(len(data) - replaced):
+        evict(MAX_BYTES)
+    return path
+
+
+def _over_cap(added: int) -> bool:
+    """Add to the running size total; True if the directory needs a scan."""
+    with _lock:
+        if _usage["bytes"] is None or time.monotonic() - _usage["scanned_at"] >= RESCAN_INTERVAL:
+            return True
+        _usage["bytes"] += added
+        return _usage["bytes"] > MAX_BYTES
+
+
+def _entries():
+    """List (mtime, size, path) of all cache entries."""
+    entries = []
+    if not os.path.exists(CACHE_DIR):
+        return entries
+    for shard in os.listdir(CACHE_DIR):
+        shard_dir = os.path.join(CACHE_DIR, shard)
+        if not os.path.isdir(shard_dir):
+            continue
+        for filename in os.listdir(shard_dir):
+            if not filename.endswith(".png"):
+                continue
+            path = os.path.join(shard_dir, filename)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+
+def evict(max_bytes: int) -> int:
+    """Delete least recently used entries until the cache fits max_bytes."""
+    entries = _entries()
+    total = sum(size for _, size, _ in entries)
+
+    removed = 0
+    if total > max_bytes:
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        _count("evictions", removed)
+
+    with _lock:
+        _usage["bytes"] = total
+        _usage["scanned_at"] = time.monotonic()
+    return removed
+
+
+def get_stats() -> Dict[str, Any]:
+    """Hit/miss counters for this process plus current disk usage."""
+    entries = _entries()
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats.update({
+        "enabled": CACHE_ENABLED,
+        "entries": len(entries),
+        "bytes": sum(size for _, size, _ in entries),
+        "max_bytes": MAX_BYTES,
+        "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0
+    })
+    return stats
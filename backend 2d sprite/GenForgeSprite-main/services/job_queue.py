@@ -0,0 +1,540 @@
+"""
+Job Queue - Runs sprite jobs in the background.
+
+Requests are written to the job store and return immediately. Each worker
+process runs a small pool of threads that claim queued jobs from the shared
+store, so a job accepted by one Gunicorn worker may run on any of them.
+
+While a job runs, a heartbeat thread in its process refreshes it (a single
+BRIA call may take longer than JOB_STALE_SECONDS), so other workers never
+take over a job that is still running.
+
+Workers claim the highest-priority lane first. A running job also checks
+for queued work of a higher lane each time it finishes a stage, and runs
+that job first on the same thread (preemption at stage boundaries).
+
+Each job runs with its own metrics.JobTimings bound, and its result gets
+the per-stage breakdown ("timings") and the number of BRIA calls made
+("upstream_calls"). Jobs whose request has "profile" set run under
+cProfile (see services/profiling.py).
+
+Kinds may register an estimator (see services/estimator.py). A job is
+stored with its estimate when queued, and while it waits its status adds
+the expected queue wait: the estimated work ahead of it spread over the
+job threads of all workers on the host.
+
+The job store is shared by the workers of one host. With an artifact store
+configured, each job's status is also written to a sprite-jobs/<job_id>
+record when it is queued, starts and finishes, so the status endpoint of
+any node can answer for it (as of its last change; progress events, event
+streams and batches are only served by the node that holds the job).
+"""
+import os
+import json
+import socket
+import threading
+import time
+import uuid
+import logging
+from typing import Callable, Dict, Any, Iterator, List, Optional
+
+from services import job_store, metrics, profiling
+from services.artifact_store import store as artifact_store
+from services.webhooks import dispatcher as webhooks
+
+log = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv("JOB_WORKERS", "2"))
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+# How often event streams look for new events, and send keep-alives when idle
+EVENT_POLL_INTERVAL = float(os.getenv("JOB_EVENT_POLL_INTERVAL", "0.25"))
+EVENT_KEEPALIVE = float(os.getenv("JOB_EVENT_KEEPALIVE", "15"))
+# Let higher-priority jobs run at stage boundaries of lower-priority ones
+PREEMPTION = os.getenv("JOB_PREEMPTION", "true").lower() not in ("0", "false", "no")
+
+# Running jobs are kept alive well within the stale window
+HEARTBEAT_INTERVAL = min(30.0, job_store.STALE_SECONDS / 3)
+
+# Events emitted on the job's own thread after a stage has finished
+STAGE_BOUNDARIES = {"sheet_received", "frames_sliced", "animation_done", "combined_sheet"}
+
+# kind -> handler(request, job_id, on_event, lane) -> result dict
+_handlers: Dict[str, Callable[..., Dict[str, Any]]] = {}
+# kind -> estimator(request) -> {"seconds": ..., "upstream_calls": ..., ...}
+_estimators: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {}
+_threads = []
+_started_pid = None
+_start_lock = threading.Lock()
+_wakeup = threading.Event()
+_preemptions = {lane: 0 for lane in job_store.LANES}
+# job id -> worker, for the jobs this process is running
+_running: Dict[str, str] = {}
+_running_lock = threading.Lock()
+_heartbeat_pid = None
+_stats_lock = threading.Lock()
+# Finished jobs of other nodes, read from the artifact store
+_remote_finished: Dict[str, Dict[str, Any]] = {}
+REMOTE_CACHE_MAX = 1000
+
+
+def register_handler(kind: str, handler: Callable[..., Dict[str, Any]]):
+    _handlers[kind] = handler
+
+
+def register_estimator(kind: str, estimator: Callable[[Dict[str, Any]], Dict[str, Any]]):
+    _estimators[kind] = estimator
+
+
+def _estimate(kind: str, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """A request's estimate (None without an estimator, or if it fails)."""
+    if kind not in _estimators:
+        return None
+    try:
+        return _estimators[kind](request)
+    except Exception as e:
+        log.warning("Could not estimate %s job: %s", kind, e)
+        return None
+
+
+def enqueue(kind: str, request: Dict[str, Any], job_id: str = None,
+            lane: str = job_store.DEFAULT_LANE, idempotency_key: str = None,
+            callback_url: str = None, base_url: str = None) -> Dict[str, Any]:
+    """
+    Store a job for background processing and wake the local pool.
+    
+    A request repeated with the same idempotency key returns the original
+    job (with "replayed" set) instead of queueing new work. If callback_url
+    is given, a signed webhook is sent there when the job finishes.
+    """
+    if kind not in _handlers:
+        raise ValueError(f"No handler registered for job kind '{kind}'")
+    if callback_url:
+        webhooks.validate_url(callback_url)
+    job = job_store.create_job(
+        job_id or str(uuid.uuid4()), kind, request, lane, idempotency_key=idempotency_key,
+        callback_url=callback_url, base_url=base_url, estimate=_estimate(kind, request)
+    )
+    start_workers()
+    if not job["replayed"]:
+        _publish_status(job["id"])
+        _wakeup.set()
+    return job
+
+
+def wait_for_job(job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+    """Block until a job finishes or timeout passes; returns its status."""
+    deadline = time.monotonic() + timeout
+    while True:
+        status = get_status(job_id)
+        if status is None or status["status"] in (job_store.COMPLETED, job_store.FAILED):
+            return status
+        if time.monotonic() >= deadline:
+            return status
+        time.sleep(EVENT_POLL_INTERVAL)
+
+
+def start_workers():
+    """Start this process's worker threads (once per process)."""
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _threads.clear()
+        for i in range(POOL_SIZE):
+            name = f"{socket.gethostname()}:{os.getpid()}:job-{i}"
+            thread = threading.Thread(target=_worker_loop, args=(name,), name=name, daemon=True)
+            thread.start()
+            _threads.append(thread)
+        _started_pid = os.getpid()
+        log.info("%d worker threads started (pid %d)", POOL_SIZE, os.getpid())
+
+
+def _worker_loop(worker: str):
+    while True:
+        try:
+            job = job_store.claim_next(worker)
+        except Exception as e:
+            log.warning("Claim failed: %s", e)
+            job = None
+        if job is None:
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+        run_job(job, worker)
+
+
+def _beat():
+    """Refresh the heartbeat of every job this process is running."""
+    with _running_lock:
+        running = dict(_running)
+    for job_id, worker in running.items():
+        try:
+            if not job_store.heartbeat(job_id, worker):
+                log.warning("Job %s is no longer held by %s", job_id[:8], worker)
+                with _running_lock:
+                    _running.pop(job_id, None)
+        except Exception as e:
+            log.warning("Heartbeat of job %s failed: %s", job_id[:8], e)
+
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        _beat()
+
+
+def _start_heartbeat():
+    global _heartbeat_pid
+    if _heartbeat_pid == os.getpid():
+        return
+    with _start_lock:
+        if _heartbeat_pid == os.getpid():
+            return
+        threading.Thread(target=_heartbeat_loop, name="job-heartbeat", daemon=True).start()
+        _heartbeat_pid = os.getpid()
+
+
+def run_job(job: Dict[str, Any], worker: str = None):
+    """Run one claimed job and record its outcome (unless another worker took the job over)."""
+    job_id = job["id"]
+    worker = worker or job["worker"]
+    job_thread = threading.get_ident()
+    # Other jobs must not run inside a profiled job's profile
+    profiled = bool((job["request"] or {}).get("profile"))
+    _publish_status(job_id)
+
+    def on_event(event: str, animation: str = None, timings: Dict[str, float] = None, **data):
+        job_store.update_progress(job_id, animation, timings=timings, worker=worker, stage=event, **data)
+        if (PREEMPTION and not profiled and event in STAGE_BOUNDARIES
+                and threading.get_ident() == job_thread):
+            _run_preempting_jobs(job, worker)
+
+    with _running_lock:
+        _running[job_id] = worker
+    _start_heartbeat()
+    try:
+        with metrics.track_job(job["kind"]) as timings:
+            if profiled:
+                result = _run_profiled(job, on_event)
+            else:
+                result = _handlers[job["kind"]](
+                    job["request"], job_id=job_id, on_event=on_event, lane=job["lane"]
+                )
+        result["timings"] = timings.as_dict()
+        result["upstream_calls"] = timings.count("bria")
+        recorded = job_store.complete_job(job_id, result, worker)
+    except Exception as e:
+        log.exception("Job %s failed: %s", job_id[:8], e)
+        recorded = job_store.fail_job(job_id, str(e), worker)
+    finally:
+        with _running_lock:
+            _running.pop(job_id, None)
+    if not recorded:
+        log.warning("Job %s was taken over by another worker; discarding the outcome of this run", job_id[:8])
+        return
+    _publish_status(job_id)
+
+    if job.get("callback_url"):
+        _send_webhook(job_id)
+
+
+def _run_profiled(job: Dict[str, Any], on_event: Callable[..., None]) -> Dict[str, Any]:
+    """Run a job's handler under cProfile; the result links to the saved profile."""
+    profile, info = None, None
+    try:
+        with profiling.profile_job(job["id"], job["kind"], bool(job["request"].get("profile_memory"))) as profile:
+            result = _handlers[job["kind"]](
+                job["request"], job_id=job["id"], on_event=on_event, lane=job["lane"]
+            )
+    finally:
+        if profile is not None:
+            try:
+                info = profile.save()
+            except Exception as e:
+                log.warning("Could not save profile of %s: %s", job["id"], e)
+    result["profile"] = info
+    return result
+
+
+def _send_webhook(job_id: str):
+    """POST the finished job's status, artifact URLs and timings to its callback."""
+    job = job_store.get_job(job_id)
+    status = get_status(job_id)
+    base_url = (job["base_url"] or "").rstrip("/")
+    result = status.get("result") or {}
+    payload = {
+        **status,
+        "artifacts": {
+            name: base_url + path if path.startswith("/") else path
+            for name, path in (result.get("download_urls") or {}).items()
+        }
+    }
+    event = "job.completed" if status["status"] == job_store.COMPLETED else "job.failed"
+    webhooks.send(job["callback_url"], event, payload)
+
+
+def _run_preempting_jobs(job: Dict[str, Any], worker: str = None):
+    """
+    Run queued jobs of higher-priority lanes before resuming this one. The
+    heartbeat thread keeps this job alive meanwhile, and the time is left
+    out of its total (and so out of the estimator's samples).
+    """
+    while True:
+        urgent = job_store.claim_next(worker, job["priority"])
+        if urgent is None:
+            return
+        log.info("%s job %s yields to %s job %s", job["lane"], job["id"][:8], urgent["lane"], urgent["id"][:8])
+        with _stats_lock:
+            _preemptions[job["lane"]] += 1
+        with metrics.paused():
+            run_job(urgent, worker)
+
+
+def queue_wait(priority: int, key: float) -> Dict[str, Any]:
+    """
+    Expected wait before a queued job with this priority and sort key
+    (job_store.sort_key) starts, and how many queued jobs are ahead of it.
+    """
+    ahead = job_store.work_ahead(priority, key)
+    # Web-only processes (JOB_WORKERS=0) leave the jobs to other workers
+    slots = max(1, POOL_SIZE * metrics.live_processes())
+    seconds = 0.0
+    if ahead["queued"] or ahead["running"] >= slots:
+        seconds = (ahead["queued_seconds"] + ahead["running_seconds"]) / slots
+    return {"queue_seconds": round(seconds, 1), "jobs_ahead": ahead["queued"]}
+
+
+def estimate_job(kind: str, request: Dict[str, Any], lane: str = job_store.DEFAULT_LANE) -> Dict[str, Any]:
+    """Estimate of a request if it were queued now, including the queue wait (nothing is queued)."""
+    if kind not in _estimators:
+        raise ValueError(f"No estimator registered for job kind '{kind}'")
+    if lane not in job_store.LANES:
+        raise ValueError(f"Unknown lane '{lane}'")
+    estimate = _estimators[kind](request)
+    wait = queue_wait(job_store.LANES.index(lane), job_store.sort_key(time.time(), estimate["seconds"]))
+    return {**estimate, **wait, "ready_in_seconds": round(wait["queue_seconds"] + estimate["seconds"], 1)}
+
+
+def get_queue_stats() -> Dict[str, Any]:
+    """Per-lane queue depth, queue wait times and preemptions, plus webhook delivery."""
+    lanes = job_store.lane_stats()
+    with _stats_lock:
+        for lane, count in _preemptions.items():
+            lanes[lane]["preempted"] = count
+    return {
+        "workers": POOL_SIZE,
+        "order": job_store.ORDER,
+        "preemption": PREEMPTION,
+        "lanes": lanes,
+        "webhooks": webhooks.get_stats()
+    }
+
+
+def _publish_status(job_id: str):
+    """Write a job's current status to its record in the artifact store."""
+    if not artifact_store.enabled:
+        return
+    try:
+        artifact_store.put_record(f"sprite-jobs/{job_id}", get_status(job_id))
+    except Exception as e:
+        # Nodes of this host still answer from the job store
+        log.warning("Could not publish the status of job %s: %s", job_id, e)
+
+
+def _remote_status(job_id: str) -> Optional[Dict[str, Any]]:
+    """Status of a job held by another node, as of its last change."""
+    status = _remote_finished.get(job_id)
+    if status is not None or not artifact_store.enabled:
+        return status
+    try:
+        status = artifact_store.get_record(f"sprite-jobs/{job_id}")
+    except Exception as e:
+        log.warning("Could not look up job %s in the artifact store: %s", job_id, e)
+        return None
+    if status is not None and status["status"] in (job_store.COMPLETED, job_store.FAILED):
+        with _stats_lock:
+            if len(_remote_finished) >= REMOTE_CACHE_MAX:
+                _remote_finished.clear()
+            _remote_finished[job_id] = status
+    return status
+
+
+def get_status(job_id: str) -> Dict[str, Any]:
+    """Public view of a job for the status endpoint (None if unknown)."""
+    job = job_store.get_job(job_id)
+    if not job:
+        return _remote_status(job_id)
+    status = {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "lane": job["lane"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "timings": job["timings"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"]
+    }
+    if job["status"] == job_store.QUEUED:
+        status["queue_position"] = job_store.queue_position(job_id)
+    if job["estimate"]:
+        estimate = dict(job["estimate"])
+        if job["status"] == job_store.QUEUED:
+            key = job_store.sort_key(job["created_at"], job["estimated_seconds"])
+            estimate.update(queue_wait(job["priority"], key))
+            estimate["ready_in_seconds"] = round(estimate["queue_seconds"] + estimate["seconds"], 1)
+        elif job["status"] == job_store.RUNNING and job["started_at"]:
+            estimate["remaining_seconds"] = round(max(0.0, estimate["seconds"] - (time.time() - job["started_at"])), 1)
+        status["estimate"] = estimate
+    if job["status"] == job_store.COMPLETED:
+        status["result"] = job["result"]
+    if job["status"] == job_store.FAILED:
+        status["error"] = job["error"]
+    return status
+
+
+def stream_events(job_id: str, after_id: int = 0) -> Iterator[Optional[Dict[str, Any]]]:
+    """
+    Yield a job's events after after_id as they are recorded, ending after
+    the completed/failed event. Yields None when idle so callers can send
+    keep-alives (and notice disconnected clients). Ends at once when
+    after_id already covers a finished job's last event.
+    """
+    job = job_store.get_job(job_id)
+    # Checked before reading events, so a finished job's last event is read below
+    finished = job is not None and job["status"] in (job_store.COMPLETED, job_store.FAILED)
+    last_sent = time.monotonic()
+    while True:
+        events = job_store.get_events(job_id, after_id)
+        for event in events:
+            after_id = event["id"]
+            yield event
+            if event["event"] in (job_store.COMPLETED, job_store.FAILED):
+                return
+        if finished:
+            return
+        if events:
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= EVENT_KEEPALIVE:
+            last_sent = time.monotonic()
+            yield None
+        time.sleep(EVENT_POLL_INTERVAL)
+
+
+def enqueue_batch(kind: str, requests: List[Dict[str, Any]], batch_id: str = None,
+                  lane: str = "bulk", callback_url: str = None, base_url: str = None) -> Dict[str, Any]:
+    """
+    Queue one job per distinct request of a batch, in the bulk lane by
+    default. Identical requests share a job.
+    """
+    batch_id = batch_id or str(uuid.uuid4())
+    jobs_by_request = {}
+    job_ids = []
+    for request in requests:
+        key = json.dumps(request, sort_keys=True)
+        if key not in jobs_by_request:
+            jobs_by_request[key] = enqueue(
+                kind, request, lane=lane, callback_url=callback_url, base_url=base_url
+            )["id"]
+        job_ids.append(jobs_by_request[key])
+    job_store.create_batch(batch_id, job_ids)
+    return get_batch_status(batch_id)
+
+
+def get_batch_status(batch_id: str) -> Optional[Dict[str, Any]]:
+    """Per-item view of a batch (None if unknown)."""
+    jobs = job_store.get_batch(batch_id)
+    if not jobs:
+        return None
+
+    items = []
+    first_index = {}
+    counts = {}
+    for job in jobs:
+        item = {
+            "index": job["position"],
+            "job_id": job["id"],
+            "status": job["status"],
+            "progress": {name: entry.get("stage") for name, entry in job["progress"].items()}
+        }
+        if job["id"] in first_index:
+            item["duplicate_of"] = first_index[job["id"]]
+        else:
+            first_index[job["id"]] = job["position"]
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        if job["status"] == job_store.COMPLETED:
+            item["result"] = job["result"]
+        if job["status"] == job_store.FAILED:
+            item["error"] = job["error"]
+        items.append(item)
+
+    finished = counts.get(job_store.COMPLETED, 0) + counts.get(job_store.FAILED, 0)
+    if finished < len(first_index):
+        status = job_store.RUNNING if len(first_index) > counts.get(job_store.QUEUED, 0) else job_store.QUEUED
+    elif counts.get(job_store.FAILED):
+        status = "completed_with_errors" if counts.get(job_store.COMPLETED) else job_store.FAILED
+    else:
+        status = job_store.COMPLETED
+
+    return {
+        "batch_id": batch_id,
+        "status": status,
+        "total": len(items),
+        "unique_jobs": len(first_index),
+        "counts": counts,
+        "items": items
+    }
+
+
+def stream_batch_events(batch_id: str, after_id: int = 0) -> Iterator[Optional[Dict[str, Any]]]:
+    """
+    Yield batch items as their jobs finish, in completion order, then a
+    final batch_completed event. Yields None when idle (see stream_events).
+    
+    batch_completed gets the id after the last item's, so a client that
+    reconnects with it gets an empty stream, and one that reconnects after
+    the last item still gets batch_completed.
+    """
+    terminal = [job_store.COMPLETED, job_store.FAILED]
+    indexes = {}
+    for job in job_store.get_batch(batch_id):
+        indexes.setdefault(job["id"], []).append(job["position"])
+    finished = {
+        event["job_id"] for event in job_store.get_batch_events(batch_id, terminal)
+        if event["id"] <= after_id
+    }
+
+    last_sent = time.monotonic()
+    while len(finished) < len(indexes):
+        events = job_store.get_batch_events(batch_id, terminal, after_id)
+        for event in events:
+            after_id = event["id"]
+            finished.add(event["job_id"])
+            yield {
+                "id": event["id"],
+                "event": f"item_{event['event']}",
+                "job_id": event["job_id"],
+                "indexes": indexes[event["job_id"]],
+                **event["data"]
+            }
+        if events:
+            last_sent = time.monotonic()
+            continue
+        if time.monotonic() - last_sent >= EVENT_KEEPALIVE:
+            last_sent = time.monotonic()
+            yield None
+        time.sleep(EVENT_POLL_INTERVAL)
+
+    end_id = max(event["id"] for event in job_store.get_batch_events(batch_id, terminal)) + 1
+    if after_id >= end_id:
+        return
+    status = get_batch_status(batch_id)
+    yield {
+        "id": end_id,
+        "event": "batch_completed",
+        "batch_id": batch_id,
+        "status": status["status"],
+        "counts": status["counts"]
+    }
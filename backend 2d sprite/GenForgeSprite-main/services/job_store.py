@@ -0,0 +1,626 @@
+"""
+Job Store - Persistent state of queued sprite jobs.
+
+Jobs live in a local SQLite database so that every Gunicorn worker on the
+host can claim queued work and answer status queries, no matter which
+worker accepted the request. Each job also keeps an ordered event log that
+the SSE endpoint replays and tails.
+
+Jobs belong to a priority lane (refine, generate, bulk); workers always
+claim from the highest-priority lane first. Within a lane jobs run oldest
+first, or with JOB_ORDER=sjf shortest first by their stored estimate (see
+services/estimator.py). Under SJF each second a job has waited counts as
+JOB_SJF_AGING seconds off its estimate, so long jobs are not starved.
+
+A running job belongs to the worker that claimed it. That worker's process
+refreshes the job's heartbeat while it runs (see services/job_queue.py);
+a job whose heartbeat stops is queued again, up to JOB_MAX_ATTEMPTS runs,
+and only the worker that holds the job can record its progress and
+outcome, so a run that lost its job cannot overwrite the new run's result.
+
+Clients may tag a request with an idempotency key; the key maps to its job
+for IDEMPOTENCY_TTL seconds, so a retried request gets the same job back.
+
+The store also keeps when each output directory was last downloaded, which
+the retention sweeper uses for LRU eviction, and each worker process's
+latest metrics snapshot, which /metrics adds up.
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+DB_PATH = os.getenv(
+    "JOB_STORE_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "jobs.sqlite")
+)
+# Running jobs without a heartbeat for this long are assumed orphaned
+# (their worker was killed) and are queued again.
+STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "900"))
+# Orphaned jobs that already ran this many times fail instead
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# How long an idempotency key keeps pointing at its job
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+# Finished jobs are deleted with their events this long after finishing
+# (by the retention sweeper; 0 = keep), as are snapshots of gone processes
+RECORD_TTL = float(os.getenv("JOB_RECORD_TTL", str(90 * 86400)))
+# Order of queued jobs within a lane: fifo or sjf (shortest estimate first)
+ORDER = os.getenv("JOB_ORDER", "fifo").lower()
+SJF_AGING = float(os.getenv("JOB_SJF_AGING", "1.0"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    request TEXT NOT NULL,
+    progress TEXT NOT NULL DEFAULT '{}',
+    timings TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL,
+    lane TEXT NOT NULL DEFAULT 'generate',
+    priority INTEGER NOT NULL DEFAULT 1,
+    callback_url TEXT,
+    base_url TEXT,
+    estimated_seconds REAL,
+    estimate TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    animation TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events (job_id, id);
+CREATE TABLE IF NOT EXISTS batch_items (
+    batch_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    job_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (batch_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_batch_items_job ON batch_items (job_id);
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    request_hash TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+CREATE TABLE IF NOT EXISTS output_access (
+    job_dir TEXT PRIMARY KEY,
+    accessed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metrics_snapshots (
+    process TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+"""
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# Priority lanes, highest first (same names as the upstream limiter's lanes)
+LANES = ("refine", "generate", "bulk")
+DEFAULT_LANE = "generate"
+# Wait-time metrics cover jobs started within this window
+LANE_STATS_WINDOW = 3600
+
+_local = threading.local()
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused with a different request body."""
+
+
+def _connect() -> sqlite3.Connection:
+    """Per-thread connection to the job database."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(DB_PATH)), exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        _migrate(conn)
+        _local.conn = conn
+    return conn
+
+
+def _migrate(conn: sqlite3.Connection):
+    """Add columns introduced after a database was created."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+    if "lane" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN lane TEXT NOT NULL DEFAULT 'generate'")
+    if "priority" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 1")
+    if "callback_url" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN callback_url TEXT")
+        conn.execute("ALTER TABLE jobs ADD COLUMN base_url TEXT")
+    if "estimate" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN estimated_seconds REAL")
+        conn.execute("ALTER TABLE jobs ADD COLUMN estimate TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority, created_at)")
+
+
+@contextmanager
+def _transaction():
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    for field in ("request", "progress", "timings", "result", "estimate"):
+        if job.get(field) is not None:
+            job[field] = json.loads(job[field])
+    return job
+
+
+def sort_key(created_at: float, estimated_seconds: Optional[float]) -> float:
+    """Position of a queued job within its lane (lower runs first)."""
+    if ORDER == "sjf":
+        return (estimated_seconds or 0.0) + created_at * SJF_AGING
+    return created_at
+
+
+def _sort_key_sql() -> Tuple[str, tuple]:
+    """sort_key() as an SQL expression over the jobs table, and its parameters."""
+    if ORDER == "sjf":
+        return "COALESCE(estimated_seconds, 0) + created_at * ?", (SJF_AGING,)
+    return "created_at", ()
+
+
+def _to_event(row: sqlite3.Row) -> Dict[str, Any]:
+    event = dict(row)
+    event["data"] = json.loads(event["data"])
+    return event
+
+
+def _insert_event(conn: sqlite3.Connection, job_id: str, event: str,
+                  animation: Optional[str] = None, data: Dict[str, Any] = None):
+    conn.execute(
+        "INSERT INTO job_events (job_id, event, animation, data, created_at) VALUES (?, ?, ?, ?, ?)",
+        (job_id, event, animation, json.dumps(data or {}), time.time())
+    )
+
+
+def request_hash(request: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _lookup_idempotency_key(conn: sqlite3.Connection, kind: str, key: str,
+                            request: Dict[str, Any], job_id: str) -> Optional[str]:
+    """
+    Job already mapped to the key, or None after mapping it to job_id.
+    A failed job releases its key, so a retry runs the request again.
+    """
+    now = time.time()
+    conn.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (now - IDEMPOTENCY_TTL,))
+    row = conn.execute(
+        """
+        SELECT k.request_hash, k.job_id FROM idempotency_keys k JOIN jobs ON jobs.id = k.job_id
+        WHERE k.kind = ? AND k.key = ? AND jobs.status != ?
+        """,
+        (kind, key, FAILED)
+    ).fetchone()
+    if row:
+        if row["request_hash"] != request_hash(request):
+            raise IdempotencyConflict(
+                f"Idempotency key '{key}' was already used with a different request"
+            )
+        return row["job_id"]
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO idempotency_keys (kind, key, request_hash, job_id, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (kind, key, request_hash(request), job_id, now)
+    )
+    return None
+
+
+def create_job(job_id: str, kind: str, request: Dict[str, Any],
+               lane: str = DEFAULT_LANE, idempotency_key: str = None,
+               callback_url: str = None, base_url: str = None,
+               estimate: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Insert a new queued job in a priority lane.
+    
+    callback_url receives a webhook when the job finishes; base_url is the
+    public server URL used to make the webhook's artifact URLs absolute.
+    estimate is the job's predicted run time and upstream calls.
+    
+    If the idempotency key already maps to a job of this kind, nothing is
+    inserted and that job is returned with "replayed" set. Raises
+    IdempotencyConflict if the key was used for a different request.
+    """
+    if lane not in LANES:
+        raise ValueError(f"Unknown lane '{lane}'")
+    with _transaction() as conn:
+        existing_id = None
+        if idempotency_key:
+            existing_id = _lookup_idempotency_key(conn, kind, idempotency_key, request, job_id)
+        if existing_id is None:
+            conn.execute(
+                """
+                INSERT INTO jobs
+                    (id, kind, status, request, created_at, lane, priority, callback_url, base_url,
+                     estimated_seconds, estimate)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (job_id, kind, QUEUED, json.dumps(request), time.time(), lane,
+                 LANES.index(lane), callback_url, base_url,
+                 estimate["seconds"] if estimate else None, json.dumps(estimate) if estimate else None)
+            )
+            _insert_event(conn, job_id, QUEUED, data={"lane": lane})
+    
+    job = get_job(existing_id or job_id)
+    job["replayed"] = existing_id is not None
+    return job
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    row = _connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _to_dict(row) if row else None
+
+
+def queue_position(job_id: str) -> Optional[int]:
+    """1-based position of a queued job, or None if it is not queued."""
+    row = _connect().execute(
+        "SELECT priority, created_at, estimated_seconds FROM jobs WHERE id = ? AND status = ?",
+        (job_id, QUEUED)
+    ).fetchone()
+    if not row:
+        return None
+    key = sort_key(row["created_at"], row["estimated_seconds"])
+    return work_ahead(row["priority"], key)["queued"] + 1
+
+
+def work_ahead(priority: int, key: float) -> Dict[str, Any]:
+    """
+    Estimated work that runs before a queued job with this priority and
+    sort key: the queued jobs ahead of it and their estimated seconds, and
+    the running jobs and their estimated remaining seconds. Jobs of higher
+    lanes queued later will also go first, so this is a lower bound.
+    """
+    key_sql, params = _sort_key_sql()
+    conn = _connect()
+    queued, queued_seconds = conn.execute(
+        f"""
+        SELECT COUNT(*), COALESCE(SUM(estimated_seconds), 0) FROM jobs WHERE status = ?
+            AND (priority < ? OR (priority = ? AND {key_sql} < ?))
+        """,
+        (QUEUED, priority, priority, *params, key)
+    ).fetchone()
+    now = time.time()
+    running = conn.execute(
+        "SELECT started_at, estimated_seconds FROM jobs WHERE status = ?", (RUNNING,)
+    ).fetchall()
+    return {
+        "queued": queued,
+        "queued_seconds": queued_seconds,
+        "running": len(running),
+        "running_seconds": sum(
+            max(0.0, (row["estimated_seconds"] or 0.0) - (now - (row["started_at"] or now)))
+            for row in running
+        )
+    }
+
+
+def claim_next(worker: str, above_priority: int = None) -> Optional[Dict[str, Any]]:
+    """
+    Atomically move the next queued job to running for this worker.
+    
+    With above_priority, only jobs of a strictly higher-priority lane are
+    claimed (used to preempt a running job at a stage boundary).
+    """
+    now = time.time()
+    max_priority = len(LANES) if above_priority is None else above_priority - 1
+    if max_priority < 0:
+        return None
+    key_sql, params = _sort_key_sql()
+    with _transaction() as conn:
+        _recover_stale(conn, now)
+        row = conn.execute(
+            f"""
+            SELECT id FROM jobs WHERE status = ? AND priority <= ?
+            ORDER BY priority, {key_sql}, created_at LIMIT 1
+            """,
+            (QUEUED, max_priority, *params)
+        ).fetchone()
+        if not row:
+            return None
+        conn.execute(
+            """
+            UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1,
+                started_at = ?, heartbeat_at = ?
+            WHERE id = ?
+            """,
+            (RUNNING, worker, now, now, row["id"])
+        )
+        _insert_event(conn, row["id"], RUNNING, data={"worker": worker})
+    return get_job(row["id"])
+
+
+def _recover_stale(conn: sqlite3.Connection, now: float):
+    """Requeue (or, after MAX_ATTEMPTS runs, fail) jobs whose worker stopped sending heartbeats."""
+    stale = conn.execute(
+        "SELECT id, worker, attempts FROM jobs WHERE status = ? AND heartbeat_at < ?",
+        (RUNNING, now - STALE_SECONDS)
+    ).fetchall()
+    for row in stale:
+        if row["attempts"] >= MAX_ATTEMPTS:
+            error = f"Worker stopped responding ({row['attempts']} attempts)"
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, error = ?, finished_at = ? WHERE id = ?",
+                (FAILED, error, now, row["id"])
+            )
+            _insert_event(conn, row["id"], FAILED, data={"error": error})
+        else:
+            conn.execute("UPDATE jobs SET status = ?, worker = NULL WHERE id = ?", (QUEUED, row["id"]))
+            _insert_event(conn, row["id"], QUEUED, data={"requeued_from": row["worker"]})
+
+
+def heartbeat(job_id: str, worker: str) -> bool:
+    """Mark a running job as alive; False if the worker no longer holds it."""
+    cursor = _connect().execute(
+        "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker = ? AND status = ?",
+        (time.time(), job_id, worker, RUNNING)
+    )
+    return cursor.rowcount == 1
+
+
+def update_progress(job_id: str, animation: Optional[str] = None,
+                    timings: Dict[str, float] = None, worker: str = None, **fields):
+    """
+    Merge progress for one animation (or the job itself) and refresh the
+    heartbeat. Stage timings are merged into the job's timing breakdown.
+    With worker, nothing is recorded unless that worker holds the job.
+    """
+    # BEGIN IMMEDIATE makes this read-modify-write atomic across workers
+    with _transaction() as conn:
+        row = conn.execute(
+            "SELECT progress, timings, worker, status FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if not row or (worker and (row["worker"] != worker or row["status"] != RUNNING)):
+            return
+        progress = json.loads(row["progress"])
+        all_timings = json.loads(row["timings"])
+
+        if animation:
+            entry = progress.setdefault(animation, {})
+            entry.update(fields)
+            if timings:
+                entry.setdefault("timings", {}).update(timings)
+                for stage, seconds in timings.items():
+                    all_timings[f"{animation}.{stage}"] = seconds
+        elif timings:
+            all_timings.update(timings)
+
+        conn.execute(
+            "UPDATE jobs SET progress = ?, timings = ?, heartbeat_at = ? WHERE id = ?",
+            (json.dumps(progress), json.dumps(all_timings), time.time(), job_id)
+        )
+        # fields["stage"] names the event; everything else is its payload
+        event = fields.pop("stage", "progress")
+        if timings:
+            fields["timings"] = timings
+        _insert_event(conn, job_id, event, animation, fields)
+
+
+def complete_job(job_id: str, result: Dict[str, Any], worker: str) -> bool:
+    """Record a job's result; False (and nothing recorded) if worker no longer holds the job."""
+    with _transaction() as conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, finished_at = ? WHERE id = ? AND worker = ? AND status = ?",
+            (COMPLETED, json.dumps(result), time.time(), job_id, worker, RUNNING)
+        )
+        if cursor.rowcount != 1:
+            return False
+        _insert_event(conn, job_id, COMPLETED, data={"result": result})
+    return True
+
+
+def fail_job(job_id: str, error: str, worker: str) -> bool:
+    """Record a job's failure; False (and nothing recorded) if worker no longer holds the job."""
+    with _transaction() as conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND worker = ? AND status = ?",
+            (FAILED, error, time.time(), job_id, worker, RUNNING)
+        )
+        if cursor.rowcount != 1:
+            return False
+        _insert_event(conn, job_id, FAILED, data={"error": error})
+    return True
+
+
+def get_events(job_id: str, after_id: int = 0) -> List[Dict[str, Any]]:
+    """Events of a job with id greater than after_id, oldest first."""
+    rows = _connect().execute(
+        "SELECT * FROM job_events WHERE job_id = ? AND id > ? ORDER BY id",
+        (job_id, after_id)
+    ).fetchall()
+    return [_to_event(row) for row in rows]
+
+
+def create_batch(batch_id: str, job_ids: List[str]):
+    """Record the job of each batch item, in request order."""
+    now = time.time()
+    with _transaction() as conn:
+        conn.executemany(
+            "INSERT INTO batch_items (batch_id, position, job_id, created_at) VALUES (?, ?, ?, ?)",
+            [(batch_id, i, job_id, now) for i, job_id in enumerate(job_ids)]
+        )
+
+
+def get_batch(batch_id: str) -> List[Dict[str, Any]]:
+    """Batch items joined with their jobs, in request order (empty if unknown)."""
+    rows = _connect().execute(
+        """
+        SELECT b.position, jobs.* FROM batch_items b JOIN jobs ON jobs.id = b.job_id
+        WHERE b.batch_id = ? ORDER BY b.position
+        """,
+        (batch_id,)
+    ).fetchall()
+    return [_to_dict(row) for row in rows]
+
+
+def get_batch_events(batch_id: str, events: List[str], after_id: int = 0) -> List[Dict[str, Any]]:
+    """Events of the given types from all jobs of a batch, in the order they happened."""
+    rows = _connect().execute(
+        f"""
+        SELECT DISTINCT e.* FROM job_events e JOIN batch_items b ON b.job_id = e.job_id
+        WHERE b.batch_id = ? AND e.id > ? AND e.event IN ({", ".join("?" * len(events))})
+        ORDER BY e.id
+        """,
+        (batch_id, after_id, *events)
+    ).fetchall()
+    return [_to_event(row) for row in rows]
+
+
+def lane_stats() -> Dict[str, Dict[str, Any]]:
+    """Queue depth and queue wait times per lane."""
+    conn = _connect()
+    now = time.time()
+    stats = {
+        lane: {"queued": 0, "running": 0, "oldest_queued_seconds": 0.0,
+               "started": 0, "wait_avg_seconds": 0.0, "wait_max_seconds": 0.0}
+        for lane in LANES
+    }
+    for row in conn.execute(
+        """
+        SELECT lane, status, COUNT(*) AS n, MIN(created_at) AS oldest FROM jobs
+        WHERE status IN (?, ?) GROUP BY lane, status
+        """,
+        (QUEUED, RUNNING)
+    ):
+        if row["lane"] not in stats:
+            continue
+        entry = stats[row["lane"]]
+        entry[row["status"]] = row["n"]
+        if row["status"] == QUEUED:
+            entry["oldest_queued_seconds"] = round(now - row["oldest"], 3)
+    for row in conn.execute(
+        """
+        SELECT lane, COUNT(*) AS n, AVG(started_at - created_at) AS avg_wait,
+            MAX(started_at - created_at) AS max_wait
+        FROM jobs WHERE started_at >= ? GROUP BY lane
+        """,
+        (now - LANE_STATS_WINDOW,)
+    ):
+        if row["lane"] in stats:
+            stats[row["lane"]].update(
+                started=row["n"],
+                wait_avg_seconds=round(row["avg_wait"], 3),
+                wait_max_seconds=round(row["max_wait"], 3)
+            )
+    return stats
+
+
+def count_by_status() -> Dict[str, int]:
+    rows = _connect().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+    return {row["status"]: row["n"] for row in rows}
+
+
+def recent_completed(limit: int) -> List[Dict[str, Any]]:
+    """The most recently finished completed jobs, newest first."""
+    rows = _connect().execute(
+        "SELECT * FROM jobs WHERE status = ? ORDER BY finished_at DESC LIMIT ?", (COMPLETED, limit)
+    ).fetchall()
+    return [_to_dict(row) for row in rows]
+
+
+def active_jobs() -> List[Dict[str, Any]]:
+    """Jobs that are queued or running."""
+    rows = _connect().execute(
+        "SELECT * FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+    ).fetchall()
+    return [_to_dict(row) for row in rows]
+
+
+def record_output_access(access: Dict[str, float]):
+    """Merge last-download times of output directories (the latest time wins)."""
+    if not access:
+        return
+    with _transaction() as conn:
+        conn.executemany(
+            """
+            INSERT INTO output_access (job_dir, accessed_at) VALUES (?, ?)
+            ON CONFLICT (job_dir) DO UPDATE SET accessed_at = MAX(accessed_at, excluded.accessed_at)
+            """,
+            list(access.items())
+        )
+
+
+def get_output_access() -> Dict[str, float]:
+    rows = _connect().execute("SELECT job_dir, accessed_at FROM output_access").fetchall()
+    return {row["job_dir"]: row["accessed_at"] for row in rows}
+
+
+def forget_output_access(job_dir: str):
+    with _transaction() as conn:
+        conn.execute("DELETE FROM output_access WHERE job_dir = ?", (job_dir,))
+
+
+def save_metrics_snapshot(process: str, data: str):
+    """Replace one process's metrics snapshot (see services/metrics.py)."""
+    with _transaction() as conn:
+        conn.execute(
+            """
+            INSERT INTO metrics_snapshots (process, updated_at, data) VALUES (?, ?, ?)
+            ON CONFLICT (process) DO UPDATE SET updated_at = excluded.updated_at, data = excluded.data
+            """,
+            (process, time.time(), data)
+        )
+
+
+def get_metrics_snapshots() -> List[Tuple[float, str]]:
+    """(updated_at, data) of every process's last snapshot."""
+    rows = _connect().execute("SELECT updated_at, data FROM metrics_snapshots").fetchall()
+    return [(row["updated_at"], row["data"]) for row in rows]
+
+
+def prune(now: Optional[float] = None) -> Dict[str, int]:
+    """
+    Delete jobs that finished more than RECORD_TTL ago, with their events
+    and batch items, and metrics snapshots not refreshed for as long.
+    Returns how many rows went, per table.
+    """
+    if not RECORD_TTL:
+        return {}
+    cutoff = (now or time.time()) - RECORD_TTL
+    expired = "SELECT id FROM jobs WHERE status IN (?, ?) AND finished_at < ?"
+    params = (COMPLETED, FAILED, cutoff)
+    with _transaction() as conn:
+        return {
+            "job_events": conn.execute(f"DELETE FROM job_events WHERE job_id IN ({expired})", params).rowcount,
+            "batch_items": conn.execute(f"DELETE FROM batch_items WHERE job_id IN ({expired})", params).rowcount,
+            "jobs": conn.execute(f"DELETE FROM jobs WHERE id IN ({expired})", params).rowcount,
+            "metrics_snapshots": conn.execute(
+                "DELETE FROM metrics_snapshots WHERE updated_at < ?", (cutoff,)
+            ).rowcount
+        }
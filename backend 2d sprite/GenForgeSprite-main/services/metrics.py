@@ -0,0 +1,353 @@
+"""
+Metrics - Per-stage timings of sprite jobs and a Prometheus /metrics endpoint.
+
+The pipeline is wrapped in spans (metrics.stage("slice") etc.):
+
+    bria_wait           waiting for a slot of the host-wide BRIA limiter
+    bria                the generate call itself (including async polling)
+    download            fetching the generated sheet from BRIA's CDN
+    slice               decoding the sheet and cutting it into frames
+    background_removal  rembg or the simple fallback, all frames
+    resize              fitting frames to the preset canvas
+    encode              writing frame PNGs and the animation's sprite sheet
+    gif                 encoding the animated GIF
+    combine             the combined sheet of all animations
+    metadata            metadata.json
+    upload              publishing the job to the shared artifact store
+
+Each span feeds a histogram, an in-flight gauge and an error counter,
+labelled by stage and preset, and adds its duration to the current job's
+JobTimings. Job queue threads bind a JobTimings for the job they run
+(track_job), so a job's result carries its own breakdown. Stages of
+animations generated in parallel overlap, so their sum can exceed the
+job's total. Time the job's thread spends running a preempting job
+(paused()) is left out of its total.
+
+The exposition format is written by hand (no prometheus_client). Each
+process keeps its metrics in memory and writes a snapshot to the job
+store every METRICS_FLUSH_INTERVAL seconds; /metrics adds up the
+snapshots of all Gunicorn workers on the host. Counters and histograms of
+exited workers are kept so totals never go backwards; gauges only count
+workers that flushed recently.
+"""
+import os
+import json
+import time
+import socket
+import threading
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from services import job_store
+
+log = logging.getLogger(__name__)
+
+STAGES = (
+    "bria_wait", "bria", "download", "slice", "background_removal",
+    "resize", "encode", "gif", "combine", "metadata", "upload"
+)
+# Histogram buckets in seconds (upstream calls take tens of seconds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "15"))
+# A process that has not flushed for this long no longer counts towards gauges
+GAUGE_STALE_AFTER = 3 * FLUSH_INTERVAL
+# One snapshot row per process; a restarted worker gets a new row
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{int(time.time())}"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# name: (type, help)
+METRICS = {
+    "sprite_stage_seconds": ("histogram", "Time spent in a pipeline stage."),
+    "sprite_stage_in_flight": ("gauge", "Pipeline stages currently running."),
+    "sprite_stage_errors_total": ("counter", "Pipeline stages that raised an error."),
+    "sprite_job_seconds": ("histogram", "Wall time of finished jobs."),
+    "sprite_jobs_total": ("counter", "Finished jobs by outcome."),
+    "sprite_jobs_in_flight": ("gauge", "Jobs currently running."),
+    "sprite_queue_jobs": ("gauge", "Jobs in the job store by status."),
+}
+
+
+class JobTimings:
+    """Seconds spent in each stage by one job (summed over its animations)."""
+
+    def __init__(self, preset: str = ""):
+        self.preset = preset
+        self.total = None
+        # Seconds this job's thread spent on other work (see paused())
+        self.paused = 0.0
+        self._seconds: Dict[str, float] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self._seconds[stage] = self._seconds.get(stage, 0.0) + seconds
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+
+    def add_paused(self, seconds: float):
+        with self._lock:
+            self.paused += seconds
+
+    def count(self, stage: str) -> int:
+        """How many times the stage ran (e.g. "bria": upstream calls, retries included)."""
+        with self._lock:
+            return self._counts.get(stage, 0)
+
+    def as_dict(self) -> Dict[str, float]:
+        with self._lock:
+            timings = {stage: round(self._seconds[stage], 3) for stage in STAGES if stage in self._seconds}
+        if self.total is not None:
+            timings["total"] = round(self.total, 3)
+        return timings
+
+
+_current: ContextVar[Optional[JobTimings]] = ContextVar("sprite_job_timings", default=None)
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+# Per-bucket counts (not cumulative), then sum and count
+_histograms: Dict[str, List[float]] = {}
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+def _key(name: str, labels: Dict[str, str]) -> str:
+    return json.dumps([name, sorted(labels.items())])
+
+
+def _inc(name: str, labels: Dict[str, str], value: float = 1.0):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def _add_gauge(name: str, labels: Dict[str, str], value: float):
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0.0) + value
+
+
+def _observe(name: str, labels: Dict[str, str], seconds: float):
+    key = _key(name, labels)
+    index = next((i for i, bound in enumerate(BUCKETS) if seconds <= bound), len(BUCKETS))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0.0] * (len(BUCKETS) + 3)
+        histogram[index] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+
+def current() -> Optional[JobTimings]:
+    """Timings of the job running in this context (None outside jobs)."""
+    return _current.get()
+
+
+@contextmanager
+def bind(timings: Optional[JobTimings]) -> Iterator[Optional[JobTimings]]:
+    """
+    Attribute spans in this block to a job. Threads started by a job (e.g.
+    its upstream pool) do not inherit the context and must bind it again.
+    """
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def set_preset(preset: str):
+    """Label the current job's stages with its preset once it is known."""
+    timings = _current.get()
+    if timings is not None:
+        timings.preset = preset
+
+
+def observe(stage: str, seconds: float):
+    """Record a stage that was timed elsewhere."""
+    timings = _current.get()
+    _observe("sprite_stage_seconds", {"stage": stage, "preset": timings.preset if timings else ""}, seconds)
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def paused() -> Iterator[None]:
+    """Leave this block out of the current job's total (e.g. a preempting job run on its thread)."""
+    timings = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.add_paused(time.perf_counter() - start)
+
+
+def paused_seconds() -> float:
+    """Seconds the current job has been paused so far."""
+    timings = _current.get()
+    return timings.paused if timings is not None else 0.0
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a pipeline stage."""
+    timings = _current.get()
+    labels = {"stage": name, "preset": timings.preset if timings else ""}
+    _add_gauge("sprite_stage_in_flight", labels, 1)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        _inc("sprite_stage_errors_total", labels)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _add_gauge("sprite_stage_in_flight", labels, -1)
+        _observe("sprite_stage_seconds", labels, seconds)
+        if timings is not None:
+            timings.add(name, seconds)
+
+
+@contextmanager
+def track_job(kind: str) -> Iterator[JobTimings]:
+    """Run a job (kind = job queue handler) with its own JobTimings bound."""
+    timings = JobTimings()
+    _add_gauge("sprite_jobs_in_flight", {"kind": kind}, 1)
+    start = time.perf_counter()
+    status = "failed"
+    try:
+        with bind(timings):
+            yield timings
+        status = "completed"
+    finally:
+        timings.total = time.perf_counter() - start - timings.paused
+        _add_gauge("sprite_jobs_in_flight", {"kind": kind}, -1)
+        labels = {"kind": kind, "preset": timings.preset}
+        _inc("sprite_jobs_total", {**labels, "status": status})
+        _observe("sprite_job_seconds", labels, timings.total)
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """This process's metrics."""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "histograms": {key: list(values) for key, values in _histograms.items()}
+        }
+
+
+def flush():
+    """Write this process's snapshot to the job store."""
+    try:
+        job_store.save_metrics_snapshot(PROCESS_ID, json.dumps(snapshot()))
+    except Exception as e:
+        log.warning("Could not save snapshot: %s", e)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def start_flusher():
+    """Start this process's snapshot thread (once per process)."""
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        threading.Thread(target=_flush_loop, name="metrics", daemon=True).start()
+        _started_pid = os.getpid()
+
+
+def live_processes() -> int:
+    """Worker processes on this host that flushed metrics recently (at least this one)."""
+    try:
+        rows = job_store.get_metrics_snapshots()
+    except Exception as e:
+        log.warning("Could not read snapshots: %s", e)
+        return 1
+    now = time.time()
+    return max(1, sum(1 for updated_at, _ in rows if now - updated_at <= GAUGE_STALE_AFTER))
+
+
+def _collect() -> Dict[str, Dict[str, Any]]:
+    """Metrics of all processes on this host, added up."""
+    flush()
+    now = time.time()
+    merged = {"counters": {}, "gauges": {}, "histograms": {}}
+    try:
+        rows = job_store.get_metrics_snapshots()
+    except Exception as e:
+        log.warning("Could not read snapshots: %s", e)
+        rows = [(now, json.dumps(snapshot()))]
+    for updated_at, data in rows:
+        data = json.loads(data)
+        for key, value in data["counters"].items():
+            merged["counters"][key] = merged["counters"].get(key, 0.0) + value
+        if now - updated_at <= GAUGE_STALE_AFTER:
+            for key, value in data["gauges"].items():
+                merged["gauges"][key] = merged["gauges"].get(key, 0.0) + value
+        for key, values in data["histograms"].items():
+            total = merged["histograms"].setdefault(key, [0.0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+    try:
+        for status, n in job_store.count_by_status().items():
+            merged["gauges"][_key("sprite_queue_jobs", {"status": status})] = n
+    except Exception as e:
+        log.warning("Could not count jobs: %s", e)
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(pairs: List[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    merged = _collect()
+    series: Dict[str, List[str]] = {name: [] for name in METRICS}
+    for kind in ("counters", "gauges"):
+        for key, value in sorted(merged[kind].items()):
+            name, pairs = json.loads(key)
+            if name in series:
+                series[name].append(f"{name}{_labels(pairs)} {_number(value)}")
+    for key, values in sorted(merged["histograms"].items()):
+        name, pairs = json.loads(key)
+        if name not in series:
+            continue
+        cumulative = 0.0
+        for bound, count in zip(BUCKETS + ("+Inf",), values):
+            cumulative += count
+            le = bound if bound == "+Inf" else _number(bound)
+            series[name].append(f"{name}_bucket{_labels(pairs + [['le', le]])} {_number(cumulative)}")
+        series[name].append(f"{name}_sum{_labels(pairs)} {_number(round(values[-2], 6))}")
+        series[name].append(f"{name}_count{_labels(pairs)} {_number(values[-1])}")
+
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(series[name])
+    return "\n".join(lines) + "\n"
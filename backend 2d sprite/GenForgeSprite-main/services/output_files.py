@@ -0,0 +1,365 @@
+"""
+Output Files - Cache-friendly serving of generated artifacts under /outputs.
+
+Every job writes into its own uuid-named directory, and metadata.json is
+the last file a sprite job writes. Once it exists the directory never
+changes again, so its files are sent with a long max-age and
+"immutable"; browsers and CDNs then stop revalidating frames, sheets and
+GIFs. Files of jobs still in progress (and of refinements, which write
+no metadata.json) are sent with "no-cache" and must be revalidated.
+
+All responses carry a strong ETag built from the file's inode, mtime and
+size, so conditional requests are answered with 304 without reading the
+file (or even opening it). Range requests are answered with 206. Full
+responses are passed to the server's wsgi.file_wrapper, which Gunicorn
+serves with sendfile().
+
+Responses are built directly rather than with send_file: the file is
+stat'ed once and the headers are precomputed strings, which keeps the
+per-request overhead below that of send_from_directory.
+
+/outputs/<job_id>.zip bundles a whole job directory. The archive is
+built while it is sent: each file is copied in fixed-size chunks and the
+zip data is passed on as it is produced, so memory use does not grow with
+file sizes and nothing is written to disk. PNGs and GIFs are already
+compressed and are stored as-is.
+
+Derived files that the retention sweeper removed are rebuilt on first
+request by the restorer that the sprite service registers.
+
+With a shared artifact store configured, finished jobs are published to
+it, and files (and zips) missing from the local disk are served from
+their published copy. Any node can then answer for any job.
+"""
+import os
+import stat
+import time
+import hashlib
+import zipfile
+import mimetypes
+import threading
+import logging
+from typing import BinaryIO, Callable, Iterator, List, Optional, Set, Tuple
+
+from flask import abort, current_app, redirect, request
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+
+from services import metrics
+from services.artifact_store import store as artifact_store
+
+log = logging.getLogger(__name__)
+
+OUTPUTS_DIR = os.getenv(
+    "OUTPUTS_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "outputs")
+)
+# Max age (seconds) for files of finished jobs
+IMMUTABLE_MAX_AGE = int(os.getenv("OUTPUTS_MAX_AGE", str(365 * 24 * 3600)))
+FINISHED_MARKER = "metadata.json"
+
+CACHE_IMMUTABLE = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+CACHE_REVALIDATE = "no-cache"
+
+# Artifact types that ?include= can select for job zips
+ARTIFACT_TYPES = ("combined", "sheets", "gifs", "frames", "metadata", "raw")
+# Already-compressed formats are stored rather than deflated
+STORED_EXTENSIONS = {".png", ".gif", ".jpg", ".jpeg", ".webp"}
+ZIP_CHUNK_SIZE = 64 * 1024
+
+# Job directories known to be finished. A directory never goes back to
+# in-progress, so only positive answers are remembered.
+_finished = set()
+_finished_lock = threading.Lock()
+_FINISHED_MAX = 10000
+
+# restorer(job_dir, relpath or None for the whole job) -> True if rebuilt
+_restorer: Optional[Callable[[str, Optional[str]], bool]] = None
+
+
+def register_restorer(restorer: Callable[[str, Optional[str]], bool]):
+    global _restorer
+    _restorer = restorer
+
+
+def file_etag(st: os.stat_result) -> str:
+    """Strong ETag for a file that changes whenever its contents are rewritten."""
+    return f"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def is_finished(job_dir: str) -> bool:
+    """True once a job directory has its metadata.json (and so is immutable)."""
+    if job_dir in _finished:
+        return True
+    if not os.path.isfile(os.path.join(OUTPUTS_DIR, job_dir, FINISHED_MARKER)):
+        return False
+    with _finished_lock:
+        if len(_finished) >= _FINISHED_MAX:
+            _finished.clear()
+        _finished.add(job_dir)
+    return True
+
+
+def guess_mimetype(filename: str) -> str:
+    ext = os.path.splitext(filename)[1].lower()
+    mimetype = _mimetypes.get(ext)
+    if mimetype is None:
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        _mimetypes[ext] = mimetype
+    return mimetype
+
+
+_mimetypes = {}
+
+
+def forget(job_dir: str):
+    """Drop a job directory from the finished set (after it is deleted)."""
+    with _finished_lock:
+        _finished.discard(job_dir)
+
+
+def _restore(job_dir: str, filename: str, path: str) -> os.stat_result:
+    """Rebuild a missing file of a finished job, or 404."""
+    if _restorer is None or "/" not in filename or not is_finished(job_dir):
+        abort(404)
+    try:
+        if not _restorer(job_dir, filename.split("/", 1)[1]):
+            abort(404)
+        return os.stat(path)
+    except OSError:
+        abort(404)
+
+
+def publish_job(job_dir: str):
+    """Upload a job directory to the shared artifact store (if one is configured)."""
+    if not artifact_store.enabled:
+        return
+    try:
+        with metrics.stage("upload"):
+            artifact_store.publish(job_dir, list_job_files(job_dir))
+    except Exception as e:
+        # The job is still served from this node's disk
+        log.warning("Publishing %s to the artifact store failed: %s", job_dir, e)
+
+
+def _send_from_store(job_dir: str, filename: str):
+    """Response for a file this node does not have but the artifact store does (or None)."""
+    if "/" not in filename or not artifact_store.enabled:
+        return None
+    manifest = artifact_store.get_manifest(job_dir)
+    entry = manifest and manifest["files"].get(filename.split("/", 1)[1])
+    if not entry:
+        return None
+    headers = {"Cache-Control": CACHE_IMMUTABLE if FINISHED_MARKER in manifest["files"] else CACHE_REVALIDATE}
+
+    url = artifact_store.public_url(entry["key"])
+    if url:
+        response = redirect(url, 302)
+        response.headers.update(headers)
+        return response
+
+    etag = entry["sha256"][:32]
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+    try:
+        body = artifact_store.open_blob(entry["key"])
+    except FileNotFoundError:
+        return None
+    response = current_app.response_class(
+        wrap_file(request.environ, body),
+        mimetype=guess_mimetype(filename),
+        headers=headers,
+        direct_passthrough=True
+    )
+    response.content_length = entry["size"]
+    response.last_modified = entry["mtime"]
+    response.set_etag(etag)
+    return response.make_conditional(request.environ)
+
+
+def send_output(filename: str):
+    """Response for GET /outputs/<filename> (404 for anything but a regular file)."""
+    path = safe_join(OUTPUTS_DIR, filename)
+    if path is None:
+        abort(404)
+    job_dir = filename.split("/", 1)[0]
+    try:
+        st = os.stat(path)
+    except OSError:
+        response = _send_from_store(job_dir, filename)
+        if response is not None:
+            return response
+        st = _restore(job_dir, filename, path)
+    if not stat.S_ISREG(st.st_mode):
+        abort(404)
+
+    finished = "/" in filename and is_finished(job_dir)
+    etag = file_etag(st)
+    headers = {"Cache-Control": CACHE_IMMUTABLE if finished else CACHE_REVALIDATE}
+
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    response = current_app.response_class(
+        wrap_file(request.environ, open(path, "rb")),
+        mimetype=guess_mimetype(filename),
+        headers=headers,
+        direct_passthrough=True
+    )
+    response.content_length = st.st_size
+    response.last_modified = st.st_mtime
+    response.set_etag(etag)
+    return response.make_conditional(request.environ, accept_ranges=True, complete_length=st.st_size)
+
+
+def artifact_type(relpath: str) -> str:
+    """Artifact type of a file, given its path inside the job directory."""
+    name = relpath.rsplit("/", 1)[-1]
+    if "/" in relpath:
+        return "frames"
+    if name == "combined_sheet.png":
+        return "combined"
+    if name == FINISHED_MARKER:
+        return "metadata"
+    if name.endswith("_raw.png"):
+        return "raw"
+    if name.endswith("_sheet.png"):
+        return "sheets"
+    if name.endswith(".gif"):
+        return "gifs"
+    return "other"
+
+
+def parse_include(value: Optional[str]) -> Optional[Set[str]]:
+    """Artifact types from a comma-separated ?include= value (None = everything)."""
+    if not value:
+        return None
+    types = {t.strip() for t in value.split(",") if t.strip()}
+    unknown = types - set(ARTIFACT_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown artifact types: {', '.join(sorted(unknown))} "
+                         f"(choose from {', '.join(ARTIFACT_TYPES)})")
+    return types
+
+
+def list_job_files(job_dir: str, include: Optional[Set[str]] = None) -> List[Tuple[str, str, os.stat_result]]:
+    """(relative path, absolute path, stat) of a job's files, in a stable order."""
+    root = os.path.join(OUTPUTS_DIR, job_dir)
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.startswith("."):
+                continue
+            path = os.path.join(dirpath, name)
+            relpath = os.path.relpath(path, root).replace(os.sep, "/")
+            if include is not None and artifact_type(relpath) not in include:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((relpath, path, st))
+    return files
+
+
+class _ZipStream:
+    """Write-only file object that hands zip data out as it is written."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(prefix: str, sources: List[Tuple[str, int, float, Callable[[], BinaryIO]]]) -> Iterator[bytes]:
+    """Yield a zip archive of (relative path, size, mtime, opener) sources chunk by chunk."""
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, "w") as archive:
+        for relpath, size, mtime, opener in sources:
+            try:
+                src = opener()
+            except OSError as e:
+                log.warning("Zip %s: skipping %s: %s", prefix, relpath, e)
+                continue
+            info = zipfile.ZipInfo(f"{prefix}/{relpath}", date_time=time.localtime(mtime)[:6])
+            info.file_size = size
+            if os.path.splitext(relpath)[1].lower() in STORED_EXTENSIONS:
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+            with src, archive.open(info, "w") as dst:
+                while True:
+                    chunk = src.read(ZIP_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    data = stream.drain()
+                    if data:
+                        yield data
+            yield stream.drain()
+    yield stream.drain()
+
+
+def send_job_zip(job_id: str):
+    """Response for GET /outputs/<job_id>.zip, optionally ?include=sheets,gifs,..."""
+    root = safe_join(OUTPUTS_DIR, job_id)
+    if root is None:
+        abort(404)
+    try:
+        include = parse_include(request.args.get("include"))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    # (relative path, size, mtime, version tag, opener) per file
+    if os.path.isdir(root):
+        finished = is_finished(job_id)
+        if _restorer is not None and finished:
+            _restorer(job_id, None)
+        sources = [
+            (relpath, st.st_size, st.st_mtime, file_etag(st), lambda path=path: open(path, "rb"))
+            for relpath, path, st in list_job_files(job_id, include)
+        ]
+    else:
+        manifest = artifact_store.get_manifest(job_id) if artifact_store.enabled else None
+        if manifest is None:
+            abort(404)
+        finished = FINISHED_MARKER in manifest["files"]
+        sources = [
+            (relpath, entry["size"], entry["mtime"], entry["sha256"][:16],
+             lambda key=entry["key"]: artifact_store.open_blob(key))
+            for relpath, entry in sorted(manifest["files"].items())
+            if include is None or artifact_type(relpath) in include
+        ]
+
+    digest = hashlib.sha256(",".join(sorted(include or ["*"])).encode("utf-8"))
+    for relpath, _, _, tag, _ in sources:
+        digest.update(f"\n{relpath}:{tag}".encode("utf-8"))
+    etag = digest.hexdigest()[:32]
+    headers = {"Cache-Control": CACHE_IMMUTABLE if finished else CACHE_REVALIDATE}
+
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    headers["Content-Disposition"] = f'attachment; filename="{job_id}.zip"'
+    response = current_app.response_class(
+        iter_zip(job_id, [(relpath, size, mtime, opener) for relpath, size, mtime, _, opener in sources]),
+        mimetype="application/zip", headers=headers, direct_passthrough=True
+    )
+    response.set_etag(etag)
+    return response
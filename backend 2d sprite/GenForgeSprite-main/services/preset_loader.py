@@ -1,11 +1,30 @@
 """
 Preset Loader - Manages sprite style presets.
+
+Presets are held in an in-memory registry: the built-in defaults, overlaid
+by presets/*.json (a JSON file replaces the default of the same name).
+Files are parsed and validated once. The presets directory is rescanned at
+most every PRESET_CHECK_INTERVAL seconds, and a file is parsed again only
+when its mtime or size changed. A file that fails validation is reported
+and skipped; the last valid version of it stays in use.
+
+The /presets listing is serialized once per registry version and served
+with an ETag (see get_presets_listing).
 """
 import os
 import json
-from typing import Dict, Any
+import time
+import hashlib
+import threading
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+log = logging.getLogger(__name__)
 
 PRESETS_DIR = os.path.join(os.path.dirname(__file__), "..", "presets")
+# Seconds between checks of presets/ for added, changed or removed files
+CHECK_INTERVAL = float(os.getenv("PRESET_CHECK_INTERVAL", "2"))
+MAX_FRAMES = 64
 
 # Default presets defined in code
 DEFAULT_PRESETS = {
@@ -122,43 +141,131 @@ DEFAULT_PRESETS = {
 }
 
 
+def validate_preset(preset: Any) -> Dict[str, Any]:
+    """Check a preset's structure; raises ValueError describing the first problem."""
+    if not isinstance(preset, dict):
+        raise ValueError("preset must be a JSON object")
+    canvas = preset.get("canvas", [128, 128])
+    if (not isinstance(canvas, list) or len(canvas) != 2
+            or not all(isinstance(v, int) and v > 0 for v in canvas)):
+        raise ValueError("canvas must be [width, height] in pixels")
+    animations = preset.get("animations", {})
+    if not isinstance(animations, dict) or not animations:
+        raise ValueError("animations must map animation names to frame counts")
+    for anim, frame_count in animations.items():
+        if not isinstance(frame_count, int) or not 1 <= frame_count <= MAX_FRAMES:
+            raise ValueError(f"animations.{anim} must be a frame count between 1 and {MAX_FRAMES}")
+    for field in ("frame_rate", "frame_duration"):
+        value = preset.get(field)
+        if value is not None and (not isinstance(value, (int, float)) or value <= 0):
+            raise ValueError(f"{field} must be a positive number")
+    for field in ("name", "display_name", "description", "style", "medium", "color_scheme"):
+        if field in preset and not isinstance(preset[field], str):
+            raise ValueError(f"{field} must be a string")
+    augmentation = preset.get("prompt_augmentation", {})
+    if not isinstance(augmentation, dict) or not all(isinstance(v, str) for v in augmentation.values()):
+        raise ValueError("prompt_augmentation must map names to strings")
+    return preset
+
+
+class _Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}  # name -> (mtime_ns, size), preset
+        self.presets: Dict[str, Dict[str, Any]] = dict(DEFAULT_PRESETS)
+        self.version = 0
+        self.checked_at = None
+        self.listing: Optional[Tuple[int, bytes, str]] = None  # version, body, etag
+
+    def _scan(self) -> bool:
+        """Reload changed files; returns whether anything changed."""
+        seen = {}
+        try:
+            entries = list(os.scandir(PRESETS_DIR))
+        except FileNotFoundError:
+            entries = []
+        changed = False
+        for entry in entries:
+            if not entry.name.endswith(".json") or not entry.is_file():
+                continue
+            preset_name = entry.name[:-5]
+            st = entry.stat()
+            signature = (st.st_mtime_ns, st.st_size)
+            seen[preset_name] = True
+            cached = self.files.get(preset_name)
+            if cached and cached[0] == signature:
+                continue
+            try:
+                with open(entry.path, "r") as f:
+                    preset = validate_preset(json.load(f))
+            except (OSError, ValueError) as e:
+                log.warning("Preset '%s' (%s) is invalid and was not loaded: %s", preset_name, entry.name, e)
+                # Remember the signature so the file is not parsed again until it changes
+                self.files[preset_name] = (signature, cached[1] if cached else None)
+                continue
+            self.files[preset_name] = (signature, preset)
+            changed = True
+        for preset_name in list(self.files):
+            if preset_name not in seen:
+                del self.files[preset_name]
+                changed = True
+        return changed
+
+    def refresh(self):
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < CHECK_INTERVAL:
+            return
+        with self.lock:
+            if self.checked_at is not None and now - self.checked_at < CHECK_INTERVAL:
+                return
+            if self._scan() or self.checked_at is None:
+                presets = dict(DEFAULT_PRESETS)
+                presets.update({name: preset for name, (_, preset) in self.files.items() if preset})
+                self.presets = presets
+                self.version += 1
+            self.checked_at = time.monotonic()
+
+    def invalidate(self):
+        with self.lock:
+            self.checked_at = None
+
+
+_registry = _Registry()
+
+
 def load_preset(preset_name: str) -> Dict[str, Any]:
     """
     Load a preset by name.
-    First checks JSON files, then falls back to defaults.
+    JSON files in presets/ take precedence over the built-in defaults.
     """
-    # Try loading from JSON file
-    json_path = os.path.join(PRESETS_DIR, f"{preset_name}.json")
-    if os.path.exists(json_path):
-        with open(json_path, "r") as f:
-            return json.load(f)
-    
-    # Fall back to default presets
-    if preset_name in DEFAULT_PRESETS:
-        return DEFAULT_PRESETS[preset_name]
+    _registry.refresh()
+    preset = _registry.presets.get(preset_name)
+    if preset is not None:
+        return preset
     
     # If not found, return anime_action as default
-    print(f"Preset '{preset_name}' not found, using anime_action")
-    return DEFAULT_PRESETS["anime_action"]
+    log.warning("Preset '%s' not found, using anime_action", preset_name)
+    return _registry.presets.get("anime_action", DEFAULT_PRESETS["anime_action"])
 
 
 def get_all_presets() -> Dict[str, Any]:
     """
-    Get all available presets.
+    Get all available presets (callers must not modify them).
     """
-    presets = dict(DEFAULT_PRESETS)
-    
-    # Load any additional JSON presets
-    if os.path.exists(PRESETS_DIR):
-        for filename in os.listdir(PRESETS_DIR):
-            if filename.endswith(".json"):
-                preset_name = filename[:-5]
-                if preset_name not in presets:
-                    json_path = os.path.join(PRESETS_DIR, filename)
-                    with open(json_path, "r") as f:
-                        presets[preset_name] = json.load(f)
-    
-    return presets
+    _registry.refresh()
+    return _registry.presets
+
+
+def get_presets_listing() -> Tuple[bytes, str]:
+    """The JSON body of the /presets listing and its ETag, rebuilt only when a preset changes."""
+    _registry.refresh()
+    listing = _registry.listing
+    if listing is None or listing[0] != _registry.version:
+        version, presets = _registry.version, _registry.presets
+        body = json.dumps(presets).encode("utf-8")
+        listing = (version, body, hashlib.sha256(body).hexdigest()[:32])
+        _registry.listing = listing
+    return listing[1], listing[2]
 
 
 def save_preset(preset_name: str, preset_data: Dict[str, Any]) -> str:
@@ -168,7 +275,9 @@ def save_preset(preset_name: str, preset_data: Dict[str, Any]) -> str:
     os.makedirs(PRESETS_DIR, exist_ok=True)
     json_path = os.path.join(PRESETS_DIR, f"{preset_name}.json")
     
+    validate_preset(preset_data)
     with open(json_path, "w") as f:
         json.dump(preset_data, f, indent=2)
+    _registry.invalidate()
     
     return json_path
@@ -0,0 +1,168 @@
+"""
+Profiling - Opt-in cProfile (and tracemalloc) capture of individual jobs.
+
+Admins can set "profile": true on /generate or /refine to find out where a
+real production request spends its time. The job queue then runs that job
+under profile_job(): a cProfile.Profile on the job's thread, plus one on
+each upstream pool thread the job starts (bind_thread), merged when the
+job ends. With "profile_memory": true, tracemalloc also records the peak
+of traced memory while the job runs. tracemalloc is process-wide, so the
+peak includes anything else the worker did at the same time. Only one job
+per process traces memory at once; others are profiled without it.
+
+Results are written to PROFILE_DIR (profiles/, next to outputs/, and
+never served from /outputs):
+
+    <job_id>.pstats   merged profile (python -m pstats, snakeviz, ...)
+    <job_id>.txt      summary: top functions by cumulative time, peak memory
+
+and downloaded by admins from /api/sprite/profile/<job_id>. The newest
+PROFILE_KEEP profiles are kept.
+
+Jobs without the flag never start a profiler. On Python 3.11 (see
+runtime.txt) cProfile hooks only the threads it is enabled on, so other
+jobs in the same worker run at full speed.
+"""
+import io
+import os
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from services.output_files import OUTPUTS_DIR
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(OUTPUTS_DIR), "profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+# Functions listed in the text summary
+SUMMARY_LINES = 40
+FORMATS = {"txt": "text/plain; charset=utf-8", "pstats": "application/octet-stream"}
+
+_trace_lock = threading.Lock()
+
+
+class JobProfile:
+    """Profiles of one job's threads, and its peak traced memory."""
+
+    def __init__(self, job_id: str, kind: str, memory: bool):
+        self.job_id = job_id
+        self.kind = kind
+        self.memory = memory
+        self.peak_memory = None
+        self.seconds = None
+        self._profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def add(self, profile: cProfile.Profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def save(self) -> Dict[str, Any]:
+        """Write the .pstats and .txt files; returns the result's "profile" entry."""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path(self.job_id, "pstats"))
+
+        summary = io.StringIO()
+        summary.write(f"job {self.job_id} ({self.kind}): {self.seconds:.3f}s wall, "
+                      f"{len(profiles)} thread(s) profiled\n")
+        if self.peak_memory is not None:
+            summary.write(f"peak traced memory: {self.peak_memory / 2**20:.1f} MB (whole process)\n")
+        elif self.memory:
+            summary.write("peak traced memory: not recorded (another job was tracing)\n")
+        summary.write("\n")
+        stats.stream = summary
+        stats.sort_stats("cumulative").print_stats(SUMMARY_LINES)
+        with open(path(self.job_id, "txt"), "w") as f:
+            f.write(summary.getvalue())
+        _prune()
+        return {
+            "url": f"/api/sprite/profile/{self.job_id}",
+            "pstats_url": f"/api/sprite/profile/{self.job_id}?format=pstats",
+            "threads": len(profiles),
+            "peak_memory_bytes": self.peak_memory
+        }
+
+
+_local = threading.local()
+
+
+def current() -> Optional[JobProfile]:
+    """Profile of the job running on this thread (None if it is not profiled)."""
+    return getattr(_local, "profile", None)
+
+
+@contextmanager
+def bind_thread(profile: Optional[JobProfile]) -> Iterator[None]:
+    """Profile this thread into a job's profile (no-op for None)."""
+    if profile is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profile.add(profiler)
+
+
+@contextmanager
+def profile_job(job_id: str, kind: str, memory: bool = False) -> Iterator[JobProfile]:
+    """Profile the block (a whole job) on this thread."""
+    profile = JobProfile(job_id, kind, memory)
+    tracing = memory and _trace_lock.acquire(blocking=False)
+    if tracing:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+    previous = current()
+    _local.profile = profile
+    start = time.perf_counter()
+    try:
+        with bind_thread(profile):
+            yield profile
+    finally:
+        profile.seconds = time.perf_counter() - start
+        _local.profile = previous
+        if tracing:
+            profile.peak_memory = tracemalloc.get_traced_memory()[1]
+            if started:
+                tracemalloc.stop()
+            _trace_lock.release()
+
+
+def path(job_id: str, fmt: str = "txt") -> str:
+    return os.path.join(PROFILE_DIR, f"{job_id}.{fmt}")
+
+
+def find(job_id: str, fmt: str = "txt") -> Optional[str]:
+    """Path of a saved profile (None if the job was not profiled)."""
+    if fmt not in FORMATS or os.path.basename(job_id) != job_id:
+        return None
+    file_path = path(job_id, fmt)
+    return file_path if os.path.isfile(file_path) else None
+
+
+def _prune():
+    """Keep the newest PROFILE_KEEP profiles."""
+    try:
+        entries = [entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".pstats")]
+    except FileNotFoundError:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in entries[PROFILE_KEEP:]:
+        job_id = entry.name[:-len(".pstats")]
+        for fmt in FORMATS:
+            try:
+                os.remove(path(job_id, fmt))
+            except FileNotFoundError:
+                pass
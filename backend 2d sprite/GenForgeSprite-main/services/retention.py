@@ -0,0 +1,245 @@
+"""
+Retention - Disk quota and per-artifact TTLs for job outputs.
+
+A background sweeper removes files from outputs/ in two passes:
+
+1. TTL: each artifact class expires a configurable time after the job
+   directory was last used (downloaded, or written).
+2. Quota: while outputs/ is larger than OUTPUTS_QUOTA_MB, classes are
+   evicted in EVICTION_ORDER, least recently used job first.
+
+Derived artifacts go first because they can be rebuilt on demand. Frames
+are sliced again from the raw sheet, and sheets, GIFs and the combined
+sheet are made from the frames. The raw sheet and metadata.json are kept
+longest. Removing metadata.json removes the whole job directory.
+Directories without metadata.json (unfinished jobs, refinements) are only
+ever removed whole.
+
+A file is only deleted while it can still be rebuilt: frames need the raw
+sheet, derived images need frames or the raw sheet, and a raw sheet is
+kept as long as frames cut from it are missing. Jobs that were published
+to the shared artifact store are served from there once removed locally,
+so any of their files can go.
+
+The sweeper never touches directories of queued or running jobs, or
+directories written to within RETENTION_GRACE seconds. Last-download
+times are collected in memory by the /outputs routes and merged into the
+job store, so all Gunicorn workers share one LRU order. Only one worker
+sweeps at a time (see genforge_common.retention).
+
+Each sweep also deletes job records past JOB_RECORD_TTL (see
+job_store.prune).
+"""
+import os
+import time
+import shutil
+import logging
+from typing import Dict, Any, List, Optional
+
+from genforge_common.retention import AccessLog, Sweeper, parse_ttls, run_exclusive
+from services import job_store, output_files
+from services.artifact_store import store as artifact_store
+
+log = logging.getLogger(__name__)
+
+ENABLED = os.getenv("RETENTION", "true").lower() not in ("0", "false", "no")
+# Total size allowed for outputs/ (0 = no quota, TTLs only)
+QUOTA_BYTES = int(float(os.getenv("OUTPUTS_QUOTA_MB", "2048")) * 1024 * 1024)
+SWEEP_INTERVAL = float(os.getenv("RETENTION_SWEEP_INTERVAL", "600"))
+# Directories written to more recently than this are left alone
+GRACE_SECONDS = float(os.getenv("RETENTION_GRACE", "3600"))
+LOCK_PATH = os.getenv(
+    "RETENTION_LOCK",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache", "locks", "retention.lock")
+)
+
+# Cheapest to rebuild first; removing "metadata" removes the job directory
+EVICTION_ORDER = ("frames", "gifs", "sheets", "combined", "raw", "metadata")
+
+TTLS = parse_ttls(os.getenv(
+    "RETENTION_TTL_HOURS",
+    "frames=72,gifs=168,sheets=336,combined=336,raw=2160,metadata=2160"
+), EVICTION_ORDER)
+
+_access = AccessLog(job_store.record_output_access)
+_last_sweep: Dict[str, Any] = {}
+
+
+def touch(path: str):
+    """Record a download of an /outputs path (a file or a job zip)."""
+    job_dir = path.split("/", 1)[0]
+    if job_dir.endswith(".zip"):
+        job_dir = job_dir[:-4]
+    _access.touch(job_dir)
+
+
+def flush_access():
+    """Merge this worker's recorded downloads into the job store."""
+    _access.flush()
+
+
+def _protected_dirs() -> set:
+    """Output directories that queued or running jobs write to."""
+    return {job["id"] for job in job_store.active_jobs()}
+
+
+class _JobDir:
+    def __init__(self, name: str, files: List, last_used: float):
+        self.name = name
+        self.last_used = last_used
+        self.by_class: Dict[str, List] = {}
+        for relpath, path, st in files:
+            self.by_class.setdefault(output_files.artifact_type(relpath), []).append((path, st.st_size))
+        self.finished = bool(self.by_class.get("metadata"))
+        self.published = False
+        self.removed = False
+
+    @property
+    def size(self) -> int:
+        return sum(size for files in self.by_class.values() for _, size in files)
+
+    def _has(self, cls: str) -> bool:
+        return bool(self.by_class.get(cls))
+
+    def can_evict(self, cls: str) -> bool:
+        if self.removed:
+            return False
+        if cls == "metadata":
+            return True
+        if not self._has(cls):
+            return False
+        if self.published:
+            return True
+        if not self.finished:
+            return False
+        if cls == "frames":
+            return self._has("raw")
+        if cls == "raw":
+            # Keep the raw sheet while it is the only source of the frames
+            return self._has("frames")
+        return self._has("frames") or self._has("raw")
+
+    def evict(self, cls: str) -> int:
+        """Delete one artifact class (or, for metadata, the directory); returns bytes freed."""
+        if not self.can_evict(cls):
+            return 0
+        if cls == "metadata":
+            freed = self.size
+            shutil.rmtree(os.path.join(output_files.OUTPUTS_DIR, self.name), ignore_errors=True)
+            output_files.forget(self.name)
+            job_store.forget_output_access(self.name)
+            self.by_class.clear()
+            self.removed = True
+            return freed
+        freed = 0
+        parents = set()
+        for path, size in self.by_class.pop(cls, []):
+            try:
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                pass
+            parents.add(os.path.dirname(path))
+        for parent in parents:
+            if os.path.basename(parent) != self.name:
+                try:
+                    os.rmdir(parent)  # e.g. idle/ once its frames are gone
+                except OSError:
+                    pass
+        return freed
+
+
+def _scan(now: float):
+    """(evictable job directories, total bytes of outputs/, skipped count)."""
+    access = job_store.get_output_access()
+    protected = _protected_dirs()
+    jobs, total, skipped = [], 0, 0
+    try:
+        names = os.listdir(output_files.OUTPUTS_DIR)
+    except FileNotFoundError:
+        return jobs, total, skipped
+    for name in names:
+        if not os.path.isdir(os.path.join(output_files.OUTPUTS_DIR, name)):
+            continue
+        files = output_files.list_job_files(name)
+        newest = max((st.st_mtime for _, _, st in files), default=0)
+        job = _JobDir(name, files, max(access.get(name, 0), newest))
+        total += job.size
+        if name in protected or now - newest < GRACE_SECONDS:
+            skipped += 1
+            continue
+        if artifact_store.enabled:
+            try:
+                job.published = artifact_store.get_manifest(name) is not None
+            except Exception as e:
+                log.warning("Could not look up %s in the artifact store: %s", name, e)
+        jobs.append(job)
+    return jobs, total, skipped
+
+
+def sweep(now: Optional[float] = None) -> Dict[str, Any]:
+    """Apply TTLs, then the quota. Returns what was removed."""
+    now = now or time.time()
+    start = time.monotonic()
+    flush_access()
+    jobs, total, skipped = _scan(now)
+    freed = {cls: 0 for cls in EVICTION_ORDER}
+
+    for job in jobs:
+        for cls in EVICTION_ORDER:
+            if TTLS[cls] and now - job.last_used > TTLS[cls]:
+                freed[cls] += job.evict(cls)
+
+    used = total - sum(freed.values())
+    if QUOTA_BYTES and used > QUOTA_BYTES:
+        lru = sorted(jobs, key=lambda job: job.last_used)
+        for cls in EVICTION_ORDER:
+            for job in lru:
+                if used <= QUOTA_BYTES:
+                    break
+                removed = job.evict(cls)
+                freed[cls] += removed
+                used -= removed
+
+    result = {
+        "finished_at": now,
+        "duration_seconds": round(time.monotonic() - start, 3),
+        "bytes_before": total,
+        "bytes_after": used,
+        "quota_bytes": QUOTA_BYTES,
+        "freed_bytes": freed,
+        "jobs_removed": sum(1 for job in jobs if job.removed),
+        "jobs_skipped": skipped,
+        "records_removed": job_store.prune(now)
+    }
+    _last_sweep.clear()
+    _last_sweep.update(result)
+    if any(freed.values()):
+        log.info("Freed %.1f MB (%d job dirs removed), outputs now %.1f MB",
+                 sum(freed.values()) / 2**20, result["jobs_removed"], used / 2**20)
+    if result["records_removed"].get("jobs"):
+        log.info("Deleted %d job records past JOB_RECORD_TTL", result["records_removed"]["jobs"])
+    return result
+
+
+def _sweep_exclusive() -> Optional[Dict[str, Any]]:
+    """Sweep unless another worker on this host is already sweeping."""
+    return run_exclusive(LOCK_PATH, sweep)
+
+
+_sweeper = Sweeper("retention", flush_access, _sweep_exclusive, SWEEP_INTERVAL)
+
+
+def start_sweeper():
+    """Start this process's sweeper thread (once per process)."""
+    if ENABLED:
+        _sweeper.start()
+
+
+def get_stats() -> Dict[str, Any]:
+    return {
+        "enabled": ENABLED,
+        "quota_bytes": QUOTA_BYTES,
+        "ttl_hours": {cls: ttl / 3600 for cls, ttl in TTLS.items()},
+        "last_sweep": dict(_last_sweep) or None
+    }
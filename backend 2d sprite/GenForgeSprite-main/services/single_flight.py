@@ -0,0 +1,187 @@
+"""
+Single Flight - Coalesces identical in-flight upstream requests.
+
+The first caller for a key does the work; concurrent callers with the same
+key wait and share its result. Threads in one process share an in-memory
+call record. Gunicorn workers serialize on a per-key lock file, and a
+worker that waited can pick up the leader's result via a recheck callback
+(the generation cache) instead of repeating the request.
+
+Waiting on another worker's lock blocks in flock() (on a helper thread, so
+the wait can time out) rather than polling. The holder removes the lock
+file before releasing it, so lock files do not pile up. A waiter that
+wakes up on a removed file locks the current one instead.
+
+Callers that must not reuse an in-flight result (a forced fresh
+generation) pass join=False.
+"""
+import os
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import fcntl
+    FILE_LOCKS_AVAILABLE = True
+except ImportError:
+    FILE_LOCKS_AVAILABLE = False
+
+log = logging.getLogger(__name__)
+
+LOCK_DIR = os.getenv(
+    "SINGLE_FLIGHT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache", "locks")
+)
+# Give up waiting on another worker's lock after this many seconds
+LOCK_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "300"))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+_calls: Dict[str, _Call] = {}
+_calls_lock = threading.Lock()
+
+
+def _lock_fd(fd: int, timeout: float) -> bool:
+    """
+    Lock fd exclusively within timeout seconds. On failure fd is closed
+    (by the helper thread once it gets the lock, if it is still waiting).
+    """
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        pass
+    if timeout <= 0:
+        os.close(fd)
+        return False
+
+    acquired = threading.Event()
+    state_lock = threading.Lock()
+    abandoned = []
+
+    def wait():
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        with state_lock:
+            if abandoned:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+                return
+            acquired.set()
+
+    threading.Thread(target=wait, name="single-flight-lock", daemon=True).start()
+    if acquired.wait(timeout):
+        return True
+    with state_lock:
+        if acquired.is_set():
+            return True
+        abandoned.append(True)
+    return False
+
+
+def _acquire(path: str, timeout: float) -> Optional[int]:
+    """fd holding the lock on path, or None after timeout."""
+    deadline = time.monotonic() + timeout
+    while True:
+        fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+        if not _lock_fd(fd, deadline - time.monotonic()):
+            return None
+        # The previous holder removes the file before unlocking it, so a lock
+        # on a file no longer at path excludes nobody: lock the current one
+        try:
+            current, held = os.stat(path), os.fstat(fd)
+            if (current.st_dev, current.st_ino) == (held.st_dev, held.st_ino):
+                return fd
+        except FileNotFoundError:
+            pass
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+@contextmanager
+def _file_lock(key: str):
+    """Exclusive per-key lock shared by all processes on this host."""
+    if not FILE_LOCKS_AVAILABLE:
+        yield False
+        return
+
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    path = os.path.join(LOCK_DIR, f"{key}.lock")
+    fd = _acquire(path, LOCK_TIMEOUT)
+    if fd is None:
+        log.warning("Lock timeout for %s, proceeding", key[:12])
+    try:
+        yield fd is not None
+    finally:
+        if fd is not None:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+def do(key: str, fn: Callable[[], Any], recheck: Optional[Callable[[], Any]] = None,
+       join: bool = True) -> Any:
+    """
+    Run fn() at most once at a time per key.
+
+    Args:
+        key: Identity of the request (e.g. hash of the upstream payload)
+        fn: Does the actual work; its result is shared with all waiters
+        recheck: Called once the cross-worker lock is held; a non-None
+                 return value is used instead of calling fn()
+        join: False never waits for another caller's result: fn() runs
+              here, as the call others join if none is in flight
+    """
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _Call()
+            _calls[key] = call
+        elif join:
+            call.waiters += 1
+
+    if not leader and not join:
+        log.debug("Not joining in-flight request %s", key[:12])
+        return fn()
+
+    if not leader:
+        log.debug("Joined in-flight request %s", key[:12])
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        with _file_lock(key):
+            result = recheck() if recheck else None
+            if result is None:
+                result = fn()
+            else:
+                log.debug("Reused result of another worker for %s", key[:12])
+        call.result = result
+        return result
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            del _calls[key]
+        call.done.set()
+
+
+def in_flight() -> int:
+    """Number of distinct keys currently being worked on in this process."""
+    with _calls_lock:
+        return len(_calls)
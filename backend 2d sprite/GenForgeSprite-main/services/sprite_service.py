@@ -3,56 +3,188 @@ Sprite Service - Generates complete sprite sheets in a SINGLE API call.
 
 The AI generates the entire sprite sheet at once, ensuring natural consistency
 across all frames. We then slice the sheet into individual frames using PIL.
+
+Jobs run concurrently on job queue threads (and Gunicorn gthread workers),
+so everything here is per-call state: files are addressed by absolute
+paths under output_files.OUTPUTS_DIR (never the working directory), each
+job writes only to its own directory, and progress goes to the
+"services.sprite_service" logger rather than stdout.
 """
+import io
 import os
+import time
 import uuid
 import json
+import logging
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from PIL import Image, ImageDraw
-from typing import Dict, List, Any, Tuple
+from typing import Callable, Dict, List, Any, Tuple, Union
 
 from services.fibo_client import (
-    generate_image_sync,
-    generate_spritesheet_simple,
-    download_image,
-    refine_spritesheet
+    build_spritesheet_payload,
+    build_refine_payload,
+    generate_sheet,
+    bria_limiter
+)
+from genforge_common.rate_limiter import DEFAULT_LANE
+from services.preset_loader import load_preset, get_all_presets, get_presets_listing
+from services import (
+    estimator, generation_cache, job_queue, metrics, output_files, profiling, retention, single_flight
 )
-from services.preset_loader import load_preset, get_all_presets
+from services.artifact_store import store as artifact_store
+from services.job_store import IdempotencyConflict
 from dotenv import load_dotenv
 
-# Try to import rembg for AI-based background removal
-try:
-    from rembg import remove as rembg_remove
-    REMBG_AVAILABLE = True
-except ImportError:
-    REMBG_AVAILABLE = False
-    print("Warning: rembg not available, using simple background removal")
+# rembg (AI background removal) is optional. Importing it pulls in
+# onnxruntime and takes seconds, so it is only located here and imported on
+# first use or by the background warm-up (see get_rembg / start_warmup).
+REMBG_AVAILABLE = importlib.util.find_spec("rembg") is not None
 
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
+if not REMBG_AVAILABLE:
+    log.warning("rembg not available, using simple background removal")
+
+REMBG_MODEL = os.getenv("REMBG_MODEL", "u2net")
+# Load lazily imported dependencies in the background once a worker is up
+WARMUP = os.getenv("WARMUP", "true").lower() not in ("0", "false", "no")
+
+_rembg = None  # (remove, session) once loaded
+_rembg_failed = False
+_rembg_lock = threading.Lock()
+_warmup_pid = None
+
 API_KEY = os.getenv("BRIA_API_KEY", "")
 USE_MOCK = not API_KEY or API_KEY == "your_bria_api_key_here"
 
+# Keep a copy of each downloaded raw sheet on disk ({animation}_raw.png).
+# The pipeline itself decodes the in-memory download, so this is optional.
+KEEP_RAW_SHEETS = os.getenv("KEEP_RAW_SHEETS", "true").lower() not in ("0", "false", "no")
+
+# Maximum upstream generations in flight per job
+MAX_CONCURRENT_GENERATIONS = int(os.getenv("SPRITE_MAX_CONCURRENCY", "4"))
+
+# How long /refine waits for its job before answering 202 with a status URL
+# (keep below the Gunicorn worker timeout)
+REFINE_WAIT_SECONDS = float(os.getenv("REFINE_WAIT_SECONDS", "90"))
+
+# Absolute, so jobs do not depend on the process's working directory
+OUTPUTS_DIR = output_files.OUTPUTS_DIR
+
+# A raw sheet is either a path on disk or an in-memory download
+SheetSource = Union[str, io.BytesIO]
+
+
+def job_path(job_id: str, *parts: str) -> str:
+    """Absolute path of a file in a job's output directory."""
+    return os.path.join(OUTPUTS_DIR, job_id, *parts)
+
+
+def output_ref(path: str) -> str:
+    """The "outputs/<job>/<file>" form of a path used in results and metadata.json."""
+    return "outputs/" + os.path.relpath(path, OUTPUTS_DIR).replace(os.sep, "/")
+
+
+def resolve_ref(ref: str) -> str:
+    """Absolute path of an "outputs/<job>/<file>" reference."""
+    if os.path.isabs(ref):
+        return ref
+    return os.path.join(OUTPUTS_DIR, *ref.split("/")[1:])
+
 
 def get_available_presets() -> Dict[str, Any]:
     return get_all_presets()
 
 
+def get_available_presets_json() -> Tuple[bytes, str]:
+    """Serialized preset listing and its ETag."""
+    return get_presets_listing()
+
+
+def get_generation_cache_stats() -> Dict[str, Any]:
+    return generation_cache.get_stats()
+
+
+def get_upstream_stats() -> Dict[str, Any]:
+    return {"bria": bria_limiter.get_stats()}
+
+
+def get_queue_stats() -> Dict[str, Any]:
+    return job_queue.get_queue_stats()
+
+
+def get_retention_stats() -> Dict[str, Any]:
+    return retention.get_stats()
+
+
+def get_artifact_store_stats() -> Dict[str, Any]:
+    return artifact_store.get_stats()
+
+
+def get_estimator_stats() -> Dict[str, Any]:
+    return estimator.get_stats()
+
+
+def get_rembg():
+    """
+    rembg's remove() and one model session shared by all threads, imported
+    and created on first use. None if rembg is missing or fails to load.
+    """
+    global _rembg, _rembg_failed
+    if _rembg is not None or _rembg_failed or not REMBG_AVAILABLE:
+        return _rembg
+    with _rembg_lock:
+        if _rembg is None and not _rembg_failed:
+            start = time.monotonic()
+            try:
+                from rembg import new_session, remove
+                _rembg = (remove, new_session(REMBG_MODEL))
+            except Exception as e:
+                _rembg_failed = True
+                log.warning("rembg could not be loaded, using simple background removal: %s", e)
+                return None
+            log.info("Loaded rembg (%s) in %.1fs", REMBG_MODEL, time.monotonic() - start)
+    return _rembg
+
+
+def warm_up():
+    """Import and initialise lazily loaded dependencies ahead of the first job."""
+    start = time.monotonic()
+    get_rembg()
+    log.info("Warm-up finished in %.1fs", time.monotonic() - start)
+
+
+def start_warmup():
+    """Run warm_up() on a background thread, once per process (unless WARMUP is off)."""
+    global _warmup_pid
+    with _rembg_lock:
+        if not WARMUP or _warmup_pid == os.getpid():
+            return
+        _warmup_pid = os.getpid()
+    threading.Thread(target=warm_up, name="warmup", daemon=True).start()
+
+
 def remove_background(img: Image.Image) -> Image.Image:
     """Remove background - uses rembg if available, otherwise edge-based removal."""
     # Always prefer rembg for consistent AI-based background removal
-    if REMBG_AVAILABLE:
-        print("    Using AI background removal (rembg)...")
-        result = rembg_remove(img)
-        return result.convert("RGBA")
+    rembg = get_rembg()
+    if rembg is not None:
+        log.debug("Using AI background removal (rembg)")
+        remove, session = rembg
+        return remove(img, session=session).convert("RGBA")
     
     # Try chroma key removal (magenta/green)
     result = remove_chroma_key(img)
     if has_transparency(result):
-        print("    Chroma key removal successful")
+        log.debug("Chroma key removal successful")
         return result
     
     # Fall back to edge-based removal
-    print("    Using edge-based background removal...")
+    log.debug("Using edge-based background removal")
     return remove_background_edge_based(img)
 
 
@@ -165,10 +297,10 @@ def remove_background_edge_based(img: Image.Image) -> Image.Image:
     # Only proceed if this color appears frequently (>30% of edge pixels)
     total_edge_pixels = len(edge_colors)
     if count < total_edge_pixels * 0.3:
-        print(f"    No dominant edge color found, using simple removal")
+        log.debug("No dominant edge color found, using simple removal")
         return remove_background_simple(img)
     
-    print(f"    Detected background color: RGB{bg_color} ({count}/{total_edge_pixels} edge pixels)")
+    log.debug("Detected background color: RGB%s (%d/%d edge pixels)", bg_color, count, total_edge_pixels)
     
     # Remove pixels similar to the background color
     tolerance = 30
@@ -248,27 +380,32 @@ def generate_spritesheet_image(
     frame_count: int,
     preset: dict,
     job_id: str,
-    use_fibo_enhanced: bool = False
-) -> str:
+    use_fibo_enhanced: bool = False,
+    bypass_cache: bool = False,
+    lane: str = DEFAULT_LANE
+) -> SheetSource:
     """
     Generate a complete sprite sheet for one animation in a SINGLE API call.
     
+    Returns the raw sheet as an in-memory buffer (or a path in mock mode).
+    
     Args:
         use_fibo_enhanced: If True, uses FIBO's structured prompt for better accuracy
+        bypass_cache: If True, ignores cached generations for this request
+        lane: Upstream priority lane (refine, generate or bulk)
     """
-    out_dir = f"outputs/{job_id}"
-    os.makedirs(out_dir, exist_ok=True)
-    out_path = f"{out_dir}/{animation}_raw.png"
+    out_path = job_path(job_id, f"{animation}_raw.png")
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
     
     if USE_MOCK:
-        print(f"  [MOCK] Generating {animation} sprite sheet...")
+        log.debug("[%s] [MOCK] Generating %s sprite sheet", job_id[:8], animation)
         return generate_mock_spritesheet(prompt, animation, frame_count, preset, out_path)
     
     mode_str = "FIBO Enhanced" if use_fibo_enhanced else "Simple"
-    print(f"  Calling FIBO API for {animation} ({frame_count} frames) - Mode: {mode_str}...")
+    log.info("[%s] Calling FIBO API for %s (%d frames) - Mode: %s", job_id[:8], animation, frame_count, mode_str)
     
     style = preset.get("style", "anime")
-    image_url = generate_spritesheet_simple(
+    payload = build_spritesheet_payload(
         subject=prompt,
         animation=animation,
         frame_count=frame_count,
@@ -276,9 +413,19 @@ def generate_spritesheet_image(
         seed=42,
         use_structured=use_fibo_enhanced
     )
-    download_image(image_url, out_path)
-    
-    return out_path
+    return generate_sheet(
+        payload,
+        save_path=out_path if KEEP_RAW_SHEETS else None,
+        bypass_cache=bypass_cache,
+        lane=lane
+    )
+
+
+def describe_sheet_source(sheet: SheetSource) -> str:
+    """Human-readable description of a raw sheet source for logging."""
+    if isinstance(sheet, str):
+        return sheet
+    return f"<in-memory, {sheet.getbuffer().nbytes} bytes>"
 
 
 def generate_mock_spritesheet(
@@ -390,7 +537,7 @@ def detect_grid_layout(sheet_w: int, sheet_h: int, frame_count: int) -> Tuple[in
 
 
 def slice_spritesheet(
-    sheet_path: str,
+    sheet: SheetSource,
     frame_count: int,
     frame_size: Tuple[int, int],
     job_id: str,
@@ -407,44 +554,49 @@ def slice_spritesheet(
     - Vertical strip (any count)
     
     Does NOT stretch/distort images - uses padding.
+    
+    The sheet may be a file path or an in-memory buffer from fetch_image().
     """
-    out_dir = f"outputs/{job_id}/{animation}"
+    out_dir = job_path(job_id, animation)
     os.makedirs(out_dir, exist_ok=True)
-    
-    sheet = Image.open(sheet_path).convert("RGBA")
-    sheet_w, sheet_h = sheet.size
     target_w, target_h = frame_size
     
-    print(f"    Sheet: {sheet_w}x{sheet_h}, Frames: {frame_count}")
-    
-    # Auto-detect grid layout
-    cols, rows = detect_grid_layout(sheet_w, sheet_h, frame_count)
+    # Each step runs over all frames, so it is timed as one stage
+    with metrics.stage("slice"):
+        sheet = Image.open(sheet).convert("RGBA")
+        sheet_w, sheet_h = sheet.size
+        
+        log.debug("Sheet: %dx%d, Frames: %d", sheet_w, sheet_h, frame_count)
+        
+        # Auto-detect grid layout
+        cols, rows = detect_grid_layout(sheet_w, sheet_h, frame_count)
+        
+        cell_w = sheet_w // cols
+        cell_h = sheet_h // rows
+        
+        log.debug("Layout: %dx%d grid, cell size %dx%d", cols, rows, cell_w, cell_h)
+        
+        frames = []
+        for row in range(rows):
+            for col in range(cols):
+                left = col * cell_w
+                top = row * cell_h
+                frames.append(sheet.crop((left, top, left + cell_w, top + cell_h)))
     
-    cell_w = sheet_w // cols
-    cell_h = sheet_h // rows
+    with metrics.stage("background_removal"):
+        frames = [remove_background(frame) for frame in frames]
     
-    print(f"    Layout: {cols}x{rows} grid ({cols} cols, {rows} rows)")
-    print(f"    Cell size: {cell_w}x{cell_h}")
+    with metrics.stage("resize"):
+        frames = [fit_to_size_with_padding(frame, target_w, target_h) for frame in frames]
     
     frame_paths = []
-    frame_idx = 0
-    for row in range(rows):
-        for col in range(cols):
-            left = col * cell_w
-            top = row * cell_h
-            right = left + cell_w
-            bottom = top + cell_h
-            
-            frame = sheet.crop((left, top, right, bottom))
-            frame = remove_background(frame)
-            frame = fit_to_size_with_padding(frame, target_w, target_h)
-            
-            frame_path = f"{out_dir}/frame_{frame_idx:02d}.png"
+    with metrics.stage("encode"):
+        for frame_idx, frame in enumerate(frames):
+            frame_path = os.path.join(out_dir, f"frame_{frame_idx:02d}.png")
             frame.save(frame_path)
             frame_paths.append(frame_path)
-            frame_idx += 1
     
-    print(f"    Target frame size: {target_w}x{target_h}")
+    log.debug("Target frame size: %dx%d", target_w, target_h)
     return frame_paths
 
 
@@ -479,6 +631,7 @@ def fit_to_size_with_padding(img: Image.Image, target_w: int, target_h: int) ->
     return result
 
 
+@metrics.stage("encode")
 def make_sprite_sheet(frame_paths: List[str], out_path: str) -> str:
     """Combine frames into horizontal sprite sheet (after processing)."""
     frames = [Image.open(p).convert("RGBA") for p in frame_paths]
@@ -495,6 +648,7 @@ def make_sprite_sheet(frame_paths: List[str], out_path: str) -> str:
     return out_path
 
 
+@metrics.stage("gif")
 def make_gif(frame_paths: List[str], out_path: str, duration: int = 100) -> str:
     """Create animated GIF with transparency."""
     frames = [Image.open(p).convert("RGBA") for p in frame_paths]
@@ -522,6 +676,7 @@ def make_gif(frame_paths: List[str], out_path: str, duration: int = 100) -> str:
     return out_path
 
 
+@metrics.stage("combine")
 def create_combined_sheet(job_id: str, frame_dict: Dict[str, List[str]]) -> str:
     """Create combined sprite sheet with all animations."""
     all_rows = []
@@ -548,11 +703,12 @@ def create_combined_sheet(job_id: str, frame_dict: Dict[str, List[str]]) -> str:
         combined.paste(row, (0, y), row)
         y += row.height
     
-    out_path = f"outputs/{job_id}/combined_sheet.png"
+    out_path = job_path(job_id, "combined_sheet.png")
     combined.save(out_path)
     return out_path
 
 
+@metrics.stage("metadata")
 def create_metadata(job_id: str, outputs: Dict[str, Any], preset: dict, prompt: str) -> str:
     """Create JSON metadata for game engines."""
     canvas = preset.get("canvas", [128, 128])
@@ -583,9 +739,9 @@ def create_metadata(job_id: str, outputs: Dict[str, Any], preset: dict, prompt:
     for anim, data in outputs.items():
         meta["animations"][anim] = {
             "frame_count": data["frame_count"],
-            "sprite_sheet": data["sprite_sheet"],
-            "gif": data["gif"],
-            "frames": data["frames"],
+            "sprite_sheet": output_ref(data["sprite_sheet"]),
+            "gif": output_ref(data["gif"]),
+            "frames": [output_ref(p) for p in data["frames"]],
             "loop": anim not in ["death", "hurt"]
         }
         meta["phaser_config"]["animations"].append({
@@ -602,31 +758,117 @@ def create_metadata(job_id: str, outputs: Dict[str, Any], preset: dict, prompt:
         })
         frame_start += data["frame_count"]
     
-    path = f"outputs/{job_id}/metadata.json"
+    path = job_path(job_id, "metadata.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
     with open(path, "w") as f:
         json.dump(meta, f, indent=2)
     return path
 
 
-def process_sprite_job(req: dict) -> dict:
+def _restore_animation(job_id: str, animation: str, info: dict, meta: dict):
+    """Frames of one animation, re-sliced from the raw sheet if they were removed."""
+    frames = [resolve_ref(p) for p in info["frames"]]
+    if not all(os.path.exists(p) for p in frames):
+        raw_path = job_path(job_id, f"{animation}_raw.png")
+        if not os.path.exists(raw_path):
+            return None
+        log.info("Restoring %s frames of %s from raw sheet", animation, job_id)
+        frames = slice_spritesheet(raw_path, info["frame_count"], tuple(meta["frame_size"]), job_id, animation)
+    sheet_path, gif_path = resolve_ref(info["sprite_sheet"]), resolve_ref(info["gif"])
+    if not os.path.exists(sheet_path):
+        make_sprite_sheet(frames, sheet_path)
+    if not os.path.exists(gif_path):
+        make_gif(frames, gif_path, meta.get("frame_duration_ms", 100))
+    return frames
+
+
+def restore_outputs(job_id: str, relpath: str = None) -> bool:
+    """
+    Rebuild derived outputs of a finished job that retention removed.
+    
+    relpath is the missing file inside the job directory; only what it
+    needs is rebuilt (None = the whole job). Returns False if the file
+    cannot be rebuilt.
+    """
+    meta_path = job_path(job_id, "metadata.json")
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    animations = meta.get("animations", {})
+    
+    if relpath is None or relpath == "combined_sheet.png":
+        targets = list(animations)
+    else:
+        name = relpath.split("/", 1)[0]
+        for suffix in ("_sheet.png", ".gif"):
+            if name.endswith(suffix):
+                name = name[:-len(suffix)]
+        if name not in animations:
+            return False
+        targets = [name]
+    
+    def rebuild():
+        frame_dict = {}
+        for anim in targets:
+            frames = _restore_animation(job_id, anim, animations[anim], meta)
+            if frames is None:
+                return False
+            frame_dict[anim] = frames
+        if len(targets) == len(animations) and not os.path.exists(job_path(job_id, "combined_sheet.png")):
+            create_combined_sheet(job_id, frame_dict)
+        return True
+    
+    return single_flight.do(f"restore-{job_id}-{relpath or 'all'}".replace("/", "_"), rebuild)
+
+
+def select_animations(preset: dict, requested: List[str] = None) -> Dict[str, int]:
+    """
+    The preset's animations (name -> frame count), limited to the requested
+    ones if given, in preset order. Raises ValueError for names the preset
+    does not have.
+    """
+    anim_config = preset.get("animations", {"idle": 4, "run": 6, "attack": 4})
+    if not requested:
+        return dict(anim_config)
+    unknown = [anim for anim in requested if anim not in anim_config]
+    if unknown:
+        raise ValueError(
+            f"Unknown animation(s) for preset '{preset.get('name', 'custom')}': {', '.join(unknown)}"
+            f" (available: {', '.join(anim_config)})"
+        )
+    return {k: v for k, v in anim_config.items() if k in requested}
+
+
+def output_url(path: str) -> str:
+    """Public download URL for a file under outputs/."""
+    return "/" + output_ref(path)
+
+
+def process_sprite_job(req: dict, job_id: str = None, on_event: Callable[..., None] = None,
+                       lane: str = DEFAULT_LANE) -> dict:
     """
     Main entry point for sprite generation.
     
     NEW APPROACH: Generate complete sprite sheet per animation in ONE API call.
     The AI creates all frames together, ensuring natural consistency.
     Then we slice the sheet into individual frames.
+    
+    Args:
+        job_id: Use this job id (e.g. assigned by the job queue) instead of a new one
+        on_event: Optional progress callback, called as
+                  on_event(event, animation=None, timings=None, **data)
+        lane: Upstream priority lane of the job's BRIA calls
     """
-    job_id = str(uuid.uuid4())
+    job_id = job_id or str(uuid.uuid4())
+    
+    def emit(event: str, animation: str = None, **data):
+        if on_event:
+            on_event(event, animation, **data)
     
     # Check for FIBO Enhanced mode
     use_fibo_enhanced = req.get("use_fibo_enhanced", False)
-    
-    print(f"\n{'='*60}")
-    print(f"SPRITE GENERATION JOB: {job_id}")
-    print(f"Mode: {'MOCK' if USE_MOCK else 'FIBO API'}")
-    print(f"FIBO Enhanced: {use_fibo_enhanced}")
-    print(f"Method: Full sprite sheet generation (AI creates all frames)")
-    print(f"{'='*60}")
+    bypass_cache = req.get("bypass_cache", False)
     
     prompt = req["prompt"]
     preset_name = req.get("preset", "anime_action")
@@ -634,65 +876,127 @@ def process_sprite_job(req: dict) -> dict:
     
     preset = load_preset(preset_name)
     frame_size = tuple(preset.get("canvas", [128, 128]))
+    metrics.set_preset(preset.get("name", "custom"))
     
-    print(f"Prompt: {prompt}")
-    print(f"Preset: {preset_name}")
-    print(f"Frame Size: {frame_size[0]}x{frame_size[1]}")
+    anim_config = select_animations(preset, requested_anims)
     
-    anim_config = preset.get("animations", {"idle": 4, "run": 6, "attack": 4})
-    if requested_anims:
-        anim_config = {k: v for k, v in anim_config.items() if k in requested_anims}
-    
-    print(f"Animations: {list(anim_config.keys())}")
+    log.info(
+        "[%s] Sprite job started: mode=%s, fibo_enhanced=%s, preset=%s, frame size %dx%d, animations=%s, prompt=%r",
+        job_id[:8], "MOCK" if USE_MOCK else "FIBO API", use_fibo_enhanced, preset_name,
+        frame_size[0], frame_size[1], list(anim_config), prompt
+    )
+    for anim, frame_count in anim_config.items():
+        emit("pending", anim, frame_count=frame_count)
     
     frame_dict = {}
     outputs = {}
     duration = preset.get("frame_duration", 100)
-    
-    # Generate each animation as a complete sprite sheet
-    for anim, frame_count in anim_config.items():
-        print(f"\n[{anim}] Generating {frame_count}-frame sprite sheet...")
-        
-        # Step 1: Generate complete sprite sheet in ONE call
-        raw_sheet_path = generate_spritesheet_image(
-            prompt, anim, frame_count, preset, job_id,
-            use_fibo_enhanced=use_fibo_enhanced
-        )
-        print(f"  Raw sheet: {raw_sheet_path}")
-        
-        # Step 2: Slice into individual frames
-        print(f"  Slicing into {frame_count} frames...")
-        frame_paths = slice_spritesheet(
-            raw_sheet_path, frame_count, frame_size, job_id, anim
-        )
-        frame_dict[anim] = frame_paths
-        
-        # Step 3: Create processed sprite sheet and GIF
-        sheet_path = f"outputs/{job_id}/{anim}_sheet.png"
-        gif_path = f"outputs/{job_id}/{anim}.gif"
-        
-        make_sprite_sheet(frame_paths, sheet_path)
-        make_gif(frame_paths, gif_path, duration)
-        
-        outputs[anim] = {
-            "frames": frame_paths,
-            "sprite_sheet": sheet_path,
-            "gif": gif_path,
-            "frame_count": frame_count
+    job_start = time.monotonic()
+    timings = metrics.current()
+    profile = profiling.current()
+    
+    def fetch(anim: str, frame_count: int):
+        emit("generating", anim)
+        start = time.monotonic()
+        # Pool threads do not inherit the job's metrics context or profiler
+        with metrics.bind(timings), profiling.bind_thread(profile):
+            raw_sheet = generate_spritesheet_image(
+                prompt, anim, frame_count, preset, job_id,
+                use_fibo_enhanced=use_fibo_enhanced,
+                bypass_cache=bypass_cache,
+                lane=lane
+            )
+        return raw_sheet, time.monotonic() - start
+    
+    # Step 1: Request every animation's sheet concurrently (ONE call each)
+    max_workers = max(1, min(MAX_CONCURRENT_GENERATIONS, len(anim_config)))
+    log.debug("[%s] Upstream concurrency: %d", job_id[:8], max_workers)
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"sprite-{job_id[:8]}")
+    try:
+        futures = {
+            pool.submit(fetch, anim, frame_count): anim
+            for anim, frame_count in anim_config.items()
         }
-        print(f"  Done: {sheet_path}")
+        
+        # Process each sheet locally as soon as it arrives
+        for future in as_completed(futures):
+            anim = futures[future]
+            frame_count = anim_config[anim]
+            raw_sheet, generate_time = future.result()
+            log.debug("[%s] %s raw sheet: %s", job_id[:8], anim, describe_sheet_source(raw_sheet))
+            raw_path = raw_sheet if isinstance(raw_sheet, str) else job_path(job_id, f"{anim}_raw.png")
+            emit(
+                "sheet_received", anim,
+                timings={"generate": round(generate_time, 3)},
+                raw_sheet=output_url(raw_path) if os.path.exists(raw_path) else None
+            )
+            
+            # Step 2: Slice into individual frames
+            start = time.monotonic()
+            frame_paths = slice_spritesheet(
+                raw_sheet, frame_count, frame_size, job_id, anim
+            )
+            frame_dict[anim] = frame_paths
+            emit(
+                "frames_sliced", anim,
+                timings={"slice": round(time.monotonic() - start, 3)},
+                frames=[output_url(p) for p in frame_paths]
+            )
+            
+            # Step 3: Create processed sprite sheet and GIF
+            sheet_path = job_path(job_id, f"{anim}_sheet.png")
+            gif_path = job_path(job_id, f"{anim}.gif")
+            
+            start = time.monotonic()
+            make_sprite_sheet(frame_paths, sheet_path)
+            sheet_time = time.monotonic() - start
+            make_gif(frame_paths, gif_path, duration)
+            gif_time = time.monotonic() - start - sheet_time
+            
+            outputs[anim] = {
+                "frames": frame_paths,
+                "sprite_sheet": sheet_path,
+                "gif": gif_path,
+                "frame_count": frame_count
+            }
+            emit(
+                "animation_done", anim,
+                timings={"sheet": round(sheet_time, 3), "gif": round(gif_time, 3)},
+                sprite_sheet=output_url(sheet_path),
+                gif=output_url(gif_path)
+            )
+            log.info("[%s] %s done (%d frames)", job_id[:8], anim, frame_count)
+    finally:
+        # On failure, drop animations that have not started yet
+        pool.shutdown(wait=True, cancel_futures=True)
+    
+    # Keep preset order for the combined sheet and metadata
+    frame_dict = {anim: frame_dict[anim] for anim in anim_config}
+    outputs = {anim: outputs[anim] for anim in anim_config}
     
     # Create combined sheet
-    print(f"\nCreating combined sprite sheet...")
+    start = time.monotonic()
     combined = create_combined_sheet(job_id, frame_dict)
+    if combined:
+        emit(
+            "combined_sheet",
+            timings={"combine": round(time.monotonic() - start, 3)},
+            url=output_url(combined)
+        )
     
     # Create metadata
-    print(f"Generating metadata...")
+    start = time.monotonic()
     metadata = create_metadata(job_id, outputs, preset, prompt)
-    
-    print(f"\n{'='*60}")
-    print(f"COMPLETE: {job_id}")
-    print(f"{'='*60}\n")
+    emit(
+        "metadata",
+        timings={
+            "metadata": round(time.monotonic() - start, 3),
+            "total": round(time.monotonic() - job_start - metrics.paused_seconds(), 3)
+        },
+        url=output_url(metadata)
+    )
+    output_files.publish_job(job_id)
+    log.info("[%s] Sprite job complete in %.1fs", job_id[:8], time.monotonic() - job_start - metrics.paused_seconds())
     
     return {
         "job_id": job_id,
@@ -700,31 +1004,35 @@ def process_sprite_job(req: dict) -> dict:
         "prompt": prompt,
         "preset": preset_name,
         "frame_size": list(frame_size),
-        "combined_sheet": combined,
+        "combined_sheet": output_ref(combined) if combined else None,
         "animations": {
             anim: {
-                "sprite_sheet": data["sprite_sheet"],
-                "gif": data["gif"],
+                "sprite_sheet": output_ref(data["sprite_sheet"]),
+                "gif": output_ref(data["gif"]),
                 "frame_count": data["frame_count"]
             }
             for anim, data in outputs.items()
         },
-        "metadata": metadata,
+        "metadata": output_ref(metadata),
         "download_urls": {
             "combined_sheet": f"/outputs/{job_id}/combined_sheet.png",
             "metadata": f"/outputs/{job_id}/metadata.json",
             **{f"{a}_sheet": f"/outputs/{job_id}/{a}_sheet.png" for a in outputs},
-            **{f"{a}_gif": f"/outputs/{job_id}/{a}.gif" for a in outputs}
+            **{f"{a}_gif": f"/outputs/{job_id}/{a}.gif" for a in outputs},
+            "bundle": f"/outputs/{job_id}.zip"
         }
     }
 
 
-def refine_sprite_animation(req: dict) -> dict:
+def refine_sprite_animation(req: dict, lane: str = "refine", refine_id: str = None) -> dict:
     """
     Refine a specific animation from an existing job with user feedback.
     
     This allows users to regenerate a single animation with improvements
     based on their feedback about what was wrong with the original.
+    
+    Output goes to a directory named after refine_id (the refine job's id),
+    so concurrent refinements of the same animation never share files.
     """
     job_id = req.get("job_id")
     animation = req.get("animation")
@@ -736,15 +1044,11 @@ def refine_sprite_animation(req: dict) -> dict:
     if not all([job_id, animation, original_prompt]):
         raise ValueError("Missing required fields: job_id, animation, prompt")
     
-    print(f"\n{'='*60}")
-    print(f"SPRITE REFINEMENT JOB")
-    print(f"Original Job: {job_id}")
-    print(f"Animation: {animation}")
-    print(f"Refinement: {refinement[:100]}...")
-    print(f"{'='*60}")
+    log.info("Refining %s of job %s: %r", animation, job_id, refinement[:100])
     
     preset = load_preset(preset_name)
     frame_size = tuple(preset.get("canvas", [128, 128]))
+    metrics.set_preset(preset.get("name", "custom"))
     style = preset.get("style", "anime")
     duration = preset.get("frame_duration", 100)
     
@@ -752,23 +1056,22 @@ def refine_sprite_animation(req: dict) -> dict:
     anim_config = preset.get("animations", {"idle": 4, "run": 6, "attack": 4})
     frame_count = anim_config.get(animation, 4)
     
-    # Create output directory (reuse job_id with _refined suffix)
-    refined_job_id = f"{job_id}_refined_{animation}"
-    out_dir = f"outputs/{refined_job_id}"
+    # Create output directory (one per refinement)
+    refined_job_id = refine_id or str(uuid.uuid4())
+    out_dir = job_path(refined_job_id)
     os.makedirs(out_dir, exist_ok=True)
+    raw_path = os.path.join(out_dir, f"{animation}_raw.png")
     
-    print(f"\n[{animation}] Refining {frame_count}-frame sprite sheet...")
     
     # Step 1: Generate refined sprite sheet
     if USE_MOCK:
-        print(f"  [MOCK] Generating refined {animation} sprite sheet...")
-        raw_sheet_path = generate_mock_spritesheet(
-            original_prompt, animation, frame_count, preset, 
-            f"{out_dir}/{animation}_raw.png"
+        log.debug("[MOCK] Generating refined %s sprite sheet", animation)
+        raw_sheet = generate_mock_spritesheet(
+            original_prompt, animation, frame_count, preset, raw_path
         )
     else:
-        print(f"  Calling FIBO API for refined {animation}...")
-        image_url = refine_spritesheet(
+        log.info("Calling FIBO API for refined %s (%d frames)", animation, frame_count)
+        payload = build_refine_payload(
             original_prompt=original_prompt,
             animation=animation,
             frame_count=frame_count,
@@ -776,28 +1079,29 @@ def refine_sprite_animation(req: dict) -> dict:
             refinement_instructions=refinement,
             seed=seed
         )
-        raw_sheet_path = f"{out_dir}/{animation}_raw.png"
-        download_image(image_url, raw_sheet_path)
+        raw_sheet = generate_sheet(
+            payload,
+            save_path=raw_path if KEEP_RAW_SHEETS else None,
+            bypass_cache=req.get("bypass_cache", False),
+            lane=lane
+        )
     
-    print(f"  Raw sheet: {raw_sheet_path}")
+    log.debug("Refined raw sheet: %s", describe_sheet_source(raw_sheet))
     
     # Step 2: Slice into individual frames
-    print(f"  Slicing into {frame_count} frames...")
     frame_paths = slice_spritesheet(
-        raw_sheet_path, frame_count, frame_size, refined_job_id, animation
+        raw_sheet, frame_count, frame_size, refined_job_id, animation
     )
     
     # Step 3: Create processed sprite sheet and GIF
-    sheet_path = f"{out_dir}/{animation}_sheet.png"
-    gif_path = f"{out_dir}/{animation}.gif"
+    sheet_path = os.path.join(out_dir, f"{animation}_sheet.png")
+    gif_path = os.path.join(out_dir, f"{animation}.gif")
     
     make_sprite_sheet(frame_paths, sheet_path)
     make_gif(frame_paths, gif_path, duration)
+    output_files.publish_job(refined_job_id)
     
-    print(f"  Done: {sheet_path}")
-    print(f"\n{'='*60}")
-    print(f"REFINEMENT COMPLETE: {refined_job_id}")
-    print(f"{'='*60}\n")
+    log.info("Refinement complete: %s", refined_job_id)
     
     return {
         "job_id": refined_job_id,
@@ -808,10 +1112,175 @@ def refine_sprite_animation(req: dict) -> dict:
         "refinement": refinement,
         "frame_size": list(frame_size),
         "frame_count": frame_count,
-        "sprite_sheet": sheet_path,
-        "gif": gif_path,
+        "sprite_sheet": output_ref(sheet_path),
+        "gif": output_ref(gif_path),
         "download_urls": {
             "sprite_sheet": f"/outputs/{refined_job_id}/{animation}_sheet.png",
-            "gif": f"/outputs/{refined_job_id}/{animation}.gif"
+            "gif": f"/outputs/{refined_job_id}/{animation}.gif",
+            "bundle": f"/outputs/{refined_job_id}.zip"
         }
     }
+
+
+def process_refine_job(req: dict, job_id: str = None, on_event: Callable[..., None] = None,
+                       lane: str = "refine") -> dict:
+    """Job queue handler for refinements."""
+    return refine_sprite_animation(req, lane=lane, refine_id=job_id)
+
+
+def submit_sprite_job(req: dict, idempotency_key: str = None,
+                      callback_url: str = None, base_url: str = None) -> dict:
+    """
+    Queue a sprite generation job; returns its initial status.
+    
+    Retries with the same idempotency key get the original job back.
+    callback_url gets a signed webhook when the job completes or fails.
+    Raises ValueError for animations the preset does not have.
+    """
+    select_animations(load_preset(req.get("preset", "anime_action")), req.get("animations"))
+    job = job_queue.enqueue(
+        "generate", req, lane="generate", idempotency_key=idempotency_key,
+        callback_url=callback_url, base_url=base_url
+    )
+    return {**job_queue.get_status(job["id"]), "replayed": job["replayed"]}
+
+
+def submit_refine_job(req: dict, idempotency_key: str = None,
+                      callback_url: str = None, base_url: str = None) -> dict:
+    """
+    Queue a refinement in the refine lane and wait up to REFINE_WAIT_SECONDS
+    for it; returns the job status (with the result once completed).
+    """
+    job = job_queue.enqueue(
+        "refine", req, lane="refine", idempotency_key=idempotency_key,
+        callback_url=callback_url, base_url=base_url
+    )
+    status = job_queue.wait_for_job(job["id"], REFINE_WAIT_SECONDS)
+    return {**status, "replayed": job["replayed"]}
+
+
+def _needs_upstream(payload: dict, bypass_cache: bool) -> bool:
+    return bypass_cache or not generation_cache.contains(generation_cache.payload_key(payload))
+
+
+def estimate_generate_job(req: dict) -> dict:
+    """Job queue estimator of generate requests (see services/estimator.py)."""
+    preset_name = req.get("preset", "anime_action")
+    preset = load_preset(preset_name)
+    anim_config = select_animations(preset, req.get("animations"))
+    calls = 0
+    if not USE_MOCK:
+        calls = sum(
+            _needs_upstream(build_spritesheet_payload(
+                subject=req["prompt"], animation=anim, frame_count=frame_count,
+                style=preset.get("style", "anime"), seed=42,
+                use_structured=req.get("use_fibo_enhanced", False)
+            ), req.get("bypass_cache", False))
+            for anim, frame_count in anim_config.items()
+        )
+    return estimator.estimate(
+        "generate", preset_name, anim_config, calls,
+        cached=0 if USE_MOCK else len(anim_config) - calls,
+        concurrency=min(MAX_CONCURRENT_GENERATIONS, max(1, len(anim_config)))
+    )
+
+
+def estimate_refine_job(req: dict) -> dict:
+    """Job queue estimator of refinements (one call, unless a fixed seed is cached)."""
+    preset_name = req.get("preset", "anime_action")
+    preset = load_preset(preset_name)
+    frame_count = preset.get("animations", {"idle": 4, "run": 6, "attack": 4}).get(req.get("animation"), 4)
+    calls = 0
+    if not USE_MOCK:
+        calls = 1
+        if req.get("seed") is not None:
+            calls = int(_needs_upstream(build_refine_payload(
+                original_prompt=req.get("prompt", ""), animation=req.get("animation"),
+                frame_count=frame_count, style=preset.get("style", "anime"),
+                refinement_instructions=req.get("refinement", ""), seed=req["seed"]
+            ), req.get("bypass_cache", False)))
+    return estimator.estimate(
+        "refine", preset_name, {req.get("animation"): frame_count}, calls, cached=0 if USE_MOCK else 1 - calls
+    )
+
+
+def estimate_sprite_job(req: dict, kind: str = "generate") -> dict:
+    """
+    Predicted run time, BRIA calls and queue wait of a generate or refine
+    request if it were submitted now. Nothing is queued or generated.
+    """
+    if kind not in ("generate", "refine"):
+        raise ValueError(f"Unknown job kind '{kind}' (generate or refine)")
+    return job_queue.estimate_job(kind, req, lane=kind)
+
+
+def get_job_status(job_id: str) -> dict:
+    return job_queue.get_status(job_id)
+
+
+def get_job_profile(job_id: str, fmt: str = "txt") -> Tuple[str, str]:
+    """(path, content type) of a profiled job's saved profile, or (None, None)."""
+    path = profiling.find(job_id, fmt)
+    return (path, profiling.FORMATS[fmt]) if path else (None, None)
+
+
+def stream_job_events(job_id: str, after_id: int = 0):
+    """Incremental events of a sprite job (see job_queue.stream_events)."""
+    return job_queue.stream_events(job_id, after_id)
+
+
+def normalize_sprite_request(req: dict) -> dict:
+    """
+    Canonical form of a generate request: preset resolved and animations
+    listed explicitly in preset order, so equivalent items compare equal.
+    """
+    preset_name = req.get("preset", "anime_action")
+    animations = list(select_animations(load_preset(preset_name), req.get("animations")))
+    return {
+        "prompt": req["prompt"].strip(),
+        "preset": preset_name,
+        "animations": animations,
+        "use_fibo_enhanced": bool(req.get("use_fibo_enhanced", False)),
+        "bypass_cache": bool(req.get("bypass_cache", False))
+    }
+
+
+def submit_sprite_batch(items: list, bypass_cache: bool = False,
+                        callback_url: str = None, base_url: str = None) -> dict:
+    """
+    Queue a batch of generate requests.
+    
+    Identical items share one job. Items that overlap on individual
+    animations (same prompt, preset and animation) share the upstream call
+    through the generation cache and single-flight. callback_url gets a
+    webhook for each job as it finishes.
+    """
+    requests = [
+        normalize_sprite_request({"bypass_cache": bypass_cache, **item})
+        for item in items
+    ]
+    requested_calls = sum(len(r["animations"]) for r in requests)
+    upstream_calls = len({
+        (r["prompt"], r["preset"], anim, r["use_fibo_enhanced"])
+        for r in requests for anim in r["animations"]
+    })
+    batch = job_queue.enqueue_batch("generate", requests, callback_url=callback_url, base_url=base_url)
+    log.info("Batch %s: %d items, %d jobs, %d distinct upstream calls (%d requested)",
+             batch["batch_id"], len(requests), batch["unique_jobs"], upstream_calls, requested_calls)
+    return {**batch, "requested_calls": requested_calls, "upstream_calls": upstream_calls}
+
+
+def get_batch_status(batch_id: str) -> dict:
+    return job_queue.get_batch_status(batch_id)
+
+
+def stream_batch_events(batch_id: str, after_id: int = 0):
+    """Batch items in completion order (see job_queue.stream_batch_events)."""
+    return job_queue.stream_batch_events(batch_id, after_id)
+
+
+job_queue.register_handler("generate", process_sprite_job)
+job_queue.register_handler("refine", process_refine_job)
+job_queue.register_estimator("generate", estimate_generate_job)
+job_queue.register_estimator("refine", estimate_refine_job)
+output_files.register_restorer(restore_outputs)
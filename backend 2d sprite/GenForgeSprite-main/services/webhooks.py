@@ -0,0 +1,9 @@
+"""
+Webhooks - The sprite backend's dispatcher for job completion callbacks.
+
+Configured by the WEBHOOK_* environment variables; delivery, retries and
+the signature format are described in genforge_common.webhooks.
+"""
+from genforge_common.webhooks import WebhookDispatcher
+
+dispatcher = WebhookDispatcher.from_env()
@@ -5,6 +5,7 @@ Then run this script: python test_api.py
 """
 import requests
 import json
+import time
 
 BASE_URL = "http://localhost:5000"
 
@@ -56,10 +57,25 @@ def test_generate():
     
     print(f"  Status: {resp.status_code}")
     
-    if resp.status_code == 200:
-        result = resp.json()
-        print(f"  Job ID: {result['job_id']}")
-        print(f"  Status: {result['status']}")
+    if resp.status_code == 202:
+        job = resp.json()
+        print(f"  Job ID: {job['job_id']} (queued)")
+        
+        # Poll the status endpoint until the job finishes
+        while True:
+            status = requests.get(f"{BASE_URL}{job['status_url']}").json()
+            stages = {name: p.get('stage') for name, p in status['progress'].items()}
+            print(f"  Status: {status['status']} {stages}")
+            if status['status'] in ('completed', 'failed'):
+                break
+            time.sleep(2)
+        
+        if status['status'] == 'failed':
+            print(f"  Error: {status['error']}")
+            return
+        
+        result = status['result']
+        print(f"  Timings: {status['timings']}")
         print(f"  Animations generated: {list(result['animations'].keys())}")
         print(f"  Download URLs:")
         for name, url in result['download_urls'].items():
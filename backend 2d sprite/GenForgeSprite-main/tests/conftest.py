@@ -0,0 +1,43 @@
+"""
+Test settings: every piece of state goes to a temporary directory, and
+the service runs in mock mode (no BRIA key), whatever .env says.
+
+Service modules read their settings when first imported, so this runs
+before any test imports them.
+"""
+import os
+import socket
+import tempfile
+
+import pytest
+
+STATE_DIR = tempfile.mkdtemp(prefix="genforge-sprite-tests-")
+
+TEST_ENV = {
+    "BRIA_API_KEY": "",
+    "JOB_WORKERS": "0",
+    "RETENTION": "false",
+    "WARMUP": "false",
+    "ARTIFACT_STORE": "",
+    "OUTPUTS_DIR": os.path.join(STATE_DIR, "outputs"),
+    "JOB_STORE_DB": os.path.join(STATE_DIR, "jobs.sqlite"),
+    "UPSTREAM_LIMITER_DB": os.path.join(STATE_DIR, "upstream.sqlite"),
+    "GENERATION_CACHE_DIR": os.path.join(STATE_DIR, "cache", "generations"),
+    "SINGLE_FLIGHT_DIR": os.path.join(STATE_DIR, "cache", "locks"),
+    "RETENTION_LOCK": os.path.join(STATE_DIR, "cache", "locks", "retention.lock"),
+    "PROFILE_DIR": os.path.join(STATE_DIR, "profiles"),
+}
+os.environ.update(TEST_ENV)
+
+
+@pytest.fixture
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def client():
+    from app import app
+    return app.test_client()
@@ -0,0 +1,127 @@
+"""Run-time estimates from job history, the fallbacks while history is thin, and SJF order."""
+import threading
+
+import pytest
+
+from services import estimator, job_store
+
+NO_CALLS = {"calls": 0, "p50_seconds": None, "wait_p50_seconds": None}
+
+
+class FakeLimiter:
+    def __init__(self, latency):
+        self._latency = latency
+
+    def latency(self, window=None):
+        return self._latency
+
+
+@pytest.fixture(autouse=True)
+def fresh_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_store, "DB_PATH", str(tmp_path / "jobs.sqlite"))
+    monkeypatch.setattr(job_store, "_local", threading.local())
+    monkeypatch.setattr(estimator, "_model", None)
+    monkeypatch.setattr(estimator, "MIN_SAMPLES", 2)
+    monkeypatch.setattr(estimator, "bria_limiter", FakeLimiter(NO_CALLS))
+
+
+def finished_job(job_id: str, preset: str, animations: dict, finish: float = 0.2):
+    """A completed generate job; animations maps name -> (frames, processing seconds)."""
+    job_store.create_job(job_id, "generate", {"prompt": "a knight", "preset": preset})
+    job_store.claim_next("w")
+    timings = {"combine": finish}
+    for anim, (frames, seconds) in animations.items():
+        job_store.update_progress(job_id, anim, worker="w", stage="pending", frame_count=frames)
+        job_store.update_progress(job_id, anim, timings={"slice": seconds}, worker="w", stage="frames_sliced")
+        timings["slice"] = timings.get("slice", 0.0) + seconds
+    result = {
+        "animations": {anim: {"frame_count": frames} for anim, (frames, _) in animations.items()},
+        "timings": timings,
+        "upstream_calls": 0
+    }
+    assert job_store.complete_job(job_id, result, "w")
+
+
+def test_defaults_without_history():
+    prediction = estimator.estimate("generate", "anime_action", {"idle": 4, "run": 6}, upstream_calls=2, concurrency=2)
+    defaults = estimator.DEFAULTS
+    assert prediction["breakdown"] == {
+        "upstream": defaults["upstream_seconds"] + defaults["download_seconds"],
+        "processing": 10 * defaults["frame_seconds"],
+        "finish": defaults["finish_seconds"]
+    }
+    assert prediction["seconds"] == round(sum(prediction["breakdown"].values()), 1)
+    assert prediction["upstream_calls"] == 2
+
+
+def test_upstream_calls_run_in_rounds(monkeypatch):
+    monkeypatch.setattr(estimator, "bria_limiter",
+                        FakeLimiter({"calls": 10, "p50_seconds": 8.0, "wait_p50_seconds": 1.0}))
+    one_at_a_time = estimator.estimate("generate", "p", {"idle": 4, "run": 4, "walk": 4}, 3, concurrency=1)
+    parallel = estimator.estimate("generate", "p", {"idle": 4, "run": 4, "walk": 4}, 3, concurrency=4)
+    call = 8.0 + 1.0 + estimator.DEFAULTS["download_seconds"]
+    assert one_at_a_time["breakdown"]["upstream"] == 3 * call
+    assert parallel["breakdown"]["upstream"] == call
+    assert parallel["history"]["upstream_calls"] == 10
+
+
+def test_animation_median_then_preset_then_all_presets():
+    # pixel: idle 0.1 s/frame and run 0.5 s/frame, with two jobs each
+    for i in range(2):
+        finished_job(f"pixel-{i}", "pixel", {"idle": (4, 0.4), "run": (6, 3.0)})
+    # anime: one job only, too few for its own medians
+    finished_job("anime-0", "anime", {"idle": (4, 4.0)})
+
+    model = estimator.get_model()
+    assert model["frame_seconds"]["pixel:idle"] == (pytest.approx(0.1), 2)
+    assert model["frame_seconds"]["pixel:run"] == (pytest.approx(0.5), 2)
+    assert model["frame_seconds"]["pixel"] == (pytest.approx(0.34), 2)
+
+    def processing(preset, animations):
+        return estimator.estimate("generate", preset, animations, 0)["breakdown"]["processing"]
+
+    assert processing("pixel", {"idle": 10}) == pytest.approx(1.0)
+    assert processing("pixel", {"run": 10}) == pytest.approx(5.0)
+    # An animation pixel jobs never had uses the preset's median
+    assert processing("pixel", {"jump": 10}) == pytest.approx(3.4)
+    # anime has one job: the median of all presets (0.34, 0.34, 1.0)
+    assert processing("anime", {"idle": 10}) == pytest.approx(3.4)
+
+
+def test_pick_falls_back_to_the_broadest_key_known():
+    table = {"p:idle": (1.0, 1), "p": (2.0, 1), "": (3.0, 1)}
+    assert estimator._pick(table, "p:idle", "p", "") == 3.0
+    assert estimator._pick({"p:idle": (1.0, 1), "p": (2.0, 1)}, "p:idle", "p", "") == 2.0
+    assert estimator._pick({**table, "p": (2.0, 2)}, "p:idle", "p", "") == 2.0
+    assert estimator._pick({**table, "p:idle": (1.0, 5)}, "p:idle", "p", "") == 1.0
+    assert estimator._pick({}, "p:idle", "p", "") is None
+
+
+def test_median_error_of_stored_estimates():
+    # Estimated 1 s, took 2 s
+    finished_job("job", "pixel", {"idle": (4, 0.4)})
+    job_store._connect().execute(
+        "UPDATE jobs SET estimate = '{\"seconds\": 1.0}', result = json_set(result, '$.timings.total', 2.0)"
+        " WHERE id = 'job'"
+    )
+    assert estimator.build_model()["median_error"] == 0.5
+
+
+def test_sjf_claims_short_jobs_first_with_aging(monkeypatch):
+    monkeypatch.setattr(job_store, "ORDER", "sjf")
+    monkeypatch.setattr(job_store, "SJF_AGING", 1.0)
+    assert job_store.sort_key(1000.0, 30.0) == 1030.0
+    assert job_store.sort_key(1000.0, None) == 1000.0
+
+    now = 1_000_000.0
+    for job_id, age, seconds in (("long", 0, 60.0), ("short", 0, 5.0), ("old-long", 100, 60.0)):
+        job_store.create_job(job_id, "generate", {"prompt": job_id}, estimate={"seconds": seconds})
+        job_store._connect().execute(
+            "UPDATE jobs SET created_at = ? WHERE id = ?", (now - age, job_id)
+        )
+    # old-long has waited 100 s, which outweighs its 55 s longer estimate
+    claimed = [job_store.claim_next("w")["id"] for _ in range(3)]
+    assert claimed == ["old-long", "short", "long"]
+
+    monkeypatch.setattr(job_store, "ORDER", "fifo")
+    assert job_store.sort_key(1000.0, 30.0) == 1000.0
@@ -0,0 +1,87 @@
+"""Server-sent events: replay after an event id, and the end of the stream."""
+import json
+import threading
+
+import pytest
+
+from services import job_queue, job_store
+
+
+@pytest.fixture(autouse=True)
+def fresh_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_store, "DB_PATH", str(tmp_path / "jobs.sqlite"))
+    monkeypatch.setattr(job_store, "_local", threading.local())
+
+
+def staged_handler(request, job_id, on_event, lane):
+    for stage in ("generating", "sheet_received", "animation_done"):
+        on_event(stage, "idle")
+    if request.get("fail"):
+        raise RuntimeError("upstream exploded")
+    return {"job_id": job_id}
+
+
+job_queue.register_handler("test-staged", staged_handler)
+
+
+def run(request: dict) -> str:
+    job = job_queue.enqueue("test-staged", request)
+    job_queue.run_job(job_store.claim_next("w"))
+    return job["id"]
+
+
+def names(events) -> list:
+    return [event["event"] for event in events]
+
+
+def test_stream_ends_after_completed_and_replays_after_an_id():
+    job_id = run({})
+    events = list(job_queue.stream_events(job_id))
+    assert names(events) == ["queued", "running", "generating", "sheet_received", "animation_done", "completed"]
+
+    resumed = list(job_queue.stream_events(job_id, after_id=events[2]["id"]))
+    assert resumed == events[3:]
+    # A client reconnecting after the last event gets an empty stream
+    assert list(job_queue.stream_events(job_id, after_id=events[-1]["id"])) == []
+
+
+def test_stream_ends_after_failed():
+    job_id = run({"fail": True})
+    events = list(job_queue.stream_events(job_id))
+    assert names(events)[-1] == "failed"
+    assert "upstream exploded" in json.dumps(events[-1]["data"])
+
+
+def test_route_replays_from_last_event_id(client):
+    job_id = run({})
+    events = list(job_queue.stream_events(job_id))
+    response = client.get(f"/api/sprite/events/{job_id}", headers={"Last-Event-ID": str(events[3]["id"])})
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    body = response.get_data(as_text=True)
+    sent = [line.split(": ", 1)[1] for line in body.splitlines() if line.startswith("event: ")]
+    assert sent == ["animation_done", "completed"]
+    assert f"id: {events[-1]['id']}\n" in body
+
+
+def test_route_refuses_a_bad_last_event_id(client):
+    job_id = run({})
+    response = client.get(f"/api/sprite/events/{job_id}", headers={"Last-Event-ID": "not-a-number"})
+    assert response.status_code == 400
+    assert client.get("/api/sprite/events/no-such-job").status_code == 404
+
+
+def test_batch_stream_ends_once_for_reconnecting_clients():
+    batch = job_queue.enqueue_batch("test-staged", [{"item": 0}, {"item": 1}, {"item": 0}])
+    job_queue.run_job(job_store.claim_next("w"))
+    job_queue.run_job(job_store.claim_next("w"))
+
+    events = list(job_queue.stream_batch_events(batch["batch_id"]))
+    assert names(events) == ["item_completed", "item_completed", "batch_completed"]
+    assert sorted(i for event in events[:2] for i in event["indexes"]) == [0, 1, 2]
+    assert events[-1]["id"] > events[-2]["id"]
+
+    # Reconnecting after the last item still gets batch_completed, but only once
+    resumed = list(job_queue.stream_batch_events(batch["batch_id"], after_id=events[-2]["id"]))
+    assert resumed == [events[-1]]
+    assert list(job_queue.stream_batch_events(batch["batch_id"], after_id=events[-1]["id"])) == []
@@ -0,0 +1,119 @@
+"""Asynchronous BRIA generations (submit and poll errors), and retries under the limiter."""
+import uuid
+
+import pytest
+import requests
+
+from genforge_common.rate_limiter import UpstreamLimiter
+from services import fibo_client
+
+
+PAYLOAD = fibo_client.build_generate_payload(simple_prompt="a knight", seed=42, num_results=1)
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, body: dict):
+        self.status_code = status_code
+        self.body = body
+        self.text = str(body)
+
+    def json(self):
+        return self.body
+
+
+class FakeSession:
+    """Answers POSTs and GETs from lists of responses, in order."""
+
+    def __init__(self, posts=(), gets=()):
+        self.posts = list(posts)
+        self.gets = list(gets)
+        self.urls = []
+
+    def post(self, url, **kwargs):
+        self.urls.append(url)
+        return self.posts.pop(0)
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        return self.gets.pop(0)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    def install(**responses):
+        fake = FakeSession(**responses)
+        monkeypatch.setattr(fibo_client, "get_session", lambda: fake)
+        return fake
+    monkeypatch.setattr(fibo_client, "API_TOKEN", "test-token")
+    monkeypatch.setattr(fibo_client, "POLL_INTERVAL", 0.0)
+    return install
+
+
+def test_submit_without_request_id_is_an_api_error(session):
+    session(posts=[FakeResponse(202, {"status": "IN_PROGRESS"})])
+    with pytest.raises(fibo_client.BriaApiError, match="request_id"):
+        fibo_client.submit_generation(PAYLOAD)
+
+
+def test_failed_generation_is_a_generation_error(session):
+    fake = session(
+        posts=[FakeResponse(202, {"request_id": "r1"})],
+        gets=[FakeResponse(200, {"status": "IN_PROGRESS"}), FakeResponse(200, {"status": "ERROR", "error": "nsfw"})]
+    )
+    with pytest.raises(fibo_client.BriaGenerationError, match="nsfw"):
+        fibo_client.generate_from_payload(PAYLOAD, use_async=True)
+    assert fake.urls[1] == f"{fibo_client.STATUS_URL}/r1"
+
+
+def test_completed_generation_returns_its_image(session):
+    session(
+        posts=[FakeResponse(202, {"request_id": "r1", "status_url": "https://status/r1"})],
+        gets=[FakeResponse(503, {}), FakeResponse(200, {"status": "COMPLETED", "result": {"image_url": "https://img"}})]
+    )
+    assert fibo_client.generate_from_payload(PAYLOAD, use_async=True) == "https://img"
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = UpstreamLimiter(f"bria-test-{uuid.uuid4().hex[:8]}", max_rpm=600, max_concurrency=4)
+    monkeypatch.setattr(fibo_client, "bria_limiter", limiter)
+    monkeypatch.setattr(fibo_client, "UPSTREAM_RETRIES", 2)
+    monkeypatch.setattr(fibo_client.time, "sleep", lambda seconds: None)
+    return limiter
+
+
+def failing(monkeypatch, *errors):
+    """Make generate_from_payload raise the given errors, then succeed."""
+    errors = list(errors)
+
+    def generate(payload, use_async=None):
+        if errors:
+            raise errors.pop(0)
+        return "https://img"
+    monkeypatch.setattr(fibo_client, "generate_from_payload", generate)
+    return errors
+
+
+@pytest.mark.parametrize("error", [requests.ConnectionError("refused"), requests.ReadTimeout("slow"),
+                                   TimeoutError("deadline passed")])
+def test_no_response_is_retried_and_shrinks_the_limits(limiter, monkeypatch, error):
+    failing(monkeypatch, error)
+    assert fibo_client.generate_limited(PAYLOAD) == "https://img"
+    stats = limiter.get_stats()
+    assert stats["throttled"] == 1
+    assert stats["concurrency"] < 4
+
+
+def test_retries_are_capped(limiter, monkeypatch):
+    failing(monkeypatch, *[requests.ConnectTimeout("down")] * 3)
+    with pytest.raises(requests.ConnectTimeout):
+        fibo_client.generate_limited(PAYLOAD)
+    assert limiter.latency()["calls"] == 3
+
+
+def test_client_errors_are_not_retried(limiter, monkeypatch):
+    errors = failing(monkeypatch, fibo_client.BriaApiError(400, "bad prompt"), fibo_client.BriaApiError(400, "again"))
+    with pytest.raises(fibo_client.BriaApiError):
+        fibo_client.generate_limited(PAYLOAD)
+    assert len(errors) == 1
+    assert limiter.get_stats()["throttled"] == 0
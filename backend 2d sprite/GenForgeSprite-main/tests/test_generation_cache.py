@@ -0,0 +1,63 @@
+"""Size-capped eviction from a running total, and lookups that leave the stats alone."""
+import os
+
+import pytest
+
+from services import generation_cache
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(generation_cache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(generation_cache, "CACHE_ENABLED", True)
+    monkeypatch.setattr(generation_cache, "MAX_BYTES", 1000)
+    monkeypatch.setattr(generation_cache, "_stats", dict.fromkeys(generation_cache._stats, 0))
+    monkeypatch.setattr(generation_cache, "_usage", {"bytes": None, "scanned_at": 0.0})
+    return tmp_path
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    calls = []
+    entries = generation_cache._entries
+
+    def counting():
+        calls.append(1)
+        return entries()
+    monkeypatch.setattr(generation_cache, "_entries", counting)
+    return calls
+
+
+def test_scans_only_when_over_the_cap(scans):
+    generation_cache.put("a" * 64, b"x" * 300)
+    assert len(scans) == 1  # the first put learns the size on disk
+    generation_cache.put("b" * 64, b"x" * 300)
+    generation_cache.put("a" * 64, b"x" * 300)  # replacing an entry adds nothing
+    assert len(scans) == 1
+
+    os.utime(generation_cache._entry_path("b" * 64), (0, 0))
+    generation_cache.put("c" * 64, b"x" * 500)
+    assert len(scans) == 2
+    assert not generation_cache.contains("b" * 64)
+    assert generation_cache.contains("a" * 64) and generation_cache.contains("c" * 64)
+    assert generation_cache._usage["bytes"] == 800
+
+
+def test_rescans_after_the_interval(scans, monkeypatch):
+    generation_cache.put("a" * 64, b"x" * 100)
+    generation_cache.put("b" * 64, b"x" * 100)
+    assert len(scans) == 1
+    monkeypatch.setattr(generation_cache, "RESCAN_INTERVAL", 0.0)
+    generation_cache.put("c" * 64, b"x" * 100)
+    assert len(scans) == 2
+
+
+def test_peek_does_not_count_lookups():
+    generation_cache.put("a" * 64, b"sheet")
+    assert generation_cache.peek("a" * 64) == b"sheet"
+    assert generation_cache.peek("b" * 64) is None
+    stats = generation_cache.get_stats()
+    assert (stats["hits"], stats["misses"]) == (0, 0)
+
+    assert generation_cache.get("b" * 64) is None
+    assert generation_cache.get_stats()["misses"] == 1
@@ -0,0 +1,92 @@
+"""The gthread configuration, and that open event streams do not block other requests."""
+import os
+import runpy
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONF = os.path.join(ROOT, "gunicorn.conf.py")
+
+
+def load_conf(monkeypatch, **env) -> dict:
+    for name in ("PORT", "WEB_CONCURRENCY", "GUNICORN_THREADS", "GUNICORN_TIMEOUT"):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return runpy.run_path(CONF)
+
+
+def test_defaults(monkeypatch):
+    conf = load_conf(monkeypatch)
+    assert conf["worker_class"] == "gthread"
+    assert conf["workers"] == 2
+    assert conf["threads"] == 16
+    assert conf["bind"] == "0.0.0.0:5000"
+    # Job threads and the sweeper start on import, so each worker imports the app itself
+    assert conf["preload_app"] is False
+
+
+def test_environment(monkeypatch):
+    conf = load_conf(monkeypatch, PORT="8123", WEB_CONCURRENCY="3", GUNICORN_THREADS="4", GUNICORN_TIMEOUT="30")
+    assert conf["bind"] == "0.0.0.0:8123"
+    assert (conf["workers"], conf["threads"], conf["timeout"]) == (3, 4, 30)
+
+
+@pytest.mark.skipif(shutil.which("gunicorn") is None or sys.platform == "win32",
+                    reason="needs gunicorn")
+def test_streams_do_not_block_requests(tmp_path, free_port):
+    """
+    One process with 8 threads: 6 open event streams of a job that never
+    runs (no job threads) leave threads for /health.
+    """
+    url = f"http://127.0.0.1:{free_port}"
+    env = {
+        **os.environ,
+        "PORT": str(free_port),
+        "WEB_CONCURRENCY": "1",
+        "GUNICORN_THREADS": "8",
+        "JOB_STORE_DB": str(tmp_path / "jobs.sqlite"),
+        "OUTPUTS_DIR": str(tmp_path / "outputs"),
+    }
+    log = open(tmp_path / "gunicorn.log", "w")
+    proc = subprocess.Popen(["gunicorn", "-c", CONF, "--bind", f"127.0.0.1:{free_port}", "app:app"],
+                            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+                            start_new_session=True)
+    streams = []
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            assert proc.poll() is None, (tmp_path / "gunicorn.log").read_text()
+            try:
+                if requests.get(f"{url}/api/sprite/health", timeout=2).ok:
+                    break
+            except requests.RequestException:
+                pass
+            assert time.monotonic() < deadline, "gunicorn did not start"
+            time.sleep(0.25)
+
+        response = requests.post(f"{url}/api/sprite/generate",
+                                 json={"prompt": "a knight", "animations": ["idle"]}, timeout=10)
+        assert response.status_code == 202, response.text
+        job = response.json()
+        for _ in range(6):
+            stream = requests.get(f"{url}/api/sprite/events/{job['job_id']}", stream=True, timeout=10)
+            assert stream.status_code == 200
+            streams.append(stream)
+
+        start = time.monotonic()
+        assert requests.get(f"{url}/api/sprite/health", timeout=5).ok
+        assert time.monotonic() - start < 2
+    finally:
+        for stream in streams:
+            stream.close()
+        # A graceful stop would wait for the streams' threads to notice
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait(30)
+        log.close()
@@ -0,0 +1,143 @@
+"""Claiming, heartbeats, stale recovery, ownership and idempotency keys."""
+import threading
+import time
+
+import pytest
+
+from services import job_queue, job_store
+from services.job_store import IdempotencyConflict
+
+
+@pytest.fixture(autouse=True)
+def fresh_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_store, "DB_PATH", str(tmp_path / "jobs.sqlite"))
+    monkeypatch.setattr(job_store, "_local", threading.local())
+
+
+def create(job_id, lane="generate", **kwargs):
+    return job_store.create_job(job_id, "generate", {"prompt": "a knight"}, lane, **kwargs)
+
+
+def go_stale(job_id):
+    job_store._connect().execute(
+        "UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time() - job_store.STALE_SECONDS - 1, job_id)
+    )
+
+
+def events(job_id):
+    return [event["event"] for event in job_store.get_events(job_id)]
+
+
+def test_claims_by_lane_then_age():
+    create("bulk-1", "bulk")
+    create("generate-1")
+    create("refine-1", "refine")
+    create("generate-2")
+    claimed = [job_store.claim_next("w")["id"] for _ in range(4)]
+    assert claimed == ["refine-1", "generate-1", "generate-2", "bulk-1"]
+    assert job_store.claim_next("w") is None
+
+
+def test_claim_above_priority_only_takes_higher_lanes():
+    create("generate-1")
+    assert job_store.claim_next("w", above_priority=job_store.LANES.index("generate")) is None
+    create("refine-1", "refine")
+    assert job_store.claim_next("w", above_priority=job_store.LANES.index("generate"))["id"] == "refine-1"
+
+
+def test_claimed_job_is_running_for_its_worker():
+    create("job")
+    job = job_store.claim_next("w1")
+    assert (job["status"], job["worker"], job["attempts"]) == (job_store.RUNNING, "w1", 1)
+    assert events("job") == [job_store.QUEUED, job_store.RUNNING]
+
+
+def test_stale_job_is_requeued_and_old_worker_loses_it():
+    create("job")
+    job_store.claim_next("w1")
+    go_stale("job")
+    job = job_store.claim_next("w2")
+    assert (job["id"], job["worker"], job["attempts"]) == ("job", "w2", 2)
+
+    assert not job_store.heartbeat("job", "w1")
+    assert not job_store.complete_job("job", {"from": "w1"}, "w1")
+    assert not job_store.fail_job("job", "late failure", "w1")
+    job_store.update_progress("job", "idle", worker="w1", stage="frames_sliced")
+    assert "frames_sliced" not in events("job")
+
+    assert job_store.heartbeat("job", "w2")
+    assert job_store.complete_job("job", {"from": "w2"}, "w2")
+    job = job_store.get_job("job")
+    assert (job["status"], job["result"]) == (job_store.COMPLETED, {"from": "w2"})
+    assert events("job").count(job_store.COMPLETED) == 1
+    # A finished job cannot be finished again
+    assert not job_store.fail_job("job", "again", "w2")
+
+
+def test_fresh_heartbeat_keeps_a_job():
+    create("job")
+    job_store.claim_next("w1")
+    assert job_store.heartbeat("job", "w1")
+    assert job_store.claim_next("w2") is None
+    assert job_store.get_job("job")["worker"] == "w1"
+
+
+def test_stale_job_fails_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(job_store, "MAX_ATTEMPTS", 2)
+    create("job")
+    for worker in ("w1", "w2"):
+        assert job_store.claim_next(worker)["id"] == "job"
+        go_stale("job")
+    assert job_store.claim_next("w3") is None
+    job = job_store.get_job("job")
+    assert job["status"] == job_store.FAILED
+    assert "2 attempts" in job["error"]
+    assert events("job")[-1] == job_store.FAILED
+
+
+def test_heartbeat_thread_refreshes_running_jobs(monkeypatch):
+    create("job")
+    job_store.claim_next("w1")
+    go_stale("job")
+    monkeypatch.setattr(job_queue, "_running", {"job": "w1", "gone": "w1"})
+    job_queue._beat()
+    assert job_store.get_job("job")["heartbeat_at"] > time.time() - 5
+    assert job_queue._running == {"job": "w1"}
+    assert job_store.claim_next("w2") is None
+
+
+def test_idempotency_key_returns_the_original_job():
+    first = create("job-1", idempotency_key="key")
+    again = create("job-2", idempotency_key="key")
+    assert not first["replayed"]
+    assert again["replayed"] and again["id"] == "job-1"
+    assert job_store.get_job("job-2") is None
+    with pytest.raises(IdempotencyConflict):
+        job_store.create_job("job-3", "generate", {"prompt": "different"}, idempotency_key="key")
+
+
+def test_failed_job_releases_its_idempotency_key():
+    create("job-1", idempotency_key="key")
+    job_store.claim_next("w")
+    assert job_store.fail_job("job-1", "boom", "w")
+    retry = create("job-2", idempotency_key="key")
+    assert not retry["replayed"] and retry["id"] == "job-2"
+
+
+def test_prune_deletes_old_finished_jobs_with_their_events():
+    for job_id in ("old", "recent", "running"):
+        create(job_id)
+        job_store.claim_next("w")
+    job_store.complete_job("old", {}, "w")
+    job_store.fail_job("recent", "boom", "w")
+    job_store.create_batch("batch", ["old", "recent"])
+    job_store.save_metrics_snapshot("gone", "{}")
+    job_store._connect().execute("UPDATE jobs SET finished_at = 0 WHERE id IN ('old', 'running')")
+    job_store._connect().execute("UPDATE metrics_snapshots SET updated_at = 0")
+
+    removed = job_store.prune()
+    assert removed == {"job_events": 3, "batch_items": 1, "jobs": 1, "metrics_snapshots": 1}
+    assert job_store.get_job("old") is None and job_store.get_events("old") == []
+    assert [item["id"] for item in job_store.get_batch("batch")] == ["recent"]
+    # Unfinished jobs stay, however old
+    assert job_store.get_job("running")["status"] == job_store.RUNNING
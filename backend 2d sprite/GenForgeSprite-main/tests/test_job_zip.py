@@ -0,0 +1,70 @@
+"""Whole-job zip bundles: a valid archive, ?include= filtering and its validation."""
+import io
+import os
+import uuid
+import zipfile
+
+import pytest
+
+from services import output_files
+
+FILES = {
+    "combined_sheet.png": b"combined",
+    "idle_sheet.png": b"sheet",
+    "idle.gif": b"gif",
+    "idle_raw.png": b"raw",
+    "frames/idle_00.png": b"frame0",
+    "frames/idle_01.png": b"frame1",
+    "metadata.json": b'{"animations": {}}',
+}
+
+
+@pytest.fixture
+def job_id():
+    job_id = str(uuid.uuid4())
+    for relpath, data in FILES.items():
+        path = os.path.join(output_files.OUTPUTS_DIR, job_id, *relpath.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+    return job_id
+
+
+def archive(response) -> zipfile.ZipFile:
+    assert response.status_code == 200
+    assert response.mimetype == "application/zip"
+    return zipfile.ZipFile(io.BytesIO(response.data))
+
+
+def test_whole_job(client, job_id):
+    response = client.get(f"/outputs/{job_id}.zip")
+    assert response.headers["Content-Disposition"] == f'attachment; filename="{job_id}.zip"'
+    with archive(response) as zf:
+        assert zf.testzip() is None
+        assert {name: zf.read(name) for name in zf.namelist()} == {
+            f"{job_id}/{relpath}": data for relpath, data in FILES.items()
+        }
+        assert zf.getinfo(f"{job_id}/idle_sheet.png").compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo(f"{job_id}/metadata.json").compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_include_filters_artifact_types(client, job_id):
+    with archive(client.get(f"/outputs/{job_id}.zip?include=sheets,gifs")) as zf:
+        assert sorted(zf.namelist()) == [f"{job_id}/idle.gif", f"{job_id}/idle_sheet.png"]
+    with archive(client.get(f"/outputs/{job_id}.zip?include=frames")) as zf:
+        assert sorted(zf.namelist()) == [f"{job_id}/frames/idle_00.png", f"{job_id}/frames/idle_01.png"]
+
+
+def test_etag_depends_on_include_and_answers_304(client, job_id):
+    whole = client.get(f"/outputs/{job_id}.zip")
+    sheets = client.get(f"/outputs/{job_id}.zip?include=sheets")
+    assert whole.headers["ETag"] != sheets.headers["ETag"]
+    response = client.get(f"/outputs/{job_id}.zip", headers={"If-None-Match": whole.headers["ETag"]})
+    assert response.status_code == 304
+
+
+def test_unknown_include_type_is_refused(client, job_id):
+    response = client.get(f"/outputs/{job_id}.zip?include=sheets,thumbnails")
+    assert response.status_code == 400
+    assert "thumbnails" in response.json["error"]
+    assert client.get(f"/outputs/{uuid.uuid4()}.zip").status_code == 404
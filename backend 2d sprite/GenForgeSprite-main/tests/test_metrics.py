@@ -0,0 +1,100 @@
+"""Stage spans, histograms, the Prometheus exposition and the sum over worker processes."""
+import json
+import threading
+import time
+
+import pytest
+
+from services import job_store, metrics
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_store, "DB_PATH", str(tmp_path / "jobs.sqlite"))
+    monkeypatch.setattr(job_store, "_local", threading.local())
+    for name in ("_counters", "_gauges", "_histograms"):
+        monkeypatch.setattr(metrics, name, {})
+
+
+def samples(text: str) -> dict:
+    """name{labels} -> value of every sample line."""
+    return {
+        line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+        for line in text.splitlines() if line and not line.startswith("#")
+    }
+
+
+def test_histogram_buckets_are_cumulative():
+    with metrics.track_job("generate") as timings:
+        metrics.set_preset("pixel")
+        metrics.observe("slice", 0.3)
+        metrics.observe("slice", 7.0)
+    assert timings.as_dict()["slice"] == 7.3
+
+    values = samples(metrics.render())
+    series = 'sprite_stage_seconds_bucket{preset="pixel",stage="slice",le="%s"}'
+    assert values[series % "0.25"] == 0
+    assert values[series % "0.5"] == 1
+    assert values[series % "5"] == 1
+    assert values[series % "10"] == 2
+    assert values[series % "+Inf"] == 2
+    assert values['sprite_stage_seconds_sum{preset="pixel",stage="slice"}'] == 7.3
+    assert values['sprite_stage_seconds_count{preset="pixel",stage="slice"}'] == 2
+    assert values['sprite_jobs_total{kind="generate",preset="pixel",status="completed"}'] == 1
+    assert values['sprite_jobs_in_flight{kind="generate"}'] == 0
+
+
+def test_failed_stage_counts_an_error():
+    with pytest.raises(RuntimeError):
+        with metrics.track_job("generate"):
+            with metrics.stage("download"):
+                raise RuntimeError("cdn down")
+    values = samples(metrics.render())
+    assert values['sprite_stage_errors_total{preset="",stage="download"}'] == 1
+    assert values['sprite_stage_in_flight{preset="",stage="download"}'] == 0
+    assert values['sprite_jobs_total{kind="generate",preset="",status="failed"}'] == 1
+
+
+def test_exposition_format():
+    metrics.observe("gif", 0.01)
+    text = metrics.render()
+    assert text.endswith("\n")
+    lines = text.splitlines()
+    for name, (metric_type, help_text) in metrics.METRICS.items():
+        type_line = lines.index(f"# TYPE {name} {metric_type}")
+        assert lines[type_line - 1] == f"# HELP {name} {help_text}"
+    buckets = [line for line in lines if line.startswith("sprite_stage_seconds_bucket")]
+    assert len(buckets) == len(metrics.BUCKETS) + 1
+    assert metrics._labels([["preset", 'say "hi"\\\n']]) == '{preset="say \\"hi\\"\\\\\\n"}'
+
+
+def test_snapshots_of_other_processes_are_added_up():
+    metrics.observe("gif", 0.01)
+    other = {
+        "counters": {metrics._key("sprite_stage_errors_total", {"stage": "gif", "preset": ""}): 2},
+        "gauges": {metrics._key("sprite_jobs_in_flight", {"kind": "generate"}): 3},
+        "histograms": {}
+    }
+    job_store.save_metrics_snapshot("other-worker", json.dumps(other))
+    values = samples(metrics.render())
+    assert values['sprite_stage_errors_total{preset="",stage="gif"}'] == 2
+    assert values['sprite_jobs_in_flight{kind="generate"}'] == 3
+    assert values['sprite_stage_seconds_count{preset="",stage="gif"}'] == 1
+    assert metrics.live_processes() == 2
+
+    # A worker that stopped flushing keeps its counters but not its gauges
+    job_store._connect().execute(
+        "UPDATE metrics_snapshots SET updated_at = ? WHERE process = 'other-worker'",
+        (time.time() - metrics.GAUGE_STALE_AFTER - 1,)
+    )
+    values = samples(metrics.render())
+    assert values['sprite_stage_errors_total{preset="",stage="gif"}'] == 2
+    assert 'sprite_jobs_in_flight{kind="generate"}' not in values
+    assert metrics.live_processes() == 1
+
+
+def test_metrics_route(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+    assert "# TYPE sprite_stage_seconds histogram" in response.get_data(as_text=True)
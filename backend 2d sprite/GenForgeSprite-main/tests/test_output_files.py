@@ -0,0 +1,63 @@
+"""Serving /outputs: ETags and 304s, ranges, and caching before and after a job finishes."""
+import os
+import uuid
+
+import pytest
+
+from services import output_files
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def job_dir():
+    job_id = str(uuid.uuid4())
+    os.makedirs(os.path.join(output_files.OUTPUTS_DIR, job_id, "frames"))
+    with open(os.path.join(output_files.OUTPUTS_DIR, job_id, "idle_sheet.png"), "wb") as f:
+        f.write(CONTENT)
+    return job_id
+
+
+def finish(job_id: str):
+    with open(os.path.join(output_files.OUTPUTS_DIR, job_id, output_files.FINISHED_MARKER), "w") as f:
+        f.write("{}")
+
+
+def test_etag_answers_304(client, job_dir):
+    url = f"/outputs/{job_dir}/idle_sheet.png"
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert response.mimetype == "image/png"
+    etag = response.headers["ETag"]
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+
+
+def test_range_answers_206(client, job_dir):
+    response = client.get(f"/outputs/{job_dir}/idle_sheet.png", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.data == CONTENT[10:20]
+    assert response.headers["Content-Range"] == f"bytes 10-19/{len(CONTENT)}"
+
+
+def test_immutable_once_metadata_exists(client, job_dir):
+    url = f"/outputs/{job_dir}/idle_sheet.png"
+    assert client.get(url).headers["Cache-Control"] == output_files.CACHE_REVALIDATE
+    finish(job_dir)
+    response = client.get(url)
+    assert response.headers["Cache-Control"] == output_files.CACHE_IMMUTABLE
+    assert "immutable" in response.headers["Cache-Control"]
+    # The 304 keeps the caching policy
+    response = client.get(url, headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+    assert response.headers["Cache-Control"] == output_files.CACHE_IMMUTABLE
+
+
+def test_missing_and_outside_files_are_404(client, job_dir):
+    assert client.get(f"/outputs/{job_dir}/nothing.png").status_code == 404
+    assert client.get(f"/outputs/{job_dir}/frames").status_code == 404
+    assert client.get("/outputs/../app.py").status_code == 404
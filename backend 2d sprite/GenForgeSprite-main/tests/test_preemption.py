@@ -0,0 +1,46 @@
+"""A preempting job runs on the bulk job's thread without counting toward it."""
+import threading
+import time
+
+import pytest
+
+from services import job_queue, job_store
+
+URGENT_SECONDS = 0.6
+
+
+@pytest.fixture(autouse=True)
+def fresh_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_store, "DB_PATH", str(tmp_path / "jobs.sqlite"))
+    monkeypatch.setattr(job_store, "_local", threading.local())
+    monkeypatch.setattr(job_queue, "PREEMPTION", True)
+
+
+def urgent_handler(request, job_id, on_event, lane):
+    time.sleep(URGENT_SECONDS)
+    return {}
+
+
+def bulk_handler(request, job_id, on_event, lane):
+    # An urgent job arrives while the bulk job waits for its sheet
+    job_queue.enqueue("test-urgent", {}, lane="refine")
+    on_event("sheet_received", "idle", timings={"bria": 0.01})
+    return {}
+
+
+job_queue.register_handler("test-urgent", urgent_handler)
+job_queue.register_handler("test-bulk", bulk_handler)
+
+
+def test_urgent_job_runs_at_stage_boundary_and_is_left_out_of_the_total():
+    bulk = job_queue.enqueue("test-bulk", {}, lane="bulk")
+    job_queue.run_job(job_store.claim_next("w"))
+
+    bulk = job_store.get_job(bulk["id"])
+    urgent = [job for job in job_store.recent_completed(10) if job["kind"] == "test-urgent"]
+    assert bulk["status"] == job_store.COMPLETED
+    assert len(urgent) == 1 and urgent[0]["worker"] == "w"
+    assert urgent[0]["result"]["timings"]["total"] >= URGENT_SECONDS
+    assert bulk["result"]["timings"]["total"] < URGENT_SECONDS / 2
+    # Wall-clock times still show the wait
+    assert bulk["finished_at"] - bulk["started_at"] >= URGENT_SECONDS
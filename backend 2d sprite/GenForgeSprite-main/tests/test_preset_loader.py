@@ -0,0 +1,100 @@
+"""The preset registry: change detection, validation, and the cached listing."""
+import json
+import os
+
+import pytest
+
+from services import preset_loader
+
+KNIGHT = {"name": "knight", "canvas": [64, 64], "animations": {"idle": 4, "walk": 6}}
+
+
+@pytest.fixture(autouse=True)
+def presets_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(preset_loader, "PRESETS_DIR", str(tmp_path))
+    monkeypatch.setattr(preset_loader, "CHECK_INTERVAL", 0.0)
+    monkeypatch.setattr(preset_loader, "_registry", preset_loader._Registry())
+    return tmp_path
+
+
+def write(presets_dir, name: str, preset):
+    with open(os.path.join(presets_dir, f"{name}.json"), "w") as f:
+        f.write(preset if isinstance(preset, str) else json.dumps(preset))
+
+
+def test_files_are_added_changed_and_removed(presets_dir):
+    assert preset_loader.load_preset("knight")["name"] == "anime_action"
+
+    write(presets_dir, "knight", KNIGHT)
+    assert preset_loader.load_preset("knight")["animations"] == {"idle": 4, "walk": 6}
+
+    write(presets_dir, "knight", {**KNIGHT, "animations": {"idle": 8, "walk": 6, "run": 6}})
+    assert preset_loader.load_preset("knight")["animations"]["idle"] == 8
+
+    os.remove(os.path.join(presets_dir, "knight.json"))
+    assert "knight" not in preset_loader.get_all_presets()
+
+
+def test_files_override_the_defaults(presets_dir):
+    write(presets_dir, "anime_action", {**KNIGHT, "name": "anime_action"})
+    assert preset_loader.load_preset("anime_action")["canvas"] == [64, 64]
+
+
+def test_invalid_file_keeps_the_last_valid_version(presets_dir):
+    write(presets_dir, "knight", KNIGHT)
+    assert preset_loader.load_preset("knight") == KNIGHT
+    write(presets_dir, "knight", "{not json")
+    assert preset_loader.load_preset("knight") == KNIGHT
+    write(presets_dir, "knight", {**KNIGHT, "animations": {"idle": 0}})
+    assert preset_loader.load_preset("knight") == KNIGHT
+
+    # A new file that never validated is not loaded at all
+    write(presets_dir, "broken", {"animations": "idle"})
+    assert "broken" not in preset_loader.get_all_presets()
+
+
+def test_unchanged_files_are_not_parsed_again(presets_dir, monkeypatch):
+    write(presets_dir, "knight", KNIGHT)
+    preset_loader.get_all_presets()
+    parsed = []
+    load = json.load
+    monkeypatch.setattr(preset_loader.json, "load", lambda f: parsed.append(f.name) or load(f))
+    for _ in range(3):
+        preset_loader.get_all_presets()
+    assert parsed == []
+
+
+def test_listing_is_rebuilt_only_on_change(presets_dir):
+    body, etag = preset_loader.get_presets_listing()
+    assert preset_loader.get_presets_listing() == (body, etag)
+    assert preset_loader.get_presets_listing()[0] is body
+
+    write(presets_dir, "knight", KNIGHT)
+    new_body, new_etag = preset_loader.get_presets_listing()
+    assert new_etag != etag
+    assert json.loads(new_body)["knight"] == KNIGHT
+
+
+@pytest.mark.parametrize("preset, problem", [
+    ([], "JSON object"),
+    ({**KNIGHT, "canvas": [64]}, "canvas"),
+    ({**KNIGHT, "canvas": [64, -1]}, "canvas"),
+    ({**KNIGHT, "animations": {}}, "animations"),
+    ({**KNIGHT, "animations": {"idle": preset_loader.MAX_FRAMES + 1}}, "animations.idle"),
+    ({**KNIGHT, "frame_rate": 0}, "frame_rate"),
+    ({**KNIGHT, "style": 3}, "style"),
+    ({**KNIGHT, "prompt_augmentation": {"lighting": 1}}, "prompt_augmentation"),
+])
+def test_validation(preset, problem):
+    with pytest.raises(ValueError, match=problem):
+        preset_loader.validate_preset(preset)
+
+
+def test_save_preset_validates_and_is_visible_at_once(presets_dir, monkeypatch):
+    monkeypatch.setattr(preset_loader, "CHECK_INTERVAL", 3600.0)
+    preset_loader.get_all_presets()
+    with pytest.raises(ValueError):
+        preset_loader.save_preset("bad", {"animations": {}})
+    assert not os.path.exists(os.path.join(presets_dir, "bad.json"))
+    preset_loader.save_preset("knight", KNIGHT)
+    assert preset_loader.load_preset("knight") == KNIGHT
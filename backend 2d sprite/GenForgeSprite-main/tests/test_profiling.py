@@ -0,0 +1,104 @@
+"""Per-job profiles: what profile_job records, pruning, and the admin gate."""
+import os
+import pstats
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from routes import sprite as sprite_routes
+from services import job_queue, job_store, profiling
+
+TOKEN = "test-admin-token"
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path / "profiles"))
+    monkeypatch.setattr(job_store, "DB_PATH", str(tmp_path / "jobs.sqlite"))
+    monkeypatch.setattr(job_store, "_local", threading.local())
+    monkeypatch.setattr(sprite_routes, "ADMIN_TOKEN", TOKEN)
+
+
+def pool_work():
+    return sum(i * i for i in range(20000))
+
+
+def profiled_handler(request, job_id, on_event, lane):
+    profile = profiling.current()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        def run():
+            with profiling.bind_thread(profile):
+                return pool_work()
+        pool.submit(run).result()
+    buffers = [bytearray(1024 * 1024) for _ in range(4)]
+    return {"job_id": job_id, "buffers": len(buffers)}
+
+
+job_queue.register_handler("test-profiled", profiled_handler)
+
+
+def test_profile_covers_the_job_and_its_pool_threads():
+    job = job_queue.enqueue("test-profiled", {"profile": True, "profile_memory": True})
+    job_queue.run_job(job_store.claim_next("w"))
+    result = job_store.get_job(job["id"])["result"]
+
+    assert result["profile"]["url"] == f"/api/sprite/profile/{job['id']}"
+    assert result["profile"]["threads"] == 2
+    assert result["profile"]["peak_memory_bytes"] >= 4 * 1024 * 1024
+    stats = pstats.Stats(profiling.find(job["id"], "pstats"))
+    functions = {name for _, _, name in stats.stats}
+    assert {"pool_work", "profiled_handler"} <= functions
+    with open(profiling.find(job["id"])) as f:
+        summary = f.read()
+    assert summary.startswith(f"job {job['id']} (test-profiled)")
+    assert "peak traced memory" in summary
+
+
+def test_jobs_without_the_flag_are_not_profiled():
+    job = job_queue.enqueue("test-profiled", {})
+    job_queue.run_job(job_store.claim_next("w"))
+    assert "profile" not in job_store.get_job(job["id"])["result"]
+    assert profiling.find(job["id"]) is None
+
+
+def test_only_the_newest_profiles_are_kept(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_KEEP", 2)
+    for i, job_id in enumerate(("first", "second", "third")):
+        with profiling.profile_job(job_id, "generate") as profile:
+            pool_work()
+        profile.save()
+        os.utime(profiling.path(job_id, "pstats"), (i, i))
+    assert profiling.find("first") is None and profiling.find("first", "pstats") is None
+    assert profiling.find("second") and profiling.find("third", "pstats")
+    assert profiling.find("../third") is None
+    assert profiling.find("third", "html") is None
+
+
+def test_admin_gate(client):
+    request = {"prompt": "a knight", "animations": ["idle"], "profile": True}
+    assert client.post("/api/sprite/generate", json=request).status_code == 403
+    assert client.post("/api/sprite/generate", json=request,
+                       headers={"X-Admin-Token": "wrong"}).status_code == 403
+    response = client.post("/api/sprite/generate", json=request, headers={"X-Admin-Token": TOKEN})
+    assert response.status_code == 202
+    assert job_store.get_job(response.json["job_id"])["request"]["profile"] is True
+
+    with profiling.profile_job("profiled-job", "generate") as profile:
+        pool_work()
+    profile.save()
+    url = "/api/sprite/profile/profiled-job"
+    assert client.get(url).status_code == 403
+    response = client.get(url, headers={"X-Admin-Token": TOKEN})
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).startswith("job profiled-job")
+    response = client.get(f"{url}?format=pstats", headers={"X-Admin-Token": TOKEN})
+    assert response.status_code == 200 and response.mimetype == "application/octet-stream"
+    assert client.get("/api/sprite/profile/other", headers={"X-Admin-Token": TOKEN}).status_code == 404
+
+
+def test_no_admin_token_configured_refuses_everyone(client, monkeypatch):
+    monkeypatch.setattr(sprite_routes, "ADMIN_TOKEN", "")
+    response = client.post("/api/sprite/generate", json={"prompt": "a knight", "profile_memory": True},
+                           headers={"X-Admin-Token": ""})
+    assert response.status_code == 403
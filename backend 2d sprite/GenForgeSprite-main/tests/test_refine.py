@@ -0,0 +1,17 @@
+"""Refinements write to a directory of their own."""
+import os
+
+from services import sprite_service
+
+
+def test_concurrent_refinements_do_not_share_a_directory():
+    req = {"job_id": "original", "animation": "idle", "prompt": "a knight", "refinement": "less blur"}
+    first = sprite_service.process_refine_job(dict(req), job_id="refine-1")
+    second = sprite_service.process_refine_job(dict(req), job_id="refine-2")
+
+    assert (first["job_id"], second["job_id"]) == ("refine-1", "refine-2")
+    assert first["original_job_id"] == "original"
+    for result in (first, second):
+        sheet = os.path.join(sprite_service.OUTPUTS_DIR, result["job_id"], "idle_sheet.png")
+        assert os.path.exists(sheet)
+        assert result["download_urls"]["sprite_sheet"] == f"/outputs/{result['job_id']}/idle_sheet.png"
@@ -0,0 +1,121 @@
+"""Coalescing in one process, the cross-process lock file, and join=False."""
+import os
+import threading
+import time
+
+import pytest
+
+from services import single_flight
+
+pytestmark = pytest.mark.skipif(not single_flight.FILE_LOCKS_AVAILABLE, reason="needs fcntl")
+
+
+@pytest.fixture(autouse=True)
+def lock_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(single_flight, "LOCK_DIR", str(tmp_path))
+    return tmp_path
+
+
+def slow(calls, result="sheet", seconds=0.3):
+    def fn():
+        calls.append(threading.current_thread().name)
+        time.sleep(seconds)
+        return result
+    return fn
+
+
+def run_threads(target, count):
+    results = [None] * count
+    threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, target())) for i in range(count)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+def test_concurrent_callers_share_one_call_and_leave_no_lock_file(lock_dir):
+    calls = []
+    fn = slow(calls)
+    assert run_threads(lambda: single_flight.do("key", fn), 4) == ["sheet"] * 4
+    assert len(calls) == 1
+    assert os.listdir(lock_dir) == []
+    assert single_flight.in_flight() == 0
+
+
+def test_callers_that_do_not_join_run_their_own_call():
+    calls = []
+    fn = slow(calls)
+    leader = threading.Thread(target=lambda: single_flight.do("key", fn))
+    leader.start()
+    time.sleep(0.05)
+    assert single_flight.do("key", fn, join=False) == "sheet"
+    leader.join(10)
+    assert len(calls) == 2
+
+
+def hold_lock(path):
+    """Lock path the way another worker process would."""
+    fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+    single_flight.fcntl.flock(fd, single_flight.fcntl.LOCK_EX)
+    return fd
+
+
+def release_like_a_leader(path, fd):
+    os.unlink(path)
+    single_flight.fcntl.flock(fd, single_flight.fcntl.LOCK_UN)
+    os.close(fd)
+
+
+def test_waits_for_another_process_and_rechecks(lock_dir):
+    path = str(lock_dir / "key.lock")
+    fd = hold_lock(path)
+    calls, result = [], []
+    waiter = threading.Thread(target=lambda: result.append(
+        single_flight.do("key", slow(calls), recheck=lambda: "cached")
+    ))
+    waiter.start()
+    time.sleep(0.3)
+    assert result == []
+    release_like_a_leader(path, fd)
+    waiter.join(5)
+    assert (result, calls) == (["cached"], [])
+    assert os.listdir(lock_dir) == []
+
+
+def test_waiter_on_a_removed_lock_file_locks_the_new_one(lock_dir):
+    """A waiter woken on an unlinked file must not run next to the file's new holder."""
+    path = str(lock_dir / "key.lock")
+    first = hold_lock(path)
+    running = []
+
+    def fn():
+        running.append(time.monotonic())
+        return "sheet"
+
+    waiter = threading.Thread(target=lambda: single_flight.do("key", fn))
+    waiter.start()
+    time.sleep(0.2)
+    # The leader removes its file; a newcomer locks a fresh one before the waiter wakes
+    os.unlink(path)
+    second = hold_lock(path)
+    single_flight.fcntl.flock(first, single_flight.fcntl.LOCK_UN)
+    os.close(first)
+    time.sleep(0.3)
+    assert running == []
+    release_like_a_leader(path, second)
+    waiter.join(5)
+    assert len(running) == 1
+
+
+def test_gives_up_waiting_after_the_timeout(lock_dir, monkeypatch):
+    monkeypatch.setattr(single_flight, "LOCK_TIMEOUT", 0.3)
+    path = str(lock_dir / "key.lock")
+    fd = hold_lock(path)
+    calls = []
+    start = time.monotonic()
+    assert single_flight.do("key", slow(calls, seconds=0)) == "sheet"
+    assert 0.3 <= time.monotonic() - start < 2
+    assert len(calls) == 1
+    release_like_a_leader(path, fd)
@@ -0,0 +1,25 @@
+"""Generate requests: unknown animations are refused, and a job with no animations still completes."""
+from services import sprite_service
+
+
+def test_unknown_animations_are_refused(client):
+    for path in ("/api/sprite/generate", "/api/sprite/estimate"):
+        response = client.post(path, json={"prompt": "a knight", "animations": ["bogus"]})
+        assert response.status_code == 400
+        assert "bogus" in response.json["error"]
+    response = client.post("/api/sprite/batch", json={"items": [{"prompt": "a knight", "animations": ["idle", "bogus"]}]})
+    assert response.status_code == 400
+
+
+def test_job_without_animations_has_no_combined_sheet(monkeypatch):
+    preset = {**sprite_service.load_preset("anime_action"), "animations": {}}
+    monkeypatch.setattr(sprite_service, "load_preset", lambda name: preset)
+    events = []
+    result = sprite_service.process_sprite_job(
+        {"prompt": "a knight"}, job_id="no-animations",
+        on_event=lambda event, animation=None, **data: events.append(event)
+    )
+    assert result["status"] == "completed"
+    assert result["combined_sheet"] is None
+    assert result["animations"] == {}
+    assert "combined_sheet" not in events and "metadata" in events
@@ -0,0 +1,40 @@
+"""Job status records let any node answer for a job held by another."""
+import uuid
+
+import pytest
+
+from genforge_common.artifact_store import ArtifactStore, make_backend
+from services import job_queue, job_store, sprite_service  # noqa: F401 (registers the handlers)
+
+
+@pytest.fixture
+def shared(tmp_path, monkeypatch):
+    """This node's store and another node's view of the same directory."""
+    root = str(tmp_path / "artifacts")
+    monkeypatch.setattr(job_queue, "artifact_store", ArtifactStore(make_backend("local", root)))
+    monkeypatch.setattr(job_queue, "_remote_finished", {})
+    return ArtifactStore(make_backend("local", root))
+
+
+def test_status_is_published_when_queued_and_finished(shared):
+    job = job_queue.enqueue("refine", {"job_id": "original", "animation": "idle", "prompt": "a knight"})
+    assert shared.get_record(f"sprite-jobs/{job['id']}")["status"] == job_store.QUEUED
+
+    claimed = job_store.claim_next("test-worker")
+    assert claimed["id"] == job["id"]
+    job_queue.run_job(claimed, "test-worker")
+    record = shared.get_record(f"sprite-jobs/{job['id']}")
+    assert record["status"] == job_store.COMPLETED
+    assert record["result"]["download_urls"]
+
+
+def test_unknown_jobs_are_looked_up_in_the_store(shared):
+    job_id = str(uuid.uuid4())
+    assert job_queue.get_status(job_id) is None
+    shared.put_record(f"sprite-jobs/{job_id}", {"job_id": job_id, "status": job_store.RUNNING})
+    assert job_queue.get_status(job_id)["status"] == job_store.RUNNING
+    # Finished jobs are remembered, unfinished ones read again
+    shared.put_record(f"sprite-jobs/{job_id}", {"job_id": job_id, "status": job_store.COMPLETED})
+    assert job_queue.get_status(job_id)["status"] == job_store.COMPLETED
+    shared.put_record(f"sprite-jobs/{job_id}", {"job_id": job_id, "status": job_store.FAILED})
+    assert job_queue.get_status(job_id)["status"] == job_store.COMPLETED
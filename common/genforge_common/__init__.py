@@ -0,0 +1,13 @@
+"""
+Services shared by the sprite (Flask) and 3D (FastAPI) backends.
+
+    artifact_store  content-addressed job outputs and job records for multi-node setups
+    rate_limiter    host-wide limits on calls to BRIA and Tripo
+    retention       access times, sweep lock and sweeper thread of the disk sweepers
+    webhooks        signed job completion callbacks with retries
+
+Both backends install this package from ../common (see their
+requirements.txt). Modules read their settings from the environment when
+first imported, so the 3D backend imports app.core.config (which loads
+.env) first.
+"""
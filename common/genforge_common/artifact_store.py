@@ -0,0 +1,364 @@
+"""
+Artifact Store - Content-addressed storage of job outputs shared by all nodes.
+
+When a job finishes, every file it produced is uploaded under the SHA-256
+of its contents (blobs/ab/abcd....png), so identical frames, sheets and
+models are stored once, however many jobs, nodes or services produce
+them. A per-job manifest (jobs/<job_dir>.json) maps each relative path to
+its blob. Any node can then serve a job's files by looking up the
+manifest, even if the job ran elsewhere:
+
+    sprite backend   jobs/<job_id>.json          /outputs/<job_id>/<file>
+    3D backend       jobs/models/<job_id>.json   /3d/models/<job_id>.glb
+
+Records (records/<name>.json) are small mutable JSON documents, such as
+the status of a job, that any node can read back.
+
+Backends (ARTIFACT_STORE):
+    ""      disabled - outputs stay on the local disk only (default)
+    local   a directory, e.g. a volume mounted on every node (ARTIFACT_DIR)
+    s3      any S3-compatible bucket (AWS, MinIO, R2, or the stand-in in the
+            sprite backend's mock_upstream.py); requests are signed with SigV4
+
+With ARTIFACT_PUBLIC_URL set (a CDN or public bucket URL), downloads are
+redirected there instead of being proxied through the server.
+"""
+import os
+import hmac
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Dict, Any, BinaryIO, List, Optional, Tuple
+from urllib.parse import quote, urlparse
+
+import requests
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+S3_TIMEOUT = (10, 120)
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+# Blob keys known to exist (skips the existence check when re-publishing)
+KNOWN_KEYS_MAX = 100000
+MANIFEST_CACHE_MAX = 1000
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def blob_key(digest: str, filename: str) -> str:
+    """Content address of a file; the extension keeps content types guessable."""
+    return f"blobs/{digest[:2]}/{digest}{os.path.splitext(filename)[1].lower()}"
+
+
+def manifest_key(job_dir: str) -> str:
+    return f"jobs/{job_dir}.json"
+
+
+def record_key(name: str) -> str:
+    return f"records/{name}.json"
+
+
+class LocalArtifactStore:
+    """Blobs and manifests in a directory (shared between nodes via a mounted volume)."""
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.local_path(key))
+
+    def _write(self, key: str, write):
+        # Write to a temporary file and rename, so readers never see partial blobs
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def put_file(self, key: str, path: str, digest: str):
+        def copy(dst):
+            with open(path, "rb") as src:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+        self._write(key, copy)
+
+    def put_bytes(self, key: str, data: bytes):
+        self._write(key, lambda dst: dst.write(data))
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self.local_path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.local_path(key), "rb")
+
+
+class S3ArtifactStore:
+    """Blobs and manifests in an S3-compatible bucket (path-style URLs, SigV4)."""
+    name = "s3"
+
+    def __init__(self, endpoint: str, bucket: str, region: str,
+                 access_key: str, secret_key: str, prefix: str = ""):
+        self.endpoint = endpoint
+        self.bucket = bucket
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.prefix = f"{prefix}/" if prefix else ""
+        self._session = requests.Session()
+
+    def local_path(self, key: str) -> Optional[str]:
+        return None
+
+    def _url(self, key: str) -> str:
+        return f"{self.endpoint}/{self.bucket}/{quote(self.prefix + key, safe='/-_.~')}"
+
+    def _signed_headers(self, method: str, url: str, payload_hash: str,
+                        headers: Dict[str, str] = None) -> Dict[str, str]:
+        """AWS Signature Version 4 for a request without query parameters."""
+        amz_date = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        scope = f"{amz_date[:8]}/{self.region}/s3/aws4_request"
+        headers = {k.lower(): str(v).strip() for k, v in (headers or {}).items()}
+        headers.update({
+            "host": urlparse(url).netloc,
+            "x-amz-date": amz_date,
+            "x-amz-content-sha256": payload_hash
+        })
+        names = sorted(headers)
+        canonical = "\n".join([
+            method,
+            urlparse(url).path,
+            "",
+            "".join(f"{name}:{headers[name]}\n" for name in names),
+            ";".join(names),
+            payload_hash
+        ])
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+        ])
+        key = ("AWS4" + self.secret_key).encode("utf-8")
+        for part in (amz_date[:8], self.region, "s3", "aws4_request"):
+            key = hmac.new(key, part.encode("utf-8"), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+        headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={';'.join(names)}, Signature={signature}"
+        )
+        del headers["host"]
+        return headers
+
+    def _request(self, method: str, key: str, payload_hash: str = EMPTY_SHA256,
+                 headers: Dict[str, str] = None, **kwargs) -> requests.Response:
+        url = self._url(key)
+        return self._session.request(
+            method, url, headers=self._signed_headers(method, url, payload_hash, headers),
+            timeout=S3_TIMEOUT, **kwargs
+        )
+
+    def exists(self, key: str) -> bool:
+        resp = self._request("HEAD", key)
+        if resp.status_code == 404:
+            return False
+        resp.raise_for_status()
+        return True
+
+    def put_file(self, key: str, path: str, digest: str):
+        with open(path, "rb") as f:
+            resp = self._request(
+                "PUT", key, digest, {"Content-Length": str(os.path.getsize(path))}, data=f
+            )
+        resp.raise_for_status()
+
+    def put_bytes(self, key: str, data: bytes):
+        resp = self._request(
+            "PUT", key, hashlib.sha256(data).hexdigest(), {"Content-Length": str(len(data))}, data=data
+        )
+        resp.raise_for_status()
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        resp = self._request("GET", key)
+        if resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+        return resp.content
+
+    def open(self, key: str) -> BinaryIO:
+        """Streaming body of an object (read() it in chunks, then close())."""
+        resp = self._request("GET", key, stream=True)
+        if resp.status_code == 404:
+            resp.close()
+            raise FileNotFoundError(key)
+        resp.raise_for_status()
+        resp.raw.decode_content = True
+        return resp.raw
+
+
+class ArtifactStore:
+    """Publishes job files with per-job manifests and resolves them on any node."""
+
+    def __init__(self, backend, public_url: str = ""):
+        self.backend = backend
+        self.public_url_base = public_url.rstrip("/")
+        self._known_keys = set()
+        self._manifests: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"published_files": 0, "stored": 0, "deduplicated": 0, "bytes_stored": 0,
+                       "bytes_deduplicated": 0, "remote_reads": 0, "records_written": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, n in deltas.items():
+                self._stats[name] += n
+
+    def publish(self, job_dir: str, files: List[Tuple[str, str, os.stat_result]]) -> Optional[Dict[str, Any]]:
+        """
+        Upload files (relative path, absolute path, stat) and the job's
+        manifest. Files already in the store are not uploaded again.
+        """
+        if self.backend is None:
+            return None
+        start = time.monotonic()
+        manifest = {"job_dir": job_dir, "published_at": time.time(), "files": {}}
+        for relpath, path, st in files:
+            digest = file_digest(path)
+            key = blob_key(digest, relpath)
+            if key in self._known_keys or self.backend.exists(key):
+                self._count(deduplicated=1, bytes_deduplicated=st.st_size)
+            else:
+                self.backend.put_file(key, path, digest)
+                self._count(stored=1, bytes_stored=st.st_size)
+            with self._lock:
+                if len(self._known_keys) >= KNOWN_KEYS_MAX:
+                    self._known_keys.clear()
+                self._known_keys.add(key)
+            manifest["files"][relpath] = {"key": key, "sha256": digest, "size": st.st_size, "mtime": st.st_mtime}
+        self.backend.put_bytes(manifest_key(job_dir), json.dumps(manifest).encode("utf-8"))
+        self._count(published_files=len(files))
+        self._cache_manifest(job_dir, manifest)
+        log.info("Published %d files of %s to %s store in %.2fs",
+                 len(files), job_dir, self.backend.name, time.monotonic() - start)
+        return manifest
+
+    def _cache_manifest(self, job_dir: str, manifest: Dict[str, Any]):
+        # Each job directory is published once, when its job has finished
+        with self._lock:
+            if len(self._manifests) >= MANIFEST_CACHE_MAX:
+                self._manifests.clear()
+            self._manifests[job_dir] = manifest
+
+    def get_manifest(self, job_dir: str) -> Optional[Dict[str, Any]]:
+        """The published manifest of a job (None if it was never published)."""
+        if self.backend is None:
+            return None
+        manifest = self._manifests.get(job_dir)
+        if manifest is None:
+            data = self.backend.get_bytes(manifest_key(job_dir))
+            if data is None:
+                return None
+            manifest = json.loads(data)
+            self._cache_manifest(job_dir, manifest)
+        return manifest
+
+    def resolve(self, job_dir: str, relpath: str) -> Optional[Dict[str, Any]]:
+        """Manifest entry (key, sha256, size, mtime) of one published file."""
+        manifest = self.get_manifest(job_dir)
+        if manifest is None:
+            return None
+        return manifest["files"].get(relpath)
+
+    def put_record(self, name: str, data: Dict[str, Any]):
+        """Write (or replace) a small JSON record, e.g. a job's status."""
+        if self.backend is None:
+            return
+        self.backend.put_bytes(record_key(name), json.dumps(data).encode("utf-8"))
+        self._count(records_written=1)
+
+    def get_record(self, name: str) -> Optional[Dict[str, Any]]:
+        """A record written by any node (None if there is none)."""
+        if self.backend is None:
+            return None
+        data = self.backend.get_bytes(record_key(name))
+        self._count(remote_reads=1)
+        return json.loads(data) if data is not None else None
+
+    def public_url(self, key: str) -> Optional[str]:
+        return f"{self.public_url_base}/{key}" if self.public_url_base else None
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self.backend.local_path(key)
+
+    def open_blob(self, key: str) -> BinaryIO:
+        """Readable file object for a blob (raises FileNotFoundError)."""
+        self._count(remote_reads=1)
+        return self.backend.open(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.backend.name if self.backend else None,
+                "public_url": self.public_url_base or None,
+                **self._stats
+            }
+
+
+def make_backend(kind: str, local_dir: str, s3_endpoint: str = "https://s3.amazonaws.com",
+                 s3_bucket: str = "", s3_region: str = "us-east-1", s3_access_key: str = "",
+                 s3_secret_key: str = "", s3_prefix: str = ""):
+    """Backend for ARTIFACT_STORE=kind ("", "local" or "s3"); None when disabled."""
+    kind = (kind or "").lower()
+    if kind == "local":
+        return LocalArtifactStore(local_dir)
+    if kind == "s3":
+        if not s3_bucket:
+            raise ValueError("ARTIFACT_STORE=s3 needs ARTIFACT_S3_BUCKET")
+        return S3ArtifactStore(s3_endpoint.rstrip("/"), s3_bucket, s3_region,
+                               s3_access_key, s3_secret_key, s3_prefix.strip("/"))
+    if kind:
+        raise ValueError(f"Unknown ARTIFACT_STORE '{kind}' (use local or s3)")
+    return None
+
+
+def from_env(default_dir: str) -> ArtifactStore:
+    """The store configured by ARTIFACT_* environment variables (ARTIFACT_DIR defaults to default_dir)."""
+    backend = make_backend(
+        os.getenv("ARTIFACT_STORE", ""),
+        os.getenv("ARTIFACT_DIR", default_dir),
+        os.getenv("ARTIFACT_S3_ENDPOINT", "https://s3.amazonaws.com"),
+        os.getenv("ARTIFACT_S3_BUCKET", ""),
+        os.getenv("ARTIFACT_S3_REGION", "us-east-1"),
+        os.getenv("ARTIFACT_S3_ACCESS_KEY", ""),
+        os.getenv("ARTIFACT_S3_SECRET_KEY", ""),
+        os.getenv("ARTIFACT_S3_PREFIX", "")
+    )
+    return ArtifactStore(backend, os.getenv("ARTIFACT_PUBLIC_URL", ""))
@@ -0,0 +1,531 @@
+"""
+Upstream Rate Limiter - Host-wide limits on calls to BRIA and Tripo.
+
+Every Gunicorn worker of both backends shares one SQLite database. Each
+upstream has a token bucket (requests per minute) and a concurrency
+semaphore made of expiring leases, so a crashed worker cannot hold a slot
+forever. Limits shrink multiplicatively on 429/5xx responses and on calls
+that got no response at all (status NO_RESPONSE: connection errors and
+timeouts), and recover additively on success (AIMD).
+
+Callers acquire slots in a priority lane (refine, generate, bulk). A lane
+may hold at most its share of the concurrency limit, and waiters of a
+higher-priority lane are served before any lower lane, host-wide.
+
+Every released slot is logged (queue wait, time held, status code) for
+UPSTREAM_HISTORY_SECONDS. latency() summarizes the recent calls of all
+processes; the sprite backend's job estimator uses it for upstream time.
+
+The first process to use an upstream stores its caps (max RPM and
+concurrency); later processes keep the stored caps even if their own
+environment differs, so one misconfigured worker cannot raise or lower
+the limits of the whole host. Change stored caps explicitly:
+
+    python -m genforge_common.rate_limiter set bria --rpm 60 --concurrency 6
+    python -m genforge_common.rate_limiter show
+
+Leases expire after UPSTREAM_LEASE_TTL seconds. Callers that hold a slot
+longer (polling a long upstream task) renew it with slot.renew().
+"""
+import os
+import sys
+import time
+import uuid
+import sqlite3
+import argparse
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+DB_PATH = os.getenv(
+    "UPSTREAM_LIMITER_DB",
+    os.path.join(tempfile.gettempdir(), "genforge_upstream.sqlite")
+)
+LEASE_TTL = float(os.getenv("UPSTREAM_LEASE_TTL", "600"))
+ACQUIRE_TIMEOUT = float(os.getenv("UPSTREAM_ACQUIRE_TIMEOUT", "300"))
+# How long released slots stay in the call log, and how many calls latency() reads
+HISTORY_SECONDS = float(os.getenv("UPSTREAM_HISTORY_SECONDS", "86400"))
+HISTORY_LIMIT = 1000
+
+# Token bucket holds this many seconds of requests for bursts
+BURST_SECONDS = 10
+MIN_RPM = 1.0
+MIN_CONCURRENCY = 1.0
+DECREASE_FACTOR = 0.5
+RPM_INCREASE = 1.0
+# Only back off once per congestion event
+DECREASE_COOLDOWN = 5.0
+MAX_POLL_INTERVAL = 1.0
+
+# Status code of calls that got no response (connection error or timeout);
+# like 5xx it counts as congestion
+NO_RESPONSE = 599
+
+# Priority lanes, highest first
+LANES = ("refine", "generate", "bulk")
+DEFAULT_LANE = "generate"
+# Waiting callers refresh their queue entry on every poll
+WAITER_TTL = 5.0
+
+
+def parse_lane_shares(spec: str) -> Dict[str, float]:
+    """Parse "refine=1.0,generate=0.75,bulk=0.5" into {lane: share}."""
+    shares = {lane: 1.0 for lane in LANES}
+    for part in spec.split(","):
+        if "=" in part:
+            lane, share = part.split("=", 1)
+            if lane.strip() in shares:
+                shares[lane.strip()] = min(1.0, max(0.0, float(share)))
+    return shares
+
+
+# Fraction of the concurrency limit each lane may hold at once
+LANE_SHARES = parse_lane_shares(os.getenv("UPSTREAM_LANE_SHARES", "refine=1.0,generate=0.75,bulk=0.5"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS upstream_limits (
+    name TEXT PRIMARY KEY,
+    max_rpm REAL NOT NULL,
+    max_concurrency REAL NOT NULL,
+    rpm REAL NOT NULL,
+    concurrency REAL NOT NULL,
+    tokens REAL NOT NULL,
+    refilled_at REAL NOT NULL,
+    decreased_at REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS upstream_leases (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    lane TEXT NOT NULL DEFAULT 'generate'
+);
+CREATE TABLE IF NOT EXISTS upstream_waiters (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    lane TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    since REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS upstream_calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    lane TEXT NOT NULL,
+    finished_at REAL NOT NULL,
+    wait_seconds REAL NOT NULL,
+    seconds REAL NOT NULL,
+    status_code INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_upstream_calls ON upstream_calls (name, finished_at);
+"""
+
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    """Per-thread connection to the shared limiter database."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(DB_PATH)), exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(upstream_leases)")]
+        if "lane" not in columns:
+            # Databases created before lanes existed
+            conn.execute("ALTER TABLE upstream_leases ADD COLUMN lane TEXT NOT NULL DEFAULT 'generate'")
+        _local.conn = conn
+    return conn
+
+
+@contextmanager
+def _transaction():
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _percentile(values, pct: float) -> Optional[float]:
+    """Nearest-rank percentile, rounded to milliseconds (None for no values)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[max(1, int(-(-len(ordered) * pct // 100))) - 1], 3)
+
+
+class RateLimitTimeout(Exception):
+    """Raised when no upstream slot frees up within the acquire timeout."""
+
+
+class UpstreamSlot:
+    """A held slot; set status_code so release() can adapt the limits."""
+
+    def __init__(self, name: str, wait_seconds: float, lane: str = DEFAULT_LANE,
+                 limiter: "UpstreamLimiter" = None, lease_id: str = None):
+        self.name = name
+        self.lane = lane
+        self.wait_seconds = wait_seconds
+        self.status_code: Optional[int] = None
+        # Seconds the slot was held, set when it is released
+        self.seconds: Optional[float] = None
+        self._limiter = limiter
+        self._lease_id = lease_id
+
+    def renew(self) -> bool:
+        """Push the lease's expiry LEASE_TTL seconds out; False if it had already expired."""
+        if self._limiter is None:
+            return False
+        return self._limiter.renew(self._lease_id)
+
+
+class UpstreamLimiter:
+    def __init__(self, name: str, max_rpm: float, max_concurrency: int,
+                 lane_shares: Dict[str, float] = None):
+        self.name = name
+        self.max_rpm = float(max_rpm)
+        self.max_concurrency = float(max_concurrency)
+        self.lane_shares = lane_shares or LANE_SHARES
+        self._configured = False
+        self._stats = {"requests": 0, "throttled": 0, "wait_total": 0.0, "wait_max": 0.0}
+        self._lane_stats = {
+            lane: {"requests": 0, "wait_total": 0.0, "wait_max": 0.0} for lane in LANES
+        }
+        self._stats_lock = threading.Lock()
+
+    def _configure(self, conn: sqlite3.Connection):
+        """Register this upstream unless it is already stored; stored caps win."""
+        conn.execute(
+            """
+            INSERT INTO upstream_limits
+                (name, max_rpm, max_concurrency, rpm, concurrency, tokens, refilled_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(name) DO NOTHING
+            """,
+            (self.name, self.max_rpm, self.max_concurrency, self.max_rpm,
+             self.max_concurrency, max(1.0, self.max_rpm * BURST_SECONDS / 60.0), time.time())
+        )
+        max_rpm, max_concurrency = conn.execute(
+            "SELECT max_rpm, max_concurrency FROM upstream_limits WHERE name = ?", (self.name,)
+        ).fetchone()
+        if (max_rpm, max_concurrency) != (self.max_rpm, self.max_concurrency):
+            log.warning(
+                "%s: keeping the stored caps (%g rpm, %g in flight) over this process's "
+                "(%g rpm, %g in flight); change them with "
+                "'python -m genforge_common.rate_limiter set %s'",
+                self.name, max_rpm, max_concurrency, self.max_rpm, self.max_concurrency, self.name
+            )
+        self._configured = True
+
+    def set_limits(self, max_rpm: float = None, max_concurrency: float = None):
+        """Change the stored caps for every process on the host, keeping adaptive state within them."""
+        with _transaction() as conn:
+            if not self._configured:
+                self._configure(conn)
+            conn.execute(
+                """
+                UPDATE upstream_limits SET
+                    max_rpm = COALESCE(?, max_rpm),
+                    max_concurrency = COALESCE(?, max_concurrency)
+                WHERE name = ?
+                """,
+                (max_rpm, max_concurrency, self.name)
+            )
+            conn.execute(
+                """
+                UPDATE upstream_limits SET
+                    rpm = MIN(rpm, max_rpm),
+                    concurrency = MIN(concurrency, max_concurrency)
+                WHERE name = ?
+                """,
+                (self.name,)
+            )
+
+    def _lane_limit(self, lane: str, concurrency: float) -> int:
+        return max(1, int(concurrency * self.lane_shares[lane]))
+
+    def _try_acquire(self, waiter_id: str, lane: str, since: float) -> Tuple[Optional[str], float]:
+        """One attempt; returns (lease_id, 0) or (None, seconds to wait)."""
+        priority = LANES.index(lane)
+        with _transaction() as conn:
+            if not self._configured:
+                self._configure(conn)
+            now = time.time()
+            conn.execute("DELETE FROM upstream_leases WHERE expires_at < ?", (now,))
+            conn.execute("DELETE FROM upstream_waiters WHERE expires_at < ?", (now,))
+            rpm, concurrency, tokens, refilled_at = conn.execute(
+                "SELECT rpm, concurrency, tokens, refilled_at FROM upstream_limits WHERE name = ?",
+                (self.name,)
+            ).fetchone()
+            lane_active = dict(conn.execute(
+                "SELECT lane, COUNT(*) FROM upstream_leases WHERE name = ? GROUP BY lane", (self.name,)
+            ).fetchall())
+            active = sum(lane_active.values())
+            # Higher lanes first; within a lane, first come first served
+            ahead_by_lane = conn.execute(
+                """
+                SELECT lane, COUNT(*) FROM upstream_waiters WHERE name = ? AND id != ?
+                    AND (priority < ? OR (priority = ? AND since < ?))
+                GROUP BY lane
+                """,
+                (self.name, waiter_id, priority, priority, since)
+            ).fetchall()
+            # Waiters held back by their own lane's share do not block others
+            ahead = sum(
+                n for waiting_lane, n in ahead_by_lane
+                if lane_active.get(waiting_lane, 0) < self._lane_limit(waiting_lane, concurrency)
+            )
+
+            capacity = max(1.0, rpm * BURST_SECONDS / 60.0)
+            tokens = min(capacity, tokens + max(0.0, now - refilled_at) * rpm / 60.0)
+
+            lease_id = None
+            if (tokens >= 1.0 and ahead == 0 and active < max(1, int(concurrency))
+                    and lane_active.get(lane, 0) < self._lane_limit(lane, concurrency)):
+                tokens -= 1.0
+                lease_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO upstream_leases (id, name, expires_at, lane) VALUES (?, ?, ?, ?)",
+                    (lease_id, self.name, now + LEASE_TTL, lane)
+                )
+                conn.execute("DELETE FROM upstream_waiters WHERE id = ?", (waiter_id,))
+            else:
+                conn.execute(
+                    """
+                    INSERT INTO upstream_waiters (id, name, lane, priority, since, expires_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET expires_at = excluded.expires_at
+                    """,
+                    (waiter_id, self.name, lane, priority, since, now + WAITER_TTL)
+                )
+            conn.execute(
+                "UPDATE upstream_limits SET tokens = ?, refilled_at = ? WHERE name = ?",
+                (tokens, now, self.name)
+            )
+
+        if lease_id:
+            return lease_id, 0.0
+        if tokens < 1.0 and ahead == 0:
+            return None, (1.0 - tokens) * 60.0 / rpm
+        return None, 0.1
+
+    def acquire(self, timeout: float = None, lane: str = DEFAULT_LANE) -> Tuple[str, float]:
+        """Block until a slot is free in the lane; returns (lease_id, seconds waited)."""
+        if lane not in LANES:
+            raise ValueError(f"Unknown upstream lane '{lane}'")
+        start = time.monotonic()
+        deadline = start + (timeout or ACQUIRE_TIMEOUT)
+        waiter_id = uuid.uuid4().hex
+        since = time.time()
+        try:
+            while True:
+                lease_id, delay = self._try_acquire(waiter_id, lane, since)
+                if lease_id:
+                    return lease_id, time.monotonic() - start
+                if time.monotonic() + delay > deadline:
+                    raise RateLimitTimeout(
+                        f"No {self.name} slot available within {timeout or ACQUIRE_TIMEOUT:.0f}s"
+                    )
+                time.sleep(min(max(delay, 0.01), MAX_POLL_INTERVAL))
+        except BaseException:
+            with _transaction() as conn:
+                conn.execute("DELETE FROM upstream_waiters WHERE id = ?", (waiter_id,))
+            raise
+
+    def renew(self, lease_id: str) -> bool:
+        """Extend a held lease by LEASE_TTL; False if it expired (and was reclaimed) meanwhile."""
+        with _transaction() as conn:
+            renewed = conn.execute(
+                "UPDATE upstream_leases SET expires_at = ? WHERE id = ?",
+                (time.time() + LEASE_TTL, lease_id)
+            ).rowcount
+        if not renewed:
+            log.warning("%s: lease %s expired before it was renewed", self.name, lease_id[:8])
+        return bool(renewed)
+
+    def release(self, lease_id: str, status_code: int = None, slot: UpstreamSlot = None):
+        """Free the slot and adapt limits to the upstream's response; log the call if slot is given."""
+        throttled = status_code is not None and (status_code == 429 or status_code >= 500)
+        with _transaction() as conn:
+            conn.execute("DELETE FROM upstream_leases WHERE id = ?", (lease_id,))
+            now = time.time()
+            if slot is not None and slot.seconds is not None:
+                conn.execute(
+                    """
+                    INSERT INTO upstream_calls (name, lane, finished_at, wait_seconds, seconds, status_code)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (self.name, slot.lane, now, slot.wait_seconds, slot.seconds, status_code)
+                )
+                conn.execute(
+                    "DELETE FROM upstream_calls WHERE name = ? AND finished_at < ?",
+                    (self.name, now - HISTORY_SECONDS)
+                )
+            if throttled:
+                # Multiplicative decrease, at most once per cooldown window
+                conn.execute(
+                    """
+                    UPDATE upstream_limits SET
+                        rpm = MAX(?, rpm * ?),
+                        concurrency = MAX(?, concurrency * ?),
+                        decreased_at = ?
+                    WHERE name = ? AND decreased_at < ?
+                    """,
+                    (MIN_RPM, DECREASE_FACTOR, MIN_CONCURRENCY, DECREASE_FACTOR,
+                     now, self.name, now - DECREASE_COOLDOWN)
+                )
+            elif status_code is not None and status_code < 400:
+                # Additive increase back towards the configured caps
+                conn.execute(
+                    """
+                    UPDATE upstream_limits SET
+                        rpm = MIN(max_rpm, rpm + ?),
+                        concurrency = MIN(max_concurrency, concurrency + 1.0 / concurrency)
+                    WHERE name = ?
+                    """,
+                    (RPM_INCREASE, self.name)
+                )
+        if throttled:
+            with self._stats_lock:
+                self._stats["throttled"] += 1
+
+    @contextmanager
+    def slot(self, timeout: float = None, lane: str = DEFAULT_LANE):
+        """
+        Hold an upstream slot in a priority lane for the duration of the block.
+
+        Set slot.status_code to the upstream response code (NO_RESPONSE if
+        there was none) before leaving, and call slot.renew() at least every LEASE_TTL seconds while held.
+        """
+        lease_id, waited = self.acquire(timeout, lane)
+        with self._stats_lock:
+            for stats in (self._stats, self._lane_stats[lane]):
+                stats["requests"] += 1
+                stats["wait_total"] += waited
+                stats["wait_max"] = max(stats["wait_max"], waited)
+        if waited >= 0.01:
+            log.debug("[%s/%s] queued %.2fs for upstream slot", self.name, lane, waited)
+        slot = UpstreamSlot(self.name, waited, lane, limiter=self, lease_id=lease_id)
+        start = time.monotonic()
+        try:
+            yield slot
+        finally:
+            slot.seconds = time.monotonic() - start
+            self.release(lease_id, slot.status_code, slot)
+
+    def latency(self, window: float = None) -> Dict[str, Any]:
+        """
+        Recent calls of this upstream from all processes (at most
+        HISTORY_LIMIT within the window): latency of successful calls,
+        queue wait and the share that failed or was throttled.
+        """
+        rows = _connect().execute(
+            """
+            SELECT wait_seconds, seconds, status_code FROM upstream_calls
+            WHERE name = ? AND finished_at >= ? ORDER BY finished_at DESC LIMIT ?
+            """,
+            (self.name, time.time() - (window or HISTORY_SECONDS), HISTORY_LIMIT)
+        ).fetchall()
+        seconds = [row[1] for row in rows if row[2] is not None and row[2] < 400]
+        waits = [row[0] for row in rows]
+        return {
+            "calls": len(rows),
+            "p50_seconds": _percentile(seconds, 50),
+            "p90_seconds": _percentile(seconds, 90),
+            "wait_p50_seconds": _percentile(waits, 50),
+            "wait_p90_seconds": _percentile(waits, 90),
+            "error_rate": round(1 - len(seconds) / len(rows), 4) if rows else 0.0
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Shared limiter state plus queue wait times seen by this process."""
+        conn = _connect()
+        row = conn.execute(
+            "SELECT rpm, concurrency, tokens, max_rpm, max_concurrency FROM upstream_limits WHERE name = ?",
+            (self.name,)
+        ).fetchone()
+        now = time.time()
+        in_flight = dict(conn.execute(
+            "SELECT lane, COUNT(*) FROM upstream_leases WHERE name = ? AND expires_at >= ? GROUP BY lane",
+            (self.name, now)
+        ).fetchall())
+        waiting = dict(conn.execute(
+            "SELECT lane, COUNT(*) FROM upstream_waiters WHERE name = ? AND expires_at >= ? GROUP BY lane",
+            (self.name, now)
+        ).fetchall())
+        with self._stats_lock:
+            stats = dict(self._stats)
+            lane_stats = {lane: dict(s) for lane, s in self._lane_stats.items()}
+        requests = stats["requests"]
+        concurrency = row[1] if row else self.max_concurrency
+        lanes = {}
+        for lane in LANES:
+            s = lane_stats[lane]
+            lanes[lane] = {
+                "share": self.lane_shares[lane],
+                "limit": self._lane_limit(lane, concurrency),
+                "in_flight": in_flight.get(lane, 0),
+                "waiting": waiting.get(lane, 0),
+                "requests": s["requests"],
+                "wait_avg_seconds": round(s["wait_total"] / s["requests"], 4) if s["requests"] else 0.0,
+                "wait_max_seconds": round(s["wait_max"], 4)
+            }
+        return {
+            "name": self.name,
+            "max_rpm": row[3] if row else self.max_rpm,
+            "max_concurrency": row[4] if row else self.max_concurrency,
+            "rpm": row[0] if row else self.max_rpm,
+            "concurrency": concurrency,
+            "tokens": round(row[2], 2) if row else None,
+            "in_flight": sum(in_flight.values()),
+            "waiting": sum(waiting.values()),
+            "requests": requests,
+            "throttled": stats["throttled"],
+            "wait_avg_seconds": round(stats["wait_total"] / requests, 4) if requests else 0.0,
+            "wait_max_seconds": round(stats["wait_max"], 4),
+            "lanes": lanes,
+            "latency": self.latency()
+        }
+
+
+def _stored_names() -> List[str]:
+    return [row[0] for row in _connect().execute("SELECT name FROM upstream_limits ORDER BY name")]
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m genforge_common.rate_limiter",
+        description=f"Show or change the stored upstream caps in {DB_PATH}"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("show", help="print the stored state of every upstream")
+    set_parser = commands.add_parser("set", help="change an upstream's caps")
+    set_parser.add_argument("name", help="upstream name, e.g. bria or tripo")
+    set_parser.add_argument("--rpm", type=float, help="max requests per minute")
+    set_parser.add_argument("--concurrency", type=float, help="max calls in flight")
+    args = parser.parse_args(argv)
+
+    if args.command == "set":
+        if args.rpm is None and args.concurrency is None:
+            parser.error("set needs --rpm and/or --concurrency")
+        UpstreamLimiter(args.name, args.rpm or MIN_RPM, args.concurrency or MIN_CONCURRENCY).set_limits(
+            args.rpm, args.concurrency
+        )
+    for name in _stored_names():
+        stats = UpstreamLimiter(name, 0, 0).get_stats()
+        print(f"{name}: max {stats['max_rpm']:g} rpm / {stats['max_concurrency']:g} in flight, "
+              f"now {stats['rpm']:g} rpm / {stats['concurrency']:g}, "
+              f"{stats['in_flight']} in flight, {stats['waiting']} waiting")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
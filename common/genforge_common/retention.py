@@ -0,0 +1,130 @@
+"""
+Retention - The parts of the disk sweepers that both backends share.
+
+Each backend decides what its files are and which may go (services/
+retention.py in the sprite backend, app/services/retention.py in the 3D
+backend); this module provides the rest:
+
+    parse_ttls      "frames=72,gifs=168" (hours) -> seconds per class
+    AccessLog       last-download times collected in memory by the serving
+                    routes, merged into a store shared by all workers
+    run_exclusive   sweep unless another worker on this host already is
+    Sweeper         the background thread that flushes access times and
+                    sweeps every interval (started once per process)
+"""
+import os
+import time
+import threading
+import logging
+from typing import Any, Callable, Dict, Iterable, Optional
+
+try:
+    import fcntl
+    FILE_LOCKS_AVAILABLE = True
+except ImportError:
+    FILE_LOCKS_AVAILABLE = False
+
+log = logging.getLogger(__name__)
+
+# How often each worker merges its recorded downloads into the shared store
+ACCESS_FLUSH_INTERVAL = 30.0
+
+
+def parse_ttls(spec: str, classes: Iterable[str]) -> Dict[str, float]:
+    """Parse "frames=72,gifs=168" (hours) into seconds per class (0 = keep forever)."""
+    ttls = {cls: 0.0 for cls in classes}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        cls, hours = item.split("=", 1)
+        cls = cls.strip()
+        if cls in ttls:
+            ttls[cls] = max(0.0, float(hours)) * 3600
+    return ttls
+
+
+class AccessLog:
+    """Last-use times recorded in memory and merged in batches by flush()."""
+
+    def __init__(self, save: Callable[[Dict[str, float]], None]):
+        self.save = save
+        self._access: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def touch(self, key: str):
+        with self._lock:
+            self._access[key] = time.time()
+
+    def flush(self):
+        """Save the recorded times; on failure they are kept for the next flush."""
+        with self._lock:
+            access = dict(self._access)
+            self._access.clear()
+        if not access:
+            return
+        try:
+            self.save(access)
+        except Exception as e:
+            log.warning("Could not record access times: %s", e)
+            with self._lock:
+                for key, accessed_at in access.items():
+                    self._access[key] = max(accessed_at, self._access.get(key, 0))
+
+
+def run_exclusive(lock_path: str, fn: Callable[[], Any]) -> Optional[Any]:
+    """fn() unless another process holds lock_path (then None)."""
+    if not FILE_LOCKS_AVAILABLE:
+        return fn()
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        try:
+            return fn()
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+class Sweeper:
+    """
+    Calls flush() every flush_interval seconds and sweep() every interval
+    (the first sweep after at most a minute), in one thread per process.
+    """
+
+    def __init__(self, name: str, flush: Callable[[], None], sweep: Callable[[], Any],
+                 interval: float, flush_interval: float = ACCESS_FLUSH_INTERVAL):
+        self.name = name
+        self.flush = flush
+        self.sweep = sweep
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self._started_pid = None
+        self._lock = threading.Lock()
+
+    def _loop(self):
+        next_sweep = time.monotonic() + min(self.interval, 60)
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+            if time.monotonic() < next_sweep:
+                continue
+            next_sweep = time.monotonic() + self.interval
+            try:
+                self.sweep()
+            except Exception as e:
+                log.exception("%s sweep failed: %s", self.name, e)
+
+    def start(self):
+        """Start the thread (once per process, also after a fork)."""
+        if self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            threading.Thread(target=self._loop, name=self.name, daemon=True).start()
+            self._started_pid = os.getpid()
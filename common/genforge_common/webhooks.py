@@ -0,0 +1,303 @@
+"""
+Webhooks - Signed completion callbacks for jobs.
+
+Deliveries wait in a bounded in-memory queue and are POSTed by a few
+background threads. Network errors, timeouts, 408/429 and 5xx responses
+are retried with exponential backoff; when the queue is full, new
+deliveries are dropped (and counted) rather than piling up.
+
+Each request carries headers that let the receiver verify it:
+
+    X-GenForge-Event: job.completed | job.failed
+    X-GenForge-Delivery: <unique delivery id, stable across retries>
+    X-GenForge-Signature: t=<unix time>,v1=<hex HMAC-SHA256>
+
+where the HMAC is computed with WEBHOOK_SECRET over "<t>.<raw body>".
+
+Callback hosts are resolved when a URL is accepted and again before each
+attempt. Loopback, private, link-local, reserved and multicast addresses
+are refused unless the host is listed in WEBHOOK_ALLOWED_HOSTS or the
+address falls in WEBHOOK_ALLOWED_NETWORKS (e.g. "10.0.0.0/8"). Each
+attempt connects to the address it just checked (TLS is still verified
+against the host name), so a DNS answer that changes after the check
+(rebinding) cannot redirect a delivery. Refused deliveries are not
+retried. Environment proxies are not used.
+
+Both backends create their dispatcher from the WEBHOOK_* settings
+(services/webhooks.py in the sprite backend, app/services/webhooks.py in
+the 3D backend).
+"""
+import os
+import json
+import hmac
+import time
+import uuid
+import heapq
+import socket
+import hashlib
+import ipaddress
+import threading
+import logging
+from typing import Dict, Any, List, Sequence, Union
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger(__name__)
+
+SECRET = os.getenv("WEBHOOK_SECRET", "")
+RETRY_MAX = 300.0
+
+RETRYABLE_STATUS = {408, 429}
+# A proxy would resolve the host again, after the address check
+NO_PROXIES = {"http": None, "https": None, "all": None}
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_hosts(value: str) -> List[str]:
+    """Comma-separated host names (WEBHOOK_ALLOWED_HOSTS) as a lowercase list."""
+    return [h.strip().lower() for h in (value or "").split(",") if h.strip()]
+
+
+def parse_networks(value: str) -> List[Network]:
+    """Comma-separated CIDRs (WEBHOOK_ALLOWED_NETWORKS) as networks."""
+    return [ipaddress.ip_network(n.strip(), strict=False) for n in (value or "").split(",") if n.strip()]
+
+
+class UnsafeTarget(ValueError):
+    """A callback host that resolves to an address callbacks may not reach."""
+
+
+class _PinnedAdapter(HTTPAdapter):
+    """HTTPS to an IP address, with SNI and certificate checks for the original host name."""
+
+    def __init__(self, hostname: str):
+        self.hostname = hostname
+        super().__init__()
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["server_hostname"] = self.hostname
+        kwargs["assert_hostname"] = self.hostname
+        super().init_poolmanager(*args, **kwargs)
+
+
+def sign(body: bytes, timestamp: int, secret: str = None) -> str:
+    """Signature header value for a payload sent at timestamp."""
+    mac = hmac.new((secret or SECRET).encode("utf-8"), f"{timestamp}.".encode("utf-8") + body, hashlib.sha256)
+    return f"t={timestamp},v1={mac.hexdigest()}"
+
+
+def verify(body: bytes, header: str, secret: str = None, tolerance: float = 300) -> bool:
+    """Check a signature header (for receivers and tests)."""
+    try:
+        parts = dict(item.split("=", 1) for item in header.split(","))
+        timestamp = int(parts["t"])
+    except (ValueError, KeyError):
+        return False
+    if abs(time.time() - timestamp) > tolerance:
+        return False
+    return hmac.compare_digest(sign(body, timestamp, secret), header)
+
+
+def _port(parsed) -> int:
+    return parsed.port or (443 if parsed.scheme == "https" else 80)
+
+
+class WebhookDispatcher:
+    def __init__(self, secret: str, max_pending: int, max_attempts: int,
+                 timeout: float, workers: int, allowed_hosts: List[str], retry_base: float = 2,
+                 allowed_networks: Sequence[Network] = ()):
+        self.secret = secret
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.workers = workers
+        self.allowed_hosts = allowed_hosts
+        self.retry_base = retry_base
+        self.allowed_networks = list(allowed_networks)
+        self._heap = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._started_pid = None
+        self._session = requests.Session()
+        self._stats = {"queued": 0, "delivered": 0, "retried": 0, "failed": 0, "dropped": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.secret)
+
+    def validate_url(self, url: str):
+        """Raise ValueError unless url is an acceptable callback target."""
+        if not self.enabled:
+            raise ValueError("Webhooks are not configured (set WEBHOOK_SECRET)")
+        parsed = urlparse(url or "")
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise ValueError(f"Invalid callback URL: {url!r}")
+        hostname = parsed.hostname.lower()
+        if self.allowed_hosts and hostname not in self.allowed_hosts:
+            raise ValueError(f"Callback host '{parsed.hostname}' is not allowed")
+        try:
+            self._address(hostname, _port(parsed))
+        except OSError as e:
+            raise ValueError(f"Callback host '{parsed.hostname}' cannot be resolved: {e}")
+
+    def _allowed_address(self, address: str) -> bool:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+        if ip.version == 6 and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+        if any(ip in network for network in self.allowed_networks):
+            return True
+        return ip.is_global and not ip.is_multicast
+
+    def _address(self, hostname: str, port: int) -> str:
+        """
+        Resolve hostname to the address to connect to. Raises UnsafeTarget
+        if any of its addresses is not public (unless allowed), OSError if
+        it does not resolve.
+        """
+        addresses = [info[4][0] for info in socket.getaddrinfo(hostname, port, type=socket.SOCK_STREAM)]
+        if not addresses:
+            raise OSError(f"no addresses for {hostname}")
+        if hostname not in self.allowed_hosts:
+            for address in addresses:
+                if not self._allowed_address(address):
+                    raise UnsafeTarget(f"Callback host '{hostname}' resolves to a non-public address ({address})")
+        return addresses[0]
+
+    def send(self, url: str, event: str, payload: Dict[str, Any]) -> bool:
+        """Queue a delivery; returns False if the queue is full."""
+        delivery = {
+            "id": str(uuid.uuid4()),
+            "url": url,
+            "event": event,
+            "body": json.dumps({"event": event, **payload}).encode("utf-8"),
+            "attempt": 0
+        }
+        self._start()
+        with self._cond:
+            if len(self._heap) >= self.max_pending:
+                self._stats["dropped"] += 1
+                log.warning("Queue full, dropped %s for %s", event, url)
+                return False
+            self._push(delivery, time.monotonic())
+            self._stats["queued"] += 1
+        return True
+
+    def _push(self, delivery: Dict[str, Any], due: float):
+        # Caller holds self._cond
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, delivery))
+        self._cond.notify()
+
+    def _start(self):
+        if self._started_pid == os.getpid():
+            return
+        with self._cond:
+            if self._started_pid == os.getpid():
+                return
+            self._threads = [
+                threading.Thread(target=self._worker, name=f"webhook-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._started_pid = os.getpid()
+
+    def _next(self) -> Dict[str, Any]:
+        with self._cond:
+            while True:
+                if self._heap:
+                    due = self._heap[0][0]
+                    now = time.monotonic()
+                    if due <= now:
+                        return heapq.heappop(self._heap)[2]
+                    self._cond.wait(due - now)
+                else:
+                    self._cond.wait()
+
+    def _worker(self):
+        while True:
+            delivery = self._next()
+            delivery["attempt"] += 1
+            try:
+                status, error = self._post(delivery)
+            except UnsafeTarget as e:
+                status, error, retryable = None, str(e), False
+            else:
+                if status is not None and 200 <= status < 300:
+                    with self._cond:
+                        self._stats["delivered"] += 1
+                    continue
+                retryable = status is None or status >= 500 or status in RETRYABLE_STATUS
+            reason = error or f"HTTP {status}"
+            with self._cond:
+                if retryable and delivery["attempt"] < self.max_attempts:
+                    delay = min(RETRY_MAX, self.retry_base * 2 ** (delivery["attempt"] - 1))
+                    self._stats["retried"] += 1
+                    self._push(delivery, time.monotonic() + delay)
+                    log.info("%s to %s failed (%s), retry %d/%d in %.1fs", delivery["event"],
+                             delivery["url"], reason, delivery["attempt"], self.max_attempts - 1, delay)
+                else:
+                    self._stats["failed"] += 1
+                    log.warning("%s to %s failed (%s), giving up", delivery["event"], delivery["url"], reason)
+
+    def _post(self, delivery: Dict[str, Any]):
+        """
+        One attempt; returns (status code or None, error message or None).
+        Raises UnsafeTarget if the host now resolves to a refused address.
+        """
+        parsed = urlparse(delivery["url"])
+        try:
+            address = self._address(parsed.hostname.lower(), _port(parsed))
+        except OSError as e:
+            return None, f"Could not resolve {parsed.hostname}: {e}"
+        # Connect to the checked address, not whatever the name resolves to next
+        userinfo, _, host = parsed.netloc.rpartition("@")
+        netloc = f"[{address}]" if ":" in address else address
+        if parsed.port:
+            netloc = f"{netloc}:{parsed.port}"
+        if userinfo:
+            netloc = f"{userinfo}@{netloc}"
+        url = parsed._replace(netloc=netloc).geturl()
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": "GenForge-Webhooks/1.0",
+            "X-GenForge-Event": delivery["event"],
+            "X-GenForge-Delivery": delivery["id"],
+            "X-GenForge-Signature": sign(delivery["body"], int(time.time()), self.secret),
+            "Host": host
+        }
+        session = self._session
+        if parsed.scheme == "https":
+            session = requests.Session()
+            session.mount("https://", _PinnedAdapter(parsed.hostname))
+        try:
+            resp = session.post(url, data=delivery["body"], headers=headers, proxies=NO_PROXIES,
+                                timeout=self.timeout, allow_redirects=False)
+            return resp.status_code, None
+        except requests.RequestException as e:
+            return None, str(e)
+        finally:
+            if session is not self._session:
+                session.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {"enabled": self.enabled, "pending": len(self._heap), **self._stats}
+
+    @classmethod
+    def from_env(cls) -> "WebhookDispatcher":
+        """A dispatcher configured by the WEBHOOK_* environment variables."""
+        return cls(
+            os.getenv("WEBHOOK_SECRET", ""),
+            int(os.getenv("WEBHOOK_MAX_PENDING", "1000")),
+            int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "6")),
+            float(os.getenv("WEBHOOK_TIMEOUT", "10")),
+            int(os.getenv("WEBHOOK_WORKERS", "2")),
+            parse_hosts(os.getenv("WEBHOOK_ALLOWED_HOSTS", "")),
+            float(os.getenv("WEBHOOK_RETRY_BASE", "2")),
+            parse_networks(os.getenv("WEBHOOK_ALLOWED_NETWORKS", ""))
+        )
@@ -0,0 +1,6 @@
+"""Every test session gets its own databases (modules read settings when first imported)."""
+import os
+import tempfile
+
+STATE_DIR = tempfile.mkdtemp(prefix="genforge-common-tests-")
+os.environ["UPSTREAM_LIMITER_DB"] = os.path.join(STATE_DIR, "upstream.sqlite")
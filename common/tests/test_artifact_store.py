@@ -0,0 +1,69 @@
+"""Artifact store on the local backend: dedupe, manifests and records."""
+import os
+
+import pytest
+
+from genforge_common.artifact_store import ArtifactStore, make_backend
+
+
+@pytest.fixture
+def store(tmp_path) -> ArtifactStore:
+    return ArtifactStore(make_backend("local", str(tmp_path / "store")))
+
+
+def job_files(tmp_path, job_dir, files):
+    root = tmp_path / "outputs" / job_dir
+    root.mkdir(parents=True)
+    listed = []
+    for relpath, data in files.items():
+        path = root / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        listed.append((relpath, str(path), os.stat(path)))
+    return listed
+
+
+def test_disabled():
+    store = ArtifactStore(make_backend("", "unused"))
+    assert not store.enabled
+    assert store.publish("job", []) is None
+    assert store.get_record("sprite-jobs/x") is None
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        make_backend("ftp", "unused")
+
+
+def test_identical_files_are_stored_once(store, tmp_path):
+    first = store.publish("a", job_files(tmp_path, "a", {"sheet.png": b"same", "metadata.json": b"{}"}))
+    second = store.publish("b", job_files(tmp_path, "b", {"sheet.png": b"same"}))
+    assert first["files"]["sheet.png"]["key"] == second["files"]["sheet.png"]["key"]
+    stats = store.get_stats()
+    assert (stats["stored"], stats["deduplicated"]) == (2, 1)
+
+
+def test_other_nodes_read_manifests_and_blobs(store, tmp_path):
+    store.publish("job", job_files(tmp_path, "job", {"idle/frame_0.png": b"frame"}))
+    other = ArtifactStore(make_backend("local", store.backend.root))
+    entry = other.resolve("job", "idle/frame_0.png")
+    assert entry["size"] == 5
+    with other.open_blob(entry["key"]) as f:
+        assert f.read() == b"frame"
+    assert other.resolve("job", "missing.png") is None
+    assert other.get_manifest("unknown") is None
+
+
+def test_records_are_replaced_and_kept_apart_from_manifests(store, tmp_path):
+    store.publish("job", job_files(tmp_path, "job", {"sheet.png": b"sheet"}))
+    store.put_record("job", {"status": "queued"})
+    store.put_record("job", {"status": "completed"})
+    other = ArtifactStore(make_backend("local", store.backend.root))
+    assert other.get_record("job") == {"status": "completed"}
+    assert other.get_manifest("job")["files"]["sheet.png"]
+    assert other.get_record("unknown") is None
+
+
+def test_public_url():
+    store = ArtifactStore(make_backend("local", "unused"), "https://cdn.example.com/")
+    assert store.public_url("blobs/ab/abc.png") == "https://cdn.example.com/blobs/ab/abc.png"
@@ -0,0 +1,120 @@
+"""Host-wide upstream limiter: stored caps, concurrency, leases and adaptation."""
+import time
+import uuid
+
+import pytest
+
+from genforge_common import rate_limiter
+from genforge_common.rate_limiter import RateLimitTimeout, UpstreamLimiter
+
+
+def upstream(max_rpm=600, max_concurrency=2, **kwargs) -> UpstreamLimiter:
+    return UpstreamLimiter(f"test-{uuid.uuid4().hex[:8]}", max_rpm, max_concurrency, **kwargs)
+
+
+def test_stored_caps_are_not_overwritten_by_other_processes():
+    first = upstream(60, 6)
+    with first.slot() as slot:
+        slot.status_code = 200
+    # Another process starting with a different environment
+    second = UpstreamLimiter(first.name, 10, 1)
+    with second.slot() as slot:
+        slot.status_code = 200
+    stats = second.get_stats()
+    assert (stats["max_rpm"], stats["max_concurrency"]) == (60, 6)
+
+
+def test_set_limits_changes_caps_and_clamps_current_limits():
+    limiter = upstream(60, 6)
+    limiter.set_limits(max_rpm=30, max_concurrency=2)
+    stats = limiter.get_stats()
+    assert (stats["max_rpm"], stats["max_concurrency"]) == (30, 2)
+    assert (stats["rpm"], stats["concurrency"]) == (30, 2)
+    limiter.set_limits(max_concurrency=4)
+    assert limiter.get_stats()["max_rpm"] == 30
+
+
+def test_concurrency_cap():
+    limiter = upstream(max_concurrency=2, lane_shares={"refine": 1.0, "generate": 1.0, "bulk": 1.0})
+    first, _ = limiter.acquire()
+    second, _ = limiter.acquire()
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(timeout=0.3)
+    limiter.release(first)
+    third, waited = limiter.acquire(timeout=1)
+    assert waited < 1
+    limiter.release(second)
+    limiter.release(third)
+
+
+def test_lane_share():
+    limiter = upstream(max_concurrency=4, lane_shares={"refine": 1.0, "generate": 1.0, "bulk": 0.5})
+    leases = [limiter.acquire(lane="bulk")[0] for _ in range(2)]
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(timeout=0.3, lane="bulk")
+    # Other lanes still get the rest of the slots
+    leases.append(limiter.acquire(timeout=0.3, lane="refine")[0])
+    for lease_id in leases:
+        limiter.release(lease_id)
+
+
+def test_renew_keeps_a_long_held_slot(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "LEASE_TTL", 0.5)
+    limiter = upstream(max_concurrency=1)
+    with limiter.slot() as slot:
+        for _ in range(3):
+            time.sleep(0.3)
+            assert slot.renew()
+        # Still held: nobody else gets in
+        with pytest.raises(RateLimitTimeout):
+            limiter.acquire(timeout=0.2)
+        slot.status_code = 200
+
+
+def test_expired_lease_cannot_be_renewed(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "LEASE_TTL", 0.1)
+    limiter = upstream(max_concurrency=1)
+    with limiter.slot() as slot:
+        time.sleep(0.2)
+        # Expired leases are reclaimed by the next caller
+        other, _ = limiter.acquire(timeout=1)
+        assert not slot.renew()
+        limiter.release(other)
+
+
+def test_throttling_halves_limits_and_success_recovers():
+    limiter = upstream(60, 4)
+    with limiter.slot() as slot:
+        slot.status_code = 429
+    stats = limiter.get_stats()
+    assert (stats["rpm"], stats["concurrency"], stats["throttled"]) == (30, 2, 1)
+    with limiter.slot() as slot:
+        slot.status_code = 200
+    assert limiter.get_stats()["rpm"] == 31
+
+
+def test_no_response_counts_as_congestion():
+    limiter = upstream(60, 4)
+    with limiter.slot() as slot:
+        slot.status_code = rate_limiter.NO_RESPONSE
+    stats = limiter.get_stats()
+    assert (stats["rpm"], stats["concurrency"], stats["throttled"]) == (30, 2, 1)
+    assert limiter.latency()["error_rate"] == 1.0
+
+
+def test_latency_reads_the_call_log():
+    limiter = upstream()
+    for status in (200, 200, 500):
+        with limiter.slot() as slot:
+            slot.status_code = status
+    latency = limiter.latency()
+    assert latency["calls"] == 3
+    assert latency["error_rate"] == pytest.approx(1 / 3, abs=1e-3)
+
+
+def test_cli_sets_and_shows_caps(capsys):
+    limiter = upstream(60, 6)
+    with limiter.slot():
+        pass
+    assert rate_limiter.main(["set", limiter.name, "--rpm", "20"]) == 0
+    assert f"{limiter.name}: max 20 rpm / 6 in flight" in capsys.readouterr().out
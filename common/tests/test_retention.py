@@ -0,0 +1,40 @@
+"""Shared sweeper plumbing: TTL parsing, access times and the sweep lock."""
+import pytest
+
+from genforge_common import retention
+from genforge_common.retention import AccessLog, parse_ttls, run_exclusive
+
+
+def test_parse_ttls():
+    ttls = parse_ttls("frames=72, gifs = 1,unknown=5,bad", ("frames", "gifs", "raw"))
+    assert ttls == {"frames": 72 * 3600, "gifs": 3600, "raw": 0.0}
+
+
+def test_access_times_survive_a_failed_save():
+    saved = []
+    failing = [True]
+
+    def save(access):
+        if failing[0]:
+            raise OSError("database is locked")
+        saved.append(access)
+
+    log = AccessLog(save)
+    log.touch("job-a")
+    log.flush()
+    assert saved == []
+    log.touch("job-b")
+    failing[0] = False
+    log.flush()
+    assert set(saved[0]) == {"job-a", "job-b"}
+    log.flush()
+    assert len(saved) == 1
+
+
+@pytest.mark.skipif(not retention.FILE_LOCKS_AVAILABLE, reason="needs fcntl")
+def test_only_one_sweep_at_a_time(tmp_path):
+    lock = str(tmp_path / "locks" / "sweep.lock")
+    nested = []
+    assert run_exclusive(lock, lambda: nested.append(run_exclusive(lock, lambda: "inner")) or "outer") == "outer"
+    assert nested == [None]
+    assert run_exclusive(lock, lambda: "again") == "again"
@@ -0,0 +1,157 @@
+"""Webhook signing and delivery."""
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from genforge_common import webhooks
+from genforge_common.webhooks import WebhookDispatcher, parse_networks
+
+SECRET = "test-secret"
+LOCAL = parse_networks("127.0.0.0/8")
+PUBLIC_IP = "93.184.216.34"
+
+
+def test_signature_round_trip():
+    body = b'{"event": "job.completed"}'
+    header = webhooks.sign(body, int(time.time()), SECRET)
+    assert webhooks.verify(body, header, SECRET)
+    assert not webhooks.verify(body + b" ", header, SECRET)
+    assert not webhooks.verify(body, header, "other-secret")
+    assert not webhooks.verify(body, "garbage", SECRET)
+
+
+def test_old_signatures_are_rejected():
+    body = b"{}"
+    header = webhooks.sign(body, int(time.time()) - 3600, SECRET)
+    assert not webhooks.verify(body, header, SECRET)
+
+
+def test_parse_hosts():
+    assert webhooks.parse_hosts(" Example.com, ,hooks.example.org ") == ["example.com", "hooks.example.org"]
+
+
+@pytest.fixture
+def dns(monkeypatch):
+    """Fake answers for *.example.com; numeric hosts resolve as usual."""
+    answers = {}
+    real = socket.getaddrinfo
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host in answers:
+            address = answers[host].pop(0) if len(answers[host]) > 1 else answers[host][0]
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port))]
+        return real(host, port, *args, **kwargs)
+
+    monkeypatch.setattr(webhooks.socket, "getaddrinfo", getaddrinfo)
+    return answers
+
+
+def test_validate_url(dns):
+    dns["hooks.example.com"] = [PUBLIC_IP]
+    dispatcher = WebhookDispatcher(SECRET, 10, 1, 5, 1, ["hooks.example.com"])
+    dispatcher.validate_url("https://hooks.example.com/done")
+    for url in ("ftp://hooks.example.com/done", "https://other.example.com/done", "not a url"):
+        with pytest.raises(ValueError):
+            dispatcher.validate_url(url)
+    with pytest.raises(ValueError):
+        WebhookDispatcher("", 10, 1, 5, 1, []).validate_url("https://hooks.example.com/done")
+
+
+@pytest.fixture
+def receiver():
+    """A local HTTP server; answers 500 to the first `fail_first` requests."""
+    received = []
+    state = {"fail_first": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            received.append((dict(self.headers), body))
+            self.send_response(500 if len(received) <= state["fail_first"] else 204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/hook", received, state
+    server.shutdown()
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/hook", "http://localhost/hook", "http://10.1.2.3/hook", "http://192.168.0.1/hook",
+    "http://169.254.169.254/latest/meta-data", "http://[::1]/hook", "http://[::ffff:127.0.0.1]/hook",
+    "http://0.0.0.0/hook", "http://224.0.0.1/hook", "http://240.0.0.1/hook"
+])
+def test_non_public_addresses_are_refused(url):
+    with pytest.raises(ValueError):
+        WebhookDispatcher(SECRET, 10, 1, 5, 1, []).validate_url(url)
+
+
+def test_allowlisted_hosts_and_networks_may_be_private(dns):
+    dns["internal.example.com"] = ["10.1.2.3"]
+    WebhookDispatcher(SECRET, 10, 1, 5, 1, ["internal.example.com"]).validate_url("http://internal.example.com/h")
+    WebhookDispatcher(SECRET, 10, 1, 5, 1, [], allowed_networks=parse_networks("10.0.0.0/8")).validate_url(
+        "http://internal.example.com/h"
+    )
+    with pytest.raises(ValueError):
+        WebhookDispatcher(SECRET, 10, 1, 5, 1, [], allowed_networks=LOCAL).validate_url("http://internal.example.com/h")
+
+
+def test_signed_delivery_with_retry(receiver):
+    url, received, state = receiver
+    state["fail_first"] = 1
+    dispatcher = WebhookDispatcher(SECRET, 10, 3, 5, 1, [], retry_base=0.05, allowed_networks=LOCAL)
+    dispatcher.validate_url(url)
+    assert dispatcher.send(url, "job.completed", {"job_id": "abc"})
+    wait_for(lambda: dispatcher.get_stats()["delivered"] == 1)
+
+    assert len(received) == 2
+    (first_headers, _), (headers, body) = received
+    assert first_headers["X-GenForge-Delivery"] == headers["X-GenForge-Delivery"]
+    assert headers["X-GenForge-Event"] == "job.completed"
+    assert webhooks.verify(body, headers["X-GenForge-Signature"], SECRET)
+    assert json.loads(body) == {"event": "job.completed", "job_id": "abc"}
+    assert dispatcher.get_stats()["retried"] == 1
+
+
+def test_full_queue_drops_deliveries():
+    dispatcher = WebhookDispatcher(SECRET, 0, 1, 5, 1, [])
+    assert not dispatcher.send("http://127.0.0.1:9/hook", "job.failed", {})
+    assert dispatcher.get_stats()["dropped"] == 1
+
+
+def test_delivery_connects_to_the_checked_address(receiver, dns):
+    url, received, _ = receiver
+    port = url.split(":")[2].split("/")[0]
+    dns["hooks.example.com"] = ["127.0.0.1"]
+    dispatcher = WebhookDispatcher(SECRET, 10, 1, 5, 1, ["hooks.example.com"])
+    assert dispatcher.send(f"http://hooks.example.com:{port}/hook", "job.completed", {"job_id": "abc"})
+    wait_for(lambda: dispatcher.get_stats()["delivered"] == 1)
+    assert received[0][0]["Host"] == f"hooks.example.com:{port}"
+
+
+def test_rebinding_after_validation_is_refused(receiver, dns):
+    url, received, _ = receiver
+    port = url.split(":")[2].split("/")[0]
+    # Public when the callback is accepted, loopback when it is delivered
+    dns["hooks.example.com"] = [PUBLIC_IP, "127.0.0.1"]
+    dispatcher = WebhookDispatcher(SECRET, 10, 3, 5, 1, [], retry_base=0.05)
+    callback = f"http://hooks.example.com:{port}/hook"
+    dispatcher.validate_url(callback)
+    assert dispatcher.send(callback, "job.completed", {"job_id": "abc"})
+    wait_for(lambda: dispatcher.get_stats()["failed"] == 1)
+    assert received == []
+    assert dispatcher.get_stats()["retried"] == 0
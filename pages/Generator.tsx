@@ -666,6 +666,17 @@ export const Generator: React.FC = () => {
                 >
                   <Info size={12} /> Metadata (JSON)
                 </button>
+                {spriteResult.download_urls.bundle && (
+                  <button
+                    onClick={() => handleDownload(
+                      api.getOutputUrl(spriteResult.download_urls.bundle),
+                      `${spriteResult.job_id}.zip`
+                    )}
+                    className="px-3 py-2 bg-white border border-gray-300 rounded-lg text-xs font-medium hover:bg-gray-50 flex items-center gap-1"
+                  >
+                    <Download size={12} /> All files (.zip)
+                  </button>
+                )}
                 {Object.keys(spriteResult.animations).map(anim => (
                   <button
                     key={anim}
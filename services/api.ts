@@ -43,6 +43,25 @@ export interface SpriteGenerationResult {
   download_urls: Record<string, string>;
 }
 
+export interface SpriteJobStatus {
+  job_id: string;
+  kind: string;
+  status: 'queued' | 'running' | 'completed' | 'failed';
+  queue_position?: number;
+  progress: Record<string, { stage: string; timings?: Record<string, number>; [key: string]: unknown }>;
+  timings: Record<string, number>;
+  result?: SpriteGenerationResult;
+  error?: string;
+}
+
+export interface SpriteJobEvent {
+  event: string;
+  job_id: string;
+  animation: string | null;
+  timings?: Record<string, number>;
+  [key: string]: unknown;
+}
+
 export interface SpriteRefineResult {
   job_id: string;
   original_job_id: string;
@@ -75,6 +94,27 @@ export interface Generation3DResult {
 // --- MOCK HELPERS (for 3D mode) ---
 const wait = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
 
+/**
+ * POST JSON with an Idempotency-Key, retrying network errors and 5xx
+ * responses with the same key so the server never starts the work twice.
+ */
+const postIdempotent = async (url: string, body: unknown, attempts = 3): Promise<Response> => {
+  const key = crypto.randomUUID();
+  for (let attempt = 1; ; attempt++) {
+    try {
+      const response = await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Idempotency-Key': key },
+        body: JSON.stringify(body)
+      });
+      if (response.status < 500 || attempt >= attempts) return response;
+    } catch (err) {
+      if (attempt >= attempts) throw err;
+    }
+    await wait(1000 * 2 ** attempt);
+  }
+};
+
 // --- API METHODS ---
 export const api = {
   
@@ -118,23 +158,31 @@ export const api = {
   },
 
   /**
-   * POST /api/sprite/generate - Generate sprite sheets
+   * GET /api/sprite/status/:jobId - Progress and result of a sprite job
+   */
+  getSpriteJobStatus: async (jobId: string): Promise<SpriteJobStatus> => {
+    const response = await fetch(`${SPRITE_API_BASE}/api/sprite/status/${jobId}`);
+    if (!response.ok) {
+      throw new Error(`Failed to get sprite job status: ${response.status}`);
+    }
+    return response.json();
+  },
+
+  /**
+   * POST /api/sprite/generate - Queue sprite generation and wait for the result
    */
   generateSprite: async (
     prompt: string,
     preset: string,
     animations?: string[],
-    useFiboEnhanced?: boolean
+    useFiboEnhanced?: boolean,
+    onEvent?: (event: SpriteJobEvent) => void
   ): Promise<SpriteGenerationResult> => {
-    const response = await fetch(`${SPRITE_API_BASE}/api/sprite/generate`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({
-        prompt,
-        preset,
-        animations: animations?.length ? animations : undefined,
-        use_fibo_enhanced: useFiboEnhanced || false
-      })
+    const response = await postIdempotent(`${SPRITE_API_BASE}/api/sprite/generate`, {
+      prompt,
+      preset,
+      animations: animations?.length ? animations : undefined,
+      use_fibo_enhanced: useFiboEnhanced || false
     });
 
     if (!response.ok) {
@@ -142,7 +190,53 @@ export const api = {
       throw new Error(error.error || `API error: ${response.status}`);
     }
 
-    return response.json();
+    const { job_id } = await response.json();
+    return api.watchSpriteJob(job_id, onEvent);
+  },
+
+  /**
+   * GET /api/sprite/events/:jobId - Follow a sprite job over server-sent events,
+   * so each animation can be shown as soon as its sheet and GIF are written.
+   * Falls back to polling the status endpoint if the stream is unavailable.
+   */
+  watchSpriteJob: (
+    jobId: string,
+    onEvent?: (event: SpriteJobEvent) => void
+  ): Promise<SpriteGenerationResult> => new Promise((resolve, reject) => {
+    const source = new EventSource(`${SPRITE_API_BASE}/api/sprite/events/${jobId}`);
+    const stages = [
+      'queued', 'running', 'pending', 'generating', 'sheet_received',
+      'frames_sliced', 'animation_done', 'combined_sheet', 'metadata'
+    ];
+    stages.forEach(stage => source.addEventListener(stage, (e) => {
+      onEvent?.({ event: stage, ...JSON.parse((e as MessageEvent).data) });
+    }));
+    source.addEventListener('completed', (e) => {
+      source.close();
+      resolve(JSON.parse((e as MessageEvent).data).result);
+    });
+    source.addEventListener('failed', (e) => {
+      source.close();
+      reject(new Error(JSON.parse((e as MessageEvent).data).error || 'Sprite generation failed'));
+    });
+    source.onerror = () => {
+      // The browser reconnects on its own unless the stream was refused
+      if (source.readyState === EventSource.CLOSED) {
+        api.pollSpriteJob(jobId).then(resolve, reject);
+      }
+    };
+  }),
+
+  /**
+   * Poll /api/sprite/status/:jobId until the job finishes
+   */
+  pollSpriteJob: async <T = SpriteGenerationResult>(jobId: string): Promise<T> => {
+    while (true) {
+      const status = await api.getSpriteJobStatus(jobId);
+      if (status.status === 'completed' && status.result) return status.result as unknown as T;
+      if (status.status === 'failed') throw new Error(status.error || 'Sprite generation failed');
+      await wait(2000);
+    }
   },
 
   /**
@@ -163,16 +257,12 @@ export const api = {
     refinement: string,
     preset?: string
   ): Promise<SpriteRefineResult> => {
-    const response = await fetch(`${SPRITE_API_BASE}/api/sprite/refine`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({
-        job_id: jobId,
-        animation,
-        prompt,
-        refinement,
-        preset: preset || 'anime_action'
-      })
+    const response = await postIdempotent(`${SPRITE_API_BASE}/api/sprite/refine`, {
+      job_id: jobId,
+      animation,
+      prompt,
+      refinement,
+      preset: preset || 'anime_action'
     });
 
     if (!response.ok) {
@@ -180,6 +270,11 @@ export const api = {
       throw new Error(error.error || `Refine failed: ${response.status}`);
     }
 
+    // 202: the refinement is still running
+    if (response.status === 202) {
+      const { job_id } = await response.json();
+      return api.pollSpriteJob<SpriteRefineResult>(job_id);
+    }
     return response.json();
   },
 